@@ -0,0 +1,9 @@
+"""Python client for the digital asset platform API."""
+from .api import ApiError, AssetsApiClient
+from .delta import DeltaUploader
+from .retry import RetryPolicy
+from .sync import sync_directory
+from .transfer import MultipartUploader, UploadManifest
+
+__all__ = ['ApiError', 'AssetsApiClient', 'DeltaUploader', 'MultipartUploader', 'RetryPolicy', 'UploadManifest',
+           'sync_directory']
@@ -0,0 +1,226 @@
+import base64
+import gzip
+import json
+import logging
+import socket
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from .retry import RETRYABLE_STATUSES, RetryPolicy
+
+logger = logging.getLogger(__name__)
+
+
+class ApiError(Exception):
+    """An error response from the platform API or from S3."""
+
+    def __init__(self, status, message, body=None):
+        super().__init__(f'{status}: {message}')
+        self.status = status
+        self.message = message
+        self.body = body
+
+
+def is_retryable(error):
+    """Retry throttling, transient server errors and network failures."""
+    if isinstance(error, ApiError):
+        return error.status in RETRYABLE_STATUSES
+    return isinstance(error, (urllib.error.URLError, socket.timeout, ConnectionError))
+
+
+def is_retryable_idempotent(error):
+    """Also retry a 409 for an idempotent request, which the first attempt still holds."""
+    return is_retryable(error) or (isinstance(error, ApiError) and error.status == 409)
+
+
+class AssetsApiClient:
+    """
+    Client for the platform's HTTP API.
+
+    Every endpoint is a POST to {base_url}/{function name}, authorized with the Cognito
+    ID token returned by login. Uploads and multipart starts and completes send an
+    Idempotency-Key, the same on every retry, so a retry after a lost response gets the
+    first attempt's result instead of repeating its work.
+    """
+
+    def __init__(self, base_url, token=None, timeout=60, retry=None):
+        self.base_url = base_url.rstrip('/')
+        self.token = token
+        self.timeout = timeout
+        self.retry = retry or RetryPolicy()
+
+    # Authentication
+
+    def login(self, username, password):
+        """Log in and keep the ID token for later calls. Returns the full authentication result."""
+        result = self._post('login', {'username': username, 'password': password}, authorized=False)
+        self.token = result['IdToken']
+        return result
+
+    # Multipart uploads
+
+    def start_multipart_upload(self, filename, content_type=None, checksum_algorithm='SHA256'):
+        """Start a multipart upload, returning {'uploadId', 'checksumAlgorithm'}."""
+        body = {'filename': filename, 'checksumAlgorithm': checksum_algorithm}
+        if content_type:
+            body['content_type'] = content_type
+        return self._post('multipart_start_upload', body, idempotent=True)
+
+    def start_uploads(self, files, part_size, checksum_algorithm='SHA256'):
+        """
+        Start the uploads of many files at once.
+
+        Every file is {'filename', 'size', 'checksums'}, with one checksum per part of
+        part_size bytes, and optionally 'content_type'. Returns {'uploads', 'failed',
+        'checksumHeader', ...}: a file of one part gets a presigned single PUT 'url', larger
+        files an 'uploadId' with their 'partUrls'.
+        """
+        return self._post('multipart_batch_start_upload', {
+            'files': files,
+            'partSize': part_size,
+            'checksumAlgorithm': checksum_algorithm
+        }, idempotent=True)
+
+    def generate_presigned_urls(self, upload_id, filename, checksums, checksum_algorithm='SHA256'):
+        """Presign one URL per part, returning {'partUrls', 'checksumHeader'}."""
+        return self._post('multipart_generate_presigned_urls', {
+            'uploadId': upload_id,
+            'filename': filename,
+            'parts': len(checksums),
+            'checksums': checksums,
+            'checksumAlgorithm': checksum_algorithm
+        })
+
+    def complete_multipart_upload(self, upload_id, filename, parts):
+        """Complete a multipart upload from its [{'PartNumber', 'ETag', 'Checksum...'}] list."""
+        return self._post('multipart_complete_upload', {'uploadId': upload_id, 'filename': filename, 'parts': parts},
+                          idempotent=True)
+
+    def abort_multipart_upload(self, upload_id, filename):
+        """Abort a multipart upload and release its parts."""
+        return self._post('multipart_abort_upload', {'uploadId': upload_id, 'filename': filename})
+
+    # Delta updates
+
+    def get_delta_manifest(self, document_name):
+        """Return the chunk manifest of a document's current version."""
+        return self._post('delta_manifest', {'document_name': document_name})
+
+    def delta_update(self, document_name, base_etag, chunks):
+        """Write a new version from its chunks, {'sha256'} for reused and {'data'} (base64) for new ones."""
+        return self._post('delta_update', {'document_name': document_name, 'base_etag': base_etag, 'chunks': chunks})
+
+    # Documents
+
+    def list_assets(self, limit=None, order=None):
+        """
+        Yield every document item, a page at a time when limit is set.
+
+        Items come in name order, or most recently written first with order='recent'.
+        """
+        cursor = None
+        while True:
+            body = {}
+            if order:
+                body['order'] = order
+            if limit:
+                body['limit'] = limit
+            if cursor:
+                body['cursor'] = cursor
+            items, headers = self._post('list_assets', body, return_headers=True)
+            yield from items
+            cursor = headers.get('X-Next-Cursor')
+            if not cursor:
+                return
+
+    def upload_asset(self, document_name, data, content_type=None):
+        """Upload a small document in a single request, its bytes base64 encoded in the body."""
+        body = {'document_name': document_name, 'document': base64.b64encode(data).decode('ascii')}
+        if content_type:
+            body['content_type'] = content_type
+        return self._post('upload_asset', body, idempotent=True)
+
+    def view_asset(self, document_name):
+        """Return a document's bytes."""
+        query = urllib.parse.urlencode({'documentName': document_name, 'format': 'raw'})
+        return self._post(f'view_asset?{query}', {}, raw=True)
+
+    def delete_asset(self, document_name):
+        """Delete a document."""
+        return self._post('delete_asset', {'document_name': document_name})
+
+    # Background jobs
+
+    def submit_job(self, job_type, params=None):
+        """Submit a bulk operation, returning the job's status with its jobId."""
+        return self._post('submit_job', {'job_type': job_type, 'params': params or {}}, idempotent=True)
+
+    def get_job_status(self, job_id):
+        """Return a job's status and progress."""
+        return self._post('get_job_status', {'jobId': job_id})
+
+    # Transport
+
+    def _post(self, path, body, authorized=True, raw=False, return_headers=False, idempotent=False):
+        """
+        POST a JSON body with retries, returning the decoded JSON (or raw bytes).
+
+        With idempotent set, every attempt carries the same new Idempotency-Key.
+        """
+        headers = {'Content-Type': 'application/json', 'Accept-Encoding': 'gzip'}
+        if authorized:
+            if not self.token:
+                raise ApiError(401, 'Not logged in')
+            headers['Authorization'] = f'Bearer {self.token}'
+        if idempotent:
+            headers['Idempotency-Key'] = str(uuid.uuid4())
+
+        data = json.dumps(body).encode('utf-8')
+        status, response_headers, payload = self.retry.call(
+            lambda: request('POST', f'{self.base_url}/{path}', data, headers, self.timeout),
+            is_retryable_idempotent if idempotent else is_retryable,
+            logger
+        )
+        result = payload if raw else (json.loads(payload) if payload else None)
+        return (result, response_headers) if return_headers else result
+
+
+def request(method, url, data=None, headers=None, timeout=60):
+    """
+    Make one HTTP request, returning (status, headers, decoded body).
+
+    Raises:
+        ApiError: For 4xx and 5xx responses, with the API's message when it sent one.
+    """
+    http_request = urllib.request.Request(url, data=data, headers=headers or {}, method=method)
+    try:
+        with urllib.request.urlopen(http_request, timeout=timeout) as response:
+            return response.status, dict(response.headers), read_body(response)
+    except urllib.error.HTTPError as e:
+        payload = read_body(e)
+        raise ApiError(e.code, error_message(payload) or e.reason, payload) from None
+
+
+def read_body(response):
+    """Read a response body, undoing gzip content encoding."""
+    payload = response.read()
+    if response.headers.get('Content-Encoding') == 'gzip':
+        payload = gzip.decompress(payload)
+    return payload
+
+
+def error_message(payload):
+    """Extract the message from an API error body, which is a JSON string or object."""
+    try:
+        decoded = json.loads(payload)
+    except (ValueError, TypeError):
+        return payload.decode('utf-8', errors='replace')[:200] if payload else None
+    if isinstance(decoded, dict):
+        return decoded.get('message') or json.dumps(decoded)
+    return str(decoded)
+
+
+def base64_checksum(digest):
+    """Encode a binary digest the way S3 expects checksum headers."""
+    return base64.b64encode(digest).decode('ascii')
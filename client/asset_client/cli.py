@@ -0,0 +1,152 @@
+"""
+Command line client for the digital asset platform.
+
+The API URL comes from --api-url or ASSET_API_URL. `login` saves the ID token to
+~/.asset-client/token.json, or set ASSET_API_TOKEN.
+
+Examples:
+    asset-client login alice
+    asset-client upload ./video.mp4 --name videos/video.mp4 --workers 8
+    asset-client upload ./data.csv --delta
+    asset-client sync ./reports --prefix reports/ --delete
+    asset-client ls
+    asset-client ls --recent 20
+    asset-client get reports/q1.pdf -o q1.pdf
+    asset-client rm reports/q1.pdf
+"""
+import argparse
+import getpass
+import itertools
+import json
+import logging
+import os
+import sys
+from .api import ApiError, AssetsApiClient
+from .delta import DeltaUploader
+from .sync import sync_directory
+from .transfer import DEFAULT_PART_SIZE, MultipartUploader
+
+CONFIG_DIR = os.path.join(os.path.expanduser('~'), '.asset-client')
+TOKEN_FILE = os.path.join(CONFIG_DIR, 'token.json')
+
+
+def load_token():
+    """Return the token from ASSET_API_TOKEN or the saved login, if any."""
+    if os.getenv('ASSET_API_TOKEN'):
+        return os.getenv('ASSET_API_TOKEN')
+    try:
+        with open(TOKEN_FILE, 'r', encoding='utf-8') as token_file:
+            return json.load(token_file)['IdToken']
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def save_token(result):
+    """Save a login result, readable by the current user only."""
+    os.makedirs(CONFIG_DIR, exist_ok=True)
+    descriptor = os.open(TOKEN_FILE, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(descriptor, 'w', encoding='utf-8') as token_file:
+        json.dump({'IdToken': result['IdToken']}, token_file)
+
+
+def print_progress(done, total):
+    """Print upload progress on one line."""
+    percent = 100 * done / total if total else 100
+    print(f'\r  {done / 1048576:,.1f} / {total / 1048576:,.1f} MiB ({percent:.0f}%)', end='', file=sys.stderr, flush=True)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='asset-client', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--api-url', default=os.getenv('ASSET_API_URL'), help='Base URL of the API')
+    parser.add_argument('--verbose', action='store_true', help='Log requests and retries')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    login = commands.add_parser('login', help='Log in and save the ID token')
+    login.add_argument('username')
+
+    upload = commands.add_parser('upload', help='Upload a file with parallel, resumable multipart')
+    upload.add_argument('path')
+    upload.add_argument('--name', help='Document name, defaults to the file name')
+    upload.add_argument('--delta', action='store_true', help='Send only the chunks that changed since the stored version')
+
+    sync = commands.add_parser('sync', help='Upload new and changed files of a directory tree')
+    sync.add_argument('directory')
+    sync.add_argument('--prefix', default='', help='Prefix for the document names, e.g. reports/')
+    sync.add_argument('--delete', action='store_true', help='Delete documents no longer present locally')
+    sync.add_argument('--file-workers', type=int, default=2, help='Files uploaded at once')
+    sync.add_argument('--dry-run', action='store_true', help='Only print what would change')
+
+    for command in (upload, sync):
+        command.add_argument('--workers', type=int, default=4, help='Parts uploaded at once per file')
+        command.add_argument('--part-size-mb', type=int, default=DEFAULT_PART_SIZE // 1048576)
+
+    ls = commands.add_parser('ls', help='List documents')
+    ls.add_argument('--recent', type=int, metavar='N', help='Only the N most recently written, newest first')
+
+    get = commands.add_parser('get', help='Download a document')
+    get.add_argument('document_name')
+    get.add_argument('-o', '--output', help='Output file, defaults to stdout')
+
+    remove = commands.add_parser('rm', help='Delete a document')
+    remove.add_argument('document_name')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    if not args.api_url:
+        print('Set --api-url or ASSET_API_URL', file=sys.stderr)
+        return 2
+
+    api = AssetsApiClient(args.api_url, token=load_token())
+    try:
+        if args.command == 'login':
+            save_token(api.login(args.username, getpass.getpass()))
+            print('Logged in')
+
+        elif args.command in ('upload', 'sync'):
+            uploader = MultipartUploader(api, max_workers=args.workers, part_size=args.part_size_mb * 1048576)
+            if args.command == 'upload' and args.delta:
+                result = DeltaUploader(api, uploader).update(args.path, args.name)
+                print(f"Updated {result['document_name']}, sent {result['sent_bytes']:,} of {result['size']:,} bytes"
+                      f"{'' if result['delta'] else ' (full upload)'}")
+            elif args.command == 'upload':
+                result = uploader.upload(args.path, args.name, progress=print_progress)
+                print(f"\nUploaded {result['document_name']} in {result['parts']} parts")
+            else:
+                result = sync_directory(api, uploader, args.directory, args.prefix, args.delete,
+                                        args.file_workers, args.dry_run)
+                print(f"Uploaded {result['uploaded']}, failed {result['failed']}, "
+                      f"deleted {result['deleted']}, unchanged {result['unchanged']}")
+                return 1 if result['failed'] else 0
+
+        elif args.command == 'ls':
+            if args.recent:
+                items = itertools.islice(api.list_assets(limit=min(args.recent, 1000), order='recent'), args.recent)
+            else:
+                items = api.list_assets(limit=1000)
+            for item in items:
+                print(f"{item.get('size', ''):>14}  {item.get('upload_date', ''):<32}  {item['document_name']}")
+
+        elif args.command == 'get':
+            data = api.view_asset(args.document_name)
+            if args.output:
+                with open(args.output, 'wb') as output:
+                    output.write(data)
+            else:
+                sys.stdout.buffer.write(data)
+
+        elif args.command == 'rm':
+            api.delete_asset(args.document_name)
+
+    except ApiError as e:
+        print(f'Error: {e}', file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,86 @@
+import base64
+import hashlib
+import logging
+import mmap
+import os
+from .api import ApiError
+from .chunking import CHUNKER, chunk_boundaries
+
+logger = logging.getLogger(__name__)
+
+
+class DeltaUploader:
+    """
+    Updates documents by sending only the chunks that changed.
+
+    The file is cut with the same content-defined chunker as the server, so an edit only
+    changes the chunks around it. Chunks the current version already has are referenced
+    by hash, and the server assembles the new version inside S3, or recompresses it from
+    the current version if that is stored compressed. When a delta cannot be used (no
+    current version, an encrypted one, or too many new bytes for one request) the file is
+    uploaded in full with the multipart uploader instead.
+    """
+
+    def __init__(self, api, uploader):
+        self.api = api
+        self.uploader = uploader
+
+    def update(self, file_path, document_name=None):
+        """
+        Update a document from a local file.
+
+        Returns:
+            dict: The document name, size, bytes sent and whether a delta was used.
+        """
+        document_name = document_name or os.path.basename(file_path)
+        try:
+            manifest = self.api.get_delta_manifest(document_name)
+        except ApiError as e:
+            if e.status not in (404, 409):
+                raise
+            logger.info(f"No delta base for {document_name} ({e.message}), uploading in full")
+            return self._upload_in_full(file_path, document_name)
+
+        if manifest.get('chunker') != CHUNKER:
+            logger.warning(f"Server chunker {manifest.get('chunker')} differs from {CHUNKER}, uploading in full")
+            return self._upload_in_full(file_path, document_name)
+
+        known = {digest for _, digest in manifest['chunks']}
+        size = os.path.getsize(file_path)
+        with open(file_path, 'rb') as source:
+            mapped = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+            try:
+                chunks, new_bytes, start = [], 0, 0
+                for end in chunk_boundaries(mapped):
+                    data = mapped[start:end]
+                    digest = hashlib.sha256(data).hexdigest()
+                    if digest in known:
+                        chunks.append({'sha256': digest})
+                    else:
+                        chunks.append({'data': base64.b64encode(data).decode('ascii')})
+                        new_bytes += len(data)
+                    start = end
+            finally:
+                if isinstance(mapped, mmap.mmap):
+                    mapped.close()
+
+        if new_bytes > manifest['max_new_bytes']:
+            logger.info(f"{new_bytes} changed bytes exceed one delta request, uploading in full")
+            return self._upload_in_full(file_path, document_name)
+
+        try:
+            self.api.delta_update(document_name, manifest['etag'], chunks)
+        except ApiError as e:
+            if e.status != 409:
+                raise
+            # Changed on the server since the manifest was read, this file wins as with a full upload
+            logger.warning(f"{document_name} changed during the delta update, uploading in full")
+            return self._upload_in_full(file_path, document_name)
+
+        logger.info(f"Updated {document_name} with {new_bytes} of {size} bytes sent")
+        return {'document_name': document_name, 'size': size, 'sent_bytes': new_bytes, 'delta': True}
+
+    def _upload_in_full(self, file_path, document_name):
+        result = self.uploader.upload(file_path, document_name)
+        return {'document_name': document_name, 'size': result['size'], 'sent_bytes': result['size'],
+                'delta': False}
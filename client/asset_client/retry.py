@@ -0,0 +1,43 @@
+import random
+import time
+
+# Statuses worth retrying: throttling and transient server or gateway errors
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter.
+
+    Each retry sleeps a random time between zero and base_delay * 2**attempt, capped at
+    max_delay, so clients that failed together do not retry together.
+    """
+
+    def __init__(self, max_attempts=5, base_delay=0.5, max_delay=20.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt):
+        """Return the sleep before retry number attempt (0 based)."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def call(self, operation, is_retryable, logger=None):
+        """
+        Call operation until it succeeds, raises a non-retryable error or attempts run out.
+
+        Args:
+            operation (callable): The zero-argument call to make.
+            is_retryable (callable): Takes the raised exception, returns whether to retry.
+            logger (logging.Logger): Optional logger for retry messages.
+        """
+        for attempt in range(self.max_attempts):
+            try:
+                return operation()
+            except Exception as e:
+                if attempt == self.max_attempts - 1 or not is_retryable(e):
+                    raise
+                delay = self.delay(attempt)
+                if logger:
+                    logger.warning(f"Attempt {attempt + 1} failed ({e}), retrying in {delay:.2f}s")
+                time.sleep(delay)
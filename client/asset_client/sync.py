@@ -0,0 +1,120 @@
+import json
+import logging
+import os
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+# Written to the synced directory, records what was uploaded so unchanged files are skipped
+SYNC_STATE_FILE = '.asset-sync.json'
+
+
+def iter_local_files(root):
+    """Yield (document name, path) for every file under root, with '/' separated names."""
+    for directory, subdirectories, files in os.walk(root):
+        subdirectories[:] = sorted(name for name in subdirectories if not name.startswith('.'))
+        for name in sorted(files):
+            if name.startswith('.'):
+                continue
+            path = os.path.join(directory, name)
+            yield os.path.relpath(path, root).replace(os.sep, '/'), path
+
+
+def load_state(root):
+    """Load the sync state of a directory: document name -> {size, mtime_ns, etag}."""
+    try:
+        with open(os.path.join(root, SYNC_STATE_FILE), 'r', encoding='utf-8') as state_file:
+            return json.load(state_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(root, state):
+    """Atomically write the sync state of a directory."""
+    descriptor, temporary_path = tempfile.mkstemp(dir=root, prefix='.asset-sync-')
+    with os.fdopen(descriptor, 'w', encoding='utf-8') as state_file:
+        json.dump(state, state_file, indent=1, sort_keys=True)
+    os.replace(temporary_path, os.path.join(root, SYNC_STATE_FILE))
+
+
+def plan_sync(root, prefix, remote, state):
+    """
+    Decide which files to upload and which remote documents to delete.
+
+    A file is uploaded when it is not on the server, or when its size, modification time
+    or the server's ETag differs from what the last sync recorded. An ETag the last sync
+    could not record, as the document was not listed yet, is taken from this listing.
+
+    Returns:
+        tuple: ([(document name, path)] to upload, [document name] only on the server).
+    """
+    uploads, local_names = [], set()
+    for relative_name, path in iter_local_files(root):
+        document_name = f'{prefix}{relative_name}'
+        local_names.add(document_name)
+        stat = os.stat(path)
+        recorded = state.get(document_name)
+        item = remote.get(document_name)
+        unchanged = (
+            item is not None and recorded is not None
+            and recorded['size'] == stat.st_size and recorded['mtime_ns'] == stat.st_mtime_ns
+            and recorded['etag'] in (None, item.get('etag'))
+        )
+        if not unchanged:
+            uploads.append((document_name, path))
+        elif recorded['etag'] is None:
+            recorded['etag'] = item.get('etag')
+
+    orphans = sorted(name for name in remote if name.startswith(prefix) and name not in local_names)
+    return uploads, orphans
+
+
+def sync_directory(api, uploader, root, prefix='', delete=False, file_workers=2, dry_run=False):
+    """
+    Upload new and changed files under root, optionally deleting documents removed locally.
+
+    Files are uploaded file_workers at a time, each with the uploader's parallel parts,
+    their uploads started in batches. A failed file does not stop the others; its manifest
+    lets the next sync resume it.
+
+    Documents are registered from S3's notifications, so some uploaded moments ago may not
+    be listed yet when their ETags are recorded; the next sync records those.
+
+    Returns:
+        dict: Counts of uploaded, failed, deleted and unchanged documents.
+    """
+    remote = {item['document_name']: item for item in api.list_assets()}
+    state = load_state(root)
+    uploads, orphans = plan_sync(root, prefix, remote, state)
+    total_local = sum(1 for _ in iter_local_files(root))
+    logger.info(f"{len(uploads)} to upload, {len(orphans) if delete else 0} to delete, "
+                f"{total_local - len(uploads)} unchanged")
+
+    if dry_run:
+        for document_name, _ in uploads:
+            print(f'upload {document_name}')
+        for document_name in orphans if delete else []:
+            print(f'delete {document_name}')
+        return {'uploaded': 0, 'failed': 0, 'deleted': 0, 'unchanged': total_local - len(uploads)}
+
+    stats = {document_name: os.stat(path) for document_name, path in uploads}
+    results, failed = uploader.upload_many([(path, document_name) for document_name, path in uploads], file_workers)
+    uploaded = {document_name: {'size': stats[document_name].st_size, 'mtime_ns': stats[document_name].st_mtime_ns}
+                for document_name in results}
+
+    deleted = 0
+    if delete:
+        for document_name in orphans:
+            api.delete_asset(document_name)
+            state.pop(document_name, None)
+            deleted += 1
+
+    # Record the server's ETags, so the next sync can tell whether anything changed there
+    if uploaded:
+        etags = {item['document_name']: item.get('etag') for item in api.list_assets()}
+        for document_name, recorded in uploaded.items():
+            state[document_name] = {**recorded, 'etag': etags.get(document_name)}
+    save_state(root, state)
+
+    return {'uploaded': len(uploaded), 'failed': len(failed), 'deleted': deleted,
+            'unchanged': total_local - len(uploads)}
@@ -0,0 +1,449 @@
+import hashlib
+import json
+import logging
+import mimetypes
+import mmap
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .api import ApiError, base64_checksum, is_retryable, request
+from .retry import RetryPolicy
+
+logger = logging.getLogger(__name__)
+
+MIN_PART_SIZE = 5 * 1024 * 1024        # S3 minimum for every part but the last
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+MAX_PARTS = 10000                      # S3 limit per upload
+MANIFEST_VERSION = 1
+
+# Limits of one multipart_batch_start_upload request
+BATCH_MAX_FILES = 500
+BATCH_MAX_URLS = 2000
+
+
+def choose_part_size(size, part_size=DEFAULT_PART_SIZE):
+    """Return a part size of at least part_size that keeps the upload within MAX_PARTS."""
+    part_size = max(part_size, MIN_PART_SIZE)
+    while -(-size // part_size) > MAX_PARTS:
+        part_size *= 2
+    return part_size
+
+
+class UploadManifest:
+    """
+    On-disk record of an in-progress multipart upload, so an interrupted upload resumes
+    from its last completed part instead of starting over.
+
+    The manifest is rewritten atomically after every part, and only matches the same
+    file, unchanged since the upload started, uploaded under the same name.
+    """
+
+    def __init__(self, path, state):
+        self.path = path
+        self.state = state
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_file(cls, manifest_dir, file_path, document_name):
+        """Return the manifest path used for a file and document name."""
+        digest = hashlib.sha256(f'{os.path.abspath(file_path)}\0{document_name}'.encode('utf-8')).hexdigest()
+        return os.path.join(manifest_dir, f'{digest[:32]}.json')
+
+    @classmethod
+    def load(cls, path, fingerprint):
+        """Load the manifest at path if it belongs to a file with this fingerprint."""
+        try:
+            with open(path, 'r', encoding='utf-8') as manifest_file:
+                state = json.load(manifest_file)
+        except (OSError, ValueError):
+            return None
+        if state.get('version') != MANIFEST_VERSION or state.get('fingerprint') != fingerprint:
+            return None
+        return cls(path, state)
+
+    def record_part(self, part):
+        """Record a completed part and persist the manifest."""
+        with self._lock:
+            self.state['parts'][str(part['PartNumber'])] = part
+            self.save()
+
+    def completed_parts(self):
+        """Return the completed parts, ordered by part number."""
+        return sorted(self.state['parts'].values(), key=lambda part: part['PartNumber'])
+
+    def save(self):
+        """Write the manifest to a temporary file and rename it into place."""
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+        descriptor, temporary_path = tempfile.mkstemp(dir=directory, prefix='.manifest-')
+        with os.fdopen(descriptor, 'w', encoding='utf-8') as manifest_file:
+            json.dump(self.state, manifest_file)
+        os.replace(temporary_path, self.path)
+
+    def delete(self):
+        """Remove the manifest once the upload has completed or been abandoned."""
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class UploadExpired(Exception):
+    """The upload a manifest refers to no longer exists, e.g. it was swept as stale."""
+
+
+class MultipartUploader:
+    """
+    Parallel, resumable multipart uploads through the platform's multipart endpoints.
+
+    Parts are read from memory-mapped slices of the file, one per worker, so at most
+    max_workers parts are in flight and no part is copied into the Python heap. Every part
+    carries its SHA-256 checksum, which the presigned URL is signed over. upload_many
+    starts the uploads of many files with one request per batch.
+    """
+
+    def __init__(self, api, max_workers=4, part_size=DEFAULT_PART_SIZE, manifest_dir=None,
+                 retry=None, timeout=300):
+        self.api = api
+        self.max_workers = max_workers
+        self.part_size = part_size
+        self.manifest_dir = manifest_dir or os.path.join(os.path.expanduser('~'), '.asset-client', 'uploads')
+        self.retry = retry or RetryPolicy()
+        self.timeout = timeout
+
+    def upload(self, file_path, document_name=None, content_type=None, progress=None):
+        """
+        Upload a file, resuming a previous attempt when a matching manifest exists.
+
+        Args:
+            file_path (str): The local file.
+            document_name (str): The document name, defaults to the file name.
+            content_type (str): The content type, guessed from the name by default.
+            progress (callable): Called with (bytes_done, bytes_total) after each part.
+
+        Returns:
+            dict: The document name, size and number of parts.
+        """
+        document_name = document_name or os.path.basename(file_path)
+        try:
+            return self._upload(file_path, document_name, content_type, progress)
+        except UploadExpired:
+            logger.warning(f"Upload for {document_name} expired, starting over")
+            os.remove(UploadManifest.for_file(self.manifest_dir, file_path, document_name))
+            return self._upload(file_path, document_name, content_type, progress)
+
+    def _upload(self, file_path, document_name, content_type, progress):
+        stat = os.stat(file_path)
+        part_size = choose_part_size(stat.st_size, self.part_size)
+        fingerprint = {'document_name': document_name, 'size': stat.st_size,
+                       'mtime_ns': stat.st_mtime_ns, 'part_size': part_size}
+        manifest_path = UploadManifest.for_file(self.manifest_dir, file_path, document_name)
+
+        with open(file_path, 'rb') as source:
+            # mmap cannot map an empty file, an empty document is a single empty part
+            mapped = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size else b''
+            try:
+                manifest = UploadManifest.load(manifest_path, fingerprint)
+                if manifest:
+                    logger.info(f"Resuming upload of {document_name} with "
+                                f"{len(manifest.state['parts'])}/{len(manifest.state['checksums'])} parts done")
+                else:
+                    manifest = self._start(manifest_path, fingerprint, mapped, document_name, content_type)
+                parts = self._finish(manifest, mapped, document_name, progress)
+            finally:
+                if isinstance(mapped, mmap.mmap):
+                    mapped.close()
+
+        manifest.delete()
+        logger.info(f"Uploaded {document_name} ({stat.st_size} bytes in {len(parts)} parts)")
+        return {'document_name': document_name, 'size': stat.st_size, 'parts': len(parts)}
+
+    def _finish(self, manifest, mapped, document_name, progress, presigned=None):
+        """Upload the remaining parts and complete the upload, returning its parts."""
+        self._upload_parts(manifest, mapped, document_name, progress, presigned)
+        parts = manifest.completed_parts()
+        self.api.complete_multipart_upload(manifest.state['upload_id'], document_name, parts)
+        return parts
+
+    def upload_many(self, files, file_workers=2):
+        """
+        Upload many files, such as a folder, starting their uploads in batches.
+
+        Instead of a start and a presign request per file, the files' uploads are started
+        with one multipart_batch_start_upload request per BATCH_MAX_FILES files: files of a
+        single part get a presigned PUT of the whole file, larger ones a multipart upload
+        with all its part URLs, so only those need a request of their own, to complete.
+        Files with a resumable manifest, too many parts for a batch, or whose start failed
+        in the batch go through upload. Batches are checksummed while the previous one
+        uploads, file_workers files at a time.
+
+        Args:
+            files (list): (file path, document name) pairs.
+            file_workers (int): Files uploaded at once, each with max_workers parallel parts.
+
+        Returns:
+            tuple: ({document name: upload result}, {document name: exception} of failed files).
+        """
+        results, failures = {}, {}
+        batchable = []
+        with ThreadPoolExecutor(max_workers=file_workers) as executor:
+            futures = {}
+            for file_path, document_name in files:
+                if self._batchable(file_path, document_name):
+                    batchable.append((file_path, document_name))
+                else:
+                    futures[executor.submit(self.upload, file_path, document_name)] = document_name
+
+            for batch in self._batches(batchable):
+                try:
+                    tasks = self._start_batch(batch)
+                except Exception as e:
+                    logger.error(f"Failed to start a batch of {len(batch)} uploads: {e}")
+                    failures.update((entry['fingerprint']['document_name'], e) for entry in batch)
+                    continue
+                for document_name, task in tasks:
+                    futures[executor.submit(task)] = document_name
+
+            for future, document_name in futures.items():
+                try:
+                    results[document_name] = future.result()
+                except Exception as e:
+                    logger.error(f"Failed to upload {document_name}: {e}")
+                    failures[document_name] = e
+        return results, failures
+
+    def _batchable(self, file_path, document_name):
+        """Whether a file can start in a batch: no upload to resume and few enough parts."""
+        stat = os.stat(file_path)
+        part_size = choose_part_size(stat.st_size, self.part_size)
+        if part_size != max(self.part_size, MIN_PART_SIZE):
+            return False
+        if len(part_ranges(stat.st_size, part_size)) > BATCH_MAX_URLS:
+            return False
+        return not os.path.exists(UploadManifest.for_file(self.manifest_dir, file_path, document_name))
+
+    def _batches(self, files):
+        """Checksum files and group them into batches within BATCH_MAX_FILES and BATCH_MAX_URLS."""
+        part_size = max(self.part_size, MIN_PART_SIZE)
+        batch, urls = [], 0
+        for file_path, document_name in files:
+            stat = os.stat(file_path)
+            parts = len(part_ranges(stat.st_size, part_size))
+            if batch and (len(batch) == BATCH_MAX_FILES or urls + parts > BATCH_MAX_URLS):
+                yield self._checksum_batch(batch, part_size)
+                batch, urls = [], 0
+            batch.append((file_path, document_name, stat))
+            urls += parts
+        if batch:
+            yield self._checksum_batch(batch, part_size)
+
+    def _checksum_batch(self, batch, part_size):
+        """Checksum every part of a batch's files, max_workers parts at a time."""
+        ranges = [(file_path, start, end) for file_path, _, stat in batch
+                  for start, end in part_ranges(stat.st_size, part_size)]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            checksums = iter(list(executor.map(lambda part: sha256_range(*part), ranges)))
+
+        prepared = []
+        for file_path, document_name, stat in batch:
+            prepared.append({
+                'file_path': file_path,
+                'fingerprint': {'document_name': document_name, 'size': stat.st_size,
+                                'mtime_ns': stat.st_mtime_ns, 'part_size': part_size},
+                'checksums': [next(checksums) for _ in part_ranges(stat.st_size, part_size)]
+            })
+        return prepared
+
+    def _start_batch(self, batch):
+        """Start a batch's uploads, returning (document name, task) pairs that upload each file."""
+        files = [{'filename': entry['fingerprint']['document_name'], 'size': entry['fingerprint']['size'],
+                  'checksums': entry['checksums']} for entry in batch]
+        for file in files:
+            content_type = mimetypes.guess_type(file['filename'])[0]
+            if content_type:
+                file['content_type'] = content_type
+        started = self.api.start_uploads(files, batch[0]['fingerprint']['part_size'], 'SHA256')
+        logger.info(f"Started {len(started['uploads'])} uploads in one request, {len(started['failed'])} failed")
+
+        entries = {entry['fingerprint']['document_name']: entry for entry in batch}
+        tasks = []
+        for upload in started['uploads']:
+            entry = entries[upload['filename']]
+            if 'url' in upload:
+                task = lambda entry=entry, upload=upload: self._put_whole(entry, upload, started['checksumHeader'])
+            else:
+                task = lambda entry=entry, upload=upload: self._upload_started(entry, upload, started['checksumHeader'])
+            tasks.append((upload['filename'], task))
+        for failure in started['failed']:
+            # Starting one upload of a batch can fail on its own, try it again by itself
+            logger.warning(f"Batch start failed for {failure['filename']}: {failure['error']}")
+            tasks.append((failure['filename'], lambda entry=entries[failure['filename']]:
+                          self.upload(entry['file_path'], entry['fingerprint']['document_name'])))
+        return tasks
+
+    def _put_whole(self, entry, upload, checksum_header):
+        """PUT a single-part file to its presigned URL; the server registers it from the bucket's notification."""
+        document_name, size = entry['fingerprint']['document_name'], entry['fingerprint']['size']
+        with open(entry['file_path'], 'rb') as source:
+            data = source.read()
+        try:
+            self.retry.call(lambda: request('PUT', upload['url'], data, {
+                'Content-Type': upload['contentType'], checksum_header: entry['checksums'][0]
+            }, self.timeout), is_retryable, logger)
+        except ApiError as e:
+            if e.status != 403:
+                raise
+            # The URL expired before its turn came, a multipart upload needs no batch to start
+            logger.warning(f"Presigned PUT of {document_name} expired, uploading it by itself")
+            return self.upload(entry['file_path'], document_name)
+        logger.info(f"Uploaded {document_name} ({size} bytes in a single PUT)")
+        return {'document_name': document_name, 'size': size, 'parts': 1}
+
+    def _upload_started(self, entry, upload, checksum_header):
+        """Upload the parts of a multipart upload started in a batch, and complete it."""
+        document_name = entry['fingerprint']['document_name']
+        manifest = UploadManifest(UploadManifest.for_file(self.manifest_dir, entry['file_path'], document_name), {
+            'version': MANIFEST_VERSION,
+            'fingerprint': entry['fingerprint'],
+            'upload_id': upload['uploadId'],
+            'checksums': entry['checksums'],
+            'parts': {}
+        })
+        manifest.save()
+        presigned = PresignedUrls(self.api, upload['uploadId'], document_name, entry['checksums'],
+                                  urls=upload['partUrls'], header=checksum_header)
+
+        with open(entry['file_path'], 'rb') as source:
+            mapped = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                parts = self._finish(manifest, mapped, document_name, None, presigned)
+            except UploadExpired:
+                logger.warning(f"Upload for {document_name} expired, starting over")
+                manifest.delete()
+                return self.upload(entry['file_path'], document_name)
+            finally:
+                mapped.close()
+
+        manifest.delete()
+        logger.info(f"Uploaded {document_name} ({entry['fingerprint']['size']} bytes in {len(parts)} parts)")
+        return {'document_name': document_name, 'size': entry['fingerprint']['size'], 'parts': len(parts)}
+
+    def _start(self, manifest_path, fingerprint, mapped, document_name, content_type):
+        """Checksum every part, start the upload and write its manifest."""
+        part_size = fingerprint['part_size']
+        ranges = part_ranges(fingerprint['size'], part_size)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            # hashlib releases the GIL on large buffers, so parts hash in parallel
+            checksums = list(executor.map(lambda bounds: sha256_slice(mapped, *bounds), ranges))
+
+        content_type = content_type or mimetypes.guess_type(document_name)[0]
+        started = self.api.start_multipart_upload(document_name, content_type, 'SHA256')
+        manifest = UploadManifest(manifest_path, {
+            'version': MANIFEST_VERSION,
+            'fingerprint': fingerprint,
+            'upload_id': started['uploadId'],
+            'checksums': checksums,
+            'parts': {}
+        })
+        manifest.save()
+        return manifest
+
+    def _upload_parts(self, manifest, mapped, document_name, progress, presigned=None):
+        """Upload the parts the manifest does not have yet, max_workers at a time."""
+        state = manifest.state
+        size, part_size = state['fingerprint']['size'], state['fingerprint']['part_size']
+        ranges = part_ranges(size, part_size)
+        pending = [number for number in range(1, len(ranges) + 1) if str(number) not in state['parts']]
+        if not pending:
+            return
+
+        presigned = presigned or PresignedUrls(self.api, state['upload_id'], document_name, state['checksums'])
+        done = [sum(ranges[int(number) - 1][1] - ranges[int(number) - 1][0] for number in state['parts'])]
+        done_lock = threading.Lock()
+
+        def upload_one(number):
+            start, end = ranges[number - 1]
+            part = self._put_part(presigned, number, mapped, start, end, state['checksums'][number - 1])
+            manifest.record_part(part)
+            if progress:
+                with done_lock:
+                    done[0] += end - start
+                    progress(done[0], size)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            # list() re-raises the first failure; finished parts are already in the manifest
+            list(executor.map(upload_one, pending))
+
+    def _put_part(self, presigned, number, mapped, start, end, checksum):
+        """PUT one part from its slice of the mapped file, refreshing expired URLs."""
+        def attempt():
+            url, checksum_header = presigned.get(number)
+            with memoryview(mapped) as whole, whole[start:end] as body:
+                try:
+                    _, headers, _ = request('PUT', url, body, {
+                        'Content-Type': 'application/octet-stream', checksum_header: checksum
+                    }, self.timeout)
+                except ApiError as e:
+                    if e.status == 403:
+                        presigned.refresh(url)
+                    elif e.status == 404:
+                        raise UploadExpired(str(e)) from None
+                    raise
+            return {'PartNumber': number, 'ETag': headers.get('ETag') or headers.get('etag'),
+                    'ChecksumSHA256': checksum}
+
+        # A 403 is usually an expired URL, worth retrying once it has been refreshed
+        return self.retry.call(attempt, lambda e: is_retryable(e) or getattr(e, 'status', None) == 403, logger)
+
+
+class PresignedUrls:
+    """
+    Thread-safe holder of an upload's part URLs, re-presigned when they expire.
+
+    URLs presigned when the upload started, in a batch, are passed as urls and header.
+    """
+
+    def __init__(self, api, upload_id, document_name, checksums, urls=None, header=None):
+        self.api = api
+        self.upload_id = upload_id
+        self.document_name = document_name
+        self.checksums = checksums
+        self._lock = threading.Lock()
+        self._urls, self._header = urls, header
+
+    def get(self, number):
+        with self._lock:
+            if self._urls is None:
+                self._fetch()
+            return self._urls[number - 1], self._header
+
+    def refresh(self, stale_url):
+        """Presign again, unless another worker already replaced the stale URL."""
+        with self._lock:
+            if self._urls is not None and stale_url in self._urls:
+                self._fetch()
+
+    def _fetch(self):
+        response = self.api.generate_presigned_urls(self.upload_id, self.document_name, self.checksums, 'SHA256')
+        self._urls, self._header = response['partUrls'], response['checksumHeader']
+
+
+def part_ranges(size, part_size):
+    """Return the [start, end) byte range of every part; an empty file has one empty part."""
+    if size == 0:
+        return [(0, 0)]
+    return [(start, min(start + part_size, size)) for start in range(0, size, part_size)]
+
+
+def sha256_slice(mapped, start, end):
+    """Return the base64 SHA-256 of a slice of the mapped file."""
+    with memoryview(mapped) as whole, whole[start:end] as view:
+        return base64_checksum(hashlib.sha256(view).digest())
+
+
+def sha256_range(file_path, start, end):
+    """Return the base64 SHA-256 of a byte range of a file, read in one go."""
+    with open(file_path, 'rb') as source:
+        source.seek(start)
+        return base64_checksum(hashlib.sha256(source.read(end - start)).digest())
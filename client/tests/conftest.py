@@ -0,0 +1,120 @@
+"""
+Fixtures for the client tests: a moto S3 server and a stand-in for the platform's API.
+
+LocalApi starts, presigns, completes and lists uploads directly against moto, the way the
+Lambdas do against S3, while parts and whole files travel over real HTTP to moto's
+presigned URLs, so the transfer engine runs end to end without AWS.
+"""
+import os
+import socket
+import sys
+
+import boto3
+import pytest
+from moto.server import ThreadedMotoServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+BUCKET = 'e2e-assets'
+USER_ID = 'e2e-user'
+
+
+class LocalApi:
+    """The subset of AssetsApiClient the transfer engine and sync use, backed by moto."""
+
+    def __init__(self, s3):
+        self.s3 = s3
+        self.calls = []
+
+    def _key(self, name):
+        return f'{USER_ID}/{name}'
+
+    def start_multipart_upload(self, filename, content_type=None, checksum_algorithm='SHA256'):
+        self.calls.append('start')
+        response = self.s3.create_multipart_upload(Bucket=BUCKET, Key=self._key(filename),
+                                                   ContentType=content_type or 'application/octet-stream',
+                                                   ChecksumAlgorithm=checksum_algorithm)
+        return {'uploadId': response['UploadId'], 'checksumAlgorithm': checksum_algorithm}
+
+    def start_uploads(self, files, part_size, checksum_algorithm='SHA256'):
+        self.calls.append('batch start')
+        uploads = []
+        for file in files:
+            content_type = file.get('content_type') or 'application/octet-stream'
+            if len(file['checksums']) == 1:
+                url = self.s3.generate_presigned_url('put_object', Params={
+                    'Bucket': BUCKET, 'Key': self._key(file['filename']), 'ContentType': content_type,
+                    f'Checksum{checksum_algorithm}': file['checksums'][0]
+                }, ExpiresIn=3600)
+                uploads.append({'filename': file['filename'], 'contentType': content_type, 'url': url})
+                continue
+            upload_id = self.s3.create_multipart_upload(Bucket=BUCKET, Key=self._key(file['filename']),
+                                                        ContentType=content_type,
+                                                        ChecksumAlgorithm=checksum_algorithm)['UploadId']
+            urls = [self.s3.generate_presigned_url('upload_part', Params={
+                'Bucket': BUCKET, 'Key': self._key(file['filename']), 'UploadId': upload_id,
+                'PartNumber': number, f'Checksum{checksum_algorithm}': checksum
+            }, ExpiresIn=3600) for number, checksum in enumerate(file['checksums'], start=1)]
+            uploads.append({'filename': file['filename'], 'uploadId': upload_id, 'partUrls': urls})
+        return {'checksumAlgorithm': checksum_algorithm, 'partSize': part_size, 'uploads': uploads, 'failed': [],
+                'checksumHeader': f'x-amz-checksum-{checksum_algorithm.lower()}'}
+
+    def generate_presigned_urls(self, upload_id, filename, checksums, checksum_algorithm='SHA256'):
+        self.calls.append('presign')
+        urls = [self.s3.generate_presigned_url('upload_part', Params={
+            'Bucket': BUCKET, 'Key': self._key(filename), 'UploadId': upload_id,
+            'PartNumber': number, f'Checksum{checksum_algorithm}': checksum
+        }, ExpiresIn=3600) for number, checksum in enumerate(checksums, start=1)]
+        return {'partUrls': urls, 'checksumHeader': f'x-amz-checksum-{checksum_algorithm.lower()}'}
+
+    def complete_multipart_upload(self, upload_id, filename, parts):
+        self.calls.append('complete')
+        self.s3.complete_multipart_upload(Bucket=BUCKET, Key=self._key(filename), UploadId=upload_id,
+                                          MultipartUpload={'Parts': parts})
+
+    def abort_multipart_upload(self, upload_id, filename):
+        self.s3.abort_multipart_upload(Bucket=BUCKET, Key=self._key(filename), UploadId=upload_id)
+
+    def list_assets(self, limit=None):
+        paginator = self.s3.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=BUCKET, Prefix=f'{USER_ID}/'):
+            for item in page.get('Contents', []):
+                yield {'document_name': item['Key'].split('/', 1)[1], 'size': item['Size'],
+                       'etag': item['ETag'].strip('"')}
+
+    def view_asset(self, document_name):
+        return self.s3.get_object(Bucket=BUCKET, Key=self._key(document_name))['Body'].read()
+
+    def delete_asset(self, document_name):
+        self.s3.delete_object(Bucket=BUCKET, Key=self._key(document_name))
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+@pytest.fixture(scope='session')
+def moto_endpoint():
+    """A moto server for the test session."""
+    port = free_port()
+    server = ThreadedMotoServer(ip_address='127.0.0.1', port=port)
+    server.start()
+    yield f'http://127.0.0.1:{port}'
+    server.stop()
+
+
+@pytest.fixture
+def api(moto_endpoint):
+    """A LocalApi over a fresh bucket."""
+    s3 = boto3.client('s3', endpoint_url=moto_endpoint, region_name='us-east-1',
+                      aws_access_key_id='testing', aws_secret_access_key='testing')
+    s3.create_bucket(Bucket=BUCKET)
+    yield LocalApi(s3)
+    for page in s3.get_paginator('list_objects_v2').paginate(Bucket=BUCKET):
+        for item in page.get('Contents', []):
+            s3.delete_object(Bucket=BUCKET, Key=item['Key'])
+    for upload in s3.list_multipart_uploads(Bucket=BUCKET).get('Uploads', []):
+        s3.abort_multipart_upload(Bucket=BUCKET, Key=upload['Key'], UploadId=upload['UploadId'])
+    s3.delete_bucket(Bucket=BUCKET)
@@ -0,0 +1,64 @@
+import os
+
+import pytest
+
+from asset_client import MultipartUploader, sync_directory
+from asset_client.sync import load_state, plan_sync
+
+
+def write_tree(root, files):
+    for name, content in files.items():
+        path = os.path.join(root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as target:
+            target.write(content)
+
+
+@pytest.fixture
+def uploader(api, tmp_path):
+    return MultipartUploader(api, max_workers=4, part_size=5 * 1048576, manifest_dir=str(tmp_path / 'manifests'))
+
+
+def test_sync_uploads_changes_and_deletes_removed_files(api, uploader, tmp_path):
+    tree = str(tmp_path / 'tree')
+    write_tree(tree, {name: '' if name == 'empty.txt' else f'content of {name}\n'
+                      for name in ('a.txt', 'docs/b.txt', 'docs/deep/c.txt', 'empty.txt')})
+
+    api.calls.clear()
+    first = sync_directory(api, uploader, tree, prefix='tree/')
+    assert first == {'uploaded': 4, 'failed': 0, 'deleted': 0, 'unchanged': 0}
+    assert api.calls == ['batch start']
+
+    with open(os.path.join(tree, 'docs/b.txt'), 'a') as changed:
+        changed.write('more\n')
+    os.remove(os.path.join(tree, 'a.txt'))
+    second = sync_directory(api, uploader, tree, prefix='tree/', delete=True)
+    assert second == {'uploaded': 1, 'failed': 0, 'deleted': 1, 'unchanged': 2}
+    assert api.view_asset('tree/docs/b.txt') == b'content of docs/b.txt\nmore\n'
+
+    third = sync_directory(api, uploader, tree, prefix='tree/', delete=True)
+    assert third == {'uploaded': 0, 'failed': 0, 'deleted': 0, 'unchanged': 3}
+
+
+def test_etag_missing_at_upload_is_recorded_from_the_next_listing(tmp_path):
+    tree = str(tmp_path / 'tree')
+    write_tree(tree, {'a.txt': 'a'})
+    stat = os.stat(os.path.join(tree, 'a.txt'))
+    # Registered from the bucket's notification after the post-upload listing
+    state = {'a.txt': {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'etag': None}}
+
+    uploads, orphans = plan_sync(tree, '', {'a.txt': {'document_name': 'a.txt', 'etag': 'e1'}}, state)
+
+    assert uploads == [] and orphans == []
+    assert state['a.txt']['etag'] == 'e1'
+
+    uploads, _ = plan_sync(tree, '', {'a.txt': {'document_name': 'a.txt', 'etag': 'e2'}}, state)
+    assert uploads == [('a.txt', os.path.join(tree, 'a.txt'))]
+
+
+def test_dry_run_changes_nothing(api, uploader, tmp_path):
+    tree = str(tmp_path / 'tree')
+    write_tree(tree, {'a.txt': 'a'})
+
+    assert sync_directory(api, uploader, tree, dry_run=True)['uploaded'] == 0
+    assert api.calls == [] and load_state(tree) == {}
@@ -0,0 +1,84 @@
+import hashlib
+import os
+import random
+
+import pytest
+
+from asset_client import MultipartUploader
+
+PART_SIZE = 5 * 1048576
+
+
+class Interrupted(Exception):
+    pass
+
+
+def write_random(path, size, seed=7):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    data = random.Random(seed).randbytes(size)
+    with open(path, 'wb') as target:
+        target.write(data)
+    return data
+
+
+@pytest.fixture
+def uploader(api, tmp_path):
+    return MultipartUploader(api, max_workers=4, part_size=PART_SIZE, manifest_dir=str(tmp_path / 'manifests'))
+
+
+def test_interrupted_upload_resumes_from_its_manifest(api, uploader, tmp_path):
+    path = str(tmp_path / 'large.bin')
+    data = write_random(path, 16 * 1048576)
+
+    # Interrupt once roughly half of the bytes are up
+    def interrupt(done, total):
+        if done >= total // 2:
+            raise Interrupted()
+
+    with pytest.raises(Interrupted):
+        uploader.upload(path, 'large.bin', progress=interrupt)
+    assert len(os.listdir(uploader.manifest_dir)) == 1
+    assert 'complete' not in api.calls
+
+    api.calls.clear()
+    result = uploader.upload(path, 'large.bin')
+
+    # Parts already in flight may finish after the interrupt, leaving nothing to presign
+    assert 'start' not in api.calls and api.calls[-1] == 'complete'
+    assert not os.listdir(uploader.manifest_dir)
+    assert result == {'document_name': 'large.bin', 'size': len(data), 'parts': 4}
+    assert hashlib.sha256(api.view_asset('large.bin')).digest() == hashlib.sha256(data).digest()
+
+
+def test_upload_many_starts_every_upload_in_one_request(api, uploader, tmp_path):
+    files = {f'small-{index}.bin': write_random(str(tmp_path / f'small-{index}.bin'), index * 1000, index)
+             for index in range(5)}
+    files['large.bin'] = write_random(str(tmp_path / 'large.bin'), 2 * PART_SIZE + 1)
+
+    results, failures = uploader.upload_many([(str(tmp_path / name), name) for name in files])
+
+    assert not failures
+    assert api.calls.count('batch start') == 1 and 'start' not in api.calls and 'presign' not in api.calls
+    assert api.calls.count('complete') == 1
+    assert results['large.bin']['parts'] == 3 and results['small-3.bin']['parts'] == 1
+    for name, data in files.items():
+        assert api.view_asset(name) == data
+    assert not os.listdir(uploader.manifest_dir)
+
+
+def test_upload_many_resumes_files_with_a_manifest(api, uploader, tmp_path):
+    path = str(tmp_path / 'large.bin')
+    data = write_random(path, 3 * PART_SIZE)
+
+    def interrupt(done, total):
+        raise Interrupted()
+
+    with pytest.raises(Interrupted):
+        uploader.upload(path, 'large.bin', progress=interrupt)
+    api.calls.clear()
+
+    results, failures = uploader.upload_many([(path, 'large.bin')])
+
+    assert not failures and results['large.bin']['parts'] == 3
+    assert 'batch start' not in api.calls and 'start' not in api.calls
+    assert api.view_asset('large.bin') == data
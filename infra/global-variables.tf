@@ -68,3 +68,15 @@ variable "lambda_role_base_name" {
   description = "Base name for Lambda execution role"
   default     = "lambda-exec-role"
 }
+
+# Client-side envelope encryption of uploaded documents, "envelope" or "off"
+variable "document_encryption" {
+  description = "DOCUMENT_ENCRYPTION of the Lambdas writing documents, envelope encrypts them under the documents KMS key"
+  default     = "off"
+}
+
+# Warm-up pings keep API Lambdas primed, set to "" to disable them
+variable "lambda_warmup_schedule" {
+  description = "Schedule expression of the warm-up event sent to every API Lambda"
+  default     = "rate(5 minutes)"
+}
@@ -7,6 +7,24 @@ locals {
   # DynamoDB table name
   dynamodb_table_name = "${var.environment}-${var.appname}-${var.dynamodb_table_base_name}"
 
+  # Per-user collection version counters, bumped on every metadata change
+  collection_versions_table_name = "${local.dynamodb_table_name}-versions"
+
+  # Status records of long-running jobs such as zip exports
+  jobs_table_name = "${local.dynamodb_table_name}-jobs"
+
+  # Idempotency records of upload requests, replayed to client retries
+  idempotency_table_name = "${local.dynamodb_table_name}-idempotency"
+
+  # SQS queue of background jobs, consumed by the process_jobs worker
+  job_queue_name = "${var.environment}-${var.appname}-jobs"
+
+  # SQS queue of the assets bucket's event notifications, consumed by register_metadata
+  metadata_events_queue_name = "${var.environment}-${var.appname}-metadata-events"
+
+  # KMS alias of the key wrapping document data keys
+  document_key_alias = "${var.environment}-${var.appname}-documents"
+
   # Cognito user pool names
   cognito_user_pool_name        = "${var.environment}-${var.appname}-${var.cognito_user_pool_base_name}"
   cognito_user_pool_client_name = "${var.environment}-${var.appname}-${var.cognito_user_pool_client_base_name}"
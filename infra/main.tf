@@ -8,6 +8,9 @@ module "iam" {
   digital_assets_bucket_name       = local.digital_assets_bucket_name       # used to assign IAM Role/Policies
   digital_assets_react_bucket_name = local.digital_assets_react_bucket_name # same as above
   dynamodb_table_name              = local.dynamodb_table_name
+  additional_dynamodb_table_names  = [local.collection_versions_table_name, local.jobs_table_name, local.idempotency_table_name]
+  self_invoking_lambda_names       = ["export_assets"]
+  sqs_queue_names                  = [local.job_queue_name, local.metadata_events_queue_name]
   lambda_role_name                 = local.lambda_role_name
   aws_region                       = var.aws_region
   cognito_user_pool_arn            = module.cognito.cognito_user_pool_arn
@@ -20,6 +23,20 @@ module "s3" {
   digital_assets_react_bucket_name = local.digital_assets_react_bucket_name
   cloudfront_distribution_arn      = module.cloudfront.cloudfront_distribution_arn
   environment                      = var.environment # Passing local environment to the module
+
+  # The sweeper aborts stale uploads after a day, the lifecycle rule catches anything it misses
+  abort_incomplete_multipart_upload_days = 7
+
+  # Export archives are only downloaded through short-lived presigned URLs
+  export_expiration_days = 1
+
+  # Every write and delete in the assets bucket, for register_metadata to record in the metadata table
+  asset_event_queues = [
+    {
+      arn    = module.metadata_events_queue.queue_arn
+      events = ["s3:ObjectCreated:*", "s3:ObjectRemoved:*"]
+    }
+  ]
 }
 
 # CloudFront Module
@@ -34,6 +51,61 @@ module "dynamodb" {
   source      = "./modules/dynamodb"
   table_name  = local.dynamodb_table_name
   environment = var.environment # Passing local environment to the module
+
+  collection_versions_table_name = local.collection_versions_table_name
+  jobs_table_name                = local.jobs_table_name
+  idempotency_table_name         = local.idempotency_table_name
+
+  # Lambdas consuming the metadata table's change stream
+  stream_consumers = {
+    "process_metadata_stream" = module.lambda.lambda_functions_by_name["process_metadata_stream"]
+    "index_document_content"  = module.lambda.lambda_functions_by_name["index_document_content"]
+    "derive_previews"         = module.lambda.lambda_functions_by_name["derive_previews"]
+  }
+
+  # Thumbnails of large images take seconds each, so previews are derived a few documents at a time
+  stream_consumer_batch_sizes = {
+    "derive_previews" = 10
+  }
+}
+
+# Job queue of the background job engine, see job_engine.py
+module "job_queue" {
+  source     = "./modules/sqs"
+  queue_name = local.job_queue_name
+
+  # Longer than the worker's timeout, so a message is not redelivered while its job runs
+  visibility_timeout_seconds = 960
+
+  # Beyond JOB_MAX_ATTEMPTS, so the engine records a stuck job as failed before SQS gives up on it
+  max_receive_count = 10
+
+  queue_consumers = {
+    "process_jobs" = module.lambda.lambda_functions_by_name["process_jobs"]
+  }
+}
+
+# S3 notifications of the assets bucket, registered in the metadata table by register_metadata
+module "metadata_events_queue" {
+  source             = "./modules/sqs"
+  queue_name         = local.metadata_events_queue_name
+  source_bucket_arns = ["arn:aws:s3:::${local.digital_assets_bucket_name}"]
+
+  visibility_timeout_seconds         = 120 # Longer than register_metadata's timeout
+  batch_size                         = 100
+  maximum_batching_window_in_seconds = 1 # Fold bursts of uploads into fewer, larger batch writes
+  maximum_concurrency                = 5
+
+  queue_consumers = {
+    "register_metadata" = module.lambda.lambda_functions_by_name["register_metadata"]
+  }
+}
+
+# KMS key wrapping the data keys of envelope encrypted documents
+module "kms" {
+  source      = "./modules/kms"
+  alias_name  = local.document_key_alias
+  description = "Wraps the data keys of envelope encrypted documents"
 }
 
 # Cognito Module
@@ -62,12 +134,12 @@ module "lambda" {
   aws_region                = var.aws_region
   lambda_execution_role_arn = module.iam.lambda_execution_role_arn
   python_runtime            = var.python_runtime
+  shared_layer_name         = "${var.environment}-${var.appname}-shared-dependencies"
 
   lambdas = {
     "register" = {
       description = ""
       handler     = "register.lambda_handler"
-      use_klayers = false
       environment_variables = {
         COGNITO_USER_POOL_CLIENT_ID = module.cognito.cognito_user_pool_client_id
       }
@@ -75,7 +147,6 @@ module "lambda" {
     "confirm_registration" = {
       handler     = "confirm_registration.lambda_handler"
       description = ""
-      use_klayers = false
       environment_variables = {
         COGNITO_USER_POOL_ID        = module.cognito.cognito_user_pool_id
         COGNITO_USER_POOL_CLIENT_ID = module.cognito.cognito_user_pool_client_id
@@ -84,7 +155,6 @@ module "lambda" {
     "resend_confirmation_code" = {
       handler     = "resend_confirmation_code.lambda_handler"
       description = ""
-      use_klayers = false
       environment_variables = {
         COGNITO_USER_POOL_CLIENT_ID = module.cognito.cognito_user_pool_client_id
       }
@@ -92,7 +162,6 @@ module "lambda" {
     "login" = {
       handler     = "login.lambda_handler"
       description = ""
-      use_klayers = false
       environment_variables = {
         COGNITO_USER_POOL_ID        = module.cognito.cognito_user_pool_id
         COGNITO_USER_POOL_CLIENT_ID = module.cognito.cognito_user_pool_client_id
@@ -101,35 +170,40 @@ module "lambda" {
     "upload_asset" = {
       handler     = "upload_asset.lambda_handler"
       description = ""
-      use_klayers = true
       environment_variables = {
         DIGITAL_ASSETS_BUCKET_NAME = local.digital_assets_bucket_name
         DYNAMODB_TABLE_NAME        = local.dynamodb_table_name
+        IDEMPOTENCY_TABLE_NAME     = local.idempotency_table_name
         COGNITO_USER_POOL_ID       = module.cognito.cognito_user_pool_id
+        DOCUMENT_COMPRESSION       = "auto"
+        DOCUMENT_ENCRYPTION        = var.document_encryption
+        DOCUMENT_KMS_KEY_ID        = module.kms.kms_key_arn
+        METADATA_REGISTRATION      = "events" # register_metadata writes the item
       }
     }
     "view_asset" = {
       handler     = "view_asset.lambda_handler"
       description = ""
-      use_klayers = true
       environment_variables = {
         DIGITAL_ASSETS_BUCKET_NAME = local.digital_assets_bucket_name
+        DOCUMENT_KMS_KEY_ID        = module.kms.kms_key_arn
         COGNITO_USER_POOL_ID       = module.cognito.cognito_user_pool_id
       }
     }
     "list_assets" = {
       handler     = "list_assets.lambda_handler"
       description = ""
-      use_klayers = true
       environment_variables = {
-        DYNAMODB_TABLE_NAME  = module.dynamodb.dynamodb_table_name
-        COGNITO_USER_POOL_ID = module.cognito.cognito_user_pool_id
+        DIGITAL_ASSETS_BUCKET_NAME     = local.digital_assets_bucket_name
+        DYNAMODB_TABLE_NAME            = module.dynamodb.dynamodb_table_name
+        COLLECTION_VERSIONS_TABLE_NAME = module.dynamodb.collection_versions_table_name
+        UPLOAD_DATE_INDEX_NAME         = module.dynamodb.upload_date_index_name
+        COGNITO_USER_POOL_ID           = module.cognito.cognito_user_pool_id
       }
     }
     "delete_asset" = {
       handler     = "delete_asset.lambda_handler"
       description = ""
-      use_klayers = true
       environment_variables = {
         DIGITAL_ASSETS_BUCKET_NAME = local.digital_assets_bucket_name
         DYNAMODB_TABLE_NAME        = module.dynamodb.dynamodb_table_name
@@ -139,26 +213,38 @@ module "lambda" {
     "update_asset" = {
       handler     = "update_asset.lambda_handler"
       description = ""
-      use_klayers = true
       environment_variables = {
         DIGITAL_ASSETS_BUCKET_NAME = local.digital_assets_bucket_name
         DYNAMODB_TABLE_NAME        = module.dynamodb.dynamodb_table_name
         COGNITO_USER_POOL_ID       = module.cognito.cognito_user_pool_id
+        DOCUMENT_COMPRESSION       = "auto"
+        DOCUMENT_ENCRYPTION        = var.document_encryption
+        DOCUMENT_KMS_KEY_ID        = module.kms.kms_key_arn
+        METADATA_REGISTRATION      = "events" # register_metadata writes the item
       }
     }
     "multipart_start_upload" = {
       handler     = "multipart_start_upload.lambda_handler"
       description = ""
-      use_klayers = true
       environment_variables = {
         DIGITAL_ASSETS_BUCKET_NAME = local.digital_assets_bucket_name
+        IDEMPOTENCY_TABLE_NAME     = local.idempotency_table_name
+        COGNITO_USER_POOL_ID       = module.cognito.cognito_user_pool_id
+      }
+    }
+    "multipart_batch_start_upload" = {
+      handler     = "multipart_batch_start_upload.lambda_handler"
+      description = "Starts the uploads of a folder's files in one request, presigning every PUT and part"
+      memory_size = 512 # Multipart uploads are started concurrently
+      environment_variables = {
+        DIGITAL_ASSETS_BUCKET_NAME = local.digital_assets_bucket_name
+        IDEMPOTENCY_TABLE_NAME     = local.idempotency_table_name
         COGNITO_USER_POOL_ID       = module.cognito.cognito_user_pool_id
       }
     }
     "multipart_generate_presigned_urls" = {
       handler     = "multipart_generate_presigned_urls.lambda_handler"
       description = ""
-      use_klayers = true
       environment_variables = {
         DIGITAL_ASSETS_BUCKET_NAME = local.digital_assets_bucket_name
         COGNITO_USER_POOL_ID       = module.cognito.cognito_user_pool_id
@@ -167,15 +253,227 @@ module "lambda" {
     "multipart_complete_upload" = {
       handler     = "multipart_complete_upload.lambda_handler"
       description = ""
-      use_klayers = true
       environment_variables = {
         DIGITAL_ASSETS_BUCKET_NAME = local.digital_assets_bucket_name
+        DYNAMODB_TABLE_NAME        = module.dynamodb.dynamodb_table_name
+        IDEMPOTENCY_TABLE_NAME     = local.idempotency_table_name
+        COGNITO_USER_POOL_ID       = module.cognito.cognito_user_pool_id
+        METADATA_REGISTRATION      = "events" # register_metadata writes the item
+      }
+    }
+    "multipart_abort_upload" = {
+      handler     = "multipart_abort_upload.lambda_handler"
+      description = ""
+      environment_variables = {
+        DIGITAL_ASSETS_BUCKET_NAME = local.digital_assets_bucket_name
+        COGNITO_USER_POOL_ID       = module.cognito.cognito_user_pool_id
+      }
+    }
+    "copy_asset" = {
+      handler     = "copy_asset.lambda_handler"
+      description = "Copies a document inside S3 with CopyObject or parallel UploadPartCopy"
+      environment_variables = {
+        DIGITAL_ASSETS_BUCKET_NAME = local.digital_assets_bucket_name
+        DYNAMODB_TABLE_NAME        = module.dynamodb.dynamodb_table_name
+        COGNITO_USER_POOL_ID       = module.cognito.cognito_user_pool_id
+      }
+    }
+    "rename_asset" = {
+      handler     = "rename_asset.lambda_handler"
+      description = "Moves a document to a new name inside S3, with the metadata moved in one transaction"
+      environment_variables = {
+        DIGITAL_ASSETS_BUCKET_NAME = local.digital_assets_bucket_name
+        DYNAMODB_TABLE_NAME        = module.dynamodb.dynamodb_table_name
+        COGNITO_USER_POOL_ID       = module.cognito.cognito_user_pool_id
+      }
+    }
+    "delta_manifest" = {
+      handler           = "delta_manifest.lambda_handler"
+      description       = "Returns a document's content-defined chunk manifest, building it if needed"
+      timeout           = 300 # A manifest built past the API timeout is still stored for the retry
+      memory_size       = 1024
+      ephemeral_storage = 2048 # Documents are chunked from a copy in /tmp
+      environment_variables = {
+        DIGITAL_ASSETS_BUCKET_NAME = local.digital_assets_bucket_name
+        COGNITO_USER_POOL_ID       = module.cognito.cognito_user_pool_id
+      }
+    }
+    "delta_update" = {
+      handler           = "delta_update.lambda_handler"
+      description       = "Assembles a new document version from changed chunks and UploadPartCopy ranges"
+      timeout           = 120
+      memory_size       = 1024
+      ephemeral_storage = 2048
+      environment_variables = {
+        DIGITAL_ASSETS_BUCKET_NAME = local.digital_assets_bucket_name
+        DYNAMODB_TABLE_NAME        = module.dynamodb.dynamodb_table_name
+        COGNITO_USER_POOL_ID       = module.cognito.cognito_user_pool_id
+        METADATA_REGISTRATION      = "events" # register_metadata writes the item
+      }
+    }
+    "sweep_multipart_uploads" = {
+      handler        = "sweep_multipart_uploads.lambda_handler"
+      description    = "Aborts stale multipart uploads and reports reclaimed bytes"
+      expose_via_api = false
+      timeout        = 300
+      environment_variables = {
+        DIGITAL_ASSETS_BUCKET_NAME     = local.digital_assets_bucket_name
+        MULTIPART_UPLOAD_MAX_AGE_HOURS = "24"
+      }
+    }
+    "search_assets" = {
+      handler     = "search_assets.lambda_handler"
+      description = "Prefix and substring search over document names"
+      memory_size = 512
+      environment_variables = {
+        DIGITAL_ASSETS_BUCKET_NAME = local.digital_assets_bucket_name
+        DYNAMODB_TABLE_NAME        = module.dynamodb.dynamodb_table_name
+        COGNITO_USER_POOL_ID       = module.cognito.cognito_user_pool_id
+      }
+    }
+    "process_metadata_stream" = {
+      handler        = "process_metadata_stream.lambda_handler"
+      description    = "Keeps per-user name indexes and collection versions in step with the metadata table"
+      expose_via_api = false
+      timeout        = 120
+      memory_size    = 1024
+      environment_variables = {
+        DIGITAL_ASSETS_BUCKET_NAME     = local.digital_assets_bucket_name
+        COLLECTION_VERSIONS_TABLE_NAME = module.dynamodb.collection_versions_table_name
+      }
+    }
+    "search_content" = {
+      handler           = "search_content.lambda_handler"
+      description       = "Full-text search over document content"
+      memory_size       = 1024
+      ephemeral_storage = 2048 # Memory-mapped index segments are cached in /tmp
+      environment_variables = {
+        DIGITAL_ASSETS_BUCKET_NAME = local.digital_assets_bucket_name
+        DYNAMODB_TABLE_NAME        = module.dynamodb.dynamodb_table_name
+        COGNITO_USER_POOL_ID       = module.cognito.cognito_user_pool_id
+      }
+    }
+    "index_document_content" = {
+      handler        = "index_document_content.lambda_handler"
+      description    = "Writes full-text index segments for changed documents"
+      expose_via_api = false
+      timeout        = 300
+      memory_size    = 1024
+      environment_variables = {
+        DIGITAL_ASSETS_BUCKET_NAME = local.digital_assets_bucket_name
+        DOCUMENT_KMS_KEY_ID        = module.kms.kms_key_arn
+      }
+    }
+    "merge_content_index" = {
+      handler        = "merge_content_index.lambda_handler"
+      description    = "Merges each user's full-text index segments"
+      expose_via_api = false
+      timeout        = 900
+      memory_size    = 2048
+      environment_variables = {
+        DIGITAL_ASSETS_BUCKET_NAME = local.digital_assets_bucket_name
+        CONTENT_MERGE_MIN_SEGMENTS = "4"
+      }
+    }
+    "export_assets" = {
+      handler     = "export_assets.lambda_handler"
+      description = "Streams selected documents into a zip archive and presigns its download"
+      timeout     = 900 # Large exports run in an asynchronous invocation of this function
+      memory_size = 1024
+      environment_variables = {
+        DIGITAL_ASSETS_BUCKET_NAME = local.digital_assets_bucket_name
+        DYNAMODB_TABLE_NAME        = module.dynamodb.dynamodb_table_name
+        DOCUMENT_KMS_KEY_ID        = module.kms.kms_key_arn
+        JOBS_TABLE_NAME            = local.jobs_table_name
         COGNITO_USER_POOL_ID       = module.cognito.cognito_user_pool_id
       }
     }
+    "submit_job" = {
+      handler     = "submit_job.lambda_handler"
+      description = "Records a bulk operation as a job and queues it for the worker"
+      environment_variables = {
+        JOBS_TABLE_NAME        = local.jobs_table_name
+        JOB_QUEUE_URL          = module.job_queue.queue_url
+        IDEMPOTENCY_TABLE_NAME = local.idempotency_table_name
+        COGNITO_USER_POOL_ID   = module.cognito.cognito_user_pool_id
+      }
+    }
+    "get_job_status" = {
+      handler     = "get_job_status.lambda_handler"
+      description = "Reports a background job's status and progress"
+      environment_variables = {
+        JOBS_TABLE_NAME      = local.jobs_table_name
+        COGNITO_USER_POOL_ID = module.cognito.cognito_user_pool_id
+      }
+    }
+    "process_jobs" = {
+      handler        = "process_jobs.lambda_handler"
+      description    = "Runs queued jobs in checkpointed batches"
+      expose_via_api = false
+      timeout        = 900 # Jobs outlasting an invocation are checkpointed and requeued
+      memory_size    = 512
+      environment_variables = {
+        DIGITAL_ASSETS_BUCKET_NAME = local.digital_assets_bucket_name
+        DYNAMODB_TABLE_NAME        = module.dynamodb.dynamodb_table_name
+        JOBS_TABLE_NAME            = local.jobs_table_name
+        JOB_QUEUE_URL              = module.job_queue.queue_url
+      }
+    }
+    "register_metadata" = {
+      handler        = "register_metadata.lambda_handler"
+      description    = "Records documents written to or deleted from the bucket in the metadata table"
+      expose_via_api = false
+      timeout        = 60
+      memory_size    = 256
+      environment_variables = {
+        DIGITAL_ASSETS_BUCKET_NAME = local.digital_assets_bucket_name
+        DYNAMODB_TABLE_NAME        = module.dynamodb.dynamodb_table_name
+      }
+    }
+    "derive_previews" = {
+      handler        = "derive_previews.lambda_handler"
+      description    = "Derives thumbnails and text excerpts for new documents"
+      expose_via_api = false
+      timeout        = 300 # Up to 10 documents per stream batch
+      memory_size    = 1024
+      environment_variables = {
+        DIGITAL_ASSETS_BUCKET_NAME = local.digital_assets_bucket_name
+        DYNAMODB_TABLE_NAME        = module.dynamodb.dynamodb_table_name
+        DOCUMENT_KMS_KEY_ID        = module.kms.kms_key_arn
+      }
+    }
   }
   depends_on = [module.iam]
 }
+# Scheduled Lambda invocations
+module "schedules" {
+  source      = "./modules/eventbridge"
+  environment = var.environment
+
+  scheduled_lambdas = merge({
+    "sweep-multipart-uploads" = {
+      function_name       = "sweep_multipart_uploads"
+      arn                 = module.lambda.lambda_function_arns["sweep_multipart_uploads"]
+      schedule_expression = "rate(6 hours)"
+    }
+    "merge-content-index" = {
+      function_name       = "merge_content_index"
+      arn                 = module.lambda.lambda_function_arns["merge_content_index"]
+      schedule_expression = "rate(1 hour)"
+    }
+    }, {
+    # Warm-up events prime each API Lambda's connections and JWKS keys, see warmup_utils.py
+    for lambda in module.lambda.lambda_functions : "warm-${lambda.name}" => {
+      function_name       = lambda.name
+      arn                 = lambda.arn
+      schedule_expression = var.lambda_warmup_schedule
+      input               = jsonencode({ warmup = true })
+    } if var.lambda_warmup_schedule != ""
+  })
+
+  depends_on = [module.lambda]
+}
+
 resource "null_resource" "deploy_react_app" {
   provisioner "local-exec" {
     when    = create
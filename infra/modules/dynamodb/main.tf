@@ -2,7 +2,7 @@ resource "aws_dynamodb_table" "digital_assets_table" {
   name         = var.table_name
   billing_mode = "PAY_PER_REQUEST"
   hash_key     = "user_id"
-  range_key    = "digital_asset_name"  # Updated to match the attribute name
+  range_key    = "document_name" # The attribute the Lambdas read and write items by
 
   attribute {
     name = "user_id"
@@ -10,10 +10,95 @@ resource "aws_dynamodb_table" "digital_assets_table" {
   }
 
   attribute {
-    name = "digital_asset_name"  # Ensure the attribute matches the range_key
+    name = "document_name"
     type = "S"
   }
 
+  attribute {
+    name = "upload_date"
+    type = "S"
+  }
+
+  # A user's documents by ISO 8601 write time, so recent-first pages are read with a Limit
+  global_secondary_index {
+    name            = var.upload_date_index_name
+    hash_key        = "user_id"
+    range_key       = "upload_date"
+    projection_type = "ALL"
+  }
+
   stream_enabled   = true
   stream_view_type = "NEW_AND_OLD_IMAGES"
-}
\ No newline at end of file
+}
+
+# One counter per user, so readers can tell whether a cached listing is still current
+resource "aws_dynamodb_table" "collection_versions_table" {
+  name         = var.collection_versions_table_name
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "user_id"
+
+  attribute {
+    name = "user_id"
+    type = "S"
+  }
+}
+
+# Status records of long-running jobs, expired by DynamoDB TTL once they are no longer needed
+resource "aws_dynamodb_table" "jobs_table" {
+  name         = var.jobs_table_name
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "user_id"
+  range_key    = "job_id"
+
+  attribute {
+    name = "user_id"
+    type = "S"
+  }
+
+  attribute {
+    name = "job_id"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+}
+
+# Requests sent with an Idempotency-Key and their stored responses, replayed to client retries
+resource "aws_dynamodb_table" "idempotency_table" {
+  name         = var.idempotency_table_name
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "user_id"
+  range_key    = "idempotency_key"
+
+  attribute {
+    name = "user_id"
+    type = "S"
+  }
+
+  attribute {
+    name = "idempotency_key"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+}
+
+# Lambdas consuming the table's change stream (search indexes, cache invalidation)
+resource "aws_lambda_event_source_mapping" "stream_consumers" {
+  for_each = var.stream_consumers
+
+  event_source_arn  = aws_dynamodb_table.digital_assets_table.stream_arn
+  function_name     = each.value
+  starting_position = "LATEST"
+
+  batch_size                         = lookup(var.stream_consumer_batch_sizes, each.key, 100)
+  maximum_batching_window_in_seconds = 1 # Fold bursts of writes, while keeping cached listings fresh
+  bisect_batch_on_function_error     = true
+  maximum_retry_attempts             = 5
+}
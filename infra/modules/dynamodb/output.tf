@@ -1,4 +1,24 @@
 # Outputs
 output "dynamodb_table_name" {
   value = aws_dynamodb_table.digital_assets_table.name
-}
\ No newline at end of file
+}
+
+output "upload_date_index_name" {
+  value = var.upload_date_index_name
+}
+
+output "dynamodb_table_stream_arn" {
+  value = aws_dynamodb_table.digital_assets_table.stream_arn
+}
+
+output "collection_versions_table_name" {
+  value = aws_dynamodb_table.collection_versions_table.name
+}
+
+output "jobs_table_name" {
+  value = aws_dynamodb_table.jobs_table.name
+}
+
+output "idempotency_table_name" {
+  value = aws_dynamodb_table.idempotency_table.name
+}
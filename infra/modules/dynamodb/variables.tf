@@ -4,7 +4,40 @@ variable "table_name" {
   type        = string
 }
 
+variable "upload_date_index_name" {
+  description = "Name of the metadata table's index of each user's documents by upload_date"
+  type        = string
+  default     = "user_id-upload_date-index"
+}
+
+variable "collection_versions_table_name" {
+  description = "Name of the table holding a version counter per user, bumped on every change to their documents"
+  type        = string
+}
+
+variable "jobs_table_name" {
+  description = "Name of the table holding the status of long-running jobs, such as zip exports"
+  type        = string
+}
+
+variable "idempotency_table_name" {
+  description = "Name of the table recording requests sent with an Idempotency-Key and their responses"
+  type        = string
+}
+
 variable "environment" {
   description = "Variable passed in from root defining the environment (e.g., dev, prod, staging)"
   type        = string
 }
+
+variable "stream_consumers" {
+  description = "Lambda functions consuming the table's DynamoDB stream, keyed by a static name to function name"
+  type        = map(string)
+  default     = {}
+}
+
+variable "stream_consumer_batch_sizes" {
+  description = "Stream records per invocation of the stream consumers named here, others take 100"
+  type        = map(number)
+  default     = {}
+}
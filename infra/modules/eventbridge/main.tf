@@ -0,0 +1,27 @@
+# Scheduled rules that invoke Lambda functions (sweepers, warm-up pings, compaction)
+resource "aws_cloudwatch_event_rule" "schedules" {
+  for_each = var.scheduled_lambdas
+
+  name                = "${var.environment}-${each.key}"
+  description         = "Invokes ${each.value.function_name} on a schedule"
+  schedule_expression = each.value.schedule_expression
+}
+
+resource "aws_cloudwatch_event_target" "schedule_targets" {
+  for_each = var.scheduled_lambdas
+
+  rule  = aws_cloudwatch_event_rule.schedules[each.key].name
+  arn   = each.value.arn
+  input = each.value.input
+}
+
+# Grant EventBridge permission to invoke each scheduled Lambda
+resource "aws_lambda_permission" "schedule_permissions" {
+  for_each = var.scheduled_lambdas
+
+  statement_id  = "AllowExecutionFromEventBridge-${each.key}"
+  action        = "lambda:InvokeFunction"
+  function_name = each.value.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.schedules[each.key].arn
+}
@@ -0,0 +1,3 @@
+output "schedule_rule_arns" {
+  value = { for k, rule in aws_cloudwatch_event_rule.schedules : k => rule.arn }
+}
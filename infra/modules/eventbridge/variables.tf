@@ -0,0 +1,14 @@
+variable "environment" {
+  description = "Variable passed in from root defining the environment (e.g., dev, prod, staging)"
+  type        = string
+}
+
+variable "scheduled_lambdas" {
+  description = "Map of schedule names to the Lambda function they invoke"
+  type = map(object({
+    function_name       = string
+    arn                 = string
+    schedule_expression = string
+    input               = optional(string)
+  }))
+}
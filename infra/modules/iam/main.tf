@@ -22,7 +22,7 @@ resource "aws_iam_policy" "lambda_policy" {
 
   policy = jsonencode({
     Version = "2012-10-17",
-    Statement = [
+    Statement = concat([
       {
         Effect   = "Allow",
         Action   = ["logs:CreateLogGroup", "logs:CreateLogStream", "logs:PutLogEvents"],
@@ -32,18 +32,50 @@ resource "aws_iam_policy" "lambda_policy" {
         Effect = "Allow",
         Action = [
           "dynamodb:PutItem", "dynamodb:GetItem", "dynamodb:UpdateItem", "dynamodb:DeleteItem", "dynamodb:Query",
+          "dynamodb:BatchGetItem", "dynamodb:BatchWriteItem", "dynamodb:DescribeStream", "dynamodb:GetRecords",
+          "dynamodb:GetShardIterator", "dynamodb:ListStreams", "dynamodb:ConditionCheckItem", "dynamodb:DescribeTable",
           "s3:PutObject", "s3:GetObject", "s3:DeleteObject", "s3:CreateMultipartUpload",
+          "s3:AbortMultipartUpload", "s3:ListMultipartUploadParts", "s3:ListBucketMultipartUploads",
+          "s3:ListBucket",
           "cognito-idp:AdminCreateUser", "cognito-idp:AdminInitiateAuth", "cognito-idp:AdminDeleteUser",
+          "cognito-idp:DescribeUserPool",
           "kms:Encrypt", "kms:Decrypt", "kms:GenerateDataKey", "kms:GenerateDataKeyWithoutPlaintext", "kms:ReEncrypt*"
         ],
-        Resource = [
+        Resource = concat([
           "arn:aws:dynamodb:${var.aws_region}:${data.aws_caller_identity.current.account_id}:table/${var.dynamodb_table_name}",
+          "arn:aws:dynamodb:${var.aws_region}:${data.aws_caller_identity.current.account_id}:table/${var.dynamodb_table_name}/stream/*",
           "arn:aws:kms:${var.aws_region}:${data.aws_caller_identity.current.account_id}:key/*",
+          "arn:aws:s3:::${var.digital_assets_bucket_name}",
           "arn:aws:s3:::${var.digital_assets_bucket_name}/*",
           "${var.cognito_user_pool_arn}"
-        ]
+          ], [
+          for table_name in var.additional_dynamodb_table_names :
+          "arn:aws:dynamodb:${var.aws_region}:${data.aws_caller_identity.current.account_id}:table/${table_name}"
+        ])
       }
-    ]
+      ], [
+      # Only present when some Lambda hands long jobs to an asynchronous invocation of itself
+      for function_names in [var.self_invoking_lambda_names] : {
+        Effect = "Allow",
+        Action = ["lambda:InvokeFunction"],
+        Resource = [
+          for function_name in function_names :
+          "arn:aws:lambda:${var.aws_region}:${data.aws_caller_identity.current.account_id}:function:${function_name}"
+        ]
+      } if length(function_names) > 0
+      ], [
+      for queue_names in [var.sqs_queue_names] : {
+        Effect = "Allow",
+        Action = [
+          "sqs:SendMessage", "sqs:ReceiveMessage", "sqs:DeleteMessage", "sqs:ChangeMessageVisibility",
+          "sqs:GetQueueAttributes"
+        ],
+        Resource = [
+          for queue_name in queue_names :
+          "arn:aws:sqs:${var.aws_region}:${data.aws_caller_identity.current.account_id}:${queue_name}"
+        ]
+      } if length(queue_names) > 0
+    ])
   })
 }
 
@@ -14,6 +14,24 @@ variable "dynamodb_table_name" {
   type        = string
 }
 
+variable "additional_dynamodb_table_names" {
+  description = "Other platform tables the Lambdas read and write, such as the collection version counters"
+  type        = list(string)
+  default     = []
+}
+
+variable "self_invoking_lambda_names" {
+  description = "Lambdas that invoke themselves asynchronously to run long jobs in the background"
+  type        = list(string)
+  default     = []
+}
+
+variable "sqs_queue_names" {
+  description = "SQS queues the Lambdas send to and consume, such as the job queue"
+  type        = list(string)
+  default     = []
+}
+
 variable "lambda_role_name" {
   description = "The name of the lambda exec role"
   type = string
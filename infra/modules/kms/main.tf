@@ -0,0 +1,13 @@
+# Customer managed key wrapping the data keys documents are encrypted with. The Lambdas
+# only call KMS to generate or unwrap a data key, which they then cache, so documents are
+# never sent to KMS and most requests make no KMS call at all.
+resource "aws_kms_key" "key" {
+  description             = var.description
+  deletion_window_in_days = var.deletion_window_in_days
+  enable_key_rotation     = true # Old key material is kept, data keys wrapped under it still unwrap
+}
+
+resource "aws_kms_alias" "alias" {
+  name          = "alias/${var.alias_name}"
+  target_key_id = aws_kms_key.key.key_id
+}
@@ -0,0 +1,16 @@
+variable "alias_name" {
+  description = "Name of the key's alias, without the alias/ prefix"
+  type        = string
+}
+
+variable "description" {
+  description = "Description of the key"
+  type        = string
+  default     = ""
+}
+
+variable "deletion_window_in_days" {
+  description = "Days a deleted key can still be restored, every document encrypted under it is lost after that"
+  type        = number
+  default     = 30
+}
@@ -4,16 +4,15 @@ terraform {
       source  = "hashicorp/aws"
       version = "~> 4.0" # Use a version that supports OAC
     }
-    klayers = {
-      source  = "ldcorentin/klayer"
-      version = "~> 1.0.0"
-    }
   }
 }
 
-data "klayers_package_latest_version" "cryptography" {
-  name   = "cryptography"
-  region = var.aws_region
+# Requirements shared by the Lambdas and the utils modules, built by lambdas/build_lambdas.py
+resource "aws_lambda_layer_version" "shared_dependencies" {
+  layer_name          = var.shared_layer_name
+  filename            = "${path.root}/../lambdas/build/layers/shared-dependencies.zip"
+  source_code_hash    = filebase64sha256("${path.root}/../lambdas/build/layers/shared-dependencies.zip")
+  compatible_runtimes = [var.python_runtime]
 }
 
 # Lambda function resource that dynamically creates multiple Lambda functions
@@ -33,11 +32,15 @@ resource "aws_lambda_function" "lambda_functions" {
   source_code_hash = filebase64sha256("${path.root}/../lambdas/build/${each.key}.zip")
   filename         = "${path.root}/../lambdas/build/${each.key}.zip" # Location of the zip file
 
-  # Conditionally include the klayers package if use_klayers is true
-  layers = each.value.use_klayers ? [data.klayers_package_latest_version.cryptography.arn] : []
+  # Every function loads the shared requirements and utils modules from the layer
+  layers = [aws_lambda_layer_version.shared_dependencies.arn]
 
   # Optional settings
-  timeout     = var.timeout
-  memory_size = var.memory_size
+  timeout     = coalesce(each.value.timeout, var.timeout)
+  memory_size = coalesce(each.value.memory_size, var.memory_size)
   description = each.value.description
+
+  ephemeral_storage {
+    size = each.value.ephemeral_storage
+  }
 }
@@ -3,7 +3,12 @@ output "lambda_function_arns" {
   value = { for k, lambda in aws_lambda_function.lambda_functions : k => lambda.arn }
 }
 
-# Output the names and ARNs of the created Lambda functions using the splat operator
+# Output the function names, so other modules reference them and depend on the functions existing
+output "lambda_functions_by_name" {
+  value = { for k, lambda in aws_lambda_function.lambda_functions : k => lambda.function_name }
+}
+
+# Output the names and ARNs of the Lambda functions that are exposed through API Gateway
 output "lambda_functions" {
   value = [
     for index, lambda in aws_lambda_function.lambda_functions :
@@ -11,6 +16,6 @@ output "lambda_functions" {
       name       = lambda.function_name,
       arn        = lambda.arn,
       invoke_arn = lambda.invoke_arn
-    }
+    } if var.lambdas[index].expose_via_api
   ]
 }
\ No newline at end of file
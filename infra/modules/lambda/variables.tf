@@ -19,7 +19,10 @@ variable "lambdas" {
     handler               = string
     environment_variables = map(string)
     description           = string
-    use_klayers           = optional(bool, false) # Optional, defaults to false
+    expose_via_api        = optional(bool, true)  # Event-driven Lambdas get no API Gateway route
+    timeout               = optional(number)      # Overrides var.timeout when set
+    memory_size           = optional(number)      # Overrides var.memory_size when set
+    ephemeral_storage     = optional(number, 512) # /tmp size in MB, for Lambdas caching files on disk
   }))
 }
 
@@ -33,4 +36,8 @@ variable "memory_size" {
   description = "Amount of memory in MB your Lambda function can use at runtime"
   type        = number
   default     = 128
-}
\ No newline at end of file
+}
+variable "shared_layer_name" {
+  description = "Name of the layer holding the Lambdas' shared requirements and utils modules"
+  type        = string
+}
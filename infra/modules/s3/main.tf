@@ -22,14 +22,67 @@ resource "aws_s3_bucket_cors_configuration" "assets_bucket_cors" {
   bucket = aws_s3_bucket.assets_bucket.id
 
   cors_rule {
-    allowed_headers = ["Authorization", "Content-Type", "x-amz-acl", "x-amz-meta-*"]
+    allowed_headers = ["Authorization", "Content-Type", "x-amz-acl", "x-amz-meta-*", "x-amz-checksum-*", "x-amz-sdk-checksum-algorithm"]
     allowed_methods = ["GET", "PUT", "POST"] # Adjust as needed based on your app's needs
     allowed_origins = ["*"]                  # Ideally, restrict this to specific origins
-    expose_headers  = ["ETag","Content-Security-Policy","x-amz-acl"] 
+    expose_headers  = ["ETag","Content-Security-Policy","x-amz-acl","x-amz-checksum-sha256","x-amz-checksum-crc32c"] 
     max_age_seconds = 3000
   }
 }
 
+# Backstop for the multipart sweeper Lambda, S3 itself drops parts of abandoned uploads,
+# and expiry of export archives once their download links have lapsed
+resource "aws_s3_bucket_lifecycle_configuration" "assets_bucket_lifecycle" {
+  count  = var.abort_incomplete_multipart_upload_days == null && var.export_expiration_days == null ? 0 : 1
+  bucket = aws_s3_bucket.assets_bucket.id
+
+  dynamic "rule" {
+    for_each = var.abort_incomplete_multipart_upload_days == null ? [] : [var.abort_incomplete_multipart_upload_days]
+    content {
+      id     = "abort-incomplete-multipart-uploads"
+      status = "Enabled"
+
+      filter {}
+
+      abort_incomplete_multipart_upload {
+        days_after_initiation = rule.value
+      }
+    }
+  }
+
+  dynamic "rule" {
+    for_each = var.export_expiration_days == null ? [] : [var.export_expiration_days]
+    content {
+      id     = "expire-export-archives"
+      status = "Enabled"
+
+      filter {
+        prefix = "exports/"
+      }
+
+      expiration {
+        days = rule.value
+      }
+    }
+  }
+}
+
+# A bucket supports a single notification configuration, so every subscriber is declared here
+resource "aws_s3_bucket_notification" "assets_bucket_notification" {
+  count  = length(var.asset_event_queues) > 0 ? 1 : 0
+  bucket = aws_s3_bucket.assets_bucket.id
+
+  dynamic "queue" {
+    for_each = var.asset_event_queues
+    content {
+      queue_arn     = queue.value.arn
+      events        = queue.value.events
+      filter_prefix = queue.value.filter_prefix
+      filter_suffix = queue.value.filter_suffix
+    }
+  }
+}
+
 /*
 # IAM policy for multipart upload to S3
 resource "aws_iam_policy" "s3_multipart_upload_policy" {
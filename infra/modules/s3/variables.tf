@@ -16,4 +16,27 @@ variable "environment" {
 variable "cloudfront_distribution_arn" {
   description = "CloudFront distribution ARN"
   type        = string
-}
\ No newline at end of file
+}
+
+variable "asset_event_queues" {
+  description = "SQS queues sent S3 event notifications of the digital assets bucket"
+  type = list(object({
+    arn           = string
+    events        = list(string)
+    filter_prefix = optional(string)
+    filter_suffix = optional(string)
+  }))
+  default = []
+}
+
+variable "abort_incomplete_multipart_upload_days" {
+  description = "Abort multipart uploads left incomplete for this many days, null disables the lifecycle rule"
+  type        = number
+  default     = null
+}
+
+variable "export_expiration_days" {
+  description = "Delete export archives under exports/ after this many days, null keeps them"
+  type        = number
+  default     = null
+}
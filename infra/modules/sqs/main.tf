@@ -0,0 +1,49 @@
+# Messages that failed max_receive_count deliveries, kept for inspection
+resource "aws_sqs_queue" "dead_letter_queue" {
+  name                      = "${var.queue_name}-dlq"
+  message_retention_seconds = 1209600 # 14 days, the maximum
+}
+
+# Work queue, consumed by the Lambdas of queue_consumers
+resource "aws_sqs_queue" "queue" {
+  name                       = var.queue_name
+  visibility_timeout_seconds = var.visibility_timeout_seconds
+  message_retention_seconds  = 345600 # 4 days
+
+  redrive_policy = jsonencode({
+    deadLetterTargetArn = aws_sqs_queue.dead_letter_queue.arn
+    maxReceiveCount     = var.max_receive_count
+  })
+}
+
+# Lets the buckets of source_bucket_arns deliver their event notifications to the queue
+resource "aws_sqs_queue_policy" "bucket_notifications" {
+  count     = length(var.source_bucket_arns) > 0 ? 1 : 0
+  queue_url = aws_sqs_queue.queue.id
+
+  policy = jsonencode({
+    Version = "2012-10-17",
+    Statement = [{
+      Effect    = "Allow",
+      Principal = { Service = "s3.amazonaws.com" },
+      Action    = "sqs:SendMessage",
+      Resource  = aws_sqs_queue.queue.arn,
+      Condition = { ArnLike = { "aws:SourceArn" = var.source_bucket_arns } }
+    }]
+  })
+}
+
+# Lambdas consuming the queue, reporting failed records so only those are redelivered
+resource "aws_lambda_event_source_mapping" "queue_consumers" {
+  for_each = var.queue_consumers
+
+  event_source_arn                   = aws_sqs_queue.queue.arn
+  function_name                      = each.value
+  batch_size                         = var.batch_size
+  maximum_batching_window_in_seconds = var.maximum_batching_window_in_seconds
+  function_response_types            = ["ReportBatchItemFailures"]
+
+  scaling_config {
+    maximum_concurrency = var.maximum_concurrency
+  }
+}
@@ -0,0 +1,19 @@
+# Outputs
+output "queue_name" {
+  value = aws_sqs_queue.queue.name
+}
+
+output "queue_url" {
+  value = aws_sqs_queue.queue.url
+}
+
+output "queue_arn" {
+  value = aws_sqs_queue.queue.arn
+
+  # Bucket notifications are only accepted once the queue lets S3 send to it
+  depends_on = [aws_sqs_queue_policy.bucket_notifications]
+}
+
+output "dead_letter_queue_arn" {
+  value = aws_sqs_queue.dead_letter_queue.arn
+}
@@ -0,0 +1,46 @@
+variable "queue_name" {
+  description = "Name of the queue, its dead-letter queue takes the same name with a -dlq suffix"
+  type        = string
+}
+
+variable "visibility_timeout_seconds" {
+  description = "How long a received message stays hidden, at least the consumers' timeout so a running job is not redelivered"
+  type        = number
+  default     = 960
+}
+
+variable "max_receive_count" {
+  description = "Deliveries of a message before it moves to the dead-letter queue"
+  type        = number
+  default     = 10
+}
+
+variable "batch_size" {
+  description = "Messages handed to a consumer invocation at a time"
+  type        = number
+  default     = 1
+}
+
+variable "maximum_batching_window_in_seconds" {
+  description = "How long to gather messages into a batch before invoking a consumer"
+  type        = number
+  default     = 0
+}
+
+variable "maximum_concurrency" {
+  description = "Consumer invocations running at once, bounding the load jobs put on the table and bucket"
+  type        = number
+  default     = 10
+}
+
+variable "queue_consumers" {
+  description = "Lambda functions consuming the queue, keyed by a static name to function name"
+  type        = map(string)
+  default     = {}
+}
+
+variable "source_bucket_arns" {
+  description = "S3 buckets allowed to send event notifications to the queue"
+  type        = list(string)
+  default     = []
+}
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Package the Python Lambdas and the dependency layer they share.
+
+Every .py file up to three levels under src/ (utils/ excepted) is a handler, packaged as
+build/<name>.zip. Requirements listed by more than one service directory go into a single
+layer, build/layers/shared-dependencies.zip, together with the utils/ modules, so a
+handler's zip holds only its own file and any requirements unique to its directory.
+boto3 and botocore are never packaged, the Lambda runtime provides them.
+
+Installed requirements are cached under build/.cache by a hash of the requirement list,
+target Python version and platform, and build/.build-state.json records the inputs each
+zip was built from, so a rebuild only repackages what changed. Zips are written with
+fixed timestamps and ordering, so an unchanged package keeps its source_code_hash and
+Terraform does not redeploy it.
+
+Usage:
+    python3 build_lambdas.py [--src DIR] [--build DIR] [--python-version 3.9] [--refresh]
+"""
+import argparse
+import compileall
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from py_compile import PycInvalidationMode
+
+BUILD_FORMAT = 1                    # Bump to invalidate every cached install and zip
+LAYER_NAME = 'shared-dependencies'
+LAYER_PREFIX = 'python'             # Lambda adds /opt/python to sys.path
+RUNTIME_PROVIDED = {'boto3', 'botocore', 's3transfer', 'jmespath'}
+STRIPPED_DIRS = {'__pycache__', 'tests', 'test', 'testing'}
+STRIPPED_SUFFIXES = ('.pyc', '.pyo')
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+DEFAULT_PLATFORM = 'manylinux2014_x86_64'
+
+
+def parse_args():
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description='Package the Lambda functions and their shared layer.')
+    parser.add_argument('--src', default=os.path.join(here, 'src'), help='Lambda source directory')
+    parser.add_argument('--build', default=os.path.join(here, 'build'), help='Output directory')
+    parser.add_argument('--python-version', default=f'{sys.version_info[0]}.{sys.version_info[1]}',
+                        help='Python version of the Lambda runtime (default: this interpreter)')
+    parser.add_argument('--platform', default=DEFAULT_PLATFORM, help='pip platform tag of the runtime')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 4, help='Parallel packaging jobs')
+    parser.add_argument('--refresh', action='store_true',
+                        help='Reinstall requirements and repackage everything, ignoring caches')
+    return parser.parse_args()
+
+
+def requirement_name(line):
+    """Return the normalised project name of a requirements.txt line."""
+    return re.split(r'[\s<>=!~;\[@]', line, maxsplit=1)[0].lower().replace('_', '-')
+
+
+def read_requirements(path):
+    """Read a requirements.txt, without comments, blank lines and runtime-provided packages."""
+    if not os.path.isfile(path):
+        return []
+    requirements = set()
+    with open(path) as file:
+        for line in file:
+            line = line.split('#', 1)[0].strip()
+            if line and requirement_name(line) not in RUNTIME_PROVIDED:
+                requirements.add(line)
+    return sorted(requirements)
+
+
+def discover_handlers(src_dir):
+    """Map each handler name to its path, as the Dockerfile layout has always found them."""
+    handlers = {}
+    for root, dirs, files in os.walk(src_dir):
+        depth = os.path.relpath(root, src_dir).count(os.sep) + (root != src_dir)
+        dirs[:] = sorted(d for d in dirs if not (root == src_dir and d == 'utils') and d not in STRIPPED_DIRS)
+        if depth >= 2:
+            dirs[:] = []
+        for name in sorted(files):
+            if not name.endswith('.py'):
+                continue
+            handler = name[:-3]
+            if handler in handlers:
+                raise SystemExit(f"Handler name {handler} is used by {handlers[handler]} and {os.path.join(root, name)}")
+            handlers[handler] = os.path.join(root, name)
+    return handlers
+
+
+def digest(*parts):
+    """Hash JSON-serialisable build inputs."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def file_digest(path):
+    with open(path, 'rb') as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+
+def strip_tree(root):
+    """Remove test suites, bytecode caches and compiled files from an installed tree."""
+    for current, dirs, files in os.walk(root, topdown=True):
+        for name in [d for d in dirs if d in STRIPPED_DIRS]:
+            shutil.rmtree(os.path.join(current, name))
+            dirs.remove(name)
+        for name in files:
+            if name.endswith(STRIPPED_SUFFIXES):
+                os.remove(os.path.join(current, name))
+
+
+def precompile(root, runtime_path, options):
+    """
+    Compile the .py files of a staged tree to bytecode for the runtime.
+
+    Bytecode is only written when this interpreter matches the runtime's Python version,
+    the only case in which the runtime would load it. Unchecked hash-based .pyc files are
+    used since zip timestamps would otherwise never match the sources.
+    """
+    if not options.compile_bytecode:
+        return
+    compileall.compile_dir(root, quiet=2, ddir=runtime_path, workers=1,
+                           invalidation_mode=PycInvalidationMode.UNCHECKED_HASH)
+
+
+def install_requirements(requirements, runtime_path, options):
+    """
+    Install requirements for the runtime into the cache, returning the installed tree.
+
+    The cache key covers the requirement list, Python version and platform, so a tree is
+    reused until one of them changes or --refresh is given. Packages are installed from
+    binary wheels for the runtime's platform, which lets the build run on any host.
+    """
+    key = digest(BUILD_FORMAT, requirements, runtime_path, options.python_version, options.platform)
+    target = os.path.join(options.cache_dir, 'site-packages', key)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    if os.path.isdir(target) and not options.refresh:
+        return target
+
+    shutil.rmtree(target, ignore_errors=True)
+    staging = tempfile.mkdtemp(dir=options.cache_dir)
+    print(f"Installing {', '.join(requirements)}...")
+    subprocess.run([
+        sys.executable, '-m', 'pip', 'install', '--quiet', '--no-compile', '--target', staging,
+        '--cache-dir', os.path.join(options.cache_dir, 'pip'),
+        '--platform', options.platform, '--python-version', options.python_version,
+        '--implementation', 'cp', '--only-binary=:all:', *requirements
+    ], check=True)
+    strip_tree(staging)
+    precompile(staging, runtime_path, options)
+    os.replace(staging, target)
+    return target
+
+
+def collect_files(root, prefix=''):
+    """Map archive names, under prefix, to the files of a staged or installed tree."""
+    files = {}
+    for current, _, names in os.walk(root):
+        for name in names:
+            path = os.path.join(current, name)
+            relative = os.path.relpath(path, root).replace(os.sep, '/')
+            files[f'{prefix}/{relative}' if prefix else relative] = path
+    return files
+
+
+def write_zip(destination, files):
+    """Write a reproducible zip: sorted entries, fixed timestamps and permissions."""
+    partial = f'{destination}.partial'
+    with zipfile.ZipFile(partial, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name in sorted(files):
+            info = zipfile.ZipInfo(name, ZIP_DATE_TIME)
+            info.external_attr = 0o644 << 16
+            with open(files[name], 'rb') as file:
+                archive.writestr(info, file.read(), compress_type=zipfile.ZIP_DEFLATED, compresslevel=9)
+    os.replace(partial, destination)
+
+
+def stage_sources(sources, runtime_path, options):
+    """Copy source files into a temporary directory and precompile them."""
+    staging = tempfile.mkdtemp(dir=options.cache_dir)
+    for path in sources:
+        shutil.copy2(path, staging)
+    precompile(staging, runtime_path, options)
+    return staging
+
+
+def package(destination, sources, runtime_path, dependency_dirs, prefix, options):
+    """Zip a package from its source files and installed dependency trees."""
+    staging = stage_sources(sources, runtime_path, options)
+    try:
+        files = {}
+        for dependencies in dependency_dirs:
+            files.update(collect_files(dependencies, prefix))
+        files.update(collect_files(staging, prefix))
+        write_zip(destination, files)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    return os.path.getsize(destination)
+
+
+def main():
+    options = parse_args()
+    options.cache_dir = os.path.join(options.build, '.cache')
+    options.compile_bytecode = options.python_version == f'{sys.version_info[0]}.{sys.version_info[1]}'
+    layer_dir = os.path.join(options.build, 'layers')
+    for directory in (options.build, options.cache_dir, layer_dir):
+        os.makedirs(directory, exist_ok=True)
+    if not options.compile_bytecode:
+        print(f"Python {sys.version_info[0]}.{sys.version_info[1]} does not match the runtime's "
+              f"{options.python_version}, packaging without precompiled bytecode")
+
+    state_path = os.path.join(options.build, '.build-state.json')
+    state = {}
+    if os.path.isfile(state_path) and not options.refresh:
+        with open(state_path) as file:
+            state = json.load(file)
+
+    handlers = discover_handlers(options.src)
+    requirements = {name: read_requirements(os.path.join(os.path.dirname(path), 'requirements.txt'))
+                    for name, path in handlers.items()}
+
+    # Requirements named by more than one service directory go into the shared layer
+    directories = {}
+    for name, path in handlers.items():
+        directories[os.path.dirname(path)] = requirements[name]
+    counts = {}
+    for listed in directories.values():
+        for line in listed:
+            counts[line] = counts.get(line, 0) + 1
+    shared = sorted(line for line, count in counts.items() if count > 1)
+
+    utils_dir = os.path.join(options.src, 'utils')
+    utils = sorted(os.path.join(utils_dir, name) for name in os.listdir(utils_dir)
+                   if name.endswith('.py')) if os.path.isdir(utils_dir) else []
+
+    jobs = {}
+    layer_path = os.path.join(layer_dir, f'{LAYER_NAME}.zip')
+    layer_inputs = digest(BUILD_FORMAT, shared, options.python_version, options.platform,
+                          [(os.path.basename(path), file_digest(path)) for path in utils])
+    if state.get(LAYER_NAME) != layer_inputs or not os.path.isfile(layer_path):
+        dependency_dirs = [install_requirements(shared, '/opt/python', options)] if shared else []
+        jobs[LAYER_NAME] = (layer_inputs, layer_path, utils, '/opt/python', dependency_dirs, LAYER_PREFIX)
+
+    for name, path in sorted(handlers.items()):
+        own = [line for line in requirements[name] if line not in shared]
+        inputs = digest(BUILD_FORMAT, own, options.python_version, options.platform, file_digest(path))
+        destination = os.path.join(options.build, f'{name}.zip')
+        if state.get(name) == inputs and os.path.isfile(destination):
+            continue
+        dependency_dirs = [install_requirements(own, '/var/task', options)] if own else []
+        jobs[name] = (inputs, destination, [path], '/var/task', dependency_dirs, '')
+
+    # Zips of handlers that no longer exist would otherwise be deployed from a stale build
+    for name in os.listdir(options.build):
+        if name.endswith('.zip') and name[:-4] not in handlers:
+            os.remove(os.path.join(options.build, name))
+            state.pop(name[:-4], None)
+
+    print(f"Packaging {len(jobs)} of {len(handlers) + 1} packages, "
+          f"{len(handlers) + 1 - len(jobs)} unchanged")
+    with ThreadPoolExecutor(max_workers=options.workers) as executor:
+        futures = {name: executor.submit(package, *job[1:], options) for name, job in jobs.items()}
+        for name, future in futures.items():
+            size = future.result()
+            state[name] = jobs[name][0]
+            print(f"Packaged {name} ({size / 1024:.0f} KB)")
+
+    state = {name: inputs for name, inputs in state.items() if name in handlers or name == LAYER_NAME}
+    with open(state_path, 'w') as file:
+        json.dump(state, file, indent=2, sort_keys=True)
+    print("Lambdas packaged successfully.")
+
+
+if __name__ == '__main__':
+    main()
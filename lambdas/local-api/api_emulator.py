@@ -0,0 +1,763 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the platform's HTTP API, for end-to-end and load testing without AWS.
+
+The route table is the one infra/modules/api_gateway_v2 builds: its route keys for every
+function infra/main.tf exposes through the API. Each HTTP request becomes an API Gateway
+v2 (payload format 2.0) proxy event for the matching lambda_handler, which runs with the
+environment main.tf gives it. AWS is a local moto server, provisioned with the bucket,
+tables, KMS key and Cognito user pool the handlers expect, plus a user to log in with.
+
+Handlers run in this process by default, one invocation per function at a time. With
+--workers N they run in N worker processes instead, each taking one invocation at a time
+like a Lambda container, which is the mode to load-test with. Every queue of the sqs
+module is created in moto, with the bucket's notifications sent to the queues the s3
+module lists, and its consumers are fed its messages by a poller, as the SQS event source
+mapping would. The metadata table's stream consumers, listed by the dynamodb module, are
+fed its stream the same way. Other event-driven functions (Lambda notifications, schedules
+and asynchronous self-invocations) are not triggered.
+
+Usage:
+    pip install -r lambdas/local-api/requirements.txt
+    python3 lambdas/local-api/api_emulator.py --port 8080 --workers 4
+"""
+import argparse
+import base64
+import importlib.util
+import json
+import logging
+import multiprocessing
+import os
+import re
+import sys
+import threading
+import time
+import traceback
+import uuid
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import boto3
+from moto.server import ThreadedMotoServer
+
+logger = logging.getLogger('api_emulator')
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+SRC_DIR = os.path.join(REPO_ROOT, 'lambdas', 'src')
+UTILS_DIR = os.path.join(SRC_DIR, 'utils')
+INFRA_MAIN = os.path.join(REPO_ROOT, 'infra', 'main.tf')
+API_GATEWAY_MODULE = os.path.join(REPO_ROOT, 'infra', 'modules', 'api_gateway_v2', 'main.tf')
+
+REGION = 'us-east-1'
+ACCOUNT_ID = '123456789012'
+DEFAULT_TIMEOUT = 30                        # The lambda module's defaults
+DEFAULT_MEMORY_SIZE = 128
+LAMBDA_PAYLOAD_LIMIT = 6 * 1024 * 1024      # Synchronous invocation request and response limit
+TEXT_CONTENT_TYPES = ('text/', 'application/json', 'application/xml', 'application/javascript',
+                      'application/x-www-form-urlencoded')
+
+
+# Terraform configuration
+
+def block_end(text, start):
+    """Return the index just past the brace closing the HCL block opened at text[start]."""
+    depth, index, in_string = 0, start, False
+    while index < len(text):
+        char = text[index]
+        if in_string:
+            if char == '\\':
+                index += 1
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == '#':
+            index = text.find('\n', index)
+            if index < 0:
+                break
+        elif char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                return index + 1
+        index += 1
+    raise ValueError(f'Unbalanced braces from offset {start}')
+
+
+def parse_function(name, body):
+    """Read a function's settings from its entry in the lambda module's map."""
+    def setting(pattern, default):
+        match = re.search(rf'^\s*{pattern}\s*=\s*("[^"]*"|\w+)', body, re.M)
+        return match.group(1).strip('"') if match else default
+
+    environment = {}
+    match = re.search(r'environment_variables\s*=\s*\{', body)
+    if match:
+        block = body[match.end():block_end(body, match.end() - 1) - 1]
+        for line in block.splitlines():
+            assignment = re.match(r'\s*(\w+)\s*=\s*("(?:[^"\\]|\\.)*"|[^#\s]+)', line)
+            if assignment:
+                environment[assignment.group(1)] = assignment.group(2)
+
+    return {
+        'name': name,
+        'handler': setting('handler', f'{name}.lambda_handler'),
+        'expose_via_api': setting('expose_via_api', 'true') == 'true',
+        'timeout': int(setting('timeout', DEFAULT_TIMEOUT)),
+        'memory_size': int(setting('memory_size', DEFAULT_MEMORY_SIZE)),
+        'environment': environment      # Names to HCL expressions, resolved by resolve_environment
+    }
+
+
+def load_functions(main_tf=INFRA_MAIN):
+    """Read every function of the lambda module's map in infra/main.tf."""
+    with open(main_tf) as file:
+        text = file.read()
+    module = re.search(r'module\s+"lambda"\s*\{', text)
+    module_end = block_end(text, module.end() - 1)
+    lambdas = re.compile(r'^\s*lambdas\s*=\s*\{', re.M).search(text, module.end(), module_end)
+    end = block_end(text, lambdas.end() - 1)
+
+    functions, position = {}, lambdas.end()
+    entry = re.compile(r'"([\w-]+)"\s*=\s*\{')
+    while True:
+        match = entry.search(text, position, end)
+        if not match:
+            break
+        entry_end = block_end(text, match.end() - 1)
+        functions[match.group(1)] = parse_function(match.group(1), text[match.end():entry_end - 1])
+        position = entry_end
+
+    for function in functions.values():
+        function['path'] = find_handler_source(function['handler'].rsplit('.', 1)[0])
+    return functions
+
+
+def load_queues(main_tf=INFRA_MAIN):
+    """
+    Read the queues infra/main.tf declares with the sqs module.
+
+    Returns:
+        tuple: ({module name: {'consumers': [function names], 'batch_size': int}},
+                [module names of the queues the s3 module sends the bucket's notifications to]).
+    """
+    with open(main_tf) as file:
+        text = file.read()
+    queues, notified = {}, []
+    for module in re.finditer(r'module\s+"([\w-]+)"\s*\{', text):
+        block = text[module.end():block_end(text, module.end() - 1)]
+        if re.search(r'source\s*=\s*"\./modules/sqs"', block):
+            batch_size = re.search(r'^\s*batch_size\s*=\s*(\d+)', block, re.MULTILINE)
+            queues[module.group(1)] = {
+                'consumers': re.findall(r'lambda_functions_by_name\["([\w-]+)"\]', block),
+                'batch_size': int(batch_size.group(1)) if batch_size else 1
+            }
+        elif re.search(r'source\s*=\s*"\./modules/s3"', block):
+            notified = re.findall(r'module\.([\w-]+)\.queue_arn', block)
+    return queues, notified
+
+
+def load_stream_consumers(main_tf=INFRA_MAIN):
+    """
+    Read the functions infra/main.tf has the dynamodb module feed the metadata table's stream.
+
+    Returns:
+        dict: {function name: batch size}, the module's default of 100 unless one is set.
+    """
+    with open(main_tf) as file:
+        text = file.read()
+    consumers = {}
+    for module in re.finditer(r'module\s+"([\w-]+)"\s*\{', text):
+        block = text[module.end():block_end(text, module.end() - 1)]
+        if not re.search(r'source\s*=\s*"\./modules/dynamodb"', block):
+            continue
+        settings = {}
+        for setting in ('stream_consumers', 'stream_consumer_batch_sizes'):
+            start = re.search(rf'^\s*{setting}\s*=\s*\{{', block, re.MULTILINE)
+            settings[setting] = block[start.end():block_end(block, start.end() - 1)] if start else ''
+        batch_sizes = {name: int(size) for name, size
+                       in re.findall(r'"([\w-]+)"\s*=\s*(\d+)', settings['stream_consumer_batch_sizes'])}
+        for key, name in re.findall(r'"([\w-]+)"\s*=\s*module\.lambda\.lambda_functions_by_name\["([\w-]+)"\]',
+                                    settings['stream_consumers']):
+            consumers[name] = batch_sizes.get(key, 100)
+    return consumers
+
+
+def find_handler_source(module_name):
+    """Find a handler module under lambdas/src, the way build_lambdas.py discovers them."""
+    for root, dirs, files in os.walk(SRC_DIR):
+        dirs[:] = [d for d in dirs if d not in ('utils', '__pycache__')]
+        if f'{module_name}.py' in files:
+            return os.path.join(root, f'{module_name}.py')
+    raise FileNotFoundError(f'No source for handler module {module_name}')
+
+
+def load_routes(functions, api_gateway_tf=API_GATEWAY_MODULE):
+    """Map route keys to functions: the module's route keys for each API-exposed function."""
+    with open(api_gateway_tf) as file:
+        templates = re.findall(r'route_key\s*=\s*"(\w+) /\$\{each\.key\}"', file.read())
+    return {f'{method} /{name}': function
+            for name, function in functions.items() if function['expose_via_api']
+            for method in templates}
+
+
+def resolve_environment(function, resources):
+    """
+    Give a function its environment: string literals as written, references by variable name.
+
+    References such as module.cognito.cognito_user_pool_id cannot be evaluated locally, so
+    each is replaced by the resource provisioned for that variable in moto; a queue's
+    module.<name>.queue_url is the URL of the queue provisioned for that module.
+    """
+    environment = {}
+    for name, expression in function['environment'].items():
+        if expression.startswith('"') and '${' not in expression:
+            environment[name] = json.loads(expression)
+        elif name in resources:
+            environment[name] = resources[name]
+        elif expression in resources:
+            environment[name] = resources[expression]
+        else:
+            logger.warning(f"{function['name']}: {name} = {expression} has no local value")
+    return environment
+
+
+# AWS resources
+
+def provision(endpoint_url, prefix, username, password, queues=(), notified_queues=()):
+    """
+    Create the bucket, tables, queues, KMS key, user pool and login user, returning them by variable name.
+
+    Each queue module gets its queue, returned as module.<name>.queue_url, and the bucket
+    notifies the queues of notified_queues of every object created and removed.
+    """
+    session = boto3.Session(aws_access_key_id='testing', aws_secret_access_key='testing', region_name=REGION)
+    s3 = session.client('s3', endpoint_url=endpoint_url)
+    dynamodb = session.client('dynamodb', endpoint_url=endpoint_url)
+    cognito = session.client('cognito-idp', endpoint_url=endpoint_url)
+    sqs = session.client('sqs', endpoint_url=endpoint_url)
+    kms = session.client('kms', endpoint_url=endpoint_url)
+
+    bucket = f'{prefix}-assets'
+    table, versions_table, jobs_table = f'{prefix}-metadata', f'{prefix}-metadata-versions', f'{prefix}-metadata-jobs'
+    idempotency_table = f'{prefix}-metadata-idempotency'
+    s3.create_bucket(Bucket=bucket)
+    # Keyed the way the handlers read and write items
+    dynamodb.create_table(
+        TableName=table, BillingMode='PAY_PER_REQUEST',
+        KeySchema=[{'AttributeName': 'user_id', 'KeyType': 'HASH'},
+                   {'AttributeName': 'document_name', 'KeyType': 'RANGE'}],
+        AttributeDefinitions=[{'AttributeName': 'user_id', 'AttributeType': 'S'},
+                              {'AttributeName': 'document_name', 'AttributeType': 'S'},
+                              {'AttributeName': 'upload_date', 'AttributeType': 'S'}],
+        GlobalSecondaryIndexes=[{
+            'IndexName': 'user_id-upload_date-index',
+            'KeySchema': [{'AttributeName': 'user_id', 'KeyType': 'HASH'},
+                          {'AttributeName': 'upload_date', 'KeyType': 'RANGE'}],
+            'Projection': {'ProjectionType': 'ALL'}
+        }],
+        StreamSpecification={'StreamEnabled': True, 'StreamViewType': 'NEW_AND_OLD_IMAGES'}
+    )
+    dynamodb.create_table(
+        TableName=versions_table, BillingMode='PAY_PER_REQUEST',
+        KeySchema=[{'AttributeName': 'user_id', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': 'user_id', 'AttributeType': 'S'}]
+    )
+    dynamodb.create_table(
+        TableName=jobs_table, BillingMode='PAY_PER_REQUEST',
+        KeySchema=[{'AttributeName': 'user_id', 'KeyType': 'HASH'}, {'AttributeName': 'job_id', 'KeyType': 'RANGE'}],
+        AttributeDefinitions=[{'AttributeName': 'user_id', 'AttributeType': 'S'},
+                              {'AttributeName': 'job_id', 'AttributeType': 'S'}]
+    )
+    dynamodb.create_table(
+        TableName=idempotency_table, BillingMode='PAY_PER_REQUEST',
+        KeySchema=[{'AttributeName': 'user_id', 'KeyType': 'HASH'},
+                   {'AttributeName': 'idempotency_key', 'KeyType': 'RANGE'}],
+        AttributeDefinitions=[{'AttributeName': 'user_id', 'AttributeType': 'S'},
+                              {'AttributeName': 'idempotency_key', 'AttributeType': 'S'}]
+    )
+
+    document_key_arn = kms.create_key(Description=f'{prefix} documents')['KeyMetadata']['Arn']
+
+    queue_urls = {name: sqs.create_queue(QueueName=f'{prefix}-{name}')['QueueUrl'] for name in queues}
+    notifications = []
+    for name in notified_queues:
+        queue_arn = sqs.get_queue_attributes(QueueUrl=queue_urls[name],
+                                             AttributeNames=['QueueArn'])['Attributes']['QueueArn']
+        notifications.append({'QueueArn': queue_arn, 'Events': ['s3:ObjectCreated:*', 's3:ObjectRemoved:*']})
+    if notifications:
+        s3.put_bucket_notification_configuration(Bucket=bucket,
+                                                 NotificationConfiguration={'QueueConfigurations': notifications})
+
+    user_pool_id = cognito.create_user_pool(PoolName=f'{prefix}-users')['UserPool']['Id']
+    client_id = cognito.create_user_pool_client(
+        UserPoolId=user_pool_id, ClientName=f'{prefix}-client',
+        ExplicitAuthFlows=['ALLOW_ADMIN_USER_PASSWORD_AUTH', 'ALLOW_USER_PASSWORD_AUTH', 'ALLOW_REFRESH_TOKEN_AUTH']
+    )['UserPoolClient']['ClientId']
+    cognito.admin_create_user(UserPoolId=user_pool_id, Username=username, MessageAction='SUPPRESS',
+                              UserAttributes=[{'Name': 'email', 'Value': f'{username}@example.com'},
+                                              {'Name': 'email_verified', 'Value': 'true'}])
+    cognito.admin_set_user_password(UserPoolId=user_pool_id, Username=username, Password=password, Permanent=True)
+
+    return {
+        'DIGITAL_ASSETS_BUCKET_NAME': bucket,
+        'DYNAMODB_TABLE_NAME': table,
+        'UPLOAD_DATE_INDEX_NAME': 'user_id-upload_date-index',
+        'COLLECTION_VERSIONS_TABLE_NAME': versions_table,
+        'JOBS_TABLE_NAME': jobs_table,
+        'IDEMPOTENCY_TABLE_NAME': idempotency_table,
+        'COGNITO_USER_POOL_ID': user_pool_id,
+        'COGNITO_USER_POOL_CLIENT_ID': client_id,
+        'DOCUMENT_KMS_KEY_ID': document_key_arn,
+        **{f'module.{name}.queue_url': url for name, url in queue_urls.items()}
+    }
+
+
+# Invocation
+
+class LambdaContext:
+    """The parts of the Lambda context object the handlers use."""
+
+    def __init__(self, function):
+        self.function_name = function['name']
+        self.function_version = '$LATEST'
+        self.invoked_function_arn = f"arn:aws:lambda:{REGION}:{ACCOUNT_ID}:function:{function['name']}"
+        self.memory_limit_in_mb = function['memory_size']
+        self.aws_request_id = str(uuid.uuid4())
+        self.log_group_name = f"/aws/lambda/{function['name']}"
+        self.log_stream_name = 'local'
+        self._deadline = time.monotonic() + function['timeout']
+
+    def get_remaining_time_in_millis(self):
+        return max(0, int((self._deadline - time.monotonic()) * 1000))
+
+
+# Handlers imported by this process, by function name
+_handlers = {}
+
+
+def load_handler(function):
+    """Import a function's handler module once per process, with the function's environment."""
+    if function['name'] not in _handlers:
+        for directory in (UTILS_DIR, os.path.dirname(function['path'])):
+            if directory not in sys.path:
+                sys.path.insert(0, directory)
+        os.environ.update(function['resolved_environment'])
+        module_name, attribute = function['handler'].rsplit('.', 1)
+        spec = importlib.util.spec_from_file_location(module_name, function['path'])
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[module_name] = module
+        spec.loader.exec_module(module)
+        _handlers[function['name']] = getattr(module, attribute)
+    return _handlers[function['name']]
+
+
+def invoke(function, event):
+    """Invoke a function's handler, returning (result, traceback or None, seconds)."""
+    started = time.perf_counter()
+    try:
+        handler = load_handler(function)
+        os.environ.update(function['resolved_environment'])
+        result = handler(event, LambdaContext(function))
+        return result, None, time.perf_counter() - started
+    except Exception:
+        return None, traceback.format_exc(), time.perf_counter() - started
+
+
+def redirect_jwks_fetch(endpoint_url):
+    """
+    Fetch the handlers' JWKS documents from moto, which serves the user pools' signing keys.
+
+    auth_utils builds a PyJWKClient for the Cognito JWKS URL of the pool; the client it gets
+    instead fetches the same path from moto. Tokens are still checked against the Cognito
+    issuer, and nothing outside this process changes.
+    """
+    if UTILS_DIR not in sys.path:
+        sys.path.insert(0, UTILS_DIR)
+    import auth_utils
+
+    class MotoJwksClient(auth_utils.PyJWKClient):
+        def __init__(self, uri, *args, **kwargs):
+            super().__init__(re.sub(r'^https://cognito-idp\.[^/]+', endpoint_url, uri), *args, **kwargs)
+
+    auth_utils.PyJWKClient = MotoJwksClient
+
+
+def init_worker(base_environment):
+    """Set up a worker process as an empty Lambda container."""
+    os.environ.update(base_environment)
+    redirect_jwks_fetch(base_environment['AWS_ENDPOINT_URL'])
+
+
+class InProcessInvoker:
+    """Runs handlers in this process, each function taking one invocation at a time."""
+
+    def __init__(self, base_environment):
+        os.environ.update(base_environment)
+        redirect_jwks_fetch(base_environment['AWS_ENDPOINT_URL'])
+        self._locks = defaultdict(threading.Lock)
+
+    def invoke(self, function, event):
+        with self._locks[function['name']]:
+            return invoke(function, event)
+
+    def close(self):
+        pass
+
+
+class ProcessPoolInvoker:
+    """Runs handlers in worker processes, each taking one invocation at a time like a container."""
+
+    def __init__(self, base_environment, workers):
+        self._executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                             initializer=init_worker, initargs=(base_environment,))
+
+    def invoke(self, function, event):
+        return self._executor.submit(invoke, function, event).result()
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class QueuePoller(threading.Thread):
+    """
+    Feeds a queue's messages to its consumer, as Lambda's SQS event source mapping does.
+
+    Records the consumer reports in batchItemFailures, or all of them if it raises, are
+    made visible again after retry_delay seconds; the others are deleted.
+    """
+
+    def __init__(self, sqs, queue_url, function, invoker, batch_size=1, retry_delay=5):
+        super().__init__(name=f"poller-{function['name']}", daemon=True)
+        self.sqs = sqs
+        self.queue_url = queue_url
+        self.queue_arn = sqs.get_queue_attributes(QueueUrl=queue_url,
+                                                  AttributeNames=['QueueArn'])['Attributes']['QueueArn']
+        self.function = function
+        self.invoker = invoker
+        self.batch_size = batch_size
+        self.retry_delay = retry_delay
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                messages = self.sqs.receive_message(QueueUrl=self.queue_url, MaxNumberOfMessages=self.batch_size,
+                                                    WaitTimeSeconds=1, AttributeNames=['All']).get('Messages', [])
+            except Exception as e:
+                logger.warning(f"Polling {self.queue_url} failed: {str(e)}")
+                self.stopped.wait(1)
+                continue
+            if messages:
+                self.deliver(messages)
+
+    def deliver(self, messages):
+        records = [{
+            'messageId': message['MessageId'],
+            'receiptHandle': message['ReceiptHandle'],
+            'body': message['Body'],
+            'attributes': message.get('Attributes', {}),
+            'messageAttributes': {},
+            'eventSource': 'aws:sqs',
+            'eventSourceARN': self.queue_arn,
+            'awsRegion': REGION
+        } for message in messages]
+        result, error, seconds = self.invoker.invoke(self.function, {'Records': records})
+        if error:
+            logger.error(f"{self.function['name']} failed on {len(records)} messages:\n{error}")
+            failed = {record['messageId'] for record in records}
+        else:
+            failed = {failure['itemIdentifier'] for failure in (result or {}).get('batchItemFailures', [])}
+        logger.info(f"{self.function['name']} took {len(records)} messages in {seconds * 1000:.0f} ms, "
+                    f"{len(failed)} failed")
+        for record in records:
+            if record['messageId'] in failed:
+                self.sqs.change_message_visibility(QueueUrl=self.queue_url, ReceiptHandle=record['receiptHandle'],
+                                                   VisibilityTimeout=self.retry_delay)
+            else:
+                self.sqs.delete_message(QueueUrl=self.queue_url, ReceiptHandle=record['receiptHandle'])
+
+
+class StreamPoller(threading.Thread):
+    """
+    Feeds a table's stream to a consumer, as Lambda's DynamoDB event source mapping does.
+
+    Each shard is read from the records written after the poller was created, like
+    starting_position = "LATEST". A batch whose invocation fails is retried after
+    retry_delay seconds, holding back the shard's later records, and skipped after
+    max_retries retries.
+    """
+
+    def __init__(self, streams, stream_arn, function, invoker, batch_size=100, retry_delay=5, max_retries=5):
+        super().__init__(name=f"stream-poller-{function['name']}", daemon=True)
+        self.streams = streams
+        self.stream_arn = stream_arn
+        self.function = function
+        self.invoker = invoker
+        self.batch_size = batch_size
+        self.retry_delay = retry_delay
+        self.max_retries = max_retries
+        self.stopped = threading.Event()
+        self.iterators = {}     # Shard ID to its next iterator, None once the shard is closed
+        self.refresh_shards('LATEST')
+
+    def refresh_shards(self, iterator_type='TRIM_HORIZON'):
+        """Start reading shards not seen before, from their first record unless told otherwise."""
+        shards = self.streams.describe_stream(StreamArn=self.stream_arn)['StreamDescription']['Shards']
+        for shard in shards:
+            if shard['ShardId'] not in self.iterators:
+                self.iterators[shard['ShardId']] = self.streams.get_shard_iterator(
+                    StreamArn=self.stream_arn, ShardId=shard['ShardId'], ShardIteratorType=iterator_type
+                )['ShardIterator']
+
+    def run(self):
+        while not self.stopped.is_set():
+            received = False
+            try:
+                self.refresh_shards()
+                for shard_id, iterator in self.iterators.items():
+                    if iterator is None:
+                        continue
+                    response = self.streams.get_records(ShardIterator=iterator, Limit=self.batch_size)
+                    self.iterators[shard_id] = response.get('NextShardIterator')
+                    if response['Records']:
+                        received = True
+                        self.deliver(response['Records'])
+            except Exception as e:
+                logger.warning(f"Polling {self.stream_arn} failed: {str(e)}")
+                self.stopped.wait(1)
+                continue
+            if not received:
+                self.stopped.wait(1)    # The module's one second batching window
+
+    def deliver(self, records):
+        event = {'Records': [self.build_record(record) for record in records]}
+        for attempt in range(self.max_retries + 1):
+            result, error, seconds = self.invoker.invoke(self.function, event)
+            if not error:
+                logger.info(f"{self.function['name']} took {len(records)} stream records in {seconds * 1000:.0f} ms")
+                return
+            logger.error(f"{self.function['name']} failed on {len(records)} stream records:\n{error}")
+            if self.stopped.wait(self.retry_delay):
+                return
+        logger.error(f"{self.function['name']}: skipping {len(records)} stream records after "
+                     f"{self.max_retries} retries")
+
+    def build_record(self, record):
+        """Shape a GetRecords record as Lambda delivers it, with the stream ARN and epoch times."""
+        change = dict(record['dynamodb'])
+        if isinstance(change.get('ApproximateCreationDateTime'), datetime):
+            change['ApproximateCreationDateTime'] = change['ApproximateCreationDateTime'].timestamp()
+        return {**record, 'dynamodb': change, 'eventSourceARN': self.stream_arn}
+
+
+# HTTP
+
+def build_event(method, raw_path, query, headers, body, route_key, stage, host, source_ip):
+    """Build an API Gateway v2 proxy event (payload format 2.0) for a request."""
+    now = datetime.now(timezone.utc)
+    cookies = headers.pop('cookie', None)
+    event = {
+        'version': '2.0',
+        'routeKey': route_key,
+        'rawPath': raw_path,
+        'rawQueryString': query,
+        'headers': headers,
+        'requestContext': {
+            'accountId': ACCOUNT_ID,
+            'apiId': 'local',
+            'domainName': host,
+            'domainPrefix': host.split('.')[0],
+            'http': {'method': method, 'path': raw_path, 'protocol': 'HTTP/1.1', 'sourceIp': source_ip,
+                     'userAgent': headers.get('user-agent', '')},
+            'requestId': uuid.uuid4().hex,
+            'routeKey': route_key,
+            'stage': stage,
+            'time': now.strftime('%d/%b/%Y:%H:%M:%S +0000'),
+            'timeEpoch': int(now.timestamp() * 1000)
+        },
+        'isBase64Encoded': False
+    }
+    if cookies:
+        event['cookies'] = [cookie.strip() for cookie in cookies.split(';')]
+    if query:
+        parameters = defaultdict(list)
+        for name, value in parse_qsl(query, keep_blank_values=True):
+            parameters[name].append(value)
+        event['queryStringParameters'] = {name: ','.join(values) for name, values in parameters.items()}
+    if body:
+        if headers.get('content-type', '').startswith(TEXT_CONTENT_TYPES):
+            event['body'] = body.decode('utf-8', errors='replace')
+        else:
+            event['body'] = base64.b64encode(body).decode('ascii')
+            event['isBase64Encoded'] = True
+    return event
+
+
+def map_response(result):
+    """Turn a handler's result into (status, headers, body), as API Gateway maps format 2.0 responses."""
+    if not (isinstance(result, dict) and 'statusCode' in result):
+        return 200, {'Content-Type': 'application/json'}, json.dumps(result).encode('utf-8')
+    headers = {str(name): str(value) for name, value in (result.get('headers') or {}).items()}
+    if not any(name.lower() == 'content-type' for name in headers):
+        headers['Content-Type'] = 'application/json'
+    body = result.get('body') or ''
+    if not isinstance(body, str):
+        body = json.dumps(body)
+    data = base64.b64decode(body) if result.get('isBase64Encoded') else body.encode('utf-8')
+    return int(result['statusCode']), headers, data
+
+
+class ApiRequestHandler(BaseHTTPRequestHandler):
+    """Routes each request to its function, like an HTTP API stage with Lambda proxy integrations."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def handle_request(self):
+        server = self.server
+        split = urlsplit(self.path)
+        path = split.path
+        if path.startswith(f'/{server.stage}/'):
+            path = path[len(server.stage) + 1:]
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+
+        route_key = f'{self.command} {path}'
+        function = server.routes.get(route_key)
+        if not function:
+            return self.respond(404, {'Content-Type': 'application/json'}, b'{"message":"Not Found"}')
+
+        headers = {}
+        for name, value in self.headers.items():
+            name = name.lower()
+            headers[name] = f'{headers[name]},{value}' if name in headers else value
+        event = build_event(self.command, split.path, split.query, headers, body, route_key, server.stage,
+                            self.headers.get('Host', 'localhost'), self.client_address[0])
+        if len(json.dumps(event)) > LAMBDA_PAYLOAD_LIMIT:
+            return self.respond(413, {'Content-Type': 'application/json'}, b'{"message":"Request Entity Too Large"}')
+
+        result, error, seconds = server.invoker.invoke(function, event)
+        if error:
+            logger.error(f"{function['name']} raised:\n{error}")
+            return self.respond(500, {'Content-Type': 'application/json'}, b'{"message":"Internal Server Error"}')
+        if len(json.dumps(result, default=str)) > LAMBDA_PAYLOAD_LIMIT:
+            logger.error(f"{function['name']} returned more than {LAMBDA_PAYLOAD_LIMIT} bytes")
+            return self.respond(500, {'Content-Type': 'application/json'}, b'{"message":"Internal Server Error"}')
+        if seconds > function['timeout']:
+            logger.warning(f"{function['name']} ran {seconds:.1f}s, Lambda would have timed out after "
+                           f"{function['timeout']}s")
+
+        status, response_headers, data = map_response(result)
+        logger.info(f"{route_key} {status} {seconds * 1000:.1f} ms")
+        self.respond(status, response_headers, data, (result or {}).get('cookies') if isinstance(result, dict) else None)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = do_OPTIONS = do_HEAD = handle_request
+
+    def respond(self, status, headers, data, cookies=None):
+        self.send_response(status)
+        for name, value in headers.items():
+            if name.lower() not in ('content-length', 'connection'):
+                self.send_header(name, value)
+        for cookie in cookies or []:
+            self.send_header('Set-Cookie', cookie)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+class ApiServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, address, routes, stage, invoker):
+        super().__init__(address, ApiRequestHandler)
+        self.routes = routes
+        self.stage = stage
+        self.invoker = invoker
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--moto-port', type=int, default=5055)
+    parser.add_argument('--stage', default='dev', help='Stage name, the environment in Terraform')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='Worker processes running handlers, 0 runs them in this process')
+    parser.add_argument('--username', default='loadtest')
+    parser.add_argument('--password', default='Load-test-1')
+    parser.add_argument('--log-level', default='INFO', help='Level of the per-request log lines')
+    parser.add_argument('--handler-log-level', default='WARNING', help='LOGGING_LEVEL given to the handlers')
+    parser.add_argument('--document-encryption', default='off', choices=('off', 'envelope'),
+                        help='DOCUMENT_ENCRYPTION given to the handlers writing documents')
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level.upper(), format='%(asctime)s %(levelname)s %(message)s')
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)    # moto's own access log
+
+    functions = load_functions()
+    routes = load_routes(functions)
+
+    moto = ThreadedMotoServer(ip_address='127.0.0.1', port=args.moto_port)
+    moto.start()
+    endpoint_url = f'http://127.0.0.1:{args.moto_port}'
+    queues, notified_queues = load_queues()
+    stream_consumers = load_stream_consumers()
+    resources = provision(endpoint_url, f'{args.stage}-local', args.username, args.password,
+                          queues, notified_queues)
+    resources['DOCUMENT_ENCRYPTION'] = args.document_encryption
+    for function in functions.values():
+        function['resolved_environment'] = resolve_environment(function, resources)
+
+    base_environment = {
+        'AWS_REGION': REGION, 'AWS_DEFAULT_REGION': REGION,
+        'AWS_ACCESS_KEY_ID': 'testing', 'AWS_SECRET_ACCESS_KEY': 'testing',
+        'AWS_ENDPOINT_URL': endpoint_url,           # Every boto3 client goes to moto
+        'LOGGING_LEVEL': args.handler_log_level
+    }
+    invoker = (ProcessPoolInvoker(base_environment, args.workers) if args.workers
+               else InProcessInvoker(base_environment))
+    server = ApiServer((args.host, args.port), routes, args.stage, invoker)
+
+    sqs = boto3.client('sqs', endpoint_url=endpoint_url, region_name=REGION,
+                       aws_access_key_id='testing', aws_secret_access_key='testing')
+    # SQS hands out at most 10 messages per receive
+    pollers = [QueuePoller(sqs, resources[f'module.{queue}.queue_url'], functions[name], invoker,
+                           batch_size=min(settings['batch_size'], 10))
+               for queue, settings in queues.items() for name in settings['consumers'] if name in functions]
+
+    dynamodb = boto3.client('dynamodb', endpoint_url=endpoint_url, region_name=REGION,
+                            aws_access_key_id='testing', aws_secret_access_key='testing')
+    streams = boto3.client('dynamodbstreams', endpoint_url=endpoint_url, region_name=REGION,
+                           aws_access_key_id='testing', aws_secret_access_key='testing')
+    stream_arn = dynamodb.describe_table(TableName=resources['DYNAMODB_TABLE_NAME'])['Table']['LatestStreamArn']
+    pollers += [StreamPoller(streams, stream_arn, functions[name], invoker, batch_size=batch_size)
+                for name, batch_size in stream_consumers.items() if name in functions]
+    for poller in pollers:
+        poller.start()
+
+    print(f"API:   http://{args.host}:{server.server_port}/{args.stage} "
+          f"({len(routes)} routes, {args.workers or 'in-process'} workers)")
+    print(f"AWS:   {endpoint_url} (moto)")
+    print(f"Login: {args.username} / {args.password}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        for poller in pollers:
+            poller.stopped.set()
+        invoker.close()
+        moto.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Load generator for the platform's HTTP API, reporting throughput and latency percentiles.
+
+Each of --concurrency threads runs flows of the chosen scenario back to back, until
+--requests flows have run or --duration seconds have passed:
+
+    multipart   multipart_start_upload, multipart_generate_presigned_urls, a PUT of every
+                part to its presigned URL, then multipart_complete_upload
+    upload      upload_asset with the document in the request body
+    view        view_asset of a document uploaded before the run
+    list        list_assets, first page
+
+Every step and every whole flow is timed. Steps go through the asset_client package
+without retries, so errors are counted instead of hidden. Point --url at the local
+emulator (api_emulator.py) or at a deployed stage.
+
+Usage:
+    python3 lambdas/local-api/load_generator.py --url http://127.0.0.1:8080/dev \\
+        --scenario multipart --concurrency 16 --requests 200 --size-kb 12288
+"""
+import argparse
+import hashlib
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'client'))
+
+from asset_client.api import AssetsApiClient, base64_checksum, request  # noqa: E402
+from asset_client.retry import RetryPolicy  # noqa: E402
+
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+class Recorder:
+    """Thread-safe latency samples and error counts, by step name."""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.error_examples = {}
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+
+    def timed(self, step, operation, sent=0):
+        """Run and time one step, recording it as an error if it raises."""
+        started = time.perf_counter()
+        try:
+            result = operation()
+        except Exception as e:
+            with self._lock:
+                self.errors[step] += 1
+                self.error_examples.setdefault(step, str(e)[:200])
+            raise
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.samples[step].append(elapsed)
+            self.bytes_sent += sent
+        return result
+
+
+def percentile(sorted_samples, fraction):
+    """Nearest-rank percentile of sorted samples."""
+    if not sorted_samples:
+        return 0.0
+    return sorted_samples[min(len(sorted_samples) - 1, max(0, round(fraction * len(sorted_samples)) - 1))]
+
+
+class Scenario:
+    """One kind of flow, with any setup it needs before the run."""
+
+    def __init__(self, api, recorder, payload, part_size):
+        self.api = api
+        self.recorder = recorder
+        self.payload = payload
+        self.part_size = part_size
+        self.run_id = uuid.uuid4().hex[:8]
+        self.parts = [payload[start:start + part_size] for start in range(0, len(payload), part_size)] or [b'']
+        self.checksums = [base64_checksum(hashlib.sha256(part).digest()) for part in self.parts]
+        self.view_name = None
+
+    def setup(self, name):
+        if name == 'view':
+            self.view_name = f'load/{self.run_id}-view.bin'
+            self.api.upload_asset(self.view_name, self.payload)
+
+    def multipart(self, index):
+        name = f'load/{self.run_id}-{index}.bin'
+        timed = self.recorder.timed
+        upload_id = timed('multipart_start_upload',
+                          lambda: self.api.start_multipart_upload(name, 'application/octet-stream'))['uploadId']
+        presigned = timed('multipart_generate_presigned_urls',
+                          lambda: self.api.generate_presigned_urls(upload_id, name, self.checksums))
+        parts = []
+        for number, (url, part, checksum) in enumerate(zip(presigned['partUrls'], self.parts, self.checksums), 1):
+            _, headers, _ = timed('part PUT', lambda: request('PUT', url, part, {
+                'Content-Type': 'application/octet-stream', presigned['checksumHeader']: checksum
+            }), sent=len(part))
+            parts.append({'PartNumber': number, 'ETag': headers.get('ETag') or headers.get('etag'),
+                          'ChecksumSHA256': checksum})
+        timed('multipart_complete_upload', lambda: self.api.complete_multipart_upload(upload_id, name, parts))
+
+    def upload(self, index):
+        name = f'load/{self.run_id}-{index}.bin'
+        self.recorder.timed('upload_asset', lambda: self.api.upload_asset(name, self.payload), sent=len(self.payload))
+
+    def view(self, index):
+        self.recorder.timed('view_asset', lambda: self.api.view_asset(self.view_name))
+
+    def list(self, index):
+        self.recorder.timed('list_assets', lambda: next(self.api.list_assets(limit=50), None))
+
+
+def run(scenario, name, concurrency, requests, duration):
+    """Run flows on concurrency threads until requests flows ran or duration passed."""
+    flow = getattr(scenario, name)
+    counter = iter(range(requests or sys.maxsize))
+    counter_lock = threading.Lock()
+    deadline = time.monotonic() + duration if duration else None
+
+    def worker():
+        while deadline is None or time.monotonic() < deadline:
+            with counter_lock:
+                index = next(counter, None)
+            if index is None:
+                return
+            try:
+                scenario.recorder.timed(f'{name} flow', lambda: flow(index))
+            except Exception:
+                pass    # Counted against the failed step and the flow
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for future in [executor.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    return time.perf_counter() - started
+
+
+def report(recorder, elapsed, concurrency):
+    print(f"\n{elapsed:.1f}s at concurrency {concurrency}, "
+          f"{recorder.bytes_sent / elapsed / 1048576:.1f} MB/s sent\n")
+    print(f"{'step':36} {'ok':>7} {'errors':>7} {'per s':>8} {'p50 ms':>9} {'p90 ms':>9} "
+          f"{'p99 ms':>9} {'max ms':>9}")
+    for step in sorted(set(recorder.samples) | set(recorder.errors), key=lambda step: step.endswith('flow')):
+        samples = sorted(recorder.samples[step])
+        print(f"{step:36} {len(samples):7} {recorder.errors[step]:7} {len(samples) / elapsed:8.1f} "
+              f"{percentile(samples, 0.5) * 1000:9.1f} {percentile(samples, 0.9) * 1000:9.1f} "
+              f"{percentile(samples, 0.99) * 1000:9.1f} {(samples[-1] if samples else 0) * 1000:9.1f}")
+    for step, message in recorder.error_examples.items():
+        print(f"first {step} error: {message}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:8080/dev', help='API base URL, including the stage')
+    parser.add_argument('--username', default='loadtest')
+    parser.add_argument('--password', default='Load-test-1')
+    parser.add_argument('--scenario', choices=('multipart', 'upload', 'view', 'list'), default='multipart')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=100, help='Flows to run, 0 for no limit')
+    parser.add_argument('--duration', type=float, default=0, help='Stop after this many seconds, 0 for no limit')
+    parser.add_argument('--size-kb', type=int, default=64, help='Document size of upload, view and multipart')
+    parser.add_argument('--part-size-mb', type=int, default=5, help='Multipart part size, at least 5')
+    args = parser.parse_args()
+    if not args.requests and not args.duration:
+        parser.error('set --requests or --duration')
+
+    api = AssetsApiClient(args.url, timeout=120, retry=RetryPolicy(max_attempts=1))
+    api.login(args.username, args.password)
+    recorder = Recorder()
+    payload = random.Random(7).randbytes(args.size_kb * 1024)
+    scenario = Scenario(api, recorder, payload, max(args.part_size_mb * 1048576, MIN_PART_SIZE))
+    scenario.setup(args.scenario)
+
+    elapsed = run(scenario, args.scenario, args.concurrency, args.requests, args.duration)
+    report(recorder, elapsed, args.concurrency)
+    sys.exit(1 if any(recorder.errors.values()) else 0)
+
+
+if __name__ == '__main__':
+    main()
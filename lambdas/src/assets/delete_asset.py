@@ -1,16 +1,23 @@
 import json
 import boto3
 import os
-from jwt import PyJWKClient
 import jwt
 from botocore.exceptions import ClientError
 
 from logging_utils import configure_logging
+from auth_utils import get_jwks_client
+from warmup_utils import handle_warmup, is_warmup_event, register_snapshot_hooks
 from cors_utils import get_cors_headers_from_event
+from retry_utils import RETRY_CLIENT_CONFIG, RetryPolicy, is_unavailable, unavailable_response
+from storage_utils import derived_key, THUMBNAIL_ARTIFACT, EXCERPT_ARTIFACT, CHUNK_MANIFEST_ARTIFACT
 
 # Initialize AWS clients
-s3_client = boto3.client('s3')
-dynamodb_client = boto3.client('dynamodb')
+s3_client = boto3.client('s3', config=RETRY_CLIENT_CONFIG)
+dynamodb_client = boto3.client('dynamodb', config=RETRY_CLIENT_CONFIG)
+
+# Retry throttled and failed calls within the invocation's deadline
+retry_policy = RetryPolicy()
+retry_policy.install(s3_client, dynamodb_client)
 
 # Validate environment variables at cold start
 DIGITAL_ASSETS_BUCKET_NAME = os.getenv('DIGITAL_ASSETS_BUCKET_NAME')
@@ -21,11 +28,17 @@ AWS_REGION = os.getenv('AWS_REGION')
 if not all([DIGITAL_ASSETS_BUCKET_NAME, DYNAMODB_TABLE_NAME, COGNITO_USER_POOL_ID, AWS_REGION]):
     raise ValueError("Missing required environment variables")
 
+# Prime connections and keys before a snapshot, and refresh them after a restore
+register_snapshot_hooks([s3_client, dynamodb_client], AWS_REGION, COGNITO_USER_POOL_ID)
+
 def lambda_handler(event, context):
     """
     Lambda function handler for deleting documents from S3 and DynamoDB.
     """
     logger = configure_logging()
+    retry_policy.start_invocation(context)
+    if is_warmup_event(event):
+        return handle_warmup(logger, [s3_client, dynamodb_client], AWS_REGION, COGNITO_USER_POOL_ID)
     logger.info("Lambda function started")
     logger.debug("Received event: %s", json.dumps(event))
 
@@ -70,12 +83,18 @@ def handle_post_request(event, logger, cors_headers):
         # Delete document from S3
         delete_document_from_s3(user_id, document_name, logger, cors_headers)
 
+        # Delete any previews derived from the document
+        delete_derived_artifacts(user_id, document_name, logger)
+
         # Delete document metadata from DynamoDB
         delete_document_from_dynamodb(user_id, document_name, logger, cors_headers)
 
-        return generate_response(200, f'Document {document_name} deleted successfully.', cors_headers)
+        return generate_response(200, f'Document {document_name} deleted successfully.', cors_headers, logger)
 
     except Exception as e:
+        if is_unavailable(e):
+            logger.warning(f"Dependency unavailable: {str(e)}")
+            return unavailable_response(e, cors_headers)
         logger.error(f"An unexpected error occurred: {str(e)}")
         return generate_response(500, f'An unexpected error occurred: {str(e)}', cors_headers, logger)
 
@@ -95,7 +114,7 @@ def validate_jwt_token(token, logger, cors_headers):
     jwks_url = f'{cognito_issuer}/.well-known/jwks.json'
 
     try:
-        jwks_client = PyJWKClient(jwks_url)
+        jwks_client = get_jwks_client(jwks_url)
         signing_key = jwks_client.get_signing_key_from_jwt(token).key
         logger.info("Public key fetched successfully from JWKS URL")
 
@@ -133,6 +152,27 @@ def delete_document_from_s3(user_id, document_name, logger, cors_headers):
         raise
 
 
+def delete_derived_artifacts(user_id, document_name, logger):
+    """Delete the preview artifacts derived from a document in a single request."""
+    try:
+        response = s3_client.delete_objects(
+            Bucket=DIGITAL_ASSETS_BUCKET_NAME,
+            Delete={
+                'Objects': [
+                    {'Key': derived_key(user_id, document_name, THUMBNAIL_ARTIFACT)},
+                    {'Key': derived_key(user_id, document_name, EXCERPT_ARTIFACT)},
+                    {'Key': derived_key(user_id, document_name, CHUNK_MANIFEST_ARTIFACT)}
+                ],
+                'Quiet': True
+            }
+        )
+        for error in response.get('Errors', []):
+            logger.warning(f"Failed to delete derived artifact {error['Key']}: {error['Message']}")
+    except ClientError as e:
+        # Orphaned previews are harmless, so this does not fail the delete
+        logger.warning(f"Failed to delete derived artifacts: {e.response['Error']['Message']}")
+
+
 def delete_document_from_dynamodb(user_id, document_name, logger, cors_headers):
     """Delete a document record from DynamoDB."""
     try:
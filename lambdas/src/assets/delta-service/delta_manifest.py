@@ -0,0 +1,106 @@
+import json
+import os
+import boto3
+from botocore.exceptions import ClientError
+from logging_utils import configure_logging
+from warmup_utils import handle_warmup, is_warmup_event, register_snapshot_hooks
+from cors_utils import get_cors_headers_from_event
+from auth_utils import extract_and_verify_token
+from response_utils import compress_response
+from delta_utils import DeltaConflict, load_chunk_manifest
+from storage_utils import document_key
+
+# Initialize AWS clients
+s3_client = boto3.client('s3')
+
+# Validate environment variables at cold start
+DIGITAL_ASSETS_BUCKET_NAME = os.getenv('DIGITAL_ASSETS_BUCKET_NAME')
+COGNITO_USER_POOL_ID = os.getenv('COGNITO_USER_POOL_ID')
+AWS_REGION = os.getenv('AWS_REGION')
+
+if not all([DIGITAL_ASSETS_BUCKET_NAME, COGNITO_USER_POOL_ID, AWS_REGION]):
+    raise ValueError("Missing required environment variables")
+
+# New bytes a delta_update request may carry, base64 keeps it under the 6 MB payload limit
+DELTA_MAX_NEW_BYTES = int(os.getenv('DELTA_MAX_NEW_BYTES', str(4 * 1024 * 1024)))
+
+# Prime connections and keys before a snapshot, and refresh them after a restore
+register_snapshot_hooks([s3_client], AWS_REGION, COGNITO_USER_POOL_ID)
+
+
+def lambda_handler(event, context):
+    """
+    Lambda function handler for fetching a document's chunk manifest.
+    """
+    logger = configure_logging()
+    if is_warmup_event(event):
+        return handle_warmup(logger, [s3_client], AWS_REGION, COGNITO_USER_POOL_ID)
+    logger.info("Lambda function started")
+    logger.debug("Received event: %s", json.dumps(event))
+
+    # Get CORS headers
+    cors_headers = get_cors_headers_from_event(event, logger)
+
+    # Determine the HTTP method
+    http_method = event.get('routeKey', '').split()[0] or event.get('httpMethod')
+
+    if http_method == 'OPTIONS':
+        return generate_response(200, 'CORS preflight', cors_headers)
+
+    elif http_method == 'POST':
+        return compress_response(event, handle_post_request(event, logger, cors_headers), logger)
+
+    return generate_response(405, f'Method {http_method} not allowed', cors_headers)
+
+
+def handle_post_request(event, logger, cors_headers):
+    """
+    Handle POST request for the chunk manifest of a document's current version.
+
+    The client chunks its new version with the same chunker and sends delta_update only
+    the chunks whose hashes are not in this manifest.
+    """
+    try:
+        auth_result = extract_and_verify_token(event, AWS_REGION, COGNITO_USER_POOL_ID)
+        if auth_result['statusCode'] != 200:
+            return generate_response(auth_result['statusCode'], auth_result['body']['message'], cors_headers)
+        user_id = auth_result['body']['user_id']
+
+        # Parse request body
+        body = json.loads(event.get('body') or '{}')
+        document_name = body.get('document_name')
+        if not document_name:
+            return generate_response(400, 'document_name is required', cors_headers)
+
+        head = s3_client.head_object(Bucket=DIGITAL_ASSETS_BUCKET_NAME, Key=document_key(user_id, document_name))
+        manifest = load_chunk_manifest(s3_client, DIGITAL_ASSETS_BUCKET_NAME, user_id, document_name, head, logger)
+        return generate_response(200, {
+            'document_name': document_name,
+            'etag': manifest['etag'].strip('"'),
+            'size': manifest['size'],
+            'chunker': manifest['chunker'],
+            'chunks': manifest['chunks'],
+            'max_new_bytes': DELTA_MAX_NEW_BYTES
+        }, cors_headers)
+
+    except DeltaConflict as e:
+        return generate_response(409, str(e), cors_headers)
+    except json.JSONDecodeError:
+        return generate_response(400, 'Invalid JSON body', cors_headers)
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+            return generate_response(404, 'Document not found', cors_headers)
+        logger.error(f"AWS error while reading the chunk manifest: {e.response['Error']['Message']}")
+        return generate_response(500, 'Failed to read the chunk manifest', cors_headers)
+    except Exception as e:
+        logger.error(f"An unexpected error occurred: {str(e)}")
+        return generate_response(500, f'An unexpected error occurred: {str(e)}', cors_headers)
+
+
+def generate_response(status_code, message, cors_headers):
+    """Generate an HTTP response with CORS headers."""
+    return {
+        'statusCode': status_code,
+        'headers': cors_headers,
+        'body': json.dumps(message)
+    }
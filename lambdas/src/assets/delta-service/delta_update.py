@@ -0,0 +1,176 @@
+import base64
+import binascii
+import json
+import os
+import boto3
+from botocore.exceptions import ClientError
+from logging_utils import configure_logging
+from warmup_utils import handle_warmup, is_warmup_event, register_snapshot_hooks
+from cors_utils import get_cors_headers_from_event
+from auth_utils import extract_and_verify_token
+from chunking import CHUNKER
+from compression_utils import CODEC_NONE
+from delta_utils import (DeltaConflict, assemble_document, document_size, load_chunk_manifest, plan_segments,
+                         rewrite_compressed_document, save_chunk_manifest, stored_codec)
+from metadata_utils import build_document_item_from_head, save_document_item
+from metrics_utils import emit_metrics
+from storage_utils import document_key
+
+# Initialize AWS clients
+s3_client = boto3.client('s3')
+dynamodb_client = boto3.client('dynamodb')
+
+# Validate environment variables at cold start
+DIGITAL_ASSETS_BUCKET_NAME = os.getenv('DIGITAL_ASSETS_BUCKET_NAME')
+DYNAMODB_TABLE_NAME = os.getenv('DYNAMODB_TABLE_NAME')
+COGNITO_USER_POOL_ID = os.getenv('COGNITO_USER_POOL_ID')
+AWS_REGION = os.getenv('AWS_REGION')
+
+if not all([DIGITAL_ASSETS_BUCKET_NAME, DYNAMODB_TABLE_NAME, COGNITO_USER_POOL_ID, AWS_REGION]):
+    raise ValueError("Missing required environment variables")
+
+# New bytes a request may carry, base64 keeps it under the 6 MB payload limit
+DELTA_MAX_NEW_BYTES = int(os.getenv('DELTA_MAX_NEW_BYTES', str(4 * 1024 * 1024)))
+DELTA_COPY_WORKERS = int(os.getenv('DELTA_COPY_WORKERS', '8'))
+
+# 'events' leaves the metadata item to register_metadata, as in upload_asset
+METADATA_REGISTRATION = os.getenv('METADATA_REGISTRATION', 'sync')
+
+# Prime connections and keys before a snapshot, and refresh them after a restore
+register_snapshot_hooks([s3_client, dynamodb_client], AWS_REGION, COGNITO_USER_POOL_ID)
+
+
+def lambda_handler(event, context):
+    """
+    Lambda function handler for updating a document from its changed chunks.
+    """
+    logger = configure_logging()
+    if is_warmup_event(event):
+        return handle_warmup(logger, [s3_client, dynamodb_client], AWS_REGION, COGNITO_USER_POOL_ID)
+    logger.info("Lambda function started")
+    logger.debug("Received event: %s", json.dumps(event))
+
+    # Get CORS headers
+    cors_headers = get_cors_headers_from_event(event, logger)
+
+    # Determine the HTTP method
+    http_method = event.get('routeKey', '').split()[0] or event.get('httpMethod')
+
+    if http_method == 'OPTIONS':
+        return generate_response(200, 'CORS preflight', cors_headers)
+
+    elif http_method == 'POST':
+        return handle_post_request(event, logger, cors_headers)
+
+    return generate_response(405, f'Method {http_method} not allowed', cors_headers)
+
+
+def handle_post_request(event, logger, cors_headers):
+    """
+    Handle POST request for a delta update.
+
+    The body holds 'document_name', the 'base_etag' of the version the client chunked
+    against (from delta_manifest), and the new version as 'chunks': {'sha256'} for a chunk
+    of the base version, or {'data'} with the base64 bytes of a new chunk.
+    """
+    try:
+        auth_result = extract_and_verify_token(event, AWS_REGION, COGNITO_USER_POOL_ID)
+        if auth_result['statusCode'] != 200:
+            return generate_response(auth_result['statusCode'], auth_result['body']['message'], cors_headers)
+        user_id = auth_result['body']['user_id']
+
+        # Parse request body
+        body = json.loads(event.get('body') or '{}')
+        document_name = body.get('document_name')
+        base_etag = body.get('base_etag')
+        chunks = body.get('chunks')
+        if not document_name or not base_etag or not isinstance(chunks, list):
+            return generate_response(400, 'document_name, base_etag and chunks are required', cors_headers)
+
+        chunks = decode_chunks(chunks)
+        new_bytes = sum(len(chunk['data']) for chunk in chunks if 'data' in chunk)
+        if new_bytes > DELTA_MAX_NEW_BYTES:
+            return generate_response(413, f'Delta carries {new_bytes} new bytes, the limit is {DELTA_MAX_NEW_BYTES}',
+                                     cors_headers)
+
+        key = document_key(user_id, document_name)
+        base_head = s3_client.head_object(Bucket=DIGITAL_ASSETS_BUCKET_NAME, Key=key)
+        if base_head['ETag'].strip('"') != base_etag.strip('"'):
+            raise DeltaConflict('The document changed since its manifest was read')
+
+        manifest = load_chunk_manifest(s3_client, DIGITAL_ASSETS_BUCKET_NAME, user_id, document_name,
+                                       base_head, logger)
+        segments, new_chunks = plan_segments(manifest, chunks)
+        if stored_codec(base_head) == CODEC_NONE:
+            version, stats = assemble_document(s3_client, DIGITAL_ASSETS_BUCKET_NAME, key, base_head, segments,
+                                               DELTA_COPY_WORKERS, logger)
+        else:
+            version, stats = rewrite_compressed_document(s3_client, DIGITAL_ASSETS_BUCKET_NAME, key, base_head,
+                                                         segments, logger)
+
+        # Record the new version, and its manifest so the next delta needs no re-chunking. Both
+        # describe the version this request wrote, whatever has been written since
+        if METADATA_REGISTRATION != 'events':
+            item = build_document_item_from_head(user_id, document_name, version)
+            save_document_item(dynamodb_client, DYNAMODB_TABLE_NAME, item)
+        save_chunk_manifest(s3_client, DIGITAL_ASSETS_BUCKET_NAME, user_id, document_name, {
+            'etag': version['ETag'], 'size': document_size(version), 'chunker': CHUNKER, 'chunks': new_chunks
+        })
+
+        emit_metrics(
+            {'DeltaCopiedBytes': stats['copied_bytes'], 'DeltaSentBytes': stats['sent_bytes'],
+             'DeltaNewBytes': new_bytes},
+            dimensions={'Function': 'delta_update'},
+            units={'DeltaCopiedBytes': 'Bytes', 'DeltaSentBytes': 'Bytes', 'DeltaNewBytes': 'Bytes'}
+        )
+        registered = METADATA_REGISTRATION != 'events'
+        return generate_response(200 if registered else 202, {
+            'message': 'Document updated' if registered else 'Document updated, its metadata is being registered',
+            'document_name': document_name,
+            'etag': version['ETag'].strip('"'),
+            'size': document_size(version),
+            'new_bytes': new_bytes,
+            'copied_bytes': stats['copied_bytes']
+        }, cors_headers)
+
+    except DeltaConflict as e:
+        logger.warning(f"Delta update conflict: {str(e)}")
+        return generate_response(409, str(e), cors_headers)
+    except (ValueError, json.JSONDecodeError) as e:
+        logger.warning(f"Invalid delta update: {str(e)}")
+        return generate_response(400, f'Invalid delta update: {str(e)}', cors_headers)
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+            return generate_response(404, 'Document not found', cors_headers)
+        logger.error(f"AWS error during delta update: {e.response['Error']['Message']}")
+        return generate_response(500, 'Failed to update document', cors_headers)
+    except Exception as e:
+        logger.error(f"An unexpected error occurred: {str(e)}")
+        return generate_response(500, f'An unexpected error occurred: {str(e)}', cors_headers)
+
+
+def decode_chunks(chunks):
+    """Validate the request's chunk list, decoding the base64 data of new chunks."""
+    decoded = []
+    for chunk in chunks:
+        if not isinstance(chunk, dict):
+            raise ValueError('Each chunk must be an object')
+        if 'data' in chunk:
+            try:
+                decoded.append({'data': base64.b64decode(chunk['data'], validate=True)})
+            except (binascii.Error, TypeError):
+                raise ValueError('Chunk data must be base64') from None
+        elif isinstance(chunk.get('sha256'), str):
+            decoded.append({'sha256': chunk['sha256']})
+        else:
+            raise ValueError("Each chunk needs 'sha256' or 'data'")
+    return decoded
+
+
+def generate_response(status_code, message, cors_headers):
+    """Generate an HTTP response with CORS headers."""
+    return {
+        'statusCode': status_code,
+        'headers': cors_headers,
+        'body': json.dumps(message)
+    }
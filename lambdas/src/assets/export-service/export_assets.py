@@ -0,0 +1,392 @@
+import json
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+import boto3
+from boto3.dynamodb.conditions import Attr, Key
+from botocore.exceptions import ClientError
+from logging_utils import configure_logging
+from warmup_utils import handle_warmup, is_warmup_event, register_snapshot_hooks
+from cors_utils import get_cors_headers_from_event
+from auth_utils import extract_and_verify_token
+from response_utils import compress_response, json_default
+from compression_utils import CODEC_NONE, STREAM_CHUNK_SIZE, is_compressible_content_type, iter_decompressed
+from encryption_utils import document_data_keys, iter_decrypted
+from metadata_utils import get_document_items
+from metrics_utils import emit_metrics
+from storage_utils import document_key, export_key
+from zip_stream import MultipartUploadWriter, write_zip
+
+# Initialize AWS clients
+s3_client = boto3.client('s3')
+lambda_client = boto3.client('lambda')
+dynamodb_resource = boto3.resource('dynamodb')
+kms_client = boto3.client('kms')
+
+# Validate environment variables at cold start
+DIGITAL_ASSETS_BUCKET_NAME = os.getenv('DIGITAL_ASSETS_BUCKET_NAME')
+DYNAMODB_TABLE_NAME = os.getenv('DYNAMODB_TABLE_NAME')
+JOBS_TABLE_NAME = os.getenv('JOBS_TABLE_NAME')
+COGNITO_USER_POOL_ID = os.getenv('COGNITO_USER_POOL_ID')
+AWS_REGION = os.getenv('AWS_REGION')
+DOCUMENT_KMS_KEY_ID = os.getenv('DOCUMENT_KMS_KEY_ID')
+
+if not all([DIGITAL_ASSETS_BUCKET_NAME, DYNAMODB_TABLE_NAME, JOBS_TABLE_NAME, COGNITO_USER_POOL_ID, AWS_REGION]):
+    raise ValueError("Missing required environment variables")
+
+# Initialize DynamoDB table resources
+table = dynamodb_resource.Table(DYNAMODB_TABLE_NAME)
+jobs_table = dynamodb_resource.Table(JOBS_TABLE_NAME)
+
+# Unwrapped data keys of encrypted documents, one KMS call per data key rather than per document
+data_keys = document_data_keys(kms_client, DIGITAL_ASSETS_BUCKET_NAME, DOCUMENT_KMS_KEY_ID)
+
+# Archives are streamed into S3 a part at a time, memory is bounded by the part size
+EXPORT_PART_SIZE = int(os.getenv('EXPORT_PART_SIZE', str(16 * 1024 * 1024)))
+
+# Exports up to these limits are built within the API request, larger ones in the background
+EXPORT_INLINE_MAX_BYTES = int(os.getenv('EXPORT_INLINE_MAX_BYTES', str(64 * 1024 * 1024)))
+EXPORT_INLINE_MAX_DOCUMENTS = int(os.getenv('EXPORT_INLINE_MAX_DOCUMENTS', '200'))
+
+EXPORT_MAX_BYTES = int(os.getenv('EXPORT_MAX_BYTES', str(50 * 1024 ** 3)))
+EXPORT_MAX_DOCUMENTS = 1000             # document_names are kept on the job record
+EXPORT_URL_EXPIRATION = int(os.getenv('EXPORT_URL_EXPIRATION', '3600'))
+EXPORT_RECORD_TTL_SECONDS = 7 * 24 * 3600
+
+# Prime connections and keys before a snapshot, and refresh them after a restore
+register_snapshot_hooks([s3_client, dynamodb_resource, lambda_client], AWS_REGION, COGNITO_USER_POOL_ID)
+
+
+def lambda_handler(event, context):
+    """
+    Lambda function handler for exporting documents as a zip archive.
+
+    API requests start an export. The function also invokes itself asynchronously with an
+    'export_job' event to build large archives in the background.
+    """
+    logger = configure_logging()
+    if is_warmup_event(event):
+        return handle_warmup(logger, [s3_client, dynamodb_resource, lambda_client], AWS_REGION, COGNITO_USER_POOL_ID)
+    logger.info("Lambda function started")
+    logger.debug("Received event: %s", json.dumps(event))
+
+    if 'export_job' in event:
+        return run_background_export(event['export_job'], context, logger)
+
+    # Get CORS headers
+    cors_headers = get_cors_headers_from_event(event, logger)
+
+    # Determine the HTTP method
+    http_method = event.get('routeKey', '').split()[0] or event.get('httpMethod')
+
+    if http_method == 'OPTIONS':
+        return generate_response(200, 'CORS preflight', cors_headers)
+
+    elif http_method == 'POST':
+        return compress_response(event, handle_post_request(event, context, logger, cors_headers), logger)
+
+    return generate_response(405, f'Method {http_method} not allowed', cors_headers)
+
+
+def handle_post_request(event, context, logger, cors_headers):
+    """
+    Handle POST request to export a folder or a list of documents, or to check on an export.
+
+    The body holds either 'prefix' (every document whose name starts with it) or
+    'document_names', and optionally the 'archive_name' offered for download. A body with
+    only 'exportId' returns that export's status, with a fresh download URL once complete.
+    """
+    try:
+        auth_result = extract_and_verify_token(event, AWS_REGION, COGNITO_USER_POOL_ID)
+        if auth_result['statusCode'] != 200:
+            return generate_response(auth_result['statusCode'], auth_result['body']['message'], cors_headers)
+        user_id = auth_result['body']['user_id']
+
+        # Parse request body
+        body = json.loads(event.get('body') or '{}')
+        if body.get('exportId'):
+            return get_export_status(user_id, str(body['exportId']), logger, cors_headers)
+
+        selection = parse_selection(body)
+        archive_name = sanitize_archive_name(body.get('archive_name') or default_archive_name(selection))
+
+        documents = resolve_documents(user_id, selection, logger)
+        if not documents:
+            return generate_response(404, 'No documents matched the export', cors_headers)
+
+        total_bytes = sum(int(item.get('size', 0)) for item in documents)
+        if total_bytes > EXPORT_MAX_BYTES:
+            return generate_response(413, f'Export exceeds {EXPORT_MAX_BYTES} bytes', cors_headers)
+
+        export_id = uuid.uuid4().hex
+        job = create_export_record(user_id, export_id, selection, archive_name, documents, total_bytes)
+
+        if total_bytes <= EXPORT_INLINE_MAX_BYTES and len(documents) <= EXPORT_INLINE_MAX_DOCUMENTS:
+            logger.info(f"Building export {export_id} inline ({len(documents)} documents, {total_bytes} bytes)")
+            job = build_export(job, documents, logger)
+            status_code = 200 if job['status'] == 'completed' else 500
+            return generate_response(status_code, export_summary(job), cors_headers)
+
+        # Too large for the API timeout, hand it to an asynchronous invocation of this function
+        try:
+            lambda_client.invoke(
+                FunctionName=context.function_name,
+                InvocationType='Event',
+                Payload=json.dumps({'export_job': {'user_id': user_id, 'export_id': export_id}}).encode('utf-8')
+            )
+        except ClientError:
+            update_export_record(job, 'failed', error='Failed to queue the export')
+            raise
+        logger.info(f"Queued export {export_id} ({len(documents)} documents, {total_bytes} bytes)")
+        return generate_response(202, export_summary(job), cors_headers)
+
+    except (ValueError, json.JSONDecodeError) as e:
+        logger.warning(f"Invalid export request: {str(e)}")
+        return generate_response(400, f'Invalid export request: {str(e)}', cors_headers)
+    except ClientError as e:
+        logger.error(f"AWS error while exporting: {e.response['Error']['Message']}")
+        return generate_response(500, 'Failed to export documents', cors_headers)
+    except Exception as e:
+        logger.error(f"An unexpected error occurred: {str(e)}")
+        return generate_response(500, f'An unexpected error occurred: {str(e)}', cors_headers)
+
+
+def get_export_status(user_id, export_id, logger, cors_headers):
+    """Return an export's status record."""
+    job = jobs_table.get_item(Key={'user_id': user_id, 'job_id': export_id}).get('Item')
+    if not job or job.get('job_type') != 'export':
+        return generate_response(404, 'Export not found', cors_headers)
+
+    # A background run that hit the Lambda timeout never records its failure
+    if job['status'] == 'running' and int(job.get('lease_expires_at', 0)) < time.time():
+        logger.warning(f"Export {export_id} outlived its invocation, reporting it as failed")
+        job = {**job, 'status': 'failed', 'error': 'Export timed out'}
+
+    return generate_response(200, export_summary(job), cors_headers)
+
+
+def run_background_export(job_key, context, logger):
+    """
+    Build an export queued by an API request.
+
+    The pending -> running transition is conditional, so a duplicate delivery of the
+    asynchronous event does not build the same archive twice. Failures are recorded on the
+    job rather than raised, as a retry would find the job no longer pending anyway.
+    """
+    user_id, export_id = job_key['user_id'], job_key['export_id']
+    lease_expires_at = int(time.time() + context.get_remaining_time_in_millis() / 1000)
+    try:
+        job = jobs_table.update_item(
+            Key={'user_id': user_id, 'job_id': export_id},
+            UpdateExpression='SET #status = :running, lease_expires_at = :lease, updated_at = :now',
+            ConditionExpression=Attr('status').eq('pending'),
+            ExpressionAttributeNames={'#status': 'status'},
+            ExpressionAttributeValues={':running': 'running', ':lease': lease_expires_at, ':now': utc_now()},
+            ReturnValues='ALL_NEW'
+        )['Attributes']
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            logger.warning(f"Export {export_id} is no longer pending, skipping")
+            return {'export_id': export_id, 'status': 'skipped'}
+        raise
+
+    documents = resolve_documents(user_id, job['selection'], logger)
+    job = build_export(job, documents, logger)
+    return {'export_id': export_id, 'status': job['status']}
+
+
+def parse_selection(body):
+    """Validate the request body's prefix or document_names into a job selection."""
+    prefix = body.get('prefix')
+    document_names = body.get('document_names')
+    if (prefix is None) == (document_names is None):
+        raise ValueError("Provide either 'prefix' or 'document_names'")
+
+    if document_names is not None:
+        if not isinstance(document_names, list) or not all(isinstance(name, str) and name for name in document_names):
+            raise ValueError("'document_names' must be a list of document names")
+        document_names = list(dict.fromkeys(document_names))
+        if not document_names or len(document_names) > EXPORT_MAX_DOCUMENTS:
+            raise ValueError(f"'document_names' must hold 1 to {EXPORT_MAX_DOCUMENTS} names")
+        return {'document_names': document_names}
+
+    if not isinstance(prefix, str):
+        raise ValueError("'prefix' must be a string")
+    return {'prefix': prefix}
+
+
+def default_archive_name(selection):
+    """Name the archive after the exported folder, or 'documents.zip'."""
+    folder = selection.get('prefix', '').rstrip('/').rsplit('/', 1)[-1]
+    return f'{folder or "documents"}.zip'
+
+
+def sanitize_archive_name(name):
+    """Keep the archive name to a plain file name that is safe in a Content-Disposition header."""
+    name = ''.join(char for char in str(name).rsplit('/', 1)[-1] if char.isprintable() and char not in '"\\')
+    name = name.strip() or 'documents.zip'
+    return name if name.lower().endswith('.zip') else f'{name}.zip'
+
+
+def resolve_documents(user_id, selection, logger):
+    """Return the metadata items of the selected documents, ordered by name."""
+    if 'prefix' in selection:
+        condition = Key('user_id').eq(user_id)
+        if selection['prefix']:
+            condition &= Key('document_name').begins_with(selection['prefix'])
+        items, params = [], {'KeyConditionExpression': condition}
+        while True:
+            response = table.query(**params)
+            items.extend(response['Items'])
+            if 'LastEvaluatedKey' not in response:
+                break
+            params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    else:
+        items = get_document_items(dynamodb_resource, DYNAMODB_TABLE_NAME, user_id, selection['document_names'])
+        missing = len(selection['document_names']) - len(items)
+        if missing:
+            logger.warning(f"{missing} requested documents do not exist and are left out")
+
+    logger.info(f"Export selection matched {len(items)} documents")
+    return sorted(items, key=lambda item: item['document_name'])
+
+
+def create_export_record(user_id, export_id, selection, archive_name, documents, total_bytes):
+    """Write the export's status record in the pending state and return it."""
+    now = utc_now()
+    job = {
+        'user_id': user_id,
+        'job_id': export_id,
+        'job_type': 'export',
+        'status': 'pending',
+        'selection': selection,
+        'archive_name': archive_name,
+        'archive_key': export_key(user_id, export_id),
+        'document_count': len(documents),
+        'total_bytes': total_bytes,
+        'created_at': now,
+        'updated_at': now,
+        'expires_at': int(time.time()) + EXPORT_RECORD_TTL_SECONDS
+    }
+    jobs_table.put_item(Item=job)
+    return job
+
+
+def build_export(job, documents, logger):
+    """
+    Stream the documents through a zip writer into a multipart upload of the archive.
+
+    Each document is read and decompressed a chunk at a time, so memory use depends on the
+    part size and chunk size only. Text-like documents are deflated, anything else is
+    stored as-is since it is usually compressed already.
+
+    Returns:
+        dict: The job record, updated to completed or failed.
+    """
+    started = time.monotonic()
+    writer = None
+    try:
+        writer = MultipartUploadWriter(s3_client, DIGITAL_ASSETS_BUCKET_NAME, job['archive_key'],
+                                       EXPORT_PART_SIZE, content_type='application/zip')
+        count = write_zip(writer, iter_archive_entries(job['user_id'], documents, logger))
+        writer.complete()
+    except Exception as e:
+        logger.error(f"Export {job['job_id']} failed: {str(e)}")
+        if writer:
+            try:
+                writer.abort()
+            except ClientError as abort_error:
+                logger.error(f"Failed to abort the archive upload: {abort_error.response['Error']['Message']}")
+        return update_export_record(job, 'failed', error=str(e))
+
+    elapsed = time.monotonic() - started
+    logger.info(f"Export {job['job_id']} wrote {count} documents, {writer.bytes_written} bytes "
+                f"in {len(writer.parts)} parts ({elapsed:.1f}s)")
+    emit_metrics(
+        {'ExportDocuments': count, 'ExportBytes': writer.bytes_written, 'ExportSeconds': elapsed},
+        dimensions={'Function': 'export_assets'},
+        units={'ExportBytes': 'Bytes', 'ExportSeconds': 'Seconds'}
+    )
+    return update_export_record(job, 'completed', document_count=count, archive_bytes=writer.bytes_written)
+
+
+def iter_archive_entries(user_id, documents, logger):
+    """Yield a write_zip entry per document, streaming its decrypted and decompressed body from S3."""
+    for item in documents:
+        document_name = item['document_name']
+        try:
+            response = s3_client.get_object(Bucket=DIGITAL_ASSETS_BUCKET_NAME, Key=document_key(user_id, document_name))
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+                # Deleted since the selection was resolved
+                logger.warning(f"Skipping {document_name}, it no longer exists")
+                continue
+            raise
+
+        codec = response.get('Metadata', {}).get('content-codec', CODEC_NONE)
+        content_type = response.get('ContentType') or item.get('content_type')
+        size = int(item.get('size', response['ContentLength']))
+        chunks = iter_decompressed(iter_decrypted(response['Body'].iter_chunks(STREAM_CHUNK_SIZE),
+                                                  response.get('Metadata', {}), data_keys), codec)
+        yield (document_name, size, response['LastModified'].timetuple()[:6],
+               is_compressible_content_type(content_type), chunks)
+
+
+def update_export_record(job, status, **attributes):
+    """Record the export's final status and return the updated job."""
+    attributes = {**attributes, 'status': status, 'updated_at': utc_now()}
+    names = {f'#{name}': name for name in attributes}
+    values = {f':{name}': value for name, value in attributes.items()}
+    jobs_table.update_item(
+        Key={'user_id': job['user_id'], 'job_id': job['job_id']},
+        UpdateExpression='SET ' + ', '.join(f'#{name} = :{name}' for name in attributes),
+        ExpressionAttributeNames=names,
+        ExpressionAttributeValues=values
+    )
+    return {**job, **attributes}
+
+
+def export_summary(job):
+    """Return the client view of an export, with a download URL once it has completed."""
+    summary = {
+        'exportId': job['job_id'],
+        'status': job['status'],
+        'archiveName': job['archive_name'],
+        'documentCount': job['document_count'],
+        'totalBytes': job['total_bytes']
+    }
+    if job['status'] == 'completed':
+        summary['archiveBytes'] = job['archive_bytes']
+        summary['downloadUrl'] = presign_archive(job)
+        summary['expiresIn'] = EXPORT_URL_EXPIRATION
+    if job.get('error'):
+        summary['error'] = job['error']
+    return summary
+
+
+def presign_archive(job):
+    """Presign a GET of the archive that downloads under its archive name."""
+    return s3_client.generate_presigned_url(
+        'get_object',
+        Params={
+            'Bucket': DIGITAL_ASSETS_BUCKET_NAME,
+            'Key': job['archive_key'],
+            'ResponseContentDisposition': f'attachment; filename="{job["archive_name"]}"'
+        },
+        ExpiresIn=EXPORT_URL_EXPIRATION
+    )
+
+
+def utc_now():
+    """Return the current time as an ISO 8601 UTC timestamp."""
+    return datetime.now(timezone.utc).isoformat()
+
+
+def generate_response(status_code, message, cors_headers):
+    """Generate an HTTP response with CORS headers."""
+    return {
+        'statusCode': status_code,
+        'headers': cors_headers,
+        'body': json.dumps(message, default=json_default)
+    }
@@ -0,0 +1,132 @@
+import json
+import os
+import boto3
+from botocore.exceptions import ClientError
+from logging_utils import configure_logging
+from warmup_utils import handle_warmup, is_warmup_event, register_snapshot_hooks
+from compression_utils import CODEC_NONE, STREAM_CHUNK_SIZE, iter_decompressed, is_compressible_content_type
+from encryption_utils import document_data_keys, iter_decrypted
+from content_index import build_segment, tokenize
+from storage_utils import content_segment_key, document_key
+
+# Initialize AWS clients
+s3_client = boto3.client('s3')
+kms_client = boto3.client('kms')
+
+# Validate environment variables at cold start
+DIGITAL_ASSETS_BUCKET_NAME = os.getenv('DIGITAL_ASSETS_BUCKET_NAME')
+DOCUMENT_KMS_KEY_ID = os.getenv('DOCUMENT_KMS_KEY_ID')
+
+if not all([DIGITAL_ASSETS_BUCKET_NAME]):
+    raise ValueError("Missing required environment variables")
+
+# Unwrapped data keys of encrypted documents, reused across the batch and warm invocations
+data_keys = document_data_keys(kms_client, DIGITAL_ASSETS_BUCKET_NAME, DOCUMENT_KMS_KEY_ID)
+
+# Larger documents are indexed by their first MAX_INDEXED_BYTES only
+MAX_INDEXED_BYTES = int(os.getenv('CONTENT_INDEX_MAX_BYTES', str(10 * 1024 * 1024)))
+
+# Prime connections and keys before a snapshot, and refresh them after a restore
+register_snapshot_hooks([s3_client])
+
+
+def lambda_handler(event, context):
+    """
+    Lambda function handler for indexing document content from the metadata table's stream.
+
+    Every write path records the document in the metadata table, so its stream carries each
+    create, overwrite and delete. Each batch becomes one new immutable segment per user.
+    """
+    logger = configure_logging()
+    if is_warmup_event(event):
+        return handle_warmup(logger, [s3_client])
+    logger.info("Lambda function started")
+    logger.debug("Received event: %s", json.dumps(event))
+
+    changes = collect_content_changes(event.get('Records', []))
+    for user_id, (sequence, documents) in changes.items():
+        index_documents(user_id, sequence, documents, logger)
+
+    logger.info(f"Wrote content index segments for {len(changes)} users")
+    return {'users': len(changes)}
+
+
+def collect_content_changes(records):
+    """
+    Fold a batch of stream records into per-user document changes.
+
+    MODIFY records only count when the ETag changed, so attribute updates such as
+    previews do not re-index a document.
+
+    Returns:
+        dict: user_id -> (highest stream sequence number, {document_name: new image or None}).
+    """
+    changes = {}
+    for record in records:
+        data = record.get('dynamodb', {})
+        keys = data.get('Keys', {})
+        if 'user_id' not in keys or 'document_name' not in keys:
+            continue
+
+        new_image = data.get('NewImage')
+        if record['eventName'] == 'MODIFY':
+            old_etag = data.get('OldImage', {}).get('etag', {}).get('S')
+            if old_etag == new_image.get('etag', {}).get('S'):
+                continue
+        elif record['eventName'] == 'REMOVE':
+            new_image = None
+
+        user_id = keys['user_id']['S']
+        sequence, documents = changes.get(user_id, (0, {}))
+        documents[keys['document_name']['S']] = new_image
+        changes[user_id] = (max(sequence, int(data['SequenceNumber'])), documents)
+    return changes
+
+
+def index_documents(user_id, sequence, documents, logger):
+    """
+    Tokenize a user's changed documents and write them as one segment.
+
+    Records for one user always arrive on the same shard, in order, so the stream sequence
+    number orders segments; deleted and non-text documents are recorded too, so they
+    shadow any older postings.
+    """
+    tokens = {}
+    for document_name, image in documents.items():
+        if image is None:
+            tokens[document_name] = None
+        elif is_compressible_content_type(image.get('content_type', {}).get('S')):
+            codec = image.get('content_codec', {}).get('S', CODEC_NONE)
+            tokens[document_name] = tokenize(read_text(user_id, document_name, codec, logger))
+        else:
+            tokens[document_name] = set()
+
+    key = content_segment_key(user_id, sequence)
+    s3_client.put_object(
+        Bucket=DIGITAL_ASSETS_BUCKET_NAME,
+        Key=key,
+        Body=build_segment(tokens),
+        ContentType='application/octet-stream'
+    )
+    logger.info(f"Wrote segment {key} covering {len(tokens)} documents")
+
+
+def read_text(user_id, document_name, codec, logger):
+    """Read up to MAX_INDEXED_BYTES of a document as text, decrypting and decompressing it if needed."""
+    try:
+        response = s3_client.get_object(Bucket=DIGITAL_ASSETS_BUCKET_NAME, Key=document_key(user_id, document_name))
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'NoSuchKey':
+            raise
+        # Deleted since the record was written, its REMOVE record follows
+        logger.info(f"Document {document_name} no longer exists")
+        return ''
+
+    chunks = iter_decrypted(response['Body'].iter_chunks(STREAM_CHUNK_SIZE), response.get('Metadata', {}), data_keys)
+    data = bytearray()
+    for chunk in iter_decompressed(chunks, codec):
+        data.extend(chunk)
+        if len(data) >= MAX_INDEXED_BYTES:
+            logger.info(f"Indexing the first {MAX_INDEXED_BYTES} bytes of {document_name}")
+            break
+    return bytes(data[:MAX_INDEXED_BYTES]).decode('utf-8', errors='ignore')
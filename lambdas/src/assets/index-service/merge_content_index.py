@@ -0,0 +1,116 @@
+import json
+import os
+import boto3
+from botocore.exceptions import ClientError
+from logging_utils import configure_logging
+from warmup_utils import handle_warmup, is_warmup_event, register_snapshot_hooks
+from metrics_utils import emit_metrics
+from content_index import Segment, merge_segments
+from storage_utils import INDEX_PREFIX, content_segment_key, content_segment_prefix, parse_content_segment_key
+
+# Initialize AWS clients
+s3_client = boto3.client('s3')
+
+# Environment variables validation
+REQUIRED_ENV_VARS = ['DIGITAL_ASSETS_BUCKET_NAME']
+MISSING_ENV_VARS = [var for var in REQUIRED_ENV_VARS if not os.getenv(var)]
+
+if MISSING_ENV_VARS:
+    raise ValueError(f"Missing required environment variables: {', '.join(MISSING_ENV_VARS)}")
+
+DIGITAL_ASSETS_BUCKET_NAME = os.getenv('DIGITAL_ASSETS_BUCKET_NAME')
+
+# Users with fewer segments than this are left alone
+CONTENT_MERGE_MIN_SEGMENTS = int(os.getenv('CONTENT_MERGE_MIN_SEGMENTS', '4'))
+
+# DeleteObjects accepts at most 1000 keys per request
+DELETE_BATCH_SIZE = 1000
+
+# Stop starting new merges when less than this much Lambda time is left
+TIME_MARGIN_MS = 30000
+
+# Prime connections and keys before a snapshot, and refresh them after a restore
+register_snapshot_hooks([s3_client])
+
+def lambda_handler(event, context):
+    """Scheduled Lambda handler that merges each user's content index segments into one."""
+    logger = configure_logging()
+    if is_warmup_event(event):
+        return handle_warmup(logger, [s3_client])
+    logger.info("Lambda function started")
+    logger.debug(f"Received event: {json.dumps(event)}")
+
+    min_segments = int(event.get('min_segments', CONTENT_MERGE_MIN_SEGMENTS))
+    totals = {'MergedUsers': 0, 'MergedSegments': 0, 'MergedBytes': 0}
+    for user_id in list_indexed_users():
+        if context and context.get_remaining_time_in_millis() < TIME_MARGIN_MS:
+            logger.warning("Running out of time, remaining users are left for the next run")
+            break
+
+        keys = list_segment_keys(user_id)
+        if len(keys) < min_segments:
+            continue
+
+        totals['MergedBytes'] += merge_user_segments(user_id, keys, logger)
+        totals['MergedUsers'] += 1
+        totals['MergedSegments'] += len(keys)
+
+    emit_metrics(totals, dimensions={'Function': 'merge_content_index'}, units={'MergedBytes': 'Bytes'})
+    logger.info(f"Content index merge finished: {totals}")
+    return totals
+
+def list_indexed_users():
+    """Yield the IDs of the users with an index prefix."""
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=DIGITAL_ASSETS_BUCKET_NAME, Prefix=INDEX_PREFIX, Delimiter='/'):
+        for prefix in page.get('CommonPrefixes', []):
+            yield prefix['Prefix'][len(INDEX_PREFIX):].rstrip('/')
+
+def list_segment_keys(user_id):
+    """Return a user's segment keys, oldest first."""
+    keys = []
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=DIGITAL_ASSETS_BUCKET_NAME, Prefix=content_segment_prefix(user_id)):
+        keys.extend(item['Key'] for item in page.get('Contents', []))
+    return sorted(keys)
+
+def merge_user_segments(user_id, keys, logger):
+    """
+    Merge all of a user's listed segments into one and delete the inputs.
+
+    The merged segment takes the newest input's sequence number, so segments written
+    while the merge runs still shadow it. Queries that race the deletes simply see the
+    merged segment alongside inputs it supersedes.
+
+    Returns:
+        int: The size of the merged segment in bytes.
+    """
+    segments = []
+    for key in keys:
+        response = s3_client.get_object(Bucket=DIGITAL_ASSETS_BUCKET_NAME, Key=key)
+        segments.append(Segment(response['Body'].read()))
+
+    merged = merge_segments(segments)
+    sequence, _ = parse_content_segment_key(keys[-1])
+    level = min(max(parse_content_segment_key(key)[1] for key in keys) + 1, 99)
+    merged_key = content_segment_key(user_id, sequence, level)
+    s3_client.put_object(
+        Bucket=DIGITAL_ASSETS_BUCKET_NAME,
+        Key=merged_key,
+        Body=merged,
+        ContentType='application/octet-stream'
+    )
+
+    inputs = [key for key in keys if key != merged_key]
+    try:
+        for start in range(0, len(inputs), DELETE_BATCH_SIZE):
+            s3_client.delete_objects(
+                Bucket=DIGITAL_ASSETS_BUCKET_NAME,
+                Delete={'Objects': [{'Key': key} for key in inputs[start:start + DELETE_BATCH_SIZE]], 'Quiet': True}
+            )
+    except ClientError as e:
+        # Leftover inputs are shadowed by the merged segment and merged again next run
+        logger.warning(f"Failed to delete merged segments for {user_id}: {e.response['Error']['Message']}")
+
+    logger.info(f"Merged {len(keys)} segments for {user_id} into {merged_key} ({len(merged)} bytes)")
+    return len(merged)
@@ -0,0 +1,141 @@
+import json
+import os
+import boto3
+from collections import defaultdict
+from botocore.exceptions import ClientError
+from logging_utils import configure_logging
+from warmup_utils import handle_warmup, is_warmup_event, register_snapshot_hooks
+from storage_utils import name_index_key
+from trigram_index import TrigramIndex
+
+# Initialize AWS clients
+s3_client = boto3.client('s3')
+dynamodb_client = boto3.client('dynamodb')
+
+# Validate environment variables at cold start
+DIGITAL_ASSETS_BUCKET_NAME = os.getenv('DIGITAL_ASSETS_BUCKET_NAME')
+COLLECTION_VERSIONS_TABLE_NAME = os.getenv('COLLECTION_VERSIONS_TABLE_NAME')
+
+if not all([DIGITAL_ASSETS_BUCKET_NAME, COLLECTION_VERSIONS_TABLE_NAME]):
+    raise ValueError("Missing required environment variables")
+
+# Read-modify-write attempts of a name index before the batch fails and is retried
+NAME_INDEX_WRITE_ATTEMPTS = int(os.getenv('NAME_INDEX_WRITE_ATTEMPTS', '5'))
+
+# Prime connections and keys before a snapshot, and refresh them after a restore
+register_snapshot_hooks([s3_client, dynamodb_client])
+
+
+def lambda_handler(event, context):
+    """
+    Lambda function handler for the metadata table's DynamoDB stream.
+
+    Keeps each user's document name trigram index in step with their items, then bumps
+    the user's collection version so cached listings are invalidated. A user's records
+    usually arrive on one shard, in order, but a shard split, a parallelization factor
+    above 1 or a retried batch can process two batches at once, so index writes are
+    conditional and retried rather than assumed not to race.
+    """
+    logger = configure_logging()
+    if is_warmup_event(event):
+        return handle_warmup(logger, [s3_client, dynamodb_client])
+    logger.info("Lambda function started")
+    logger.debug("Received event: %s", json.dumps(event))
+
+    records = event.get('Records', [])
+    changes = collect_name_changes(records)
+    for user_id, (added, removed) in changes.items():
+        update_name_index(user_id, added, removed, logger)
+
+    # Any change, including attribute updates such as previews, invalidates the listing
+    users = {record['dynamodb']['Keys']['user_id']['S'] for record in records
+             if 'user_id' in record.get('dynamodb', {}).get('Keys', {})}
+    for user_id in users:
+        bump_collection_version(user_id, logger)
+
+    logger.info(f"Updated name indexes for {len(changes)} users, collection versions for {len(users)}")
+    return {'users': len(users)}
+
+
+def collect_name_changes(records):
+    """
+    Fold a batch of stream records into per-user added and removed names.
+
+    Returns:
+        dict: user_id -> (added names, removed names), later records winning.
+    """
+    changes = defaultdict(lambda: (set(), set()))
+    for record in records:
+        keys = record.get('dynamodb', {}).get('Keys', {})
+        if 'user_id' not in keys or 'document_name' not in keys:
+            continue
+
+        user_id = keys['user_id']['S']
+        document_name = keys['document_name']['S']
+        added, removed = changes[user_id]
+        if record['eventName'] == 'INSERT':
+            added.add(document_name)
+            removed.discard(document_name)
+        elif record['eventName'] == 'REMOVE':
+            removed.add(document_name)
+            added.discard(document_name)
+        # MODIFY never changes a key, so the name set is unaffected
+    return changes
+
+
+def update_name_index(user_id, added, removed, logger):
+    """
+    Apply a batch of name changes to a user's index in S3.
+
+    The index is written with IfMatch on the ETag it was read with (IfNoneMatch when it did
+    not exist), so a concurrent update is never overwritten; the changes are applied again
+    to a fresh read instead.
+    """
+    if not added and not removed:
+        return
+
+    key = name_index_key(user_id)
+    for attempt in range(1, NAME_INDEX_WRITE_ATTEMPTS + 1):
+        try:
+            response = s3_client.get_object(Bucket=DIGITAL_ASSETS_BUCKET_NAME, Key=key)
+            index = TrigramIndex.from_bytes(response['Body'].read())
+            condition = {'IfMatch': response['ETag']}
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'NoSuchKey':
+                raise
+            index = TrigramIndex.build([])
+            condition = {'IfNoneMatch': '*'}
+
+        index = index.with_changes(added, removed)
+        try:
+            s3_client.put_object(
+                Bucket=DIGITAL_ASSETS_BUCKET_NAME,
+                Key=key,
+                Body=index.to_bytes(),
+                ContentType='application/octet-stream',
+                **condition
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] not in ('PreconditionFailed', '412', 'ConditionalRequestConflict'):
+                raise
+            if attempt == NAME_INDEX_WRITE_ATTEMPTS:
+                raise
+            logger.info(f"Name index for {user_id} changed while it was updated, retrying")
+            continue
+
+        logger.info(f"Name index for {user_id} now holds {len(index.names)} names "
+                    f"(+{len(added)}/-{len(removed)})")
+        return
+
+
+def bump_collection_version(user_id, logger):
+    """Increment the user's collection version, creating the counter on first use."""
+    response = dynamodb_client.update_item(
+        TableName=COLLECTION_VERSIONS_TABLE_NAME,
+        Key={'user_id': {'S': user_id}},
+        UpdateExpression='ADD #version :one',
+        ExpressionAttributeNames={'#version': 'version'},
+        ExpressionAttributeValues={':one': {'N': '1'}},
+        ReturnValues='UPDATED_NEW'
+    )
+    logger.debug(f"Collection version for {user_id} is now {response['Attributes']['version']['N']}")
@@ -0,0 +1,108 @@
+import json
+import os
+import boto3
+from botocore.exceptions import ClientError
+from logging_utils import configure_logging
+from warmup_utils import handle_warmup, is_warmup_event, register_snapshot_hooks
+from cors_utils import get_cors_headers_from_event
+from auth_utils import extract_and_verify_token
+from response_utils import compress_response, json_default
+from retry_utils import RETRY_CLIENT_CONFIG, RetryPolicy, is_unavailable, unavailable_response
+from job_engine import JobEngine, job_summary
+from job_types import JOB_TYPES
+
+# Initialize AWS clients
+dynamodb_resource = boto3.resource('dynamodb', config=RETRY_CLIENT_CONFIG)
+
+# Retry throttled and failed calls within the invocation's deadline
+retry_policy = RetryPolicy()
+retry_policy.install(dynamodb_resource)
+
+# Validate environment variables at cold start
+JOBS_TABLE_NAME = os.getenv('JOBS_TABLE_NAME')
+COGNITO_USER_POOL_ID = os.getenv('COGNITO_USER_POOL_ID')
+AWS_REGION = os.getenv('AWS_REGION')
+
+if not all([JOBS_TABLE_NAME, COGNITO_USER_POOL_ID, AWS_REGION]):
+    raise ValueError("Missing required environment variables")
+
+# Status reads do not queue anything, so the engine goes without a queue
+engine = JobEngine(dynamodb_resource.Table(JOBS_TABLE_NAME), None, JOB_TYPES)
+
+# Prime connections and keys before a snapshot, and refresh them after a restore
+register_snapshot_hooks([dynamodb_resource], AWS_REGION, COGNITO_USER_POOL_ID)
+
+
+def lambda_handler(event, context):
+    """
+    Lambda function handler for reporting a background job's status and progress.
+    """
+    logger = configure_logging()
+    retry_policy.start_invocation(context)
+    if is_warmup_event(event):
+        return handle_warmup(logger, [dynamodb_resource], AWS_REGION, COGNITO_USER_POOL_ID)
+    logger.info("Lambda function started")
+    logger.debug("Received event: %s", json.dumps(event))
+
+    # Get CORS headers
+    cors_headers = get_cors_headers_from_event(event, logger)
+
+    # Determine the HTTP method
+    http_method = event.get('routeKey', '').split()[0] or event.get('httpMethod')
+
+    if http_method == 'OPTIONS':
+        return generate_response(200, 'CORS preflight', cors_headers)
+
+    elif http_method == 'POST':
+        return compress_response(event, handle_post_request(event, logger, cors_headers), logger)
+
+    return generate_response(405, f'Method {http_method} not allowed', cors_headers)
+
+
+def handle_post_request(event, logger, cors_headers):
+    """
+    Handle POST request for the status of the job in the body's 'jobId'.
+
+    The response carries the job's status, the items processed and failed so far, the
+    total when known, and the first failed items with their errors.
+    """
+    try:
+        auth_result = extract_and_verify_token(event, AWS_REGION, COGNITO_USER_POOL_ID)
+        if auth_result['statusCode'] != 200:
+            return generate_response(auth_result['statusCode'], auth_result['body']['message'], cors_headers)
+        user_id = auth_result['body']['user_id']
+
+        body = json.loads(event.get('body') or '{}')
+        job_id = body.get('jobId') if isinstance(body, dict) else None
+        if not job_id:
+            return generate_response(400, "'jobId' is required", cors_headers)
+
+        job = engine.get(user_id, str(job_id))
+        if not job:
+            return generate_response(404, 'Job not found', cors_headers)
+        return generate_response(200, job_summary(job), cors_headers)
+
+    except json.JSONDecodeError as e:
+        logger.warning(f"Invalid request body: {str(e)}")
+        return generate_response(400, 'Invalid request body', cors_headers)
+    except ClientError as e:
+        if is_unavailable(e):
+            logger.warning(f"Dependency unavailable: {str(e)}")
+            return unavailable_response(e, cors_headers)
+        logger.error(f"AWS error while reading the job: {e.response['Error']['Message']}")
+        return generate_response(500, 'Failed to read the job', cors_headers)
+    except Exception as e:
+        if is_unavailable(e):
+            logger.warning(f"Dependency unavailable: {str(e)}")
+            return unavailable_response(e, cors_headers)
+        logger.error(f"An unexpected error occurred: {str(e)}")
+        return generate_response(500, f'An unexpected error occurred: {str(e)}', cors_headers)
+
+
+def generate_response(status_code, message, cors_headers):
+    """Generate an HTTP response with CORS headers."""
+    return {
+        'statusCode': status_code,
+        'headers': cors_headers,
+        'body': json.dumps(message, default=json_default)
+    }
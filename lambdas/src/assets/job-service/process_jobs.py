@@ -0,0 +1,56 @@
+import json
+import os
+import boto3
+from logging_utils import configure_logging
+from warmup_utils import handle_warmup, is_warmup_event, register_snapshot_hooks
+from retry_utils import RETRY_CLIENT_CONFIG, RetryPolicy
+from job_engine import JobEngine, SqsJobQueue
+from job_types import job_types_for
+
+# Initialize AWS clients
+s3_client = boto3.client('s3', config=RETRY_CLIENT_CONFIG)
+sqs_client = boto3.client('sqs', config=RETRY_CLIENT_CONFIG)
+dynamodb_resource = boto3.resource('dynamodb', config=RETRY_CLIENT_CONFIG)
+
+# Retry throttled and failed calls within the invocation's deadline
+retry_policy = RetryPolicy()
+retry_policy.install(s3_client, sqs_client, dynamodb_resource)
+
+# Validate environment variables at cold start
+DIGITAL_ASSETS_BUCKET_NAME = os.getenv('DIGITAL_ASSETS_BUCKET_NAME')
+DYNAMODB_TABLE_NAME = os.getenv('DYNAMODB_TABLE_NAME')
+JOBS_TABLE_NAME = os.getenv('JOBS_TABLE_NAME')
+JOB_QUEUE_URL = os.getenv('JOB_QUEUE_URL')
+
+if not all([DIGITAL_ASSETS_BUCKET_NAME, DYNAMODB_TABLE_NAME, JOBS_TABLE_NAME, JOB_QUEUE_URL]):
+    raise ValueError("Missing required environment variables")
+
+engine = JobEngine(
+    dynamodb_resource.Table(JOBS_TABLE_NAME),
+    SqsJobQueue(sqs_client, JOB_QUEUE_URL),
+    job_types_for(s3_client, dynamodb_resource, DIGITAL_ASSETS_BUCKET_NAME, DYNAMODB_TABLE_NAME)
+)
+
+# Prime connections before a snapshot, and refresh them after a restore
+register_snapshot_hooks([s3_client, sqs_client, dynamodb_resource])
+
+
+def lambda_handler(event, context):
+    """
+    Lambda function handler for running background jobs, triggered by the job queue.
+
+    Each record carries a job's key. Jobs run from their last checkpoint; records whose
+    job failed with an error are reported in batchItemFailures, so SQS redelivers only
+    those, and the job resumes from its checkpoint.
+    """
+    logger = configure_logging()
+    retry_policy.start_invocation(context)
+    if is_warmup_event(event):
+        return handle_warmup(logger, [s3_client, sqs_client, dynamodb_resource])
+    logger.info("Lambda function started")
+    logger.debug(f"Received event: {json.dumps(event)}")
+
+    response = engine.handle_records(event.get('Records', []), context)
+    logger.info(f"Processed {len(event.get('Records', []))} job messages, "
+                f"{len(response['batchItemFailures'])} to be redelivered")
+    return response
@@ -0,0 +1,119 @@
+import json
+import os
+import boto3
+from botocore.exceptions import ClientError
+from logging_utils import configure_logging
+from warmup_utils import handle_warmup, is_warmup_event, register_snapshot_hooks
+from cors_utils import get_cors_headers_from_event
+from auth_utils import extract_and_verify_token
+from response_utils import json_default
+from idempotency_utils import run_idempotent
+from retry_utils import RETRY_CLIENT_CONFIG, RetryPolicy, is_unavailable, unavailable_response
+from job_engine import JobEngine, SqsJobQueue, job_summary
+from job_types import JOB_TYPES
+
+# Initialize AWS clients
+sqs_client = boto3.client('sqs', config=RETRY_CLIENT_CONFIG)
+dynamodb_client = boto3.client('dynamodb', config=RETRY_CLIENT_CONFIG)
+dynamodb_resource = boto3.resource('dynamodb', config=RETRY_CLIENT_CONFIG)
+
+# Retry throttled and failed calls within the invocation's deadline
+retry_policy = RetryPolicy()
+retry_policy.install(sqs_client, dynamodb_client, dynamodb_resource)
+
+# Validate environment variables at cold start
+JOBS_TABLE_NAME = os.getenv('JOBS_TABLE_NAME')
+JOB_QUEUE_URL = os.getenv('JOB_QUEUE_URL')
+COGNITO_USER_POOL_ID = os.getenv('COGNITO_USER_POOL_ID')
+AWS_REGION = os.getenv('AWS_REGION')
+
+if not all([JOBS_TABLE_NAME, JOB_QUEUE_URL, COGNITO_USER_POOL_ID, AWS_REGION]):
+    raise ValueError("Missing required environment variables")
+
+engine = JobEngine(dynamodb_resource.Table(JOBS_TABLE_NAME), SqsJobQueue(sqs_client, JOB_QUEUE_URL), JOB_TYPES)
+
+# Prime connections and keys before a snapshot, and refresh them after a restore
+register_snapshot_hooks([sqs_client, dynamodb_client], AWS_REGION, COGNITO_USER_POOL_ID)
+
+
+def lambda_handler(event, context):
+    """
+    Lambda function handler for submitting bulk operations to run as background jobs.
+    """
+    logger = configure_logging()
+    retry_policy.start_invocation(context)
+    if is_warmup_event(event):
+        return handle_warmup(logger, [sqs_client, dynamodb_client], AWS_REGION, COGNITO_USER_POOL_ID)
+    logger.info("Lambda function started")
+    logger.debug("Received event: %s", json.dumps(event))
+
+    # Get CORS headers
+    cors_headers = get_cors_headers_from_event(event, logger)
+
+    # Determine the HTTP method
+    http_method = event.get('routeKey', '').split()[0] or event.get('httpMethod')
+
+    if http_method == 'OPTIONS':
+        return generate_response(200, 'CORS preflight', cors_headers)
+
+    elif http_method == 'POST':
+        return handle_post_request(event, context, logger, cors_headers)
+
+    return generate_response(405, f'Method {http_method} not allowed', cors_headers)
+
+
+def handle_post_request(event, context, logger, cors_headers):
+    """
+    Handle POST request to submit a job.
+
+    The body holds 'job_type' and the type's 'params'. The job is recorded and queued, and
+    its status returned with a 202; get_job_status reports its progress from then on. A
+    request carrying an Idempotency-Key submits one job, retries get the same job back.
+    """
+    try:
+        auth_result = extract_and_verify_token(event, AWS_REGION, COGNITO_USER_POOL_ID)
+        if auth_result['statusCode'] != 200:
+            return generate_response(auth_result['statusCode'], auth_result['body']['message'], cors_headers)
+        user_id = auth_result['body']['user_id']
+
+        return run_idempotent(dynamodb_client, event, context, user_id, 'submit_job',
+                              lambda: submit(event, user_id, logger, cors_headers), cors_headers, logger)
+
+    except ClientError as e:
+        if is_unavailable(e):
+            logger.warning(f"Dependency unavailable: {str(e)}")
+            return unavailable_response(e, cors_headers)
+        logger.error(f"AWS error while submitting a job: {e.response['Error']['Message']}")
+        return generate_response(500, 'Failed to submit the job', cors_headers)
+    except Exception as e:
+        if is_unavailable(e):
+            logger.warning(f"Dependency unavailable: {str(e)}")
+            return unavailable_response(e, cors_headers)
+        logger.error(f"An unexpected error occurred: {str(e)}")
+        return generate_response(500, f'An unexpected error occurred: {str(e)}', cors_headers)
+
+
+def submit(event, user_id, logger, cors_headers):
+    """Validate the request body and submit its job."""
+    try:
+        body = json.loads(event.get('body') or '{}')
+        if not isinstance(body, dict) or not isinstance(body.get('job_type'), str):
+            raise ValueError("'job_type' is required")
+        params = body.get('params') or {}
+        if not isinstance(params, dict):
+            raise ValueError("'params' must be an object")
+        job = engine.submit(user_id, body['job_type'], params)
+    except (ValueError, json.JSONDecodeError) as e:
+        logger.warning(f"Invalid job request: {str(e)}")
+        return generate_response(400, f'Invalid job request: {str(e)}', cors_headers)
+
+    return generate_response(202, job_summary(job), cors_headers)
+
+
+def generate_response(status_code, message, cors_headers):
+    """Generate an HTTP response with CORS headers."""
+    return {
+        'statusCode': status_code,
+        'headers': cors_headers,
+        'body': json.dumps(message, default=json_default)
+    }
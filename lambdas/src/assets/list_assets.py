@@ -1,32 +1,78 @@
 import json
 import jwt
-from jwt import PyJWKClient
 import boto3
 import os
+import base64
+import bisect
+import hashlib
+import time
 from boto3.dynamodb.conditions import Key
 from botocore.exceptions import ClientError
 from logging_utils import configure_logging
+from auth_utils import get_jwks_client
+from warmup_utils import handle_warmup, is_warmup_event, register_snapshot_hooks
 from cors_utils import get_cors_headers_from_event
+from response_utils import compress_response, json_default, etag_matches, not_modified_response
+from memory_cache import MemoryCache
+from metrics_utils import emit_metrics
+from retry_utils import RETRY_CLIENT_CONFIG, RetryPolicy, is_unavailable, unavailable_response
 
 # Initialize AWS clients
-dynamodb_client = boto3.client('dynamodb')
+dynamodb_client = boto3.client('dynamodb', config=RETRY_CLIENT_CONFIG)
+s3_client = boto3.client('s3', config=RETRY_CLIENT_CONFIG)
 
 # Validate environment variables at cold start
+DIGITAL_ASSETS_BUCKET_NAME = os.getenv('DIGITAL_ASSETS_BUCKET_NAME')
 DYNAMODB_TABLE_NAME = os.getenv('DYNAMODB_TABLE_NAME')
+COLLECTION_VERSIONS_TABLE_NAME = os.getenv('COLLECTION_VERSIONS_TABLE_NAME')
 COGNITO_USER_POOL_ID = os.getenv('COGNITO_USER_POOL_ID')
 AWS_REGION = os.getenv('AWS_REGION')
 
-if not all([DYNAMODB_TABLE_NAME, COGNITO_USER_POOL_ID, AWS_REGION]):
+# Presigned preview URLs are valid for 15 minutes
+PREVIEW_URL_EXPIRATION = 900
+
+if not all([DIGITAL_ASSETS_BUCKET_NAME, DYNAMODB_TABLE_NAME, COLLECTION_VERSIONS_TABLE_NAME,
+            COGNITO_USER_POOL_ID, AWS_REGION]):
     raise ValueError("Missing required environment variables")
 
-# Initialize DynamoDB table resource
-table = boto3.resource('dynamodb').Table(DYNAMODB_TABLE_NAME)
+# Initialize DynamoDB table resources
+dynamodb_resource = boto3.resource('dynamodb', config=RETRY_CLIENT_CONFIG)
+table = dynamodb_resource.Table(DYNAMODB_TABLE_NAME)
+versions_table = dynamodb_resource.Table(COLLECTION_VERSIONS_TABLE_NAME)
+
+# Retry throttled and failed calls within the invocation's deadline
+retry_policy = RetryPolicy()
+retry_policy.install(dynamodb_client, s3_client, dynamodb_resource)
+
+# Listings are reused while the user's collection version is unchanged, and never for
+# longer than the TTL, in case a version bump was missed
+LISTING_CACHE_MAX_ENTRIES = int(os.getenv('LISTING_CACHE_MAX_ENTRIES', '256'))
+LISTING_CACHE_MAX_BYTES = int(os.getenv('LISTING_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+LISTING_CACHE_TTL_SECONDS = float(os.getenv('LISTING_CACHE_TTL_SECONDS', '300'))
+
+# Pages hold at most this many items; without a limit the whole collection is returned
+MAX_PAGE_SIZE = 1000
+
+# Listing orders: by name from the (cached) collection, or most recent first from the
+# user_id + upload_date index, a page at a time
+ORDER_NAME = 'name'
+ORDER_RECENT = 'recent'
+RECENT_PAGE_SIZE = 50
+UPLOAD_DATE_INDEX_NAME = os.getenv('UPLOAD_DATE_INDEX_NAME', 'user_id-upload_date-index')
+
+listing_cache = MemoryCache(LISTING_CACHE_MAX_ENTRIES, LISTING_CACHE_MAX_BYTES, LISTING_CACHE_TTL_SECONDS)
+
+# Prime connections and keys before a snapshot, and refresh them after a restore
+register_snapshot_hooks([dynamodb_client, s3_client], AWS_REGION, COGNITO_USER_POOL_ID)
 
 def lambda_handler(event, context):
     """
     Lambda function handler for querying user documents from DynamoDB.
     """
     logger = configure_logging()
+    retry_policy.start_invocation(context)
+    if is_warmup_event(event):
+        return handle_warmup(logger, [dynamodb_client, s3_client], AWS_REGION, COGNITO_USER_POOL_ID)
     logger.info("Lambda function started")
     logger.debug("Received event: %s", json.dumps(event))
 
@@ -40,7 +86,7 @@ def lambda_handler(event, context):
         return generate_response(200, 'CORS preflight', cors_headers, logger)
 
     elif http_method == 'POST':
-        return handle_post_request(event, logger, cors_headers)
+        return compress_response(event, handle_post_request(event, logger, cors_headers), logger)
 
     return generate_response(405, 'Method not allowed', cors_headers, logger)
 
@@ -60,10 +106,35 @@ def handle_post_request(event, logger, cors_headers):
         if not user_id:
             return generate_response(401, 'Invalid JWT token', cors_headers, logger)
 
+        # Parse optional order and pagination parameters
+        body = json.loads(event.get('body') or '{}')
+        order = body.get('order', ORDER_NAME)
+        limit = body.get('limit')
+        cursor = body.get('cursor')
+        if order not in (ORDER_NAME, ORDER_RECENT):
+            return generate_response(400, f'order must be {ORDER_NAME} or {ORDER_RECENT}', cors_headers, logger)
+        if limit is not None:
+            limit = int(limit)
+            if not 0 < limit <= MAX_PAGE_SIZE:
+                return generate_response(400, f'limit must be between 1 and {MAX_PAGE_SIZE}', cors_headers, logger)
+
+        if order == ORDER_RECENT:
+            start_key = decode_recent_cursor(cursor, user_id) if cursor else None
+            return query_recent_documents(event, user_id, limit or RECENT_PAGE_SIZE, cursor, start_key,
+                                          logger, cors_headers)
+
+        after = decode_cursor(cursor) if cursor else None
+
         # Query DynamoDB for user documents
-        return query_user_documents(user_id, logger, cors_headers)
+        return query_user_documents(event, user_id, limit, cursor, after, logger, cors_headers)
 
+    except (ValueError, TypeError) as e:
+        logger.warning(f"Invalid list request: {str(e)}")
+        return generate_response(400, 'Invalid limit or cursor', cors_headers, logger)
     except Exception as e:
+        if is_unavailable(e):
+            logger.warning(f"Dependency unavailable: {str(e)}")
+            return unavailable_response(e, cors_headers)
         logger.error(f"An unexpected error occurred: {str(e)}")
         return generate_response(500, f'An unexpected error occurred: {str(e)}', cors_headers, logger)
 
@@ -83,7 +154,7 @@ def validate_jwt_token(token, logger):
     jwks_url = f'{cognito_issuer}/.well-known/jwks.json'
 
     try:
-        jwks_client = PyJWKClient(jwks_url)
+        jwks_client = get_jwks_client(jwks_url)
         signing_key = jwks_client.get_signing_key_from_jwt(token).key
         logger.info("Public key fetched successfully from JWKS URL")
 
@@ -107,26 +178,197 @@ def validate_jwt_token(token, logger):
     return None
 
 
-def query_user_documents(user_id, logger, cors_headers):
-    """Query DynamoDB to get documents for the user."""
+def query_user_documents(event, user_id, limit, cursor, after, logger, cors_headers):
+    """
+    Get a page of the user's documents, or a 304 when the client's copy is current.
+
+    The ETag is derived from the user's collection version, so a matching If-None-Match
+    costs one GetItem and neither the listing nor its serialization is touched.
+    """
     try:
-        response = table.query(
-            KeyConditionExpression=Key('user_id').eq(user_id)
-        )
-        logger.info(f"DynamoDB query successful, retrieved {len(response['Items'])} items")
-        return generate_response(200, response['Items'], cors_headers, logger)
+        version = get_collection_version(user_id)
+        etag = collection_etag(user_id, version, ORDER_NAME, limit, cursor)
+        if etag_matches(event, etag):
+            logger.info(f"Collection unchanged at version {version}, returning 304")
+            return not_modified_response(etag, cors_headers)
+
+        items = get_user_documents(user_id, version, logger)
+        page, next_cursor = paginate(items, limit, after)
+
+        # Copies, so the presigned URLs never end up in the cached listing
+        page = [dict(item) for item in page]
+        response = generate_response(200, add_preview_urls(page), cors_headers, logger)
+        response['headers'] = {**response['headers'], 'ETag': etag}
+        if next_cursor:
+            response['headers']['X-Next-Cursor'] = next_cursor
+        return response
 
     except ClientError as e:
         logger.error(f"Failed to query DynamoDB: {e.response['Error']['Message']}")
         return generate_response(400, e.response['Error']['Message'], cors_headers, logger)
 
 
+def query_recent_documents(event, user_id, limit, cursor, start_key, logger, cors_headers):
+    """
+    Get a page of the user's documents, most recently written first.
+
+    The page comes straight from the upload_date index with a Limit, so its cost depends
+    on the page size rather than the size of the collection, and the listing cache is not
+    involved. The ETag and 304 work as for the name order.
+    """
+    try:
+        version = get_collection_version(user_id)
+        etag = collection_etag(user_id, version, ORDER_RECENT, limit, cursor)
+        if etag_matches(event, etag):
+            logger.info(f"Collection unchanged at version {version}, returning 304")
+            return not_modified_response(etag, cors_headers)
+
+        params = {
+            'IndexName': UPLOAD_DATE_INDEX_NAME,
+            'KeyConditionExpression': Key('user_id').eq(user_id),
+            'ScanIndexForward': False,
+            'Limit': limit
+        }
+        if start_key:
+            params['ExclusiveStartKey'] = start_key
+        result = table.query(**params)
+        page = result['Items']
+        logger.info(f"DynamoDB index query successful, retrieved {len(page)} recent items")
+
+        response = generate_response(200, add_preview_urls(page), cors_headers, logger)
+        response['headers'] = {**response['headers'], 'ETag': etag}
+        if 'LastEvaluatedKey' in result:
+            response['headers']['X-Next-Cursor'] = encode_recent_cursor(result['LastEvaluatedKey'])
+        return response
+
+    except ClientError as e:
+        logger.error(f"Failed to query DynamoDB: {e.response['Error']['Message']}")
+        return generate_response(400, e.response['Error']['Message'], cors_headers, logger)
+
+
+def collection_etag(user_id, version, order, limit, cursor):
+    """
+    Build the weak ETag of one page of a user's collection.
+
+    The preview URL epoch is part of it, so a client never revalidates a body whose
+    presigned URLs have used up more than half of their lifetime.
+    """
+    preview_epoch = int(time.time() // (PREVIEW_URL_EXPIRATION // 2))
+    digest = hashlib.sha256(f'{user_id}:{order}:{limit}:{cursor}:{preview_epoch}'.encode('utf-8')).hexdigest()[:16]
+    return f'W/"{version}-{digest}"'
+
+
+def paginate(items, limit, after):
+    """
+    Return the page of items after the given document name, and the cursor of the next page.
+
+    Items are in key order, so a cursor stays valid while documents come and go.
+    """
+    start = bisect.bisect_right([item['document_name'] for item in items], after) if after else 0
+    if limit is None:
+        return items[start:], None
+    page = items[start:start + limit]
+    has_more = start + limit < len(items)
+    return page, encode_cursor(page[-1]['document_name']) if has_more else None
+
+
+def encode_cursor(document_name):
+    """Encode the last document name of a page as an opaque cursor."""
+    return base64.urlsafe_b64encode(document_name.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor back into the document name to continue after."""
+    return base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+
+
+def encode_recent_cursor(last_key):
+    """Encode the index position of a recent-first page as an opaque cursor, without the user ID."""
+    position = [last_key['upload_date'], last_key['document_name']]
+    return base64.urlsafe_b64encode(json.dumps(position).encode('utf-8')).decode('ascii')
+
+
+def decode_recent_cursor(cursor, user_id):
+    """Decode a recent-first cursor into the ExclusiveStartKey of the index query, for the caller only."""
+    upload_date, document_name = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    if not isinstance(upload_date, str) or not isinstance(document_name, str):
+        raise ValueError('Malformed cursor')
+    return {'user_id': user_id, 'upload_date': upload_date, 'document_name': document_name}
+
+
+def get_user_documents(user_id, version, logger):
+    """
+    Return all of the user's document items.
+
+    The collection version decides whether the cached listing is still current. It is
+    read before the query, so a change that lands while the query runs bumps it past the
+    cached value and the next call queries again.
+    """
+    cached = listing_cache.get(user_id)
+    if cached and cached['version'] == version:
+        logger.info(f"Serving {len(cached['items'])} cached items at collection version {version}")
+        record_cache_result(hit=True)
+        return cached['items']
+
+    record_cache_result(hit=False)
+    items = query_all_documents(user_id, logger)
+    size = len(json.dumps(items, default=json_default))
+    listing_cache.put(user_id, {'version': version, 'items': items}, size)
+    return items
+
+
+def get_collection_version(user_id):
+    """Read the user's collection version, 0 until their first change is recorded."""
+    response = versions_table.get_item(Key={'user_id': user_id}, ConsistentRead=True)
+    return int(response.get('Item', {}).get('version', 0))
+
+
+def query_all_documents(user_id, logger):
+    """Query DynamoDB for every document of the user, following pagination."""
+    items = []
+    params = {'KeyConditionExpression': Key('user_id').eq(user_id)}
+    while True:
+        response = table.query(**params)
+        items.extend(response['Items'])
+        if 'LastEvaluatedKey' not in response:
+            break
+        params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    logger.info(f"DynamoDB query successful, retrieved {len(items)} items")
+    return items
+
+
+def record_cache_result(hit):
+    """Emit the listing cache hit and miss counters for this request."""
+    emit_metrics(
+        {'ListingCacheHits': int(hit), 'ListingCacheMisses': int(not hit)},
+        dimensions={'Function': 'list_assets'}
+    )
+
+
+def add_preview_urls(items):
+    """
+    Attach a presigned thumbnail URL to items that have a derived preview,
+    so the document list renders without touching the originals.
+    """
+    for item in items:
+        thumbnail_key = item.get('preview', {}).get('thumbnail_key')
+        if thumbnail_key:
+            # Presigning is a local signature, no request is made to S3
+            item['preview_url'] = s3_client.generate_presigned_url(
+                ClientMethod='get_object',
+                Params={'Bucket': DIGITAL_ASSETS_BUCKET_NAME, 'Key': thumbnail_key},
+                ExpiresIn=PREVIEW_URL_EXPIRATION
+            )
+    return items
+
+
 def generate_response(status_code, message, cors_headers, logger):
     """Generate an HTTP response with CORS headers and log the response."""
     response = {
         'statusCode': status_code,
         'headers': cors_headers,
-        'body': json.dumps(message)
+        'body': json.dumps(message, default=json_default)
     }
     logger.info(f"Response: {json.dumps(response)}")
     return response
\ No newline at end of file
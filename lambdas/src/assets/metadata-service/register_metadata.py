@@ -0,0 +1,193 @@
+import json
+import os
+import time
+import datetime
+import boto3
+from concurrent.futures import ThreadPoolExecutor
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from logging_utils import configure_logging
+from warmup_utils import handle_warmup, is_warmup_event, register_snapshot_hooks
+from retry_utils import RETRY_CLIENT_CONFIG, RetryPolicy
+from metadata_utils import build_document_item_from_head, write_batches
+from metrics_utils import emit_metrics
+from storage_utils import document_key, parse_document_key
+
+# Concurrent HEAD requests per invocation
+REGISTER_MAX_WORKERS = int(os.getenv('REGISTER_MAX_WORKERS', '16'))
+
+BATCH_GET_MAX_KEYS = 100
+
+# Initialize AWS clients, the S3 pool as large as the worker pool to avoid serialising requests
+s3_client = boto3.client('s3', config=RETRY_CLIENT_CONFIG.merge(Config(max_pool_connections=REGISTER_MAX_WORKERS)))
+dynamodb_client = boto3.client('dynamodb', config=RETRY_CLIENT_CONFIG)
+
+# Retry throttled and failed calls within the invocation's deadline
+retry_policy = RetryPolicy()
+retry_policy.install(s3_client, dynamodb_client)
+
+# Validate environment variables at cold start
+DIGITAL_ASSETS_BUCKET_NAME = os.getenv('DIGITAL_ASSETS_BUCKET_NAME')
+DYNAMODB_TABLE_NAME = os.getenv('DYNAMODB_TABLE_NAME')
+
+if not all([DIGITAL_ASSETS_BUCKET_NAME, DYNAMODB_TABLE_NAME]):
+    raise ValueError("Missing required environment variables")
+
+# Prime connections before a snapshot, and refresh them after a restore
+register_snapshot_hooks([s3_client, dynamodb_client])
+
+
+def lambda_handler(event, context):
+    """
+    Lambda function handler registering document metadata from S3 notifications.
+
+    S3 sends ObjectCreated and ObjectRemoved notifications for the assets bucket to an SQS
+    queue, which hands them over in batches. Rather than trusting each notification, which
+    may arrive late, twice or out of order, every document named in the batch is looked up
+    with a HEAD: its item is written from the object if it exists, and deleted if not. So
+    the table converges on what the bucket holds whatever the delivery order. Records whose
+    documents could not be registered are reported in batchItemFailures, so SQS redelivers
+    only those.
+    """
+    logger = configure_logging()
+    retry_policy.start_invocation(context)
+    if is_warmup_event(event):
+        return handle_warmup(logger, [s3_client, dynamodb_client])
+    logger.info("Lambda function started")
+    logger.debug(f"Received event: {json.dumps(event)}")
+
+    records = event.get('Records', [])
+    documents = collect_documents(records, logger)
+    heads, failed = head_documents(documents, logger)
+    failed |= write_items(heads, logger)
+
+    failures = [{'itemIdentifier': record['messageId']} for record in records
+                if documents_of(record) & failed]
+    totals = {
+        'RegisteredDocuments': sum(1 for key, head in heads.items() if head is not None and key not in failed),
+        'RemovedDocuments': sum(1 for key, head in heads.items() if head is None and key not in failed),
+        'FailedDocuments': len(failed)
+    }
+    emit_metrics(totals, dimensions={'Function': 'register_metadata'})
+    logger.info(f"Registered metadata from {len(records)} messages: {totals}")
+    return {'batchItemFailures': failures}
+
+
+def documents_of(record):
+    """
+    Return the (user_id, document_name) of every document a queue record notifies about.
+
+    Keys outside user documents (derived artifacts, indexes, exports) and S3's test
+    event are left out; a body that is not an S3 notification holds no documents.
+    """
+    try:
+        notification = json.loads(record['body'])
+    except (KeyError, ValueError):
+        return set()
+    documents = set()
+    for s3_record in notification.get('Records', []) if isinstance(notification, dict) else []:
+        key = s3_record.get('s3', {}).get('object', {}).get('key', '')
+        parsed_key = parse_document_key(key)
+        if parsed_key:
+            documents.add(parsed_key)
+    return documents
+
+
+def collect_documents(records, logger):
+    """Return the distinct documents a batch of queue records notifies about."""
+    documents = set()
+    for record in records:
+        found = documents_of(record)
+        if not found:
+            logger.debug(f"Message {record.get('messageId')} names no documents, skipping")
+        documents |= found
+    return documents
+
+
+def head_documents(documents, logger):
+    """
+    HEAD every document concurrently.
+
+    Returns:
+        tuple: ({(user_id, document_name): head response, or None if the object is gone},
+                set of the documents whose HEAD failed).
+    """
+    def head(document):
+        user_id, document_name = document
+        try:
+            return s3_client.head_object(Bucket=DIGITAL_ASSETS_BUCKET_NAME, Key=document_key(user_id, document_name),
+                                         ChecksumMode='ENABLED')
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+
+    heads, failed = {}, set()
+    documents = sorted(documents)
+    with ThreadPoolExecutor(max_workers=max(1, min(REGISTER_MAX_WORKERS, len(documents)))) as executor:
+        futures = [executor.submit(head, document) for document in documents]
+        for document, future in zip(documents, futures):
+            try:
+                heads[document] = future.result()
+            except Exception as e:
+                logger.error(f"Failed to HEAD {document[1]} of {document[0]}: {str(e)}")
+                failed.add(document)
+    return heads, failed
+
+
+def write_items(heads, logger):
+    """
+    Put the items of existing documents and delete those of removed ones, in batches.
+
+    A put replaces the whole item, so the preview of an unchanged object is carried over;
+    a changed object gets its preview derived again from the table's stream.
+
+    Returns:
+        set: The documents whose write was still unprocessed after the retries.
+    """
+    previews = get_previews([document for document, head in heads.items() if head is not None])
+    requests = {}
+    for (user_id, document_name), head in heads.items():
+        key = {'user_id': {'S': user_id}, 'document_name': {'S': document_name}}
+        if head is None:
+            requests[(user_id, document_name)] = {'DeleteRequest': {'Key': key}}
+            continue
+        item = build_document_item_from_head(user_id, document_name, head, upload_date=iso_timestamp(head))
+        preview = previews.get((user_id, document_name))
+        if preview and preview['M'].get('etag', {}).get('S') == item['etag']['S']:
+            item['preview'] = preview
+        requests[(user_id, document_name)] = {'PutRequest': {'Item': item}}
+
+    unprocessed = write_batches(dynamodb_client, DYNAMODB_TABLE_NAME, list(requests.values()))
+    failed = set()
+    for request in unprocessed:
+        key = (request.get('PutRequest', {}).get('Item') or request['DeleteRequest']['Key'])
+        failed.add((key['user_id']['S'], key['document_name']['S']))
+    if failed:
+        logger.error(f"{len(failed)} metadata writes were still throttled after retries")
+    return failed
+
+
+def get_previews(documents):
+    """Read the preview attribute of existing items, BatchGetItem reads 100 keys at a time."""
+    previews = {}
+    for start in range(0, len(documents), BATCH_GET_MAX_KEYS):
+        request = {DYNAMODB_TABLE_NAME: {
+            'Keys': [{'user_id': {'S': user_id}, 'document_name': {'S': document_name}}
+                     for user_id, document_name in documents[start:start + BATCH_GET_MAX_KEYS]],
+            'ProjectionExpression': 'user_id, document_name, preview'
+        }}
+        while request:
+            response = dynamodb_client.batch_get_item(RequestItems=request)
+            for item in response['Responses'].get(DYNAMODB_TABLE_NAME, []):
+                if 'preview' in item:
+                    previews[(item['user_id']['S'], item['document_name']['S'])] = item['preview']
+            request = response.get('UnprocessedKeys')
+            if request:
+                time.sleep(0.05)  # Throttled keys, back off briefly before retrying them
+    return previews
+
+
+def iso_timestamp(head):
+    """Return the object's LastModified time in the upload_date format of metadata_utils."""
+    return head['LastModified'].astimezone(datetime.timezone.utc).isoformat(timespec='microseconds')
@@ -0,0 +1,138 @@
+import json
+import os
+import boto3
+import jwt
+from botocore.exceptions import ClientError
+from logging_utils import configure_logging
+from auth_utils import get_jwks_client
+from warmup_utils import handle_warmup, is_warmup_event, register_snapshot_hooks
+from cors_utils import get_cors_headers_from_event
+from storage_utils import document_key
+from retry_utils import RETRY_CLIENT_CONFIG, RetryPolicy, is_unavailable, unavailable_response
+
+# Initialize S3 client at module level
+s3_client = boto3.client('s3', config=RETRY_CLIENT_CONFIG)
+
+# Retry throttled and failed calls within the invocation's deadline
+retry_policy = RetryPolicy()
+retry_policy.install(s3_client)
+
+# Environment variables validation
+REQUIRED_ENV_VARS = ['DIGITAL_ASSETS_BUCKET_NAME', 'COGNITO_USER_POOL_ID', 'AWS_REGION']
+MISSING_ENV_VARS = [var for var in REQUIRED_ENV_VARS if not os.getenv(var)]
+
+if MISSING_ENV_VARS:
+    raise ValueError(f"Missing required environment variables: {', '.join(MISSING_ENV_VARS)}")
+
+DIGITAL_ASSETS_BUCKET_NAME = os.getenv('DIGITAL_ASSETS_BUCKET_NAME')
+COGNITO_USER_POOL_ID = os.getenv('COGNITO_USER_POOL_ID')
+AWS_REGION = os.getenv('AWS_REGION')
+
+# Prime connections and keys before a snapshot, and refresh them after a restore
+register_snapshot_hooks([s3_client], AWS_REGION, COGNITO_USER_POOL_ID)
+
+def lambda_handler(event, context):
+    """Lambda handler for aborting a multipart upload the client has cancelled."""
+    logger = configure_logging()
+    retry_policy.start_invocation(context)
+    if is_warmup_event(event):
+        return handle_warmup(logger, [s3_client], AWS_REGION, COGNITO_USER_POOL_ID)
+    logger.info("Lambda function started")
+    logger.debug(f"Received event: {json.dumps(event)}")
+
+    cors_headers = get_cors_headers_from_event(event, logger)
+    http_method = extract_http_method(event)
+
+    if http_method == 'OPTIONS':
+        return generate_response(200, 'CORS preflight', cors_headers, logger)
+
+    if http_method == 'POST':
+        return handle_post_request(event, logger, cors_headers)
+
+    return generate_response(405, f'Method {http_method} not allowed', cors_headers, logger)
+
+def extract_http_method(event):
+    """Extract HTTP method from event."""
+    return event.get('routeKey', '').split(' ')[0] if 'routeKey' in event else event.get('httpMethod')
+
+def handle_post_request(event, logger, cors_headers):
+    """Handle POST request logic."""
+    try:
+        auth_token = get_authorization_token(event, logger)
+        user_id = validate_jwt_token(auth_token, logger) if auth_token else None
+        if not user_id:
+            return generate_response(401, 'Unauthorized', cors_headers, logger)
+
+        body = json.loads(event.get('body', '{}'))
+        upload_id = body.get('uploadId')
+        filename = body.get('filename')
+        if not all([upload_id, filename]):
+            return generate_response(400, 'uploadId and filename are required', cors_headers, logger)
+
+        # The key is always under the caller's prefix, so users can only abort their own uploads
+        s3_client.abort_multipart_upload(
+            Bucket=DIGITAL_ASSETS_BUCKET_NAME,
+            Key=document_key(user_id, filename),
+            UploadId=upload_id
+        )
+        logger.info(f"Multipart upload {upload_id} for file {filename} aborted")
+        return generate_response(200, 'Multipart upload aborted', cors_headers, logger)
+
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'NoSuchUpload':
+            return generate_response(404, 'Upload not found', cors_headers, logger)
+        if is_unavailable(e):
+            logger.warning(f"Dependency unavailable: {str(e)}")
+            return unavailable_response(e, cors_headers)
+        logger.error(f"ClientError: {e}")
+        return generate_response(500, f'Error aborting multipart upload: {e}', cors_headers, logger)
+
+    except json.JSONDecodeError as e:
+        logger.error(f"JSON decoding error: {e}")
+        return generate_response(400, 'Invalid JSON format', cors_headers, logger)
+
+    except Exception as e:
+        if is_unavailable(e):
+            logger.warning(f"Dependency unavailable: {str(e)}")
+            return unavailable_response(e, cors_headers)
+        logger.error(f"Unhandled exception: {e}")
+        return generate_response(500, 'Internal server error', cors_headers, logger)
+
+def get_authorization_token(event, logger):
+    """Extract Bearer token from Authorization header."""
+    auth_header = event.get('headers', {}).get('Authorization') or event.get('headers', {}).get('authorization')
+    if auth_header and auth_header.startswith('Bearer '):
+        return auth_header.split(' ')[1]
+    logger.warning("Malformed Authorization header")
+    return None
+
+def validate_jwt_token(token, logger):
+    """Validate the JWT token with Cognito, returning the user ID (sub) on success."""
+    cognito_issuer = f'https://cognito-idp.{AWS_REGION}.amazonaws.com/{COGNITO_USER_POOL_ID}'
+    jwks_url = f'{cognito_issuer}/.well-known/jwks.json'
+
+    try:
+        jwks_client = get_jwks_client(jwks_url)
+        signing_key = jwks_client.get_signing_key_from_jwt(token).key
+
+        decoded_token = jwt.decode(token, signing_key, algorithms=["RS256"], issuer=cognito_issuer, options={"verify_aud": False})
+        logger.info("JWT token decoded and validated successfully")
+        return decoded_token.get('sub')
+
+    except jwt.ExpiredSignatureError:
+        logger.error("JWT token has expired")
+        return None
+    except jwt.InvalidTokenError as e:
+        logger.error(f"Invalid JWT token: {e}")
+        return None
+
+def generate_response(status_code, message, cors_headers, logger=None):
+    """Generate an HTTP response."""
+    response = {
+        'statusCode': status_code,
+        'headers': cors_headers,
+        'body': json.dumps(message)
+    }
+    if logger:
+        logger.info(f"Response generated: {response}")
+    return response
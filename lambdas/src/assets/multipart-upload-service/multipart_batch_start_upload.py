@@ -0,0 +1,275 @@
+import json
+import os
+import boto3
+from concurrent.futures import ThreadPoolExecutor
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from logging_utils import configure_logging
+from warmup_utils import handle_warmup, is_warmup_event, register_snapshot_hooks
+from cors_utils import get_cors_headers_from_event
+from auth_utils import extract_and_verify_token
+from storage_utils import document_key
+from compression_utils import guess_content_type
+from response_utils import compress_response
+from idempotency_utils import run_idempotent
+from retry_utils import RETRY_CLIENT_CONFIG, RetryPolicy, is_unavailable, unavailable_response
+
+# Concurrent CreateMultipartUpload requests per invocation
+BATCH_START_MAX_WORKERS = int(os.getenv('BATCH_START_MAX_WORKERS', '16'))
+
+# Bounds of a batch; at about 1.5 KB per presigned URL, the URL limit keeps the response
+# well under Lambda's 6 MB payload limit
+BATCH_START_MAX_FILES = 500
+BATCH_START_MAX_URLS = 2000
+
+MIN_PART_SIZE = 5 * 1024 * 1024         # S3 minimum for every part but the last
+MAX_PART_SIZE = 5 * 1024 ** 3
+MAX_PARTS = 10000
+PRESIGNED_URL_EXPIRATION = 3600
+
+SUPPORTED_CHECKSUM_ALGORITHMS = ('SHA256', 'CRC32C')
+
+# Initialize AWS clients, the S3 pool as large as the worker pool to avoid serialising requests
+s3_client = boto3.client('s3', config=RETRY_CLIENT_CONFIG.merge(Config(max_pool_connections=BATCH_START_MAX_WORKERS)))
+dynamodb_client = boto3.client('dynamodb', config=RETRY_CLIENT_CONFIG)     # Idempotency records
+
+# Retry throttled and failed calls within the invocation's deadline
+retry_policy = RetryPolicy()
+retry_policy.install(s3_client, dynamodb_client)
+
+# Validate environment variables at cold start
+DIGITAL_ASSETS_BUCKET_NAME = os.getenv('DIGITAL_ASSETS_BUCKET_NAME')
+COGNITO_USER_POOL_ID = os.getenv('COGNITO_USER_POOL_ID')
+AWS_REGION = os.getenv('AWS_REGION')
+
+if not all([DIGITAL_ASSETS_BUCKET_NAME, COGNITO_USER_POOL_ID, AWS_REGION]):
+    raise ValueError("Missing required environment variables")
+
+# Parts must carry a checksum in this algorithm unless the client asks for another supported one
+MULTIPART_CHECKSUM_ALGORITHM = os.getenv('MULTIPART_CHECKSUM_ALGORITHM', 'SHA256')
+
+# Prime connections and keys before a snapshot, and refresh them after a restore
+register_snapshot_hooks([s3_client, dynamodb_client], AWS_REGION, COGNITO_USER_POOL_ID)
+
+
+class InvalidBatch(Exception):
+    """The request body does not describe a valid batch of files."""
+
+
+def lambda_handler(event, context):
+    """
+    Lambda function handler for starting the uploads of many files in one request.
+    """
+    logger = configure_logging()
+    retry_policy.start_invocation(context)
+    if is_warmup_event(event):
+        return handle_warmup(logger, [s3_client, dynamodb_client], AWS_REGION, COGNITO_USER_POOL_ID)
+    logger.info("Lambda function started")
+    logger.debug(f"Received event: {json.dumps(event)}")
+
+    # Get CORS headers
+    cors_headers = get_cors_headers_from_event(event, logger)
+
+    # Determine the HTTP method
+    http_method = event.get('routeKey', '').split()[0] or event.get('httpMethod')
+
+    if http_method == 'OPTIONS':
+        return generate_response(200, 'CORS preflight', cors_headers)
+
+    elif http_method == 'POST':
+        return compress_response(event, handle_post_request(event, context, logger, cors_headers), logger)
+
+    return generate_response(405, f'Method {http_method} not allowed', cors_headers)
+
+
+def handle_post_request(event, context, logger, cors_headers):
+    """
+    Handle POST request to start the uploads of a batch of files, such as a folder.
+
+    The body holds 'files', each with its 'filename', 'size', optional 'content_type' and
+    'checksums', one per part of 'partSize' bytes. A file that fits in one part gets a
+    presigned single PUT URL; larger files get a multipart upload, started concurrently,
+    with a presigned URL for every part. Either way the URLs are signed over the client's
+    checksums, as multipart_generate_presigned_urls signs them. So a folder needs this one
+    request, the PUTs, and a multipart_complete_upload per large file, where it used to
+    need a start and a presign request per file, each verifying the token again.
+
+    Files that could not be started are listed in 'failed' with their error, the others
+    are started regardless. A request carrying an Idempotency-Key starts its uploads once.
+    """
+    try:
+        auth_result = extract_and_verify_token(event, AWS_REGION, COGNITO_USER_POOL_ID)
+        if auth_result['statusCode'] != 200:
+            return generate_response(auth_result['statusCode'], auth_result['body']['message'], cors_headers)
+        user_id = auth_result['body']['user_id']
+
+        return run_idempotent(dynamodb_client, event, context, user_id, 'multipart_batch_start_upload',
+                              lambda: start_batch(event, user_id, logger, cors_headers), cors_headers, logger)
+
+    except ClientError as e:
+        if is_unavailable(e):
+            logger.warning(f"Dependency unavailable: {str(e)}")
+            return unavailable_response(e, cors_headers)
+        logger.error(f"AWS error while starting uploads: {e.response['Error']['Message']}")
+        return generate_response(500, 'Failed to start the uploads', cors_headers)
+    except Exception as e:
+        if is_unavailable(e):
+            logger.warning(f"Dependency unavailable: {str(e)}")
+            return unavailable_response(e, cors_headers)
+        logger.error(f"An unexpected error occurred: {str(e)}")
+        return generate_response(500, f'An unexpected error occurred: {str(e)}', cors_headers)
+
+
+def start_batch(event, user_id, logger, cors_headers):
+    """Validate the request body and start its uploads."""
+    try:
+        body = json.loads(event.get('body') or '{}')
+        checksum_algorithm, part_size, files = parse_batch(body)
+    except (InvalidBatch, json.JSONDecodeError) as e:
+        logger.warning(f"Invalid batch: {str(e)}")
+        return generate_response(400, f'Invalid batch: {str(e)}', cors_headers)
+
+    single = [file for file in files if len(file['checksums']) == 1]
+    multipart = [file for file in files if len(file['checksums']) > 1]
+    uploads = [presign_put(user_id, file, checksum_algorithm) for file in single]
+    started, failed = start_multipart_uploads(user_id, multipart, checksum_algorithm, logger)
+    uploads += started
+
+    logger.info(f"Started {len(uploads)} uploads ({len(single)} single PUTs, {len(started)} multipart), "
+                f"{len(failed)} failed")
+    return generate_response(200, {
+        'checksumAlgorithm': checksum_algorithm,
+        'checksumHeader': f'x-amz-checksum-{checksum_algorithm.lower()}',
+        'partSize': part_size,
+        'uploads': uploads,
+        'failed': failed
+    }, cors_headers)
+
+
+def parse_batch(body):
+    """
+    Validate a batch request body.
+
+    Returns:
+        tuple: (checksum algorithm, part size, [{'filename', 'size', 'content_type', 'checksums'}]).
+
+    Raises:
+        InvalidBatch: With the first problem found.
+    """
+    if not isinstance(body, dict):
+        raise InvalidBatch('the body must be an object')
+    checksum_algorithm = str(body.get('checksumAlgorithm', MULTIPART_CHECKSUM_ALGORITHM)).upper()
+    if checksum_algorithm not in SUPPORTED_CHECKSUM_ALGORITHMS:
+        raise InvalidBatch(f'checksumAlgorithm must be one of {", ".join(SUPPORTED_CHECKSUM_ALGORITHMS)}')
+    part_size = body.get('partSize')
+    if not isinstance(part_size, int) or not MIN_PART_SIZE <= part_size <= MAX_PART_SIZE:
+        raise InvalidBatch(f"'partSize' must be between {MIN_PART_SIZE} and {MAX_PART_SIZE} bytes")
+
+    files = body.get('files')
+    if not isinstance(files, list) or not files:
+        raise InvalidBatch("'files' must be a non-empty list")
+    if len(files) > BATCH_START_MAX_FILES:
+        raise InvalidBatch(f'at most {BATCH_START_MAX_FILES} files per batch')
+
+    parsed, names = [], set()
+    for file in files:
+        filename = file.get('filename') if isinstance(file, dict) else None
+        if not isinstance(filename, str) or not filename:
+            raise InvalidBatch("every file needs a 'filename'")
+        if filename in names:
+            raise InvalidBatch(f'{filename} is listed twice')
+        names.add(filename)
+
+        size = file.get('size')
+        if not isinstance(size, int) or size < 0:
+            raise InvalidBatch(f"{filename}: 'size' must be a byte count")
+        parts = max(1, -(-size // part_size))
+        if parts > MAX_PARTS:
+            raise InvalidBatch(f'{filename}: more than {MAX_PARTS} parts, use a larger partSize')
+        checksums = file.get('checksums')
+        if (not isinstance(checksums, list) or len(checksums) != parts
+                or not all(isinstance(checksum, str) and checksum for checksum in checksums)):
+            raise InvalidBatch(f"{filename}: 'checksums' must hold one base64 checksum per part ({parts})")
+
+        parsed.append({'filename': filename, 'size': size, 'checksums': checksums,
+                       'content_type': guess_content_type(filename, file.get('content_type'))})
+
+    urls = sum(len(file['checksums']) for file in parsed)
+    if urls > BATCH_START_MAX_URLS:
+        raise InvalidBatch(f'{urls} parts in the batch, at most {BATCH_START_MAX_URLS}; split it')
+    return checksum_algorithm, part_size, parsed
+
+
+def presign_put(user_id, file, checksum_algorithm):
+    """
+    Presign a single PUT of a whole file, signed over its content type and checksum.
+
+    The object is registered in the metadata table from the bucket's notification, like
+    every other write, so the client has nothing to complete.
+    """
+    url = s3_client.generate_presigned_url(
+        ClientMethod='put_object',
+        Params={
+            'Bucket': DIGITAL_ASSETS_BUCKET_NAME,
+            'Key': document_key(user_id, file['filename']),
+            'ContentType': file['content_type'],
+            f'Checksum{checksum_algorithm}': file['checksums'][0]
+        },
+        ExpiresIn=PRESIGNED_URL_EXPIRATION
+    )
+    return {'filename': file['filename'], 'contentType': file['content_type'], 'url': url}
+
+
+def start_multipart_uploads(user_id, files, checksum_algorithm, logger):
+    """
+    Start a multipart upload per file concurrently, presigning every part.
+
+    Returns:
+        tuple: ([{'filename', 'uploadId', 'partUrls'}], [{'filename', 'error'}] of the files
+                whose upload could not be started).
+    """
+    def start(file):
+        key = document_key(user_id, file['filename'])
+        upload_id = s3_client.create_multipart_upload(
+            Bucket=DIGITAL_ASSETS_BUCKET_NAME,
+            Key=key,
+            ContentType=file['content_type'],
+            ChecksumAlgorithm=checksum_algorithm
+        )['UploadId']
+        part_urls = [
+            s3_client.generate_presigned_url(
+                ClientMethod='upload_part',
+                Params={
+                    'Bucket': DIGITAL_ASSETS_BUCKET_NAME,
+                    'Key': key,
+                    'UploadId': upload_id,
+                    'PartNumber': number,
+                    f'Checksum{checksum_algorithm}': checksum
+                },
+                ExpiresIn=PRESIGNED_URL_EXPIRATION
+            )
+            for number, checksum in enumerate(file['checksums'], 1)
+        ]
+        return {'filename': file['filename'], 'uploadId': upload_id, 'partUrls': part_urls}
+
+    started, failed = [], []
+    if not files:
+        return started, failed
+    with ThreadPoolExecutor(max_workers=min(BATCH_START_MAX_WORKERS, len(files))) as executor:
+        futures = [executor.submit(start, file) for file in files]
+        for file, future in zip(files, futures):
+            try:
+                started.append(future.result())
+            except ClientError as e:
+                logger.error(f"Failed to start the upload of {file['filename']}: {e.response['Error']['Message']}")
+                failed.append({'filename': file['filename'], 'error': e.response['Error']['Message']})
+    return started, failed
+
+
+def generate_response(status_code, message, cors_headers):
+    """Generate an HTTP response with CORS headers."""
+    return {
+        'statusCode': status_code,
+        'headers': cors_headers,
+        'body': json.dumps(message)
+    }
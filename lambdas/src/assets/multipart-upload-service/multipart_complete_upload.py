@@ -3,39 +3,47 @@ import os
 import boto3
 import jwt
 from botocore.exceptions import ClientError
-from jwt import PyJWKClient, PyJWKClientError
 from logging_utils import configure_logging
+from auth_utils import get_jwks_client
+from warmup_utils import handle_warmup, is_warmup_event, register_snapshot_hooks
 from cors_utils import get_cors_headers_from_event
+from storage_utils import document_key
+from metadata_utils import build_document_item_from_head, save_document_item
+from idempotency_utils import run_idempotent
+from retry_utils import RETRY_CLIENT_CONFIG, RetryPolicy, is_unavailable, unavailable_response
 
-# Initialize S3 client
-s3_client = boto3.client('s3')
+# Initialize AWS clients
+s3_client = boto3.client('s3', config=RETRY_CLIENT_CONFIG)
+dynamodb_client = boto3.client('dynamodb', config=RETRY_CLIENT_CONFIG)
+
+# Retry throttled and failed calls within the invocation's deadline
+retry_policy = RetryPolicy()
+retry_policy.install(s3_client, dynamodb_client)
 
 # Validate environment variables at cold start
 DIGITAL_ASSETS_BUCKET_NAME = os.getenv('DIGITAL_ASSETS_BUCKET_NAME')
+DYNAMODB_TABLE_NAME = os.getenv('DYNAMODB_TABLE_NAME')
 COGNITO_USER_POOL_ID = os.getenv('COGNITO_USER_POOL_ID')
 AWS_REGION = os.getenv('AWS_REGION')
 
-if not all([DIGITAL_ASSETS_BUCKET_NAME, COGNITO_USER_POOL_ID, AWS_REGION]):
+if not all([DIGITAL_ASSETS_BUCKET_NAME, DYNAMODB_TABLE_NAME, COGNITO_USER_POOL_ID, AWS_REGION]):
     raise ValueError("Missing required environment variables")
 
-_jwks_client = None  # Cache JWKS client
+# 'events' leaves the metadata item to register_metadata, fed by the bucket's notifications,
+# and answers as soon as S3 has completed the object; 'sync' writes the item before answering
+METADATA_REGISTRATION = os.getenv('METADATA_REGISTRATION', 'sync')
 
-def get_jwks_client(jwks_url, logger):
-    global _jwks_client
-    if _jwks_client is None:
-        try:
-            _jwks_client = PyJWKClient(jwks_url)
-            logger.info("JWKS client initialized")
-        except PyJWKClientError as e:
-            logger.error("Error initializing JWKS client: %s", str(e))
-            raise
-    return _jwks_client
+# Prime connections and keys before a snapshot, and refresh them after a restore
+register_snapshot_hooks([s3_client, dynamodb_client], AWS_REGION, COGNITO_USER_POOL_ID)
 
 def lambda_handler(event, context):
     """
     Lambda function handler for completing a multipart upload.
     """
     logger = configure_logging()
+    retry_policy.start_invocation(context)
+    if is_warmup_event(event):
+        return handle_warmup(logger, [s3_client, dynamodb_client], AWS_REGION, COGNITO_USER_POOL_ID)
     logger.info("Lambda function started")
     logger.info(f"Received event: {json.dumps(event)}")
 
@@ -49,49 +57,115 @@ def lambda_handler(event, context):
         return generate_response(200, 'CORS preflight', cors_headers)
 
     if http_method == 'POST':
-        return handle_post_request(event, logger, cors_headers)
+        return handle_post_request(event, context, logger, cors_headers)
 
     return generate_response(405, f'Method {http_method} not allowed', cors_headers)
 
-def handle_post_request(event, logger, cors_headers):
+def handle_post_request(event, context, logger, cors_headers):
     """
     Handle POST requests for completing a multipart upload.
+
+    A request carrying an Idempotency-Key completes the upload once. Retries get the stored
+    response, rather than a NoSuchUpload error for the upload the first request completed.
     """
     try:
          # Validate JWT from Authorization header
         auth_token = get_authorization_token(event, logger)
-        if not auth_token or not validate_jwt_token(auth_token, logger):
+        user_id = validate_jwt_token(auth_token, logger) if auth_token else None
+        if not user_id:
             return generate_response(401, 'Unauthorized', cors_headers)
 
-        # Parse the request body
-        body = json.loads(event.get('body', '{}'))
-        upload_id = body.get('uploadId')
-        filename = body.get('filename')
-        parts = body.get('parts')
-
-        # Validate required fields
-        if not all([upload_id, filename, parts]):
-            return generate_response(400, 'upload_id, filename, and parts are required', cors_headers)
-
-        # Complete the multipart upload
-        s3_client.complete_multipart_upload(
-            Bucket=DIGITAL_ASSETS_BUCKET_NAME,
-            Key=filename,
-            UploadId=upload_id,
-            MultipartUpload={'Parts': parts}
-        )
-
-        logger.info(f"Multipart upload for file {filename} completed successfully.")
-        return generate_response(200, 'Multipart upload completed successfully', cors_headers)
+        return run_idempotent(dynamodb_client, event, context, user_id, 'multipart_complete_upload',
+                              lambda: complete_upload(event, user_id, logger, cors_headers), cors_headers, logger)
 
     except ClientError as e:
+        if is_unavailable(e):
+            logger.warning(f"Dependency unavailable: {str(e)}")
+            return unavailable_response(e, cors_headers)
         logger.error("ClientError: %s", e)
         return generate_response(500, f'Error completing multipart upload: {e}', cors_headers)
 
     except Exception as e:
+        if is_unavailable(e):
+            logger.warning(f"Dependency unavailable: {str(e)}")
+            return unavailable_response(e, cors_headers)
         logger.error("Unhandled exception: %s", str(e))
         return generate_response(500, 'Internal server error', cors_headers)
 
+def complete_upload(event, user_id, logger, cors_headers):
+    """Verify the parts, complete the upload and record the document's metadata."""
+    # Parse the request body
+    body = json.loads(event.get('body', '{}'))
+    upload_id = body.get('uploadId')
+    filename = body.get('filename')
+    parts = body.get('parts')
+
+    # Validate required fields
+    if not all([upload_id, filename, parts]):
+        return generate_response(400, 'upload_id, filename, and parts are required', cors_headers)
+
+    # Check the client's per-part checksums against the ones S3 verified on upload
+    key = document_key(user_id, filename)
+    mismatched_parts = verify_part_checksums(key, upload_id, parts, logger)
+    if mismatched_parts:
+        return generate_response(422, {
+            'message': 'Part checksums do not match the uploaded parts',
+            'parts': mismatched_parts
+        }, cors_headers)
+
+    # Complete the multipart upload, S3 derives the composite checksum from the part checksums
+    s3_client.complete_multipart_upload(
+        Bucket=DIGITAL_ASSETS_BUCKET_NAME,
+        Key=key,
+        UploadId=upload_id,
+        MultipartUpload={'Parts': parts}
+    )
+
+    logger.info(f"Multipart upload for file {filename} completed successfully.")
+    if METADATA_REGISTRATION == 'events':
+        return generate_response(202, 'Multipart upload completed, its metadata is being registered', cors_headers)
+
+    # Record the object's metadata, one HEAD here saves one per listing later
+    store_document_metadata(user_id, filename, key, logger)
+    return generate_response(200, 'Multipart upload completed successfully', cors_headers)
+
+def verify_part_checksums(key, upload_id, parts, logger):
+    """
+    Compare the part list sent by the client with the parts S3 has stored.
+
+    Returns:
+        list: The part numbers whose ETag or checksum is missing or does not match.
+    """
+    stored_parts = {}
+    checksum_algorithm = None
+    paginator = s3_client.get_paginator('list_parts')
+    for page in paginator.paginate(Bucket=DIGITAL_ASSETS_BUCKET_NAME, Key=key, UploadId=upload_id):
+        checksum_algorithm = page.get('ChecksumAlgorithm') or checksum_algorithm
+        for part in page.get('Parts', []):
+            stored_parts[part['PartNumber']] = part
+
+    if not checksum_algorithm:
+        logger.warning(f"Upload {upload_id} was started without a checksum algorithm")
+
+    checksum_field = f'Checksum{checksum_algorithm}' if checksum_algorithm else None
+    mismatched = []
+    for part in parts:
+        stored = stored_parts.get(part.get('PartNumber'))
+        if (not stored or stored['ETag'] != part.get('ETag')
+                or (checksum_field and stored.get(checksum_field) != part.get(checksum_field))):
+            mismatched.append(part.get('PartNumber'))
+
+    if mismatched:
+        logger.error(f"Part checksum mismatch for upload {upload_id}: {mismatched}")
+    return mismatched
+
+def store_document_metadata(user_id, filename, key, logger):
+    """Store the completed object's metadata, including its composite checksum, in DynamoDB."""
+    head = s3_client.head_object(Bucket=DIGITAL_ASSETS_BUCKET_NAME, Key=key, ChecksumMode='ENABLED')
+    item = build_document_item_from_head(user_id, filename, head)
+    save_document_item(dynamodb_client, DYNAMODB_TABLE_NAME, item)
+    logger.info(f"Metadata for {filename} stored in DynamoDB successfully")
+
 def get_authorization_token(event, logger):
     """Extract the JWT token from the Authorization header."""
     authorization = event.get('headers', {}).get('Authorization') or event.get('headers', {}).get('authorization')
@@ -101,15 +175,15 @@ def get_authorization_token(event, logger):
     return None
 
 def validate_jwt_token(token, logger):
-    """Validate and decode the JWT token."""
+    """Validate and decode the JWT token, returning the user ID (sub) on success."""
     cognito_issuer = f'https://cognito-idp.{AWS_REGION}.amazonaws.com/{COGNITO_USER_POOL_ID}'
     jwks_url = f'{cognito_issuer}/.well-known/jwks.json'
 
     try:
-        jwks_client = get_jwks_client(jwks_url, logger)
+        jwks_client = get_jwks_client(jwks_url)
         signing_key = jwks_client.get_signing_key_from_jwt(token).key
 
-        jwt.decode(
+        decoded_token = jwt.decode(
             token,
             signing_key,
             algorithms=["RS256"],
@@ -117,11 +191,11 @@ def validate_jwt_token(token, logger):
             options={"verify_aud": False}
         )
         logger.info("JWT token decoded and validated successfully")
-        return True
+        return decoded_token.get('sub')
 
     except Exception as e:
         logger.error(f"JWT validation failed: {str(e)}")
-        return False
+        return None
 
 def generate_response(status_code, message, cors_headers):
     """
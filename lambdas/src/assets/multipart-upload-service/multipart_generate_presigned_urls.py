@@ -3,9 +3,11 @@ import os
 import boto3
 import jwt
 from botocore.exceptions import ClientError
-from jwt import PyJWKClient, PyJWKClientError
 from logging_utils import configure_logging
+from auth_utils import get_jwks_client
+from warmup_utils import handle_warmup, is_warmup_event, register_snapshot_hooks
 from cors_utils import get_cors_headers_from_event
+from storage_utils import document_key
 
 # Initialize S3 client
 s3_client = boto3.client('s3')
@@ -21,24 +23,16 @@ DIGITAL_ASSETS_BUCKET_NAME = os.getenv('DIGITAL_ASSETS_BUCKET_NAME')
 COGNITO_USER_POOL_ID = os.getenv('COGNITO_USER_POOL_ID')
 AWS_REGION = os.getenv('AWS_REGION')
 
-# Cache JWKS client globally to avoid re-initializing
-_jwks_client = None
+SUPPORTED_CHECKSUM_ALGORITHMS = ('SHA256', 'CRC32C')
 
-def get_jwks_client(jwks_url, logger):
-    """Fetch JWKS client, using cached instance for efficiency."""
-    global _jwks_client
-    if _jwks_client is None:
-        try:
-            _jwks_client = PyJWKClient(jwks_url)
-            logger.info("JWKS client initialized")
-        except PyJWKClientError as e:
-            logger.error(f"Error initializing JWKS client: {e}")
-            raise
-    return _jwks_client
+# Prime connections and keys before a snapshot, and refresh them after a restore
+register_snapshot_hooks([s3_client], AWS_REGION, COGNITO_USER_POOL_ID)
 
 def lambda_handler(event, context):
     """Main Lambda handler."""
     logger = configure_logging()
+    if is_warmup_event(event):
+        return handle_warmup(logger, [s3_client], AWS_REGION, COGNITO_USER_POOL_ID)
     logger.info("Lambda function started")
     logger.info(f"Received event: {json.dumps(event)}")
 
@@ -63,7 +57,8 @@ def handle_post_request(event, logger, cors_headers):
     """Handle POST request logic for generating presigned URLs."""
     try:
         auth_token = get_authorization_token(event, logger)
-        if not auth_token or not validate_jwt_token(auth_token, logger):
+        user_id = validate_jwt_token(auth_token, logger) if auth_token else None
+        if not user_id:
             return generate_response(401, 'Unauthorized', cors_headers)
 
         body = json.loads(event.get('body', '{}'))
@@ -71,8 +66,20 @@ def handle_post_request(event, logger, cors_headers):
         if not all([uploadId, filename, parts]):
             return generate_response(400, 'uploadId, filename, and parts are required', cors_headers, logger)
 
-        presigned_urls = generate_presigned_urls(uploadId, filename, parts, logger)
-        return generate_response(200, {'partUrls': presigned_urls}, cors_headers, logger)
+        # Every part URL is signed over the checksum the client computed for that part
+        checksum_algorithm = body.get('checksumAlgorithm', 'SHA256').upper()
+        checksums = body.get('checksums') or []
+        if checksum_algorithm not in SUPPORTED_CHECKSUM_ALGORITHMS:
+            return generate_response(400, f'checksumAlgorithm must be one of {", ".join(SUPPORTED_CHECKSUM_ALGORITHMS)}',
+                                     cors_headers, logger)
+        if len(checksums) != parts:
+            return generate_response(400, 'checksums must hold one base64 checksum per part', cors_headers, logger)
+
+        presigned_urls = generate_presigned_urls(user_id, uploadId, filename, parts, checksum_algorithm, checksums, logger)
+        return generate_response(200, {
+            'partUrls': presigned_urls,
+            'checksumHeader': f'x-amz-checksum-{checksum_algorithm.lower()}'
+        }, cors_headers, logger)
 
     except ClientError as e:
         logger.error(f"ClientError: {e}")
@@ -90,8 +97,13 @@ def extract_body_fields(body, logger):
     logger.info(f"Extracted body fields - uploadId: {uploadId}, filename: {filename}, parts: {parts}")
     return uploadId, filename, parts
 
-def generate_presigned_urls(uploadId, filename, parts, logger):
-    """Generate presigned URLs for each part."""
+def generate_presigned_urls(user_id, uploadId, filename, parts, checksum_algorithm, checksums, logger):
+    """
+    Generate presigned URLs for each part.
+
+    The part checksum is part of the signature, so S3 only accepts the upload when the
+    client sends that checksum and the bytes it receives match it.
+    """
     presigned_urls = []
     for part_number in range(1, parts + 1):
         try:
@@ -99,9 +111,10 @@ def generate_presigned_urls(uploadId, filename, parts, logger):
                 ClientMethod='upload_part',
                 Params={
                     'Bucket': DIGITAL_ASSETS_BUCKET_NAME,
-                    'Key': filename,
+                    'Key': document_key(user_id, filename),
                     'UploadId': uploadId,
-                    'PartNumber': part_number
+                    'PartNumber': part_number,
+                    f'Checksum{checksum_algorithm}': checksums[part_number - 1]
                 },
                 ExpiresIn=3600 # 1 hour in seconds 
             )
@@ -122,15 +135,15 @@ def get_authorization_token(event, logger):
     return None
 
 def validate_jwt_token(token, logger):
-    """Validate and decode the JWT token."""
+    """Validate and decode the JWT token, returning the user ID (sub) on success."""
     cognito_issuer = f'https://cognito-idp.{AWS_REGION}.amazonaws.com/{COGNITO_USER_POOL_ID}'
     jwks_url = f'{cognito_issuer}/.well-known/jwks.json'
 
     try:
-        jwks_client = get_jwks_client(jwks_url, logger)
+        jwks_client = get_jwks_client(jwks_url)
         signing_key = jwks_client.get_signing_key_from_jwt(token).key
 
-        jwt.decode(
+        decoded_token = jwt.decode(
             token,
             signing_key,
             algorithms=["RS256"],
@@ -138,14 +151,14 @@ def validate_jwt_token(token, logger):
             options={"verify_aud": False}
         )
         logger.info("JWT token decoded and validated successfully")
-        return True
+        return decoded_token.get('sub')
 
     except jwt.ExpiredSignatureError:
         logger.error("JWT token has expired")
-        return False
+        return None
     except jwt.InvalidTokenError as e:
         logger.error(f"Invalid JWT token: {e}")
-        return False
+        return None
 
 def generate_response(status_code, message, cors_headers, logger=None):
     """Generate a HTTP response."""
@@ -3,12 +3,22 @@ import os
 import boto3
 import jwt
 from botocore.exceptions import ClientError
-from jwt import PyJWKClient, PyJWKClientError
 from logging_utils import configure_logging
+from auth_utils import get_jwks_client
+from warmup_utils import handle_warmup, is_warmup_event, register_snapshot_hooks
 from cors_utils import get_cors_headers_from_event
+from storage_utils import document_key
+from compression_utils import guess_content_type
+from idempotency_utils import run_idempotent
+from retry_utils import RETRY_CLIENT_CONFIG, RetryPolicy, is_unavailable, unavailable_response
 
-# Initialize S3 client at module level
-s3_client = boto3.client('s3')
+# Initialize AWS clients at module level
+s3_client = boto3.client('s3', config=RETRY_CLIENT_CONFIG)
+dynamodb_client = boto3.client('dynamodb', config=RETRY_CLIENT_CONFIG)     # Idempotency records
+
+# Retry throttled and failed calls within the invocation's deadline
+retry_policy = RetryPolicy()
+retry_policy.install(s3_client, dynamodb_client)
 
 # Environment variables validation
 REQUIRED_ENV_VARS = ['DIGITAL_ASSETS_BUCKET_NAME', 'COGNITO_USER_POOL_ID', 'AWS_REGION']
@@ -21,24 +31,19 @@ DIGITAL_ASSETS_BUCKET_NAME = os.getenv('DIGITAL_ASSETS_BUCKET_NAME')
 COGNITO_USER_POOL_ID = os.getenv('COGNITO_USER_POOL_ID')
 AWS_REGION = os.getenv('AWS_REGION')
 
-# Cache JWKS client globally
-_jwks_client = None
-
-def get_jwks_client(jwks_url, logger):
-    """Fetch JWKS client, using cached instance for efficiency."""
-    global _jwks_client
-    if _jwks_client is None:
-        try:
-            _jwks_client = PyJWKClient(jwks_url)
-            logger.info("JWKS client initialized")
-        except PyJWKClientError as e:
-            logger.error(f"Error initializing JWKS client: {e}")
-            raise
-    return _jwks_client
+# Parts must carry a checksum in this algorithm unless the client asks for another supported one
+MULTIPART_CHECKSUM_ALGORITHM = os.getenv('MULTIPART_CHECKSUM_ALGORITHM', 'SHA256')
+SUPPORTED_CHECKSUM_ALGORITHMS = ('SHA256', 'CRC32C')
+
+# Prime connections and keys before a snapshot, and refresh them after a restore
+register_snapshot_hooks([s3_client, dynamodb_client], AWS_REGION, COGNITO_USER_POOL_ID)
 
 def lambda_handler(event, context):
     """Main Lambda handler."""
     logger = configure_logging()
+    retry_policy.start_invocation(context)
+    if is_warmup_event(event):
+        return handle_warmup(logger, [s3_client, dynamodb_client], AWS_REGION, COGNITO_USER_POOL_ID)
     logger.info("Lambda function started")
     logger.debug(f"Received event: {json.dumps(event)}")
 
@@ -49,7 +54,7 @@ def lambda_handler(event, context):
         return generate_response(200, 'CORS preflight', cors_headers, logger)
     
     if http_method == 'POST':
-        return handle_post_request(event, logger, cors_headers)
+        return handle_post_request(event, context, logger, cors_headers)
 
     return generate_response(405, f'Method {http_method} not allowed', cors_headers, logger)
 
@@ -57,22 +62,26 @@ def extract_http_method(event):
     """Extract HTTP method from event."""
     return event.get('routeKey', '').split(' ')[0] if 'routeKey' in event else event.get('httpMethod')
 
-def handle_post_request(event, logger, cors_headers):
-    """Handle POST request logic."""
+def handle_post_request(event, context, logger, cors_headers):
+    """
+    Handle POST request logic.
+
+    A request carrying an Idempotency-Key starts one upload, retries get the same uploadId
+    instead of leaving orphaned uploads behind.
+    """
     try:
         auth_token = get_authorization_token(event, logger)
-        if not auth_token or not validate_jwt_token(auth_token, logger):
+        user_id = validate_jwt_token(auth_token, logger) if auth_token else None
+        if not user_id:
             return generate_response(401, 'Unauthorized', cors_headers, logger)
 
-        body = extract_body(event, logger)
-        filename = body.get('filename')
-        if not filename:
-            return generate_response(400, 'Filename is required', cors_headers, logger)
-
-        upload_id = initiate_multipart_upload(filename, logger)
-        return generate_response(200, {'uploadId': upload_id}, cors_headers, logger)
+        return run_idempotent(dynamodb_client, event, context, user_id, 'multipart_start_upload',
+                              lambda: start_upload(event, user_id, logger, cors_headers), cors_headers, logger)
 
     except ClientError as e:
+        if is_unavailable(e):
+            logger.warning(f"Dependency unavailable: {str(e)}")
+            return unavailable_response(e, cors_headers)
         logger.error(f"ClientError: {e}")
         return generate_response(500, f'Error starting multipart upload: {e}', cors_headers, logger)
 
@@ -81,9 +90,29 @@ def handle_post_request(event, logger, cors_headers):
         return generate_response(400, 'Invalid JSON format', cors_headers, logger)
 
     except Exception as e:
+        if is_unavailable(e):
+            logger.warning(f"Dependency unavailable: {str(e)}")
+            return unavailable_response(e, cors_headers)
         logger.error(f"Unhandled exception: {e}")
         return generate_response(500, 'Internal server error', cors_headers, logger)
 
+def start_upload(event, user_id, logger, cors_headers):
+    """Validate the request and start the multipart upload."""
+    body = extract_body(event, logger)
+    filename = body.get('filename')
+    if not filename:
+        return generate_response(400, 'Filename is required', cors_headers, logger)
+
+    checksum_algorithm = body.get('checksumAlgorithm', MULTIPART_CHECKSUM_ALGORITHM).upper()
+    if checksum_algorithm not in SUPPORTED_CHECKSUM_ALGORITHMS:
+        return generate_response(400, f'checksumAlgorithm must be one of {", ".join(SUPPORTED_CHECKSUM_ALGORITHMS)}',
+                                 cors_headers, logger)
+
+    content_type = guess_content_type(filename, body.get('content_type'))
+    upload_id = initiate_multipart_upload(user_id, filename, content_type, checksum_algorithm, logger)
+    return generate_response(200, {'uploadId': upload_id, 'checksumAlgorithm': checksum_algorithm},
+                             cors_headers, logger)
+
 def extract_body(event, logger):
     """Extract and parse the request body from the event."""
     try:
@@ -94,9 +123,19 @@ def extract_body(event, logger):
         logger.error(f"Invalid JSON format: {e}")
         raise
 
-def initiate_multipart_upload(filename, logger):
-    """Initiate S3 multipart upload."""
-    response = s3_client.create_multipart_upload(Bucket=DIGITAL_ASSETS_BUCKET_NAME, Key=filename)
+def initiate_multipart_upload(user_id, filename, content_type, checksum_algorithm, logger):
+    """
+    Initiate S3 multipart upload under the user's prefix.
+
+    With a checksum algorithm set, S3 rejects any part uploaded without a matching checksum
+    and computes a composite checksum of the object on completion.
+    """
+    response = s3_client.create_multipart_upload(
+        Bucket=DIGITAL_ASSETS_BUCKET_NAME,
+        Key=document_key(user_id, filename),
+        ContentType=content_type,
+        ChecksumAlgorithm=checksum_algorithm
+    )
     upload_id = response['UploadId']
     logger.info(f"Multipart upload initiated for file: {filename}, uploadId: {upload_id}")
     return upload_id
@@ -110,24 +149,24 @@ def get_authorization_token(event, logger):
     return None
 
 def validate_jwt_token(token, logger):
-    """Validate the JWT token with Cognito."""
+    """Validate the JWT token with Cognito, returning the user ID (sub) on success."""
     cognito_issuer = f'https://cognito-idp.{AWS_REGION}.amazonaws.com/{COGNITO_USER_POOL_ID}'
     jwks_url = f'{cognito_issuer}/.well-known/jwks.json'
 
     try:
-        jwks_client = get_jwks_client(jwks_url, logger)
+        jwks_client = get_jwks_client(jwks_url)
         signing_key = jwks_client.get_signing_key_from_jwt(token).key
 
-        jwt.decode(token, signing_key, algorithms=["RS256"], issuer=cognito_issuer, options={"verify_aud": False})
+        decoded_token = jwt.decode(token, signing_key, algorithms=["RS256"], issuer=cognito_issuer, options={"verify_aud": False})
         logger.info("JWT token decoded and validated successfully")
-        return True
+        return decoded_token.get('sub')
 
     except jwt.ExpiredSignatureError:
         logger.error("JWT token has expired")
-        return False
+        return None
     except jwt.InvalidTokenError as e:
         logger.error(f"Invalid JWT token: {e}")
-        return False
+        return None
 
 def generate_response(status_code, message, cors_headers, logger=None):
     """Generate an HTTP response."""
@@ -0,0 +1,94 @@
+import json
+import os
+import datetime
+import boto3
+from concurrent.futures import ThreadPoolExecutor
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from logging_utils import configure_logging
+from warmup_utils import handle_warmup, is_warmup_event, register_snapshot_hooks
+from metrics_utils import emit_metrics
+
+# Environment variables validation
+REQUIRED_ENV_VARS = ['DIGITAL_ASSETS_BUCKET_NAME']
+MISSING_ENV_VARS = [var for var in REQUIRED_ENV_VARS if not os.getenv(var)]
+
+if MISSING_ENV_VARS:
+    raise ValueError(f"Missing required environment variables: {', '.join(MISSING_ENV_VARS)}")
+
+DIGITAL_ASSETS_BUCKET_NAME = os.getenv('DIGITAL_ASSETS_BUCKET_NAME')
+MULTIPART_UPLOAD_MAX_AGE_HOURS = float(os.getenv('MULTIPART_UPLOAD_MAX_AGE_HOURS', '24'))
+SWEEPER_MAX_WORKERS = int(os.getenv('SWEEPER_MAX_WORKERS', '16'))
+
+# Stop starting new batches when less than this much Lambda time is left
+TIME_MARGIN_MS = 10000
+
+# The connection pool must be as large as the worker pool to avoid serialising requests
+s3_client = boto3.client('s3', config=Config(max_pool_connections=SWEEPER_MAX_WORKERS))
+
+# Prime connections and keys before a snapshot, and refresh them after a restore
+register_snapshot_hooks([s3_client])
+
+def lambda_handler(event, context):
+    """Scheduled Lambda handler that aborts stale multipart uploads and reports reclaimed bytes."""
+    logger = configure_logging()
+    if is_warmup_event(event):
+        return handle_warmup(logger, [s3_client])
+    logger.info("Lambda function started")
+    logger.debug(f"Received event: {json.dumps(event)}")
+
+    max_age_hours = float(event.get('max_age_hours', MULTIPART_UPLOAD_MAX_AGE_HOURS))
+    cutoff = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=max_age_hours)
+
+    totals = {'ScannedUploads': 0, 'AbortedUploads': 0, 'FailedAborts': 0, 'ReclaimedBytes': 0}
+    with ThreadPoolExecutor(max_workers=SWEEPER_MAX_WORKERS) as executor:
+        for page in list_upload_pages(logger):
+            if context and context.get_remaining_time_in_millis() < TIME_MARGIN_MS:
+                logger.warning("Running out of time, remaining uploads are left for the next run")
+                break
+
+            totals['ScannedUploads'] += len(page)
+            stale = [upload for upload in page if upload['Initiated'] < cutoff]
+            for reclaimed in executor.map(lambda upload: abort_upload(upload, logger), stale):
+                if reclaimed is None:
+                    totals['FailedAborts'] += 1
+                else:
+                    totals['AbortedUploads'] += 1
+                    totals['ReclaimedBytes'] += reclaimed
+
+    emit_metrics(totals, dimensions={'Function': 'sweep_multipart_uploads'}, units={'ReclaimedBytes': 'Bytes'})
+    logger.info(f"Multipart sweep finished: {totals}")
+    return totals
+
+def list_upload_pages(logger):
+    """Yield pages of in-progress multipart uploads in the assets bucket."""
+    paginator = s3_client.get_paginator('list_multipart_uploads')
+    for page in paginator.paginate(Bucket=DIGITAL_ASSETS_BUCKET_NAME):
+        uploads = page.get('Uploads', [])
+        logger.debug(f"Listed {len(uploads)} multipart uploads")
+        yield uploads
+
+def abort_upload(upload, logger):
+    """
+    Abort one multipart upload.
+
+    Returns:
+        int: The bytes held by the upload's parts, or None if the abort failed.
+    """
+    key, upload_id = upload['Key'], upload['UploadId']
+    try:
+        reclaimed = 0
+        paginator = s3_client.get_paginator('list_parts')
+        for page in paginator.paginate(Bucket=DIGITAL_ASSETS_BUCKET_NAME, Key=key, UploadId=upload_id):
+            reclaimed += sum(part['Size'] for part in page.get('Parts', []))
+
+        s3_client.abort_multipart_upload(Bucket=DIGITAL_ASSETS_BUCKET_NAME, Key=key, UploadId=upload_id)
+        logger.info(f"Aborted multipart upload {upload_id} for {key} ({reclaimed} bytes)")
+        return reclaimed
+
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'NoSuchUpload':
+            # Completed or aborted since it was listed
+            return 0
+        logger.error(f"Failed to abort multipart upload {upload_id} for {key}: {e}")
+        return None
@@ -0,0 +1,256 @@
+import io
+import json
+import os
+import boto3
+from botocore.exceptions import ClientError
+from logging_utils import configure_logging
+from warmup_utils import handle_warmup, is_warmup_event, register_snapshot_hooks
+from compression_utils import CODEC_NONE, STREAM_CHUNK_SIZE, iter_decompressed
+from encryption_utils import document_data_keys, is_encrypted, iter_decrypted
+from storage_utils import document_key, derived_key, THUMBNAIL_ARTIFACT, EXCERPT_ARTIFACT
+
+try:
+    from PIL import Image
+except ImportError:  # Thumbnails are skipped when Pillow is not packaged
+    Image = None
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # PDF excerpts are skipped when pypdf is not packaged
+    PdfReader = None
+
+# Initialize AWS clients
+s3_client = boto3.client('s3')
+dynamodb_client = boto3.client('dynamodb')
+kms_client = boto3.client('kms')
+
+# Validate environment variables at cold start
+DIGITAL_ASSETS_BUCKET_NAME = os.getenv('DIGITAL_ASSETS_BUCKET_NAME')
+DYNAMODB_TABLE_NAME = os.getenv('DYNAMODB_TABLE_NAME')
+DOCUMENT_KMS_KEY_ID = os.getenv('DOCUMENT_KMS_KEY_ID')
+
+if not all([DIGITAL_ASSETS_BUCKET_NAME, DYNAMODB_TABLE_NAME]):
+    raise ValueError("Missing required environment variables")
+
+# Unwrapped data keys of encrypted documents, reused across the batch and warm invocations
+data_keys = document_data_keys(kms_client, DIGITAL_ASSETS_BUCKET_NAME, DOCUMENT_KMS_KEY_ID)
+
+THUMBNAIL_SIZE = (256, 256)
+EXCERPT_CHARS = 2000
+TEXT_SAMPLE_BYTES = 64 * 1024               # Enough of a text document for its excerpt
+MAX_SOURCE_BYTES = 50 * 1024 * 1024         # Larger images and PDFs are not previewed
+
+# Leading bytes of common formats, used when the stored content type is generic
+MAGIC_NUMBERS = (
+    (b'%PDF-', 'application/pdf'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'PK\x03\x04', 'application/zip'),
+)
+TEXT_MEDIA_TYPES = ('text/', 'application/json', 'application/xml', 'application/csv')
+
+# Prime connections and keys before a snapshot, and refresh them after a restore
+register_snapshot_hooks([s3_client, dynamodb_client])
+
+
+def lambda_handler(event, context):
+    """
+    Lambda function handler for deriving previews from the metadata table's stream.
+
+    Previews are derived once a document's item is written, whichever path registered it,
+    so recording them never races the item's creation.
+    """
+    logger = configure_logging()
+    if is_warmup_event(event):
+        return handle_warmup(logger, [s3_client, dynamodb_client])
+    logger.info("Lambda function started")
+    logger.debug("Received event: %s", json.dumps(event))
+
+    derived = 0
+    for user_id, document_name in collect_documents_needing_previews(event.get('Records', [])):
+        try:
+            if derive_previews(s3_client, dynamodb_client, DIGITAL_ASSETS_BUCKET_NAME, DYNAMODB_TABLE_NAME,
+                               user_id, document_name, data_keys, logger) is not None:
+                derived += 1
+        except ClientError as e:
+            logger.error(f"Failed to derive previews for {document_name}: {e.response['Error']['Message']}")
+            raise
+
+    logger.info(f"Derived previews for {derived} documents")
+    return {'derived': derived}
+
+
+def collect_documents_needing_previews(records):
+    """
+    Return the documents of a batch of stream records whose preview is missing or stale.
+
+    A preview records the ETag it was derived from, so recording it (a MODIFY of the same
+    ETag) does not trigger another derivation, while a new version or a rewrite of the item
+    that dropped the preview does. Previews recorded before the ETag was kept count as
+    current until the ETag changes.
+
+    Returns:
+        list: (user_id, document_name) pairs, each once, in stream order.
+    """
+    documents = {}
+    for record in records:
+        data = record.get('dynamodb', {})
+        keys = data.get('Keys', {})
+        if record.get('eventName') == 'REMOVE' or 'user_id' not in keys or 'document_name' not in keys:
+            continue
+
+        new_image = data.get('NewImage', {})
+        etag = new_image.get('etag', {}).get('S')
+        preview = new_image.get('preview', {}).get('M')
+        if preview is not None:
+            preview_etag = preview.get('etag', {}).get('S')
+            if preview_etag is None:
+                preview_etag = data.get('OldImage', {}).get('etag', {}).get('S')
+            if preview_etag == etag:
+                continue
+        documents[(keys['user_id']['S'], keys['document_name']['S'])] = True
+    return list(documents)
+
+
+def derive_previews(s3, dynamodb, bucket, table_name, user_id, document_name, data_keys, logger):
+    """
+    Generate the preview artifacts for one document and record their keys in its DynamoDB item.
+
+    Everything the pipeline touches is passed in, so it runs in-process against fakes.
+
+    Args:
+        s3: An S3 client.
+        dynamodb: A DynamoDB client.
+        bucket (str): The assets bucket.
+        table_name (str): The metadata table.
+        user_id (str): The owner of the document.
+        document_name (str): The document name.
+        data_keys (DataKeyCache): Unwraps the data keys of encrypted documents.
+        logger (logging.Logger): The logger instance.
+
+    Returns:
+        dict: The preview attributes that were recorded, or None if the document is gone.
+    """
+    key = document_key(user_id, document_name)
+    try:
+        head = s3.head_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        if e.response['Error']['Code'] not in ('404', 'NoSuchKey', 'NotFound'):
+            raise
+        # Deleted since its item was written, the REMOVE record follows
+        logger.info(f"Document {document_name} no longer exists")
+        return None
+    metadata = head.get('Metadata', {})
+    content_type = head.get('ContentType', 'application/octet-stream')
+    size = int(metadata.get('original-size', head['ContentLength']))    # Sources are read decompressed
+
+    sample = read_document(s3, bucket, key, metadata, TEXT_SAMPLE_BYTES, data_keys, logger)
+    media_type = sniff_media_type(sample, content_type)
+    preview = {'media_type': media_type, 'etag': head['ETag'].strip('"')}
+
+    if media_type.startswith('image/') and Image and size <= MAX_SOURCE_BYTES:
+        thumbnail = make_thumbnail(read_document(s3, bucket, key, metadata, None, data_keys, logger), logger)
+        if thumbnail:
+            preview['thumbnail_key'] = put_artifact(s3, bucket, user_id, document_name, THUMBNAIL_ARTIFACT,
+                                                    thumbnail, 'image/jpeg')
+
+    excerpt = None
+    if media_type.startswith(TEXT_MEDIA_TYPES):
+        excerpt = sample.decode('utf-8', errors='ignore')[:EXCERPT_CHARS]
+    elif media_type == 'application/pdf' and PdfReader and size <= MAX_SOURCE_BYTES:
+        excerpt = extract_pdf_excerpt(read_document(s3, bucket, key, metadata, None, data_keys, logger), logger)
+
+    if excerpt:
+        preview['excerpt_key'] = put_artifact(s3, bucket, user_id, document_name, EXCERPT_ARTIFACT,
+                                              excerpt.encode('utf-8'), 'text/plain; charset=utf-8')
+
+    record_previews(dynamodb, table_name, user_id, document_name, preview, logger)
+    return preview
+
+
+def read_document(s3, bucket, key, metadata, max_bytes, data_keys, logger):
+    """
+    Read a document, or only its first max_bytes, decrypting and decompressing it as it was stored.
+    """
+    codec = metadata.get('content-codec', CODEC_NONE)
+    params = {'Bucket': bucket, 'Key': key}
+    if max_bytes and codec == CODEC_NONE and not is_encrypted(metadata):
+        # A range GET keeps excerpts cheap for large uncompressed documents
+        params['Range'] = f'bytes=0-{max_bytes - 1}'
+
+    response = s3.get_object(**params)
+    chunks = iter_decrypted(response['Body'].iter_chunks(STREAM_CHUNK_SIZE), metadata, data_keys)
+    data = bytearray()
+    for chunk in iter_decompressed(chunks, codec):
+        data.extend(chunk)
+        if max_bytes and len(data) >= max_bytes:
+            break
+
+    logger.debug(f"Read {len(data)} bytes of {key}")
+    return bytes(data[:max_bytes] if max_bytes else data)
+
+
+def sniff_media_type(sample, content_type):
+    """Detect the media type from the leading bytes, falling back to the stored content type."""
+    for magic, media_type in MAGIC_NUMBERS:
+        if sample.startswith(magic):
+            return media_type
+    return content_type.split(';')[0].strip().lower()
+
+
+def make_thumbnail(data, logger):
+    """Render a JPEG thumbnail of an image, or None if the image cannot be decoded."""
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image.draft('RGB', THUMBNAIL_SIZE)  # Lets JPEG decode at a reduced scale
+            image.thumbnail(THUMBNAIL_SIZE)
+            output = io.BytesIO()
+            image.convert('RGB').save(output, format='JPEG', quality=80, optimize=True)
+            return output.getvalue()
+    except Exception as e:
+        logger.warning(f"Failed to create thumbnail: {str(e)}")
+        return None
+
+
+def extract_pdf_excerpt(data, logger):
+    """Extract the text of the first page of a PDF, or None if it has none."""
+    try:
+        reader = PdfReader(io.BytesIO(data))
+        if not reader.pages:
+            return None
+        text = (reader.pages[0].extract_text() or '').strip()
+        return text[:EXCERPT_CHARS] or None
+    except Exception as e:
+        logger.warning(f"Failed to extract PDF excerpt: {str(e)}")
+        return None
+
+
+def put_artifact(s3, bucket, user_id, document_name, artifact, body, content_type):
+    """Store a derived artifact and return its key."""
+    key = derived_key(user_id, document_name, artifact)
+    s3.put_object(Bucket=bucket, Key=key, Body=body, ContentType=content_type)
+    return key
+
+
+def record_previews(dynamodb, table_name, user_id, document_name, preview, logger):
+    """Record the preview attributes on the document's DynamoDB item, if the item still exists."""
+    try:
+        dynamodb.update_item(
+            TableName=table_name,
+            Key={
+                'user_id': {'S': user_id},
+                'document_name': {'S': document_name}
+            },
+            UpdateExpression='SET preview = :preview',
+            ConditionExpression='attribute_exists(user_id)',
+            ExpressionAttributeValues={
+                ':preview': {'M': {name: {'S': value} for name, value in preview.items()}}
+            }
+        )
+        logger.info(f"Preview for {document_name} recorded in DynamoDB successfully")
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        logger.warning(f"Document {document_name} was deleted before its preview was recorded")
@@ -0,0 +1,116 @@
+import json
+import os
+import boto3
+from botocore.exceptions import ClientError
+from logging_utils import configure_logging
+from warmup_utils import handle_warmup, is_warmup_event, register_snapshot_hooks
+from cors_utils import get_cors_headers_from_event
+from auth_utils import extract_and_verify_token
+from copy_utils import CopyConflict, copy_document
+
+# Initialize AWS clients
+s3_client = boto3.client('s3')
+dynamodb_client = boto3.client('dynamodb')
+
+# Validate environment variables at cold start
+DIGITAL_ASSETS_BUCKET_NAME = os.getenv('DIGITAL_ASSETS_BUCKET_NAME')
+DYNAMODB_TABLE_NAME = os.getenv('DYNAMODB_TABLE_NAME')
+COGNITO_USER_POOL_ID = os.getenv('COGNITO_USER_POOL_ID')
+AWS_REGION = os.getenv('AWS_REGION')
+
+if not all([DIGITAL_ASSETS_BUCKET_NAME, DYNAMODB_TABLE_NAME, COGNITO_USER_POOL_ID, AWS_REGION]):
+    raise ValueError("Missing required environment variables")
+
+# Objects above this size are copied as parallel UploadPartCopy ranges, never above 5 GB
+MULTIPART_COPY_THRESHOLD = int(os.getenv('MULTIPART_COPY_THRESHOLD', str(256 * 1024 * 1024)))
+MULTIPART_COPY_PART_SIZE = int(os.getenv('MULTIPART_COPY_PART_SIZE', str(128 * 1024 * 1024)))
+MULTIPART_COPY_WORKERS = int(os.getenv('MULTIPART_COPY_WORKERS', '16'))
+
+# Prime connections and keys before a snapshot, and refresh them after a restore
+register_snapshot_hooks([s3_client, dynamodb_client], AWS_REGION, COGNITO_USER_POOL_ID)
+
+
+def lambda_handler(event, context):
+    """
+    Lambda function handler for renaming (moving) a document.
+    """
+    logger = configure_logging()
+    if is_warmup_event(event):
+        return handle_warmup(logger, [s3_client, dynamodb_client], AWS_REGION, COGNITO_USER_POOL_ID)
+    logger.info("Lambda function started")
+    logger.debug("Received event: %s", json.dumps(event))
+
+    # Get CORS headers
+    cors_headers = get_cors_headers_from_event(event, logger)
+
+    # Determine the HTTP method
+    http_method = event.get('routeKey', '').split()[0] or event.get('httpMethod')
+
+    if http_method == 'OPTIONS':
+        return generate_response(200, 'CORS preflight', cors_headers)
+
+    elif http_method == 'POST':
+        return handle_post_request(event, logger, cors_headers)
+
+    return generate_response(405, f'Method {http_method} not allowed', cors_headers)
+
+
+def handle_post_request(event, logger, cors_headers):
+    """
+    Handle POST request to rename a document, entirely inside S3.
+
+    The body holds 'source_name' and 'destination_name'; 'overwrite' replaces an existing
+    destination instead of failing with 409.
+    """
+    try:
+        auth_result = extract_and_verify_token(event, AWS_REGION, COGNITO_USER_POOL_ID)
+        if auth_result['statusCode'] != 200:
+            return generate_response(auth_result['statusCode'], auth_result['body']['message'], cors_headers)
+        user_id = auth_result['body']['user_id']
+
+        # Parse request body
+        body = json.loads(event.get('body') or '{}')
+        source_name = body.get('source_name')
+        destination_name = body.get('destination_name')
+        overwrite = bool(body.get('overwrite', False))
+
+        if not source_name or not destination_name:
+            return generate_response(400, 'source_name and destination_name are required', cors_headers)
+        if source_name == destination_name:
+            return generate_response(400, 'source_name and destination_name must differ', cors_headers)
+
+        item = copy_document(
+            s3_client, dynamodb_client, DIGITAL_ASSETS_BUCKET_NAME, DYNAMODB_TABLE_NAME, user_id,
+            source_name, destination_name, move=True, overwrite=overwrite,
+            multipart_threshold=MULTIPART_COPY_THRESHOLD, part_size=MULTIPART_COPY_PART_SIZE,
+            max_workers=MULTIPART_COPY_WORKERS, logger=logger
+        )
+        return generate_response(200, {
+            'message': 'Document renamed',
+            'document_name': destination_name,
+            'size': int(item['size']['N']),
+            'etag': item['etag']['S']
+        }, cors_headers)
+
+    except CopyConflict as e:
+        logger.warning(f"Rename conflict: {str(e)}")
+        return generate_response(409, str(e), cors_headers)
+    except json.JSONDecodeError:
+        return generate_response(400, 'Invalid JSON body', cors_headers)
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+            return generate_response(404, 'Document not found', cors_headers)
+        logger.error(f"AWS error while renaming document: {e.response['Error']['Message']}")
+        return generate_response(500, 'Failed to rename document', cors_headers)
+    except Exception as e:
+        logger.error(f"An unexpected error occurred: {str(e)}")
+        return generate_response(500, f'An unexpected error occurred: {str(e)}', cors_headers)
+
+
+def generate_response(status_code, message, cors_headers):
+    """Generate an HTTP response with CORS headers."""
+    return {
+        'statusCode': status_code,
+        'headers': cors_headers,
+        'body': json.dumps(message)
+    }
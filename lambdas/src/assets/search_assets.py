@@ -0,0 +1,172 @@
+import json
+import os
+import time
+import boto3
+from collections import OrderedDict
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+from logging_utils import configure_logging
+from warmup_utils import handle_warmup, is_warmup_event, register_snapshot_hooks
+from cors_utils import get_cors_headers_from_event
+from auth_utils import extract_and_verify_token
+from response_utils import compress_response, json_default
+from metadata_utils import get_document_items
+from storage_utils import name_index_key
+from trigram_index import TrigramIndex
+
+# Initialize AWS clients
+s3_client = boto3.client('s3')
+dynamodb_resource = boto3.resource('dynamodb')
+
+# Validate environment variables at cold start
+DIGITAL_ASSETS_BUCKET_NAME = os.getenv('DIGITAL_ASSETS_BUCKET_NAME')
+DYNAMODB_TABLE_NAME = os.getenv('DYNAMODB_TABLE_NAME')
+COGNITO_USER_POOL_ID = os.getenv('COGNITO_USER_POOL_ID')
+AWS_REGION = os.getenv('AWS_REGION')
+
+if not all([DIGITAL_ASSETS_BUCKET_NAME, DYNAMODB_TABLE_NAME, COGNITO_USER_POOL_ID, AWS_REGION]):
+    raise ValueError("Missing required environment variables")
+
+# Initialize DynamoDB table resource
+table = dynamodb_resource.Table(DYNAMODB_TABLE_NAME)
+
+# Cached name indexes are used as-is for this long, then revalidated with a conditional GET
+NAME_INDEX_CACHE_TTL_SECONDS = float(os.getenv('NAME_INDEX_CACHE_TTL_SECONDS', '30'))
+NAME_INDEX_CACHE_MAX_USERS = int(os.getenv('NAME_INDEX_CACHE_MAX_USERS', '32'))
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 100     # BatchGetItem reads at most 100 keys per request
+
+# user_id -> {'etag', 'index', 'checked_at'}, least recently used first
+_name_index_cache = OrderedDict()
+
+# Prime connections and keys before a snapshot, and refresh them after a restore
+register_snapshot_hooks([s3_client, dynamodb_resource], AWS_REGION, COGNITO_USER_POOL_ID)
+
+
+def lambda_handler(event, context):
+    """
+    Lambda function handler for searching a user's documents by name.
+    """
+    logger = configure_logging()
+    if is_warmup_event(event):
+        return handle_warmup(logger, [s3_client, dynamodb_resource], AWS_REGION, COGNITO_USER_POOL_ID)
+    logger.info("Lambda function started")
+    logger.debug("Received event: %s", json.dumps(event))
+
+    # Get CORS headers
+    cors_headers = get_cors_headers_from_event(event, logger)
+
+    # Determine the HTTP method
+    http_method = event.get('routeKey', '').split()[0] or event.get('httpMethod')
+
+    if http_method == 'OPTIONS':
+        return generate_response(200, 'CORS preflight', cors_headers)
+
+    elif http_method == 'POST':
+        return compress_response(event, handle_post_request(event, logger, cors_headers), logger)
+
+    return generate_response(405, f'Method {http_method} not allowed', cors_headers)
+
+
+def handle_post_request(event, logger, cors_headers):
+    """
+    Handle POST request for a prefix or substring search over document names.
+    """
+    try:
+        auth_result = extract_and_verify_token(event, AWS_REGION, COGNITO_USER_POOL_ID)
+        if auth_result['statusCode'] != 200:
+            return generate_response(auth_result['statusCode'], auth_result['body']['message'], cors_headers)
+        user_id = auth_result['body']['user_id']
+
+        # Parse request body
+        body = json.loads(event.get('body') or '{}')
+        query = body.get('query', '')
+        mode = body.get('mode', 'prefix')
+        limit = int(body.get('limit', DEFAULT_LIMIT))
+
+        if not query:
+            return generate_response(400, 'query is required', cors_headers)
+        if not 0 < limit <= MAX_LIMIT:
+            return generate_response(400, f'limit must be between 1 and {MAX_LIMIT}', cors_headers)
+
+        if mode == 'prefix':
+            items = prefix_search(user_id, query, limit, logger)
+        elif mode == 'substring':
+            items = substring_search(user_id, query, limit, logger)
+        else:
+            return generate_response(400, "mode must be 'prefix' or 'substring'", cors_headers)
+
+        return generate_response(200, items, cors_headers)
+
+    except (ValueError, json.JSONDecodeError) as e:
+        logger.warning(f"Invalid search request: {str(e)}")
+        return generate_response(400, 'Invalid search request', cors_headers)
+    except Exception as e:
+        logger.error(f"An unexpected error occurred: {str(e)}")
+        return generate_response(500, f'An unexpected error occurred: {str(e)}', cors_headers)
+
+
+def prefix_search(user_id, prefix, limit, logger):
+    """Find documents whose name starts with the prefix with a begins_with key condition."""
+    response = table.query(
+        KeyConditionExpression=Key('user_id').eq(user_id) & Key('document_name').begins_with(prefix),
+        Limit=limit
+    )
+    logger.info(f"Prefix search returned {len(response['Items'])} items")
+    return response['Items']
+
+
+def substring_search(user_id, query, limit, logger):
+    """Find documents whose name contains the query using the user's trigram index."""
+    index = get_name_index(user_id, logger)
+    names = index.search(query, limit)
+    logger.info(f"Substring search matched {len(names)} of {len(index.names)} names")
+    return get_document_items(dynamodb_resource, DYNAMODB_TABLE_NAME, user_id, names)
+
+
+def get_name_index(user_id, logger):
+    """
+    Return the user's name index, from the container cache when it is still current.
+
+    Within the TTL the cached copy is used without any request. After that a conditional
+    GET revalidates it, which is a 304 with no body unless the index has changed.
+    """
+    cached = _name_index_cache.get(user_id)
+    if cached and time.monotonic() - cached['checked_at'] < NAME_INDEX_CACHE_TTL_SECONDS:
+        _name_index_cache.move_to_end(user_id)
+        return cached['index']
+
+    params = {'Bucket': DIGITAL_ASSETS_BUCKET_NAME, 'Key': name_index_key(user_id)}
+    if cached:
+        params['IfNoneMatch'] = cached['etag']
+
+    try:
+        response = s3_client.get_object(**params)
+        cached = {'etag': response['ETag'], 'index': TrigramIndex.from_bytes(response['Body'].read())}
+        logger.info(f"Loaded name index with {len(cached['index'].names)} names")
+    except ClientError as e:
+        code = e.response['Error']['Code']
+        if code in ('304', 'NotModified'):
+            logger.debug("Cached name index is current")
+        elif code in ('NoSuchKey', '404'):
+            # No documents indexed yet
+            return TrigramIndex.build([])
+        else:
+            raise
+
+    cached['checked_at'] = time.monotonic()
+    _name_index_cache[user_id] = cached
+    _name_index_cache.move_to_end(user_id)
+    while len(_name_index_cache) > NAME_INDEX_CACHE_MAX_USERS:
+        _name_index_cache.popitem(last=False)
+    return cached['index']
+
+
+def generate_response(status_code, message, cors_headers):
+    """Generate an HTTP response with CORS headers."""
+    return {
+        'statusCode': status_code,
+        'headers': cors_headers,
+        'body': json.dumps(message, default=json_default)
+    }
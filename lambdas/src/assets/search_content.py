@@ -0,0 +1,201 @@
+import json
+import os
+import time
+import boto3
+from collections import OrderedDict
+from botocore.exceptions import ClientError
+from logging_utils import configure_logging
+from warmup_utils import handle_warmup, is_warmup_event, register_snapshot_hooks
+from cors_utils import get_cors_headers_from_event
+from auth_utils import extract_and_verify_token
+from response_utils import compress_response, json_default
+from content_index import ContentIndex, Segment, tokenize
+from metadata_utils import get_document_items
+from storage_utils import content_segment_prefix
+
+# Initialize AWS clients
+s3_client = boto3.client('s3')
+dynamodb_resource = boto3.resource('dynamodb')
+
+# Validate environment variables at cold start
+DIGITAL_ASSETS_BUCKET_NAME = os.getenv('DIGITAL_ASSETS_BUCKET_NAME')
+DYNAMODB_TABLE_NAME = os.getenv('DYNAMODB_TABLE_NAME')
+COGNITO_USER_POOL_ID = os.getenv('COGNITO_USER_POOL_ID')
+AWS_REGION = os.getenv('AWS_REGION')
+
+if not all([DIGITAL_ASSETS_BUCKET_NAME, DYNAMODB_TABLE_NAME, COGNITO_USER_POOL_ID, AWS_REGION]):
+    raise ValueError("Missing required environment variables")
+
+# Segments are downloaded here and memory-mapped; they are immutable, so a file is valid
+# for as long as its key is listed
+CONTENT_INDEX_CACHE_DIR = os.getenv('CONTENT_INDEX_CACHE_DIR', '/tmp/content-index')
+
+# The segment listing is reused for this long before S3 is listed again
+CONTENT_INDEX_CACHE_TTL_SECONDS = float(os.getenv('CONTENT_INDEX_CACHE_TTL_SECONDS', '30'))
+CONTENT_INDEX_CACHE_MAX_USERS = int(os.getenv('CONTENT_INDEX_CACHE_MAX_USERS', '16'))
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 100     # BatchGetItem reads at most 100 keys per request
+MAX_TERMS = 10
+
+# user_id -> {'keys', 'index', 'checked_at'}, least recently used first
+_content_index_cache = OrderedDict()
+
+# Prime connections and keys before a snapshot, and refresh them after a restore
+register_snapshot_hooks([s3_client, dynamodb_resource], AWS_REGION, COGNITO_USER_POOL_ID)
+
+
+def lambda_handler(event, context):
+    """
+    Lambda function handler for full-text search over a user's documents.
+    """
+    logger = configure_logging()
+    if is_warmup_event(event):
+        return handle_warmup(logger, [s3_client, dynamodb_resource], AWS_REGION, COGNITO_USER_POOL_ID)
+    logger.info("Lambda function started")
+    logger.debug("Received event: %s", json.dumps(event))
+
+    # Get CORS headers
+    cors_headers = get_cors_headers_from_event(event, logger)
+
+    # Determine the HTTP method
+    http_method = event.get('routeKey', '').split()[0] or event.get('httpMethod')
+
+    if http_method == 'OPTIONS':
+        return generate_response(200, 'CORS preflight', cors_headers)
+
+    elif http_method == 'POST':
+        return compress_response(event, handle_post_request(event, logger, cors_headers), logger)
+
+    return generate_response(405, f'Method {http_method} not allowed', cors_headers)
+
+
+def handle_post_request(event, logger, cors_headers):
+    """
+    Handle POST request for documents containing all words of the query.
+    """
+    try:
+        auth_result = extract_and_verify_token(event, AWS_REGION, COGNITO_USER_POOL_ID)
+        if auth_result['statusCode'] != 200:
+            return generate_response(auth_result['statusCode'], auth_result['body']['message'], cors_headers)
+        user_id = auth_result['body']['user_id']
+
+        # Parse request body
+        body = json.loads(event.get('body') or '{}')
+        terms = sorted(tokenize(body.get('query', '')))
+        limit = int(body.get('limit', DEFAULT_LIMIT))
+
+        if not terms:
+            return generate_response(400, 'query must contain at least one word', cors_headers)
+        if not 0 < limit <= MAX_LIMIT:
+            return generate_response(400, f'limit must be between 1 and {MAX_LIMIT}', cors_headers)
+        if len(terms) > MAX_TERMS:
+            return generate_response(400, f'query may contain at most {MAX_TERMS} words', cors_headers)
+
+        started = time.perf_counter()
+        names = get_content_index(user_id, logger).search(terms, limit)
+        logger.info(f"Content search for {len(terms)} terms matched {len(names)} documents "
+                    f"in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+        items = get_document_items(dynamodb_resource, DYNAMODB_TABLE_NAME, user_id, names)
+        return generate_response(200, items, cors_headers)
+
+    except (ValueError, json.JSONDecodeError) as e:
+        logger.warning(f"Invalid search request: {str(e)}")
+        return generate_response(400, 'Invalid search request', cors_headers)
+    except ClientError as e:
+        logger.error(f"ClientError: {e.response['Error']['Message']}")
+        return generate_response(500, 'Error searching documents', cors_headers)
+    except Exception as e:
+        logger.error(f"An unexpected error occurred: {str(e)}")
+        return generate_response(500, f'An unexpected error occurred: {str(e)}', cors_headers)
+
+
+def get_content_index(user_id, logger):
+    """
+    Return the user's content index, reusing segments already mapped by this container.
+
+    Within the TTL the cached index is used without any request. After that the segment
+    prefix is listed again and only segments that are new since the last listing are
+    downloaded. A merge can delete a listed segment before it is downloaded, in which case
+    the prefix is listed once more.
+    """
+    cached = _content_index_cache.get(user_id)
+    if cached and time.monotonic() - cached['checked_at'] < CONTENT_INDEX_CACHE_TTL_SECONDS:
+        _content_index_cache.move_to_end(user_id)
+        return cached['index']
+
+    for attempt in range(2):
+        keys = list_segment_keys(user_id)
+        if cached and cached['keys'] == keys:
+            index = cached['index']
+            break
+        try:
+            index = load_index(keys, cached['index'] if cached else None, logger)
+            break
+        except ClientError as e:
+            if e.response['Error']['Code'] not in ('404', 'NoSuchKey') or attempt:
+                raise
+            logger.info("Segment merged away while loading, listing again")
+
+    if cached and cached['index'] is not index:
+        release_segments(cached['index'], keep=index.segments)
+
+    _content_index_cache[user_id] = {'keys': keys, 'index': index, 'checked_at': time.monotonic()}
+    _content_index_cache.move_to_end(user_id)
+    while len(_content_index_cache) > CONTENT_INDEX_CACHE_MAX_USERS:
+        _, evicted = _content_index_cache.popitem(last=False)
+        release_segments(evicted['index'])
+    return index
+
+
+def list_segment_keys(user_id):
+    """Return a user's segment keys, oldest first."""
+    keys = []
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=DIGITAL_ASSETS_BUCKET_NAME, Prefix=content_segment_prefix(user_id)):
+        keys.extend(item['Key'] for item in page.get('Contents', []))
+    return sorted(keys)
+
+
+def load_index(keys, previous, logger):
+    """Build an index over the listed segments, downloading the ones not mapped yet."""
+    mapped = {segment.path: segment for segment in previous.segments} if previous else {}
+    segments, opened = [], []
+    try:
+        for key in keys:
+            path = os.path.join(CONTENT_INDEX_CACHE_DIR, key)
+            if path not in mapped:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                s3_client.download_file(DIGITAL_ASSETS_BUCKET_NAME, key, path)
+                mapped[path] = Segment.open(path)
+                opened.append(mapped[path])
+                logger.info(f"Downloaded and mapped segment {key}")
+            segments.append(mapped[path])
+    except ClientError:
+        for segment in opened:
+            segment.close()
+        raise
+    return ContentIndex(segments)
+
+
+def release_segments(index, keep=()):
+    """Unmap and delete the files of an index's segments, except those still in use."""
+    keep = {id(segment) for segment in keep}
+    for segment in index.segments:
+        if id(segment) in keep:
+            continue
+        segment.close()
+        try:
+            os.remove(segment.path)
+        except OSError:
+            pass
+
+
+def generate_response(status_code, message, cors_headers):
+    """Generate an HTTP response with CORS headers."""
+    return {
+        'statusCode': status_code,
+        'headers': cors_headers,
+        'body': json.dumps(message, default=json_default)
+    }
@@ -1,32 +1,54 @@
 import json
 import jwt
-from jwt import PyJWKClient
 import boto3
 import os
 import base64
+import hashlib
 from botocore.exceptions import ClientError
-import datetime
 from logging_utils import configure_logging
+from auth_utils import get_jwks_client
+from warmup_utils import handle_warmup, is_warmup_event, register_snapshot_hooks
 from cors_utils import get_cors_headers_from_event
+from compression_utils import guess_content_type, choose_codec, compress_document
+from encryption_utils import ENCRYPTION_NONE, document_data_keys, encrypt_document, resolve_encryption
+from metadata_utils import build_document_item, save_document_item
 
 # Initialize AWS clients
 s3_client = boto3.client('s3')
 dynamodb_client = boto3.client('dynamodb')
+kms_client = boto3.client('kms')
 
 # Validate environment variables at cold start
 DIGITAL_ASSETS_BUCKET_NAME = os.getenv('DIGITAL_ASSETS_BUCKET_NAME')
 DYNAMODB_TABLE_NAME = os.getenv('DYNAMODB_TABLE_NAME')
 COGNITO_USER_POOL_ID = os.getenv('COGNITO_USER_POOL_ID')
 AWS_REGION = os.getenv('AWS_REGION')
+DOCUMENT_COMPRESSION = os.getenv('DOCUMENT_COMPRESSION', 'off')
+DOCUMENT_ENCRYPTION = resolve_encryption(os.getenv('DOCUMENT_ENCRYPTION', 'off'))
+DOCUMENT_KMS_KEY_ID = os.getenv('DOCUMENT_KMS_KEY_ID')
+
+# 'events' leaves the metadata item to register_metadata, as in upload_asset
+METADATA_REGISTRATION = os.getenv('METADATA_REGISTRATION', 'sync')
 
 if not all([DIGITAL_ASSETS_BUCKET_NAME, DYNAMODB_TABLE_NAME, COGNITO_USER_POOL_ID, AWS_REGION]):
     raise ValueError("Missing required environment variables")
+if DOCUMENT_ENCRYPTION != ENCRYPTION_NONE and not DOCUMENT_KMS_KEY_ID:
+    raise ValueError("DOCUMENT_ENCRYPTION needs DOCUMENT_KMS_KEY_ID")
+
+# Data keys are reused across warm invocations, see upload_asset
+data_keys = document_data_keys(kms_client, DIGITAL_ASSETS_BUCKET_NAME, DOCUMENT_KMS_KEY_ID)
+clients = [s3_client, dynamodb_client] + ([kms_client] if DOCUMENT_ENCRYPTION != ENCRYPTION_NONE else [])
+
+# Prime connections and keys before a snapshot, and refresh them after a restore
+register_snapshot_hooks(clients, AWS_REGION, COGNITO_USER_POOL_ID)
 
 def lambda_handler(event, context):
     """
     Lambda function handler for updating documents in S3 and DynamoDB.
     """
     logger = configure_logging()
+    if is_warmup_event(event):
+        return handle_warmup(logger, clients, AWS_REGION, COGNITO_USER_POOL_ID)
     logger.info("Lambda function started")
     logger.debug("Received event: %s", json.dumps(event))
 
@@ -73,11 +95,33 @@ def handle_post_request(event, logger, cors_headers):
         decoded_document = base64.b64decode(encoded_document)
         logger.info("Document decoded successfully")
 
+        # Compress text-like documents before they are stored, then encrypt them if required
+        content_type = guess_content_type(document_name, body.get('content_type'))
+        codec = choose_codec(content_type, decoded_document, DOCUMENT_COMPRESSION, logger)
+        stored_document = compress_document(decoded_document, codec)
+        encryption_metadata = {}
+        if DOCUMENT_ENCRYPTION != ENCRYPTION_NONE:
+            stored_document, encryption_metadata = encrypt_document(stored_document, data_keys)
+
         # Upload document to S3
-        upload_document_to_s3(user_id, document_name, decoded_document, logger, cors_headers)
+        etag, checksum = upload_document_to_s3(user_id, document_name, stored_document, content_type, codec,
+                                               len(decoded_document), encryption_metadata, logger, cors_headers)
+        if METADATA_REGISTRATION == 'events':
+            return generate_response(202, 'Document updated, its metadata is being registered', cors_headers)
 
         # Update document metadata in DynamoDB
-        update_document_metadata_in_dynamodb(user_id, document_name, logger, cors_headers)
+        item = build_document_item(
+            user_id,
+            document_name,
+            size=len(decoded_document),
+            content_type=content_type,
+            etag=etag,
+            checksum_algorithm='SHA256',
+            checksum=checksum,
+            content_codec=codec,
+            stored_size=len(stored_document)
+        )
+        update_document_metadata_in_dynamodb(item, logger, cors_headers)
 
         return generate_response(200, 'Document updated successfully!', cors_headers)
 
@@ -101,7 +145,7 @@ def validate_jwt_token(token, logger, cors_headers):
     jwks_url = f'{cognito_issuer}/.well-known/jwks.json'
 
     try:
-        jwks_client = PyJWKClient(jwks_url)
+        jwks_client = get_jwks_client(jwks_url)
         signing_key = jwks_client.get_signing_key_from_jwt(token).key
         logger.info("Public key fetched successfully from JWKS URL")
 
@@ -126,34 +170,40 @@ def validate_jwt_token(token, logger, cors_headers):
         return None
 
 
-def upload_document_to_s3(user_id, document_name, decoded_document, logger, cors_headers):
-    """Upload the document to S3."""
+def upload_document_to_s3(user_id, document_name, stored_document, content_type, codec,
+                          original_size, encryption_metadata, logger, cors_headers):
+    """
+    Upload the document to S3, recording the compression codec and any wrapped data key in its metadata.
+
+    Returns:
+        tuple: The ETag of the stored object and its base64 SHA-256 checksum, which S3 verifies on receipt.
+    """
+    checksum = base64.b64encode(hashlib.sha256(stored_document).digest()).decode('utf-8')
     try:
-        s3_client.put_object(
+        response = s3_client.put_object(
             Bucket=DIGITAL_ASSETS_BUCKET_NAME,
             Key=f'{user_id}/{document_name}',
-            Body=decoded_document
+            Body=stored_document,
+            ChecksumSHA256=checksum,
+            ContentType=content_type,
+            Metadata={
+                'content-codec': codec,
+                'original-size': str(original_size),
+                **encryption_metadata
+            }
         )
         logger.info(f"Document {document_name} updated in S3 successfully")
+        return response['ETag'], checksum
     except ClientError as e:
         logger.error(f"Failed to update document in S3: {e.response['Error']['Message']}")
         raise
 
 
-def update_document_metadata_in_dynamodb(user_id, document_name, logger, cors_headers):
+def update_document_metadata_in_dynamodb(item, logger, cors_headers):
     """Update document metadata in DynamoDB."""
+    document_name = item['document_name']['S']
     try:
-        dynamodb_client.update_item(
-            TableName=DYNAMODB_TABLE_NAME,
-            Key={
-                'user_id': {'S': user_id},
-                'document_name': {'S': document_name}
-            },
-            UpdateExpression='SET upload_date = :val1',
-            ExpressionAttributeValues={
-                ':val1': {'S': str(datetime.datetime.now())}
-            }
-        )
+        save_document_item(dynamodb_client, DYNAMODB_TABLE_NAME, item)
         logger.info(f"Document metadata for {document_name} updated in DynamoDB successfully")
     except ClientError as e:
         logger.error(f"Failed to update document metadata in DynamoDB: {e.response['Error']['Message']}")
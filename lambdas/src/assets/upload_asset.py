@@ -1,32 +1,62 @@
 import json
 import jwt
-from jwt import PyJWKClient
 import boto3
 import os
 import base64
-import datetime
+import hashlib
 from botocore.exceptions import ClientError
 from logging_utils import configure_logging
+from auth_utils import get_jwks_client
+from warmup_utils import handle_warmup, is_warmup_event, register_snapshot_hooks
 from cors_utils import get_cors_headers_from_event
+from compression_utils import guess_content_type, choose_codec, compress_document
+from encryption_utils import ENCRYPTION_NONE, document_data_keys, encrypt_document, resolve_encryption
+from metadata_utils import build_document_item, save_document_item
+from idempotency_utils import run_idempotent
+from retry_utils import RETRY_CLIENT_CONFIG, RetryPolicy, is_unavailable, unavailable_response
 
 # Initialize AWS clients
-s3_client = boto3.client('s3')
-dynamodb_client = boto3.client('dynamodb')
+s3_client = boto3.client('s3', config=RETRY_CLIENT_CONFIG)
+dynamodb_client = boto3.client('dynamodb', config=RETRY_CLIENT_CONFIG)
+kms_client = boto3.client('kms', config=RETRY_CLIENT_CONFIG)
+
+# Retry throttled and failed calls within the invocation's deadline
+retry_policy = RetryPolicy()
+retry_policy.install(s3_client, dynamodb_client, kms_client)
 
 # Validate environment variables at cold start
 DIGITAL_ASSETS_BUCKET_NAME = os.getenv('DIGITAL_ASSETS_BUCKET_NAME')
 DYNAMODB_TABLE_NAME = os.getenv('DYNAMODB_TABLE_NAME')
 COGNITO_USER_POOL_ID = os.getenv('COGNITO_USER_POOL_ID')
 AWS_REGION = os.getenv('AWS_REGION')
+DOCUMENT_COMPRESSION = os.getenv('DOCUMENT_COMPRESSION', 'off')
+DOCUMENT_ENCRYPTION = resolve_encryption(os.getenv('DOCUMENT_ENCRYPTION', 'off'))
+DOCUMENT_KMS_KEY_ID = os.getenv('DOCUMENT_KMS_KEY_ID')
+
+# 'events' leaves the metadata item to register_metadata, fed by the bucket's notifications,
+# and answers as soon as S3 has the object; 'sync' writes the item before answering
+METADATA_REGISTRATION = os.getenv('METADATA_REGISTRATION', 'sync')
 
 if not all([DIGITAL_ASSETS_BUCKET_NAME, DYNAMODB_TABLE_NAME, COGNITO_USER_POOL_ID, AWS_REGION]):
     raise ValueError("Missing required environment variables")
+if DOCUMENT_ENCRYPTION != ENCRYPTION_NONE and not DOCUMENT_KMS_KEY_ID:
+    raise ValueError("DOCUMENT_ENCRYPTION needs DOCUMENT_KMS_KEY_ID")
+
+# Data keys are reused across warm invocations, a KMS call every few minutes rather than per upload
+data_keys = document_data_keys(kms_client, DIGITAL_ASSETS_BUCKET_NAME, DOCUMENT_KMS_KEY_ID)
+clients = [s3_client, dynamodb_client] + ([kms_client] if DOCUMENT_ENCRYPTION != ENCRYPTION_NONE else [])
+
+# Prime connections and keys before a snapshot, and refresh them after a restore
+register_snapshot_hooks(clients, AWS_REGION, COGNITO_USER_POOL_ID)
 
 def lambda_handler(event, context):
     """
     Lambda function handler for processing document uploads and storing metadata.
     """
     logger = configure_logging()
+    retry_policy.start_invocation(context)
+    if is_warmup_event(event):
+        return handle_warmup(logger, clients, AWS_REGION, COGNITO_USER_POOL_ID)
     logger.info("Lambda function started")
     logger.debug("Received event: %s", json.dumps(event))
 
@@ -40,14 +70,16 @@ def lambda_handler(event, context):
         return generate_response(200, 'CORS preflight', cors_headers)
 
     elif http_method == 'POST':
-        return handle_post_request(event, logger, cors_headers)
+        return handle_post_request(event, context, logger, cors_headers)
 
     return generate_response(405, f'Method {http_method} not allowed', cors_headers)
 
 
-def handle_post_request(event, logger, cors_headers):
+def handle_post_request(event, context, logger, cors_headers):
     """
     Handle POST request for document upload and storing metadata.
+
+    A request carrying an Idempotency-Key is processed once, retries get the stored response.
     """
     try:
         # Extract JWT token from Authorization header
@@ -65,32 +97,63 @@ def handle_post_request(event, logger, cors_headers):
         user_id = decoded_token.get('sub')
         logger.info(f"Username extracted from token: {username}")
 
-        # Parse request body
-        body = json.loads(event.get('body', '{}'))
-        document = body.get('document')
-        document_name = body.get('document_name')
-
-        if not document or not document_name:
-            return generate_response(400, 'Document and document_name are required.', cors_headers)
-
-        # Base64 decode the document content
-        decoded_document = decode_document(document, logger, cors_headers)
-        if not decoded_document:
-            return generate_response(400, 'Failed to decode document.', cors_headers)
-
-        # Upload document to S3
-        upload_document_to_s3(user_id, document_name, decoded_document, logger, cors_headers)
-
-        # Store metadata in DynamoDB
-        store_document_metadata(user_id, document_name, logger, cors_headers)
-
-        return generate_response(200, 'Document uploaded and metadata stored successfully!', cors_headers)
+        return run_idempotent(dynamodb_client, event, context, user_id, 'upload_asset',
+                              lambda: upload_document(event, user_id, logger, cors_headers), cors_headers, logger)
 
     except Exception as e:
+        if is_unavailable(e):
+            logger.warning(f"Dependency unavailable: {str(e)}")
+            return unavailable_response(e, cors_headers)
         logger.error(f"An unexpected error occurred: {str(e)}")
         return generate_response(500, f'An unexpected error occurred: {str(e)}', cors_headers)
 
 
+def upload_document(event, user_id, logger, cors_headers):
+    """Store the uploaded document in S3 and its metadata in DynamoDB."""
+    # Parse request body
+    body = json.loads(event.get('body', '{}'))
+    document = body.get('document')
+    document_name = body.get('document_name')
+    content_type = guess_content_type(document_name or '', body.get('content_type'))
+
+    if not document or not document_name:
+        return generate_response(400, 'Document and document_name are required.', cors_headers)
+
+    # Base64 decode the document content
+    decoded_document = decode_document(document, logger, cors_headers)
+    if not decoded_document:
+        return generate_response(400, 'Failed to decode document.', cors_headers)
+
+    # Compress text-like documents before they are stored, then encrypt them if required
+    codec = choose_codec(content_type, decoded_document, DOCUMENT_COMPRESSION, logger)
+    stored_document = compress_document(decoded_document, codec)
+    encryption_metadata = {}
+    if DOCUMENT_ENCRYPTION != ENCRYPTION_NONE:
+        stored_document, encryption_metadata = encrypt_document(stored_document, data_keys)
+
+    # Upload document to S3
+    etag, checksum = upload_document_to_s3(user_id, document_name, stored_document, content_type, codec,
+                                           len(decoded_document), encryption_metadata, logger, cors_headers)
+    if METADATA_REGISTRATION == 'events':
+        return generate_response(202, 'Document uploaded, its metadata is being registered', cors_headers)
+
+    # Store metadata in DynamoDB
+    item = build_document_item(
+        user_id,
+        document_name,
+        size=len(decoded_document),
+        content_type=content_type,
+        etag=etag,
+        checksum_algorithm='SHA256',
+        checksum=checksum,
+        content_codec=codec,
+        stored_size=len(stored_document)
+    )
+    store_document_metadata(item, logger, cors_headers)
+
+    return generate_response(200, 'Document uploaded and metadata stored successfully!', cors_headers)
+
+
 def extract_jwt_token(event, logger):
     """Extract the JWT token from the Authorization header."""
     auth_header = event['headers'].get('authorization')
@@ -106,7 +169,7 @@ def decode_jwt_token(token, logger):
         cognito_issuer = f'https://cognito-idp.{AWS_REGION}.amazonaws.com/{COGNITO_USER_POOL_ID}'
         jwks_url = f'{cognito_issuer}/.well-known/jwks.json'
 
-        jwks_client = PyJWKClient(jwks_url)
+        jwks_client = get_jwks_client(jwks_url)
         signing_key = jwks_client.get_signing_key_from_jwt(token).key
 
         decoded_token = jwt.decode(
@@ -141,31 +204,39 @@ def decode_document(document, logger, cors_headers):
         return None
 
 
-def upload_document_to_s3(user_id, document_name, decoded_document, logger, cors_headers):
-    """Upload the document to the S3 bucket."""
+def upload_document_to_s3(user_id, document_name, stored_document, content_type, codec,
+                          original_size, encryption_metadata, logger, cors_headers):
+    """
+    Upload the document to the S3 bucket, recording the compression codec and any wrapped data key in its metadata.
+
+    Returns:
+        tuple: The ETag of the stored object and its base64 SHA-256 checksum, which S3 verifies on receipt.
+    """
+    checksum = base64.b64encode(hashlib.sha256(stored_document).digest()).decode('utf-8')
     try:
-        s3_client.put_object(
+        response = s3_client.put_object(
             Bucket=DIGITAL_ASSETS_BUCKET_NAME,
             Key=f'{user_id}/{document_name}',
-            Body=decoded_document
+            Body=stored_document,
+            ChecksumSHA256=checksum,
+            ContentType=content_type,
+            Metadata={
+                'content-codec': codec,
+                'original-size': str(original_size),
+                **encryption_metadata
+            }
         )
         logger.info("Document uploaded to S3 successfully")
+        return response['ETag'], checksum
     except ClientError as e:
         logger.error(f"Failed to upload document to S3: {e.response['Error']['Message']}")
         raise
 
 
-def store_document_metadata(user_id, document_name, logger, cors_headers):
+def store_document_metadata(item, logger, cors_headers):
     """Store document metadata in DynamoDB."""
     try:
-        dynamodb_client.put_item(
-            TableName=DYNAMODB_TABLE_NAME,
-            Item={
-                'user_id': {'S': user_id},
-                'document_name': {'S': document_name},
-                'upload_date': {'S': str(datetime.datetime.now())}
-            }
-        )
+        save_document_item(dynamodb_client, DYNAMODB_TABLE_NAME, item)
         logger.info("Metadata for document stored in DynamoDB successfully")
     except ClientError as e:
         logger.error(f"Failed to store metadata in DynamoDB: {e.response['Error']['Message']}")
@@ -1,30 +1,56 @@
 
 import json
 import jwt
-from jwt import PyJWKClient
 import boto3
 import os
+import base64
 from botocore.exceptions import ClientError
 from logging_utils import configure_logging
+from auth_utils import get_jwks_client
+from warmup_utils import handle_warmup, is_warmup_event, register_snapshot_hooks
 from cors_utils import get_cors_headers_from_event
+from response_utils import compress_response
+from compression_utils import CODEC_NONE, STREAM_CHUNK_SIZE, iter_decompressed, accepts_encoding
+from encryption_utils import document_data_keys, iter_decrypted
+from disk_cache import DiskCache
+from metrics_utils import emit_metrics
+from storage_utils import document_key
 
 # Initialize AWS clients
 s3_client = boto3.client('s3')
+kms_client = boto3.client('kms')
 
 # Validate environment variables at cold start
 DIGITAL_ASSETS_BUCKET_NAME = os.getenv('DIGITAL_ASSETS_BUCKET_NAME')
 COGNITO_USER_POOL_ID = os.getenv('COGNITO_USER_POOL_ID')
 AWS_REGION = os.getenv('AWS_REGION')
+DOCUMENT_KMS_KEY_ID = os.getenv('DOCUMENT_KMS_KEY_ID')
 
 if not all([DIGITAL_ASSETS_BUCKET_NAME, COGNITO_USER_POOL_ID, AWS_REGION]):
     raise ValueError("Missing required environment variables")
 
+# Read-through cache of stored documents in /tmp, revalidated against S3 on every use
+DOCUMENT_CACHE_DIR = os.getenv('DOCUMENT_CACHE_DIR', '/tmp/document-cache')
+DOCUMENT_CACHE_MAX_BYTES = int(os.getenv('DOCUMENT_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+DOCUMENT_CACHE_MAX_ENTRY_BYTES = int(os.getenv('DOCUMENT_CACHE_MAX_ENTRY_BYTES', str(16 * 1024 * 1024)))
+
+document_cache = DiskCache(DOCUMENT_CACHE_DIR, DOCUMENT_CACHE_MAX_BYTES, DOCUMENT_CACHE_MAX_ENTRY_BYTES)
+
+# Unwrapped data keys are reused across warm invocations, so most encrypted reads make no KMS call
+data_keys = document_data_keys(kms_client, DIGITAL_ASSETS_BUCKET_NAME, DOCUMENT_KMS_KEY_ID)
+clients = [s3_client] + ([kms_client] if DOCUMENT_KMS_KEY_ID else [])
+
+# Prime connections and keys before a snapshot, and refresh them after a restore
+register_snapshot_hooks(clients, AWS_REGION, COGNITO_USER_POOL_ID)
+
 
 def lambda_handler(event, context):
     """
     Lambda function handler for fetching documents.
     """
     logger = configure_logging()
+    if is_warmup_event(event):
+        return handle_warmup(logger, clients, AWS_REGION, COGNITO_USER_POOL_ID)
     logger.info("Lambda function started")
     logger.debug("Received event: %s", json.dumps(event))
 
@@ -38,7 +64,7 @@ def lambda_handler(event, context):
         return generate_response(200, 'CORS preflight', cors_headers)
 
     elif http_method == 'POST':
-        return handle_post_request(event, logger, cors_headers)
+        return compress_response(event, handle_post_request(event, logger, cors_headers), logger)
 
     return generate_response(405, f'Method {http_method} not allowed', cors_headers)
 
@@ -69,11 +95,32 @@ def handle_post_request(event, logger, cors_headers):
         if not document_name:
             return generate_response(400, 'Document name missing', cors_headers)
 
-        # Fetch the document from S3
-        document = fetch_document_from_s3(user_id, document_name, logger)
-        if document is None:
+        # 'raw' returns the document bytes as-is instead of a JSON string
+        response_format = event['queryStringParameters'].get('format', 'json')
+
+        # Fetch the document, from the local cache when S3 confirms it is current
+        stored = fetch_document(user_id, document_name, logger)
+        if stored is None:
             return generate_response(404, 'Document not found', cors_headers)
 
+        codec = stored['metadata'].get('content-codec', CODEC_NONE)
+        content_type = stored['content_type']
+
+        # Encrypted documents are cached as stored, they are only decrypted to be served.
+        # Decryption and decompression stream a segment at a time; the response body is
+        # the only whole copy, as a Lambda response cannot be streamed
+        chunks = iter_decrypted(stored['chunks'], stored['metadata'], data_keys)
+
+        # Hand the stored (compressed) bytes straight to clients that can decode them
+        if response_format == 'raw' and codec != CODEC_NONE and accepts_encoding(event, codec):
+            logger.info(f"Returning {codec} encoded document without decompressing")
+            return generate_binary_response(200, b''.join(chunks), content_type, codec, cors_headers)
+
+        document = b''.join(iter_decompressed(chunks, codec))
+
+        if response_format == 'raw':
+            return generate_binary_response(200, document, content_type, None, cors_headers)
+
         return generate_response(200, document.decode('utf-8'), cors_headers)
 
     except Exception as e:
@@ -100,7 +147,7 @@ def decode_jwt_token(token, logger):
         cognito_issuer = f'https://cognito-idp.{AWS_REGION}.amazonaws.com/{COGNITO_USER_POOL_ID}'
         jwks_url = f'{cognito_issuer}/.well-known/jwks.json'
 
-        jwks_client = PyJWKClient(jwks_url)
+        jwks_client = get_jwks_client(jwks_url)
         signing_key = jwks_client.get_signing_key_from_jwt(token).key
 
         decoded_token = jwt.decode(
@@ -124,22 +171,61 @@ def decode_jwt_token(token, logger):
         return None
 
 
-def fetch_document_from_s3(user_id, document_name, logger):
+def fetch_document(user_id, document_name, logger):
     """
-    Fetch the document from the S3 bucket.
+    Fetch the stored document bytes, through the container's disk cache.
+
+    A cached copy is revalidated with a conditional GET on its ETag. S3 answers 304 with
+    no body while it is current, so a hit costs one small round trip instead of a download.
+
+    Returns:
+        dict: The stored bytes as an iterable of 'chunks', read from the cache or S3 as it is
+        consumed, the 'content_type' and user 'metadata', or None if the document does not exist.
     """
-    try:
-        response = s3_client.get_object(
-            Bucket=DIGITAL_ASSETS_BUCKET_NAME,
-            Key=f'{user_id}/{document_name}'
-        )
-        logger.info(f"Document {document_name} fetched from S3 successfully")
-        return response['Body'].read()
+    key = document_key(user_id, document_name)
+    cached = document_cache.get(key)
+    params = {'Bucket': DIGITAL_ASSETS_BUCKET_NAME, 'Key': key}
+    if cached:
+        params['IfNoneMatch'] = cached['etag']
 
+    try:
+        response = s3_client.get_object(**params)
     except ClientError as e:
+        code = e.response['Error']['Code']
+        if cached and code in ('304', 'NotModified'):
+            logger.info(f"Document {document_name} served from the local cache")
+            record_cache_result(hit=True)
+            return {**cached['attributes'], 'chunks': document_cache.iter_chunks(cached, STREAM_CHUNK_SIZE)}
+
+        if code in ('NoSuchKey', '404'):
+            document_cache.discard(key)
         logger.error(f"Failed to fetch document from S3: {e.response['Error']['Message']}")
         return None
 
+    record_cache_result(hit=False)
+    attributes = {
+        'content_type': response.get('ContentType', 'application/octet-stream'),
+        'metadata': response.get('Metadata', {})
+    }
+    chunks = response['Body'].iter_chunks(STREAM_CHUNK_SIZE)
+    if not document_cache.fits(response.get('ContentLength')):
+        logger.info(f"Document {document_name} fetched from S3, too large to cache")
+        return {**attributes, 'chunks': chunks}
+
+    entry = document_cache.put(key, response['ETag'], chunks, attributes)
+    logger.info(f"Document {document_name} fetched from S3 and cached ({entry['size']} bytes)")
+    return {**attributes, 'chunks': document_cache.iter_chunks(entry, STREAM_CHUNK_SIZE)}
+
+
+def record_cache_result(hit):
+    """Emit the document cache hit and miss counters for this request."""
+    emit_metrics(
+        {'DocumentCacheHits': int(hit), 'DocumentCacheMisses': int(not hit),
+         'DocumentCacheBytes': document_cache.total_bytes},
+        dimensions={'Function': 'view_asset'},
+        units={'DocumentCacheBytes': 'Bytes'}
+    )
+
 
 def generate_response(status_code, message, cors_headers):
     """
@@ -150,3 +236,20 @@ def generate_response(status_code, message, cors_headers):
         'headers': cors_headers,
         'body': json.dumps(message)
     }
+
+
+def generate_binary_response(status_code, document, content_type, content_encoding, cors_headers):
+    """
+    Helper function to generate a base64 encoded binary HTTP response with CORS headers.
+    """
+    headers = {**cors_headers, 'Content-Type': content_type}
+    if content_encoding:
+        headers['Content-Encoding'] = content_encoding
+        headers['Vary'] = 'Accept-Encoding'
+
+    return {
+        'statusCode': status_code,
+        'headers': headers,
+        'body': base64.b64encode(document).decode('utf-8'),
+        'isBase64Encoded': True
+    }
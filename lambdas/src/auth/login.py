@@ -4,6 +4,7 @@ import boto3
 from botocore.exceptions import ClientError
 
 from logging_utils import configure_logging
+from warmup_utils import handle_warmup, is_warmup_event, register_snapshot_hooks
 from cors_utils import get_cors_headers_from_event
 
 # Initialize Cognito client at cold start
@@ -17,11 +18,16 @@ AWS_REGION = os.getenv('AWS_REGION')
 if not all([COGNITO_USER_POOL_ID, COGNITO_USER_POOL_CLIENT_ID, AWS_REGION]):
     raise ValueError("Missing required environment variable: COGNITO_USER_POOL_CLIENT_ID, COGNITO_USER_POOL_ID, AWS_REGION")
 
+# Prime connections and keys before a snapshot, and refresh them after a restore
+register_snapshot_hooks([cognito_client], user_pool_id=COGNITO_USER_POOL_ID)
+
 def lambda_handler(event, context):
     """
     Lambda function handler for user login.
     """
     logger = configure_logging()
+    if is_warmup_event(event):
+        return handle_warmup(logger, [cognito_client], user_pool_id=COGNITO_USER_POOL_ID)
     logger.info("login AWS Lambda called")
     logger.debug(f"Received event: {json.dumps(event)}")
 
@@ -4,6 +4,7 @@ import boto3
 from botocore.exceptions import ClientError
 
 from logging_utils import configure_logging
+from warmup_utils import handle_warmup, is_warmup_event, register_snapshot_hooks
 from cors_utils import get_cors_headers_from_event
 
 # Initialize Cognito client at cold start
@@ -14,12 +15,17 @@ COGNITO_USER_POOL_CLIENT_ID = os.getenv('COGNITO_USER_POOL_CLIENT_ID')
 if not COGNITO_USER_POOL_CLIENT_ID:
     raise ValueError("Missing required environment variable: COGNITO_USER_POOL_CLIENT_ID")
 
+# Prime connections and keys before a snapshot, and refresh them after a restore
+register_snapshot_hooks([cognito_client])
+
 
 def lambda_handler(event, context):
     """
     Lambda function handler for resending the confirmation code.
     """
     logger = configure_logging()
+    if is_warmup_event(event):
+        return handle_warmup(logger, [cognito_client])
     logger.info("Lambda function started")
     logger.info(f"Received event: {json.dumps(event)}")
 
@@ -1,9 +1,51 @@
+import base64
 import logging
 import jwt
 from jwt import PyJWKClient
 
 logger = logging.getLogger()
 
+# JWKS clients cached per URL for the lifetime of the container
+_jwks_clients = {}
+
+# An RS256 token with an all-zero signature, decoded during priming to exercise the verify path
+_PRIMING_TOKEN = '.'.join(
+    base64.urlsafe_b64encode(part).rstrip(b'=').decode('ascii')
+    for part in (b'{"alg":"RS256","typ":"JWT"}', b'{}', bytes(256))
+)
+
+def get_jwks_client(jwks_url):
+    """Return the cached JWKS client for the URL, creating it on first use."""
+    if jwks_url not in _jwks_clients:
+        _jwks_clients[jwks_url] = PyJWKClient(jwks_url)
+        logger.info("JWKS client initialized")
+    return _jwks_clients[jwks_url]
+
+def prime_jwks_client(region, user_pool_id, refresh=False):
+    """
+    Fetch the user pool's signing keys ahead of the first request.
+
+    Loading the keys builds their RSA public keys, and a verification attempt with one of
+    them loads the cryptography backend's RSA and hash code, so the first real token is
+    verified without any fetch or lazy import.
+
+    Args:
+        refresh (bool): Replace the cached client first, e.g. after a snapshot restore,
+            when the cached keys may be stale.
+
+    Returns:
+        int: The number of signing keys loaded.
+    """
+    jwks_url = f'https://cognito-idp.{region}.amazonaws.com/{user_pool_id}/.well-known/jwks.json'
+    if refresh:
+        _jwks_clients.pop(jwks_url, None)
+    signing_keys = get_jwks_client(jwks_url).get_signing_keys()
+    try:
+        jwt.decode(_PRIMING_TOKEN, signing_keys[0].key, algorithms=["RS256"])
+    except jwt.InvalidTokenError:
+        pass
+    return len(signing_keys)
+
 def extract_and_verify_token(event, region, user_pool_id):
     """
     Extracts and verifies the JWT token from the Authorization header in the event, 
@@ -36,7 +78,7 @@ def extract_and_verify_token(event, region, user_pool_id):
 
     # Fetch the public key from the JWKS URL
     try:
-        jwks_client = PyJWKClient(jwks_url)
+        jwks_client = get_jwks_client(jwks_url)
         signing_key = jwks_client.get_signing_key_from_jwt(token).key
         logger.info("Public key fetched successfully from JWKS URL")
     except Exception as e:
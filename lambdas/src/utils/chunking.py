@@ -0,0 +1,50 @@
+import hashlib
+import zlib
+
+# Content-defined chunking, identical to client/asset_client/chunking.py. Both sides must cut
+# at the same boundaries for unchanged chunks to be recognised, so any change to these
+# parameters or to chunk_boundaries() needs a new CHUNKER name.
+CHUNKER = 'anchor-crc32-v1'
+ANCHOR = b'\n'                  # Candidate cut points, found at C speed with find()
+WINDOW_SIZE = 48                # Bytes before and including the anchor that decide a cut
+BOUNDARY_MODULUS = 1024         # One in this many candidates is a cut
+MIN_CHUNK_SIZE = 16 * 1024
+MAX_CHUNK_SIZE = 1024 * 1024
+
+
+def chunk_boundaries(data):
+    """
+    Return the end offset of every chunk of data (bytes, or a memory-mapped file).
+
+    A chunk ends after an anchor byte whose preceding window hashes to a multiple of
+    BOUNDARY_MODULUS, so cut points depend only on nearby content: an insertion or deletion
+    moves the cuts around it and leaves the chunks elsewhere intact. Only anchor bytes are
+    hashed, which keeps a pure Python chunker at hundreds of MB per second. Data without
+    anchors falls back to MAX_CHUNK_SIZE chunks.
+    """
+    size = len(data)
+    boundaries, start = [], 0
+    find, crc32 = data.find, zlib.crc32
+    while start < size:
+        limit = min(start + MAX_CHUNK_SIZE, size)
+        position, cut = start + MIN_CHUNK_SIZE - 1, limit
+        while True:
+            position = find(ANCHOR, position, limit)
+            if position < 0:
+                break
+            if crc32(data[position - WINDOW_SIZE + 1:position + 1]) % BOUNDARY_MODULUS == 0:
+                cut = position + 1
+                break
+            position += 1
+        boundaries.append(cut)
+        start = cut
+    return boundaries
+
+
+def build_chunk_list(data):
+    """Return [length, sha256 hex] for every chunk of data, in order."""
+    chunks, start = [], 0
+    for end in chunk_boundaries(data):
+        chunks.append([end - start, hashlib.sha256(data[start:end]).hexdigest()])
+        start = end
+    return chunks
@@ -0,0 +1,157 @@
+import gzip
+import mimetypes
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional, gzip is always available
+    zstandard = None
+
+# Content types that are worth compressing at write time
+COMPRESSIBLE_CONTENT_TYPES = (
+    'text/',
+    'application/json',
+    'application/xml',
+    'application/csv',
+    'application/javascript',
+    'application/x-ndjson',
+    'application/yaml',
+    'image/svg+xml',
+)
+COMPRESSIBLE_SUFFIXES = ('+json', '+xml')
+
+# Codec names as recorded in S3 object metadata and DynamoDB
+CODEC_NONE = 'identity'
+CODEC_GZIP = 'gzip'
+CODEC_ZSTD = 'zstd'
+
+MIN_COMPRESSIBLE_SIZE = 1024       # Not worth the CPU below 1 KB
+SAMPLE_SIZE = 64 * 1024            # Bytes sampled for the compressibility check
+MAX_SAMPLE_RATIO = 0.9             # Sample must shrink by at least 10%
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+
+def guess_content_type(document_name, content_type=None):
+    """Return the given content type, or guess one from the document name."""
+    if content_type:
+        return content_type
+    guessed, _ = mimetypes.guess_type(document_name)
+    return guessed or 'application/octet-stream'
+
+
+def is_compressible_content_type(content_type):
+    """Check whether the content type is a text-like type that compresses well."""
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    return (content_type.startswith(COMPRESSIBLE_CONTENT_TYPES)
+            or content_type.endswith(COMPRESSIBLE_SUFFIXES))
+
+
+def resolve_codec(setting):
+    """
+    Map the DOCUMENT_COMPRESSION setting to a codec.
+
+    'auto' prefers zstd when the zstandard package is bundled and falls back to gzip.
+    Anything unrecognised disables compression.
+    """
+    setting = (setting or '').lower()
+    if setting == 'auto':
+        return CODEC_ZSTD if zstandard else CODEC_GZIP
+    if setting == CODEC_ZSTD:
+        return CODEC_ZSTD if zstandard else CODEC_GZIP
+    if setting == CODEC_GZIP:
+        return CODEC_GZIP
+    return CODEC_NONE
+
+
+def choose_codec(content_type, data, setting, logger):
+    """
+    Pick the codec for a document, based on its content type and a sample compressibility check.
+
+    Args:
+        content_type (str): The document content type.
+        data (bytes): The raw document.
+        setting (str): The DOCUMENT_COMPRESSION setting ('auto', 'zstd', 'gzip' or 'off').
+        logger (logging.Logger): The logger instance.
+
+    Returns:
+        str: The codec to store the document with.
+    """
+    codec = resolve_codec(setting)
+    if codec == CODEC_NONE:
+        return CODEC_NONE
+
+    if len(data) < MIN_COMPRESSIBLE_SIZE or not is_compressible_content_type(content_type):
+        return CODEC_NONE
+
+    # A fast level-1 pass over a sample is enough to spot already-compressed payloads
+    sample = data[:SAMPLE_SIZE]
+    ratio = len(zlib.compress(sample, 1)) / len(sample)
+    if ratio > MAX_SAMPLE_RATIO:
+        logger.info(f"Skipping compression, sample ratio {ratio:.2f} is too high")
+        return CODEC_NONE
+
+    logger.info(f"Compressing document with {codec} (sample ratio {ratio:.2f})")
+    return codec
+
+
+def compress_document(data, codec):
+    """Compress the document bytes with the given codec."""
+    if codec == CODEC_ZSTD:
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    if codec == CODEC_GZIP:
+        return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    return data
+
+
+def stream_compressor(codec):
+    """
+    Return a compressor for the codec, fed with compress() and finished with flush().
+
+    Its output is the same format compress_document writes, for documents written a piece
+    at a time.
+    """
+    if codec == CODEC_ZSTD:
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+    if codec == CODEC_GZIP:
+        return zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    raise ValueError(f"No compressor for codec {codec}")
+
+
+def iter_decompressed(chunks, codec):
+    """
+    Decompress an iterable of byte chunks lazily, yielding decompressed chunks.
+
+    Used with a StreamingBody's iter_chunks() so the compressed object is never
+    held in memory alongside its decompressed form.
+    """
+    if codec == CODEC_ZSTD:
+        decompressor = zstandard.ZstdDecompressor().decompressobj()
+    elif codec == CODEC_GZIP:
+        decompressor = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+    else:
+        yield from chunks
+        return
+
+    for chunk in chunks:
+        data = decompressor.decompress(chunk)
+        if data:
+            yield data
+    if codec == CODEC_GZIP:
+        tail = decompressor.flush()
+        if tail:
+            yield tail
+
+
+def accepts_encoding(event, codec):
+    """Check the request's Accept-Encoding header for the given codec."""
+    if codec in (None, CODEC_NONE):
+        return True
+    headers = event.get('headers') or {}
+    accept_encoding = headers.get('accept-encoding') or headers.get('Accept-Encoding') or ''
+    for entry in accept_encoding.split(','):
+        name, _, params = entry.strip().partition(';')
+        if name.strip().lower() in (codec, '*') and params.replace(' ', '') not in ('q=0', 'q=0.0'):
+            return True
+    return False
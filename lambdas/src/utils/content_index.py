@@ -0,0 +1,227 @@
+import mmap
+import re
+import struct
+from collections import defaultdict
+from trigram_index import encode_varint, decode_varint, encode_postings, decode_postings
+
+# Segment layout:
+#   header | documents | term entries | term strings | postings
+# Documents are (flags, varint length, utf-8 name) in name order, identified by position.
+# Term entries are fixed width and sorted by the term's utf-8 bytes, so a term is found by
+# binary search straight over the memory-mapped file without loading the dictionary.
+# Posting lists are delta encoded varints, as in the name index.
+MAGIC = b'CIX1'
+HEADER = struct.Struct('<4sIIQQQQ')     # magic, documents, terms, then the four section offsets
+TERM_ENTRY = struct.Struct('<IHQI')     # term string offset and length, postings offset and length
+
+DOCUMENT_DELETED = 0x01                 # Tombstone, the document was removed after older segments
+
+TOKEN_PATTERN = re.compile(r'\w+')
+MIN_TOKEN_LENGTH = 2
+MAX_TOKEN_LENGTH = 64
+
+
+def tokenize(text):
+    """Return the set of lowercase word tokens in a text."""
+    return {token for token in TOKEN_PATTERN.findall(text.lower())
+            if MIN_TOKEN_LENGTH <= len(token) <= MAX_TOKEN_LENGTH}
+
+
+def build_segment(documents):
+    """
+    Build a segment from a batch of document changes.
+
+    Args:
+        documents (dict): Document name -> set of tokens, or None for a deleted document.
+
+    Returns:
+        bytes: The serialized segment.
+    """
+    names = sorted(documents)
+    postings = defaultdict(list)
+    for document_id, name in enumerate(names):
+        for token in documents[name] or ():
+            postings[token].append(document_id)
+
+    deleted = {name for name in names if documents[name] is None}
+    return write_segment(names, deleted, postings)
+
+
+def write_segment(names, deleted, postings):
+    """Serialize sorted names, their tombstones and term -> ascending document ID lists."""
+    documents = bytearray()
+    for name in names:
+        documents.append(DOCUMENT_DELETED if name in deleted else 0)
+        encoded = name.encode('utf-8')
+        encode_varint(len(encoded), documents)
+        documents += encoded
+
+    entries, strings, lists = bytearray(), bytearray(), bytearray()
+    for term, ids in sorted((term.encode('utf-8'), ids) for term, ids in postings.items()):
+        encoded = encode_postings(ids)
+        entries += TERM_ENTRY.pack(len(strings), len(term), len(lists), len(encoded))
+        strings += term
+        lists += encoded
+
+    documents_offset = HEADER.size
+    entries_offset = documents_offset + len(documents)
+    strings_offset = entries_offset + len(entries)
+    postings_offset = strings_offset + len(strings)
+    header = HEADER.pack(MAGIC, len(names), len(postings),
+                         documents_offset, entries_offset, strings_offset, postings_offset)
+    return b''.join([header, documents, entries, strings, lists])
+
+
+class Segment:
+    """
+    A read-only view of one immutable index segment, over bytes or a memory-mapped file.
+
+    Only the document names are decoded up front; term lookups read the mapped file.
+    """
+
+    def __init__(self, buffer, path=None):
+        self.buffer = buffer
+        self.path = path
+        (magic, document_count, self.term_count, offset,
+         self.entries_offset, self.strings_offset, self.postings_offset) = HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC:
+            raise ValueError("Not a content index segment")
+
+        self.names = []
+        self.deleted = set()
+        for _ in range(document_count):
+            flags = buffer[offset]
+            length, offset = decode_varint(buffer, offset + 1)
+            name = buffer[offset:offset + length].decode('utf-8')
+            offset += length
+            self.names.append(name)
+            if flags & DOCUMENT_DELETED:
+                self.deleted.add(name)
+
+    @classmethod
+    def open(cls, path):
+        """Memory-map a segment file."""
+        with open(path, 'rb') as segment_file:
+            buffer = mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(buffer, path)
+
+    def close(self):
+        """Unmap the segment, if it is backed by a file."""
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+
+    def _entry(self, position):
+        return TERM_ENTRY.unpack_from(self.buffer, self.entries_offset + position * TERM_ENTRY.size)
+
+    def _term(self, entry):
+        start = self.strings_offset + entry[0]
+        return self.buffer[start:start + entry[1]]
+
+    def _postings(self, entry):
+        start = self.postings_offset + entry[2]
+        return decode_postings(self.buffer[start:start + entry[3]])
+
+    def postings(self, term):
+        """Return the ascending IDs of the documents containing the term."""
+        target = term.encode('utf-8')
+        low, high = 0, self.term_count
+        while low < high:
+            middle = (low + high) // 2
+            entry = self._entry(middle)
+            candidate = self._term(entry)
+            if candidate < target:
+                low = middle + 1
+            elif candidate > target:
+                high = middle
+            else:
+                return self._postings(entry)
+        return []
+
+    def iter_terms(self):
+        """Yield every (term, document IDs) pair in term order."""
+        for position in range(self.term_count):
+            entry = self._entry(position)
+            yield self._term(entry).decode('utf-8'), self._postings(entry)
+
+
+class ContentIndex:
+    """
+    A user's full-text index: an ordered stack of segments, oldest first.
+
+    A document belongs to the newest segment that mentions it, so a re-indexed document
+    shadows its older postings and a tombstone hides it, without rewriting any segment.
+    """
+
+    def __init__(self, segments):
+        self.segments = segments
+        self.owner = {}
+        for position, segment in enumerate(segments):
+            for name in segment.names:
+                self.owner[name] = position
+
+    def live_names(self):
+        """Return the names of the documents that are indexed and not deleted."""
+        return sorted(name for name, position in self.owner.items()
+                      if name not in self.segments[position].deleted)
+
+    def search(self, terms, limit=50):
+        """
+        Return up to limit names of documents containing all of the terms, in name order.
+
+        Posting lists are intersected within each segment, shortest first.
+        """
+        if not terms:
+            return []
+
+        results = []
+        for position, segment in enumerate(self.segments):
+            lists = sorted((segment.postings(term) for term in terms), key=len)
+            if not lists[0]:
+                continue
+            candidates = lists[0]
+            for other in lists[1:]:
+                other_ids = set(other)
+                candidates = [document_id for document_id in candidates if document_id in other_ids]
+                if not candidates:
+                    break
+
+            for document_id in candidates:
+                name = segment.names[document_id]
+                if self.owner[name] == position:
+                    results.append(name)
+
+        results.sort()
+        return results[:limit]
+
+    def close(self):
+        """Unmap all segments."""
+        for segment in self.segments:
+            segment.close()
+
+
+def merge_segments(segments):
+    """
+    Merge an oldest-first stack of segments into one.
+
+    Shadowed postings are dropped. Tombstones are kept, as a name alone, so the merged
+    segment still hides a deleted document from any input that outlives the merge.
+
+    Returns:
+        bytes: The serialized merged segment.
+    """
+    index = ContentIndex(segments)
+    names = sorted(index.owner)
+    deleted = {name for name in names if name in segments[index.owner[name]].deleted}
+    new_ids = {name: document_id for document_id, name in enumerate(names)}
+
+    postings = defaultdict(list)
+    for position, segment in enumerate(segments):
+        for term, ids in segment.iter_terms():
+            for document_id in ids:
+                name = segment.names[document_id]
+                if index.owner[name] == position:
+                    postings[term].append(new_ids[name])
+
+    for ids in postings.values():
+        ids.sort()
+    return write_segment(names, deleted, postings)
@@ -0,0 +1,216 @@
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+from metadata_utils import build_document_item_from_head, save_document_item
+from storage_utils import (document_key, derived_key, staging_key, THUMBNAIL_ARTIFACT, EXCERPT_ARTIFACT,
+                           CHUNK_MANIFEST_ARTIFACT)
+
+COPY_OBJECT_MAX_BYTES = 5 * 1024 ** 3       # S3 limit for a single CopyObject
+MAX_PARTS = 10000                           # S3 limit per upload
+
+
+class CopyConflict(Exception):
+    """The destination exists, or the source changed or vanished while it was being copied."""
+
+
+def part_copy_ranges(size, part_size):
+    """Return the inclusive 'bytes=first-last' ranges of a multipart copy."""
+    while -(-size // part_size) > MAX_PARTS:
+        part_size *= 2
+    return [f'bytes={start}-{min(start + part_size, size) - 1}' for start in range(0, size, part_size)]
+
+
+def copy_stored_object(s3, bucket, source_key, destination_key, head, multipart_threshold, part_size,
+                       max_workers, logger, conditions=None):
+    """
+    Copy an object inside S3, without its bytes passing through the Lambda.
+
+    Objects up to multipart_threshold (at most 5 GB) are copied with a single CopyObject.
+    Larger ones are copied as a multipart upload whose parts are UploadPartCopy ranges of
+    the source, max_workers at a time, which S3 serves in parallel.
+
+    Args:
+        head (dict): The source's head_object response. The copy is made from this ETag,
+            and carries over its content type, metadata and checksum algorithm.
+        conditions (dict): IfMatch or IfNoneMatch the write of the destination must meet.
+
+    Returns:
+        tuple: The head_object fields of the copy, taken from the write's own response, and
+        the number of parts copied, 1 for a CopyObject.
+    """
+    copy_source = {'Bucket': bucket, 'Key': source_key}
+    algorithm = next((name for name in ('SHA256', 'CRC32C', 'SHA1', 'CRC32') if head.get(f'Checksum{name}')), None)
+    checksum_params = {'ChecksumAlgorithm': algorithm} if algorithm else {}
+    conditions = conditions or {}
+    size = head['ContentLength']
+
+    if size <= min(multipart_threshold, COPY_OBJECT_MAX_BYTES):
+        result = s3.copy_object(Bucket=bucket, Key=destination_key, CopySource=copy_source,
+                                CopySourceIfMatch=head['ETag'], MetadataDirective='COPY',
+                                **checksum_params, **conditions)['CopyObjectResult']
+        return copied_head(head, result, algorithm), 1
+
+    upload_id = s3.create_multipart_upload(
+        Bucket=bucket, Key=destination_key, ContentType=head.get('ContentType', 'application/octet-stream'),
+        Metadata=head.get('Metadata', {}), **checksum_params
+    )['UploadId']
+
+    def copy_part(numbered_range):
+        number, byte_range = numbered_range
+        result = s3.upload_part_copy(
+            Bucket=bucket, Key=destination_key, UploadId=upload_id, PartNumber=number,
+            CopySource=copy_source, CopySourceRange=byte_range, CopySourceIfMatch=head['ETag']
+        )['CopyPartResult']
+        part = {'PartNumber': number, 'ETag': result['ETag']}
+        if algorithm and result.get(f'Checksum{algorithm}'):
+            part[f'Checksum{algorithm}'] = result[f'Checksum{algorithm}']
+        return part
+
+    ranges = part_copy_ranges(size, part_size)
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            parts = list(executor.map(copy_part, enumerate(ranges, start=1)))
+        result = s3.complete_multipart_upload(Bucket=bucket, Key=destination_key, UploadId=upload_id,
+                                              MultipartUpload={'Parts': parts}, **conditions)
+    except Exception:
+        s3.abort_multipart_upload(Bucket=bucket, Key=destination_key, UploadId=upload_id)
+        raise
+
+    logger.info(f"Copied {size} bytes in {len(parts)} parts")
+    return copied_head(head, result, algorithm), len(parts)
+
+
+def copied_head(head, result, algorithm):
+    """Describe a copy of the object described by head, as head_object would, from the copy's response."""
+    copy = {'ETag': result['ETag'], 'ContentLength': head['ContentLength'], 'Metadata': head.get('Metadata', {}),
+            'ContentType': head.get('ContentType', 'application/octet-stream')}
+    if algorithm and result.get(f'Checksum{algorithm}'):
+        copy[f'Checksum{algorithm}'] = result[f'Checksum{algorithm}']
+    return copy
+
+
+def copy_document(s3, dynamodb, bucket, table_name, user_id, source_name, destination_name, move,
+                  overwrite, multipart_threshold, part_size, max_workers, logger):
+    """
+    Copy or move a document to a new name, in S3 and in the metadata table.
+
+    The object is copied first, then a single transaction writes the destination item and,
+    for a move, deletes the source item. The transaction only succeeds while the source item
+    still has the copied ETag, so a concurrent upload or delete cannot be silently lost.
+    Without overwrite, the copy is only written while the destination does not exist, and
+    the destination may only hold an item already registered for the copy from its bucket
+    notification. An existing destination is replaced only once the transaction commits:
+    the copy is staged under a reserved prefix and then copied over it, so a conflict never
+    leaves the destination changed. The source object and its previews are deleted only once
+    the transaction commits.
+
+    Returns:
+        dict: The destination item, in DynamoDB attribute-value format.
+
+    Raises:
+        CopyConflict: The destination exists and overwrite is off, or the source changed.
+        ClientError: The source does not exist (404), or S3 or DynamoDB failed.
+    """
+    source_key = document_key(user_id, source_name)
+    destination_key = document_key(user_id, destination_name)
+
+    source_head = s3.head_object(Bucket=bucket, Key=source_key, ChecksumMode='ENABLED')
+    destination_exists = object_exists(s3, bucket, destination_key)
+    if destination_exists and not overwrite:
+        raise CopyConflict(f"{destination_name} already exists")
+
+    copy_key = staging_key(user_id, uuid.uuid4().hex) if destination_exists else destination_key
+    try:
+        copy_head, parts = copy_stored_object(s3, bucket, source_key, copy_key, source_head, multipart_threshold,
+                                              part_size, max_workers, logger,
+                                              conditions=None if destination_exists else {'IfNoneMatch': '*'})
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('PreconditionFailed', '412', 'ConditionalRequestConflict'):
+            raise CopyConflict(f"{source_name} or {destination_name} changed while it was being copied") from None
+        raise
+
+    item = build_document_item_from_head(user_id, destination_name, copy_head)
+
+    source_item_key = {'user_id': {'S': user_id}, 'document_name': {'S': source_name}}
+    source_condition = {
+        'ConditionExpression': 'attribute_exists(document_name) AND etag = :etag',
+        'ExpressionAttributeValues': {':etag': {'S': source_head['ETag'].strip('"')}}
+    }
+    destination_put = {'TableName': table_name, 'Item': item}
+    if not overwrite:
+        # The bucket notifies register_metadata of the copy too, and it may have registered it
+        # already; only an item for another object means the name was taken meanwhile
+        destination_put['ConditionExpression'] = 'attribute_not_exists(document_name) OR etag = :destination_etag'
+        destination_put['ExpressionAttributeValues'] = {':destination_etag': item['etag']}
+
+    source_action = (
+        {'Delete': {'TableName': table_name, 'Key': source_item_key, **source_condition}} if move
+        else {'ConditionCheck': {'TableName': table_name, 'Key': source_item_key, **source_condition}}
+    )
+
+    try:
+        dynamodb.transact_write_items(TransactItems=[{'Put': destination_put}, source_action])
+    except ClientError as e:
+        # Only the copy is removed, a document written to the destination since is kept
+        delete_copy(s3, bucket, copy_key, copy_head['ETag'], logger)
+        if e.response['Error']['Code'] == 'TransactionCanceledException':
+            raise CopyConflict(f"{source_name} or {destination_name} changed during the copy") from None
+        raise
+
+    if destination_exists:
+        try:
+            destination_head, _ = copy_stored_object(s3, bucket, copy_key, destination_key, copy_head,
+                                                      multipart_threshold, part_size, max_workers, logger)
+        finally:
+            s3.delete_object(Bucket=bucket, Key=copy_key)
+        if destination_head['ETag'] != copy_head['ETag']:
+            # Copies only share an ETag when they are stored alike, record the one in place
+            item = build_document_item_from_head(user_id, destination_name, destination_head)
+            save_document_item(dynamodb, table_name, item)
+
+    if move:
+        s3.delete_object(Bucket=bucket, Key=source_key)
+        delete_derived_artifacts(s3, bucket, user_id, source_name, logger)
+
+    logger.info(f"{'Moved' if move else 'Copied'} {source_name} to {destination_name} "
+                f"({source_head['ContentLength']} bytes, {parts} parts)")
+    return item
+
+
+def delete_copy(s3, bucket, key, etag, logger):
+    """Delete an object written by a copy that did not commit, unless it has been replaced since."""
+    try:
+        s3.delete_object(Bucket=bucket, Key=key, IfMatch=etag)
+    except ClientError as e:
+        if e.response['Error']['Code'] not in ('PreconditionFailed', '412', '404', 'NoSuchKey'):
+            raise
+        logger.info(f"{key} was replaced after the copy, keeping it")
+
+
+def object_exists(s3, bucket, key):
+    """Check whether an object exists with a HEAD request."""
+    try:
+        s3.head_object(Bucket=bucket, Key=key)
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+            return False
+        raise
+
+
+def delete_derived_artifacts(s3, bucket, user_id, document_name, logger):
+    """Delete the preview artifacts derived from a document, they are re-derived for its new name."""
+    try:
+        s3.delete_objects(
+            Bucket=bucket,
+            Delete={
+                'Objects': [
+                    {'Key': derived_key(user_id, document_name, THUMBNAIL_ARTIFACT)},
+                    {'Key': derived_key(user_id, document_name, EXCERPT_ARTIFACT)},
+                    {'Key': derived_key(user_id, document_name, CHUNK_MANIFEST_ARTIFACT)}
+                ],
+                'Quiet': True
+            }
+        )
+    except ClientError as e:
+        logger.warning(f"Failed to delete derived artifacts: {e.response['Error']['Message']}")
@@ -4,9 +4,9 @@ import json
 ALLOWED_ORIGINS = ['*']  # Update this to restrict to specific domains
 CORS_HEADERS = {
     'Access-Control-Allow-Origin': '*',  # Default to allow all origins
-    'Access-Control-Allow-Headers': 'Content-Type, Authorization, Content-Security-Policy, ETag, X-Amz-Date, X-Api-Key, x-amz-security-token',
+    'Access-Control-Allow-Headers': 'Content-Type, Authorization, Content-Security-Policy, ETag, If-None-Match, Idempotency-Key, X-Amz-Date, X-Api-Key, x-amz-security-token',
     'Access-Control-Allow-Methods': 'GET, PUT, POST, OPTIONS',
-    'Access-Control-Expose-Headers': 'ETag, Content-Security-Policy, x-amz-security-token'
+    'Access-Control-Expose-Headers': 'ETag, X-Next-Cursor, Idempotent-Replayed, Content-Security-Policy, x-amz-security-token'
 }
 
 def get_cors_headers_from_event(event, logger):
@@ -0,0 +1,326 @@
+import hashlib
+import json
+import mmap
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+from chunking import CHUNKER, build_chunk_list
+from compression_utils import CODEC_NONE, STREAM_CHUNK_SIZE, iter_decompressed, stream_compressor
+from encryption_utils import is_encrypted
+from storage_utils import document_key, derived_key, CHUNK_MANIFEST_ARTIFACT
+
+MIN_PART_SIZE = 5 * 1024 * 1024     # S3 minimum for every part but the last
+COPY_PART_SIZE = 256 * 1024 * 1024  # Long unchanged ranges are copied in parts of about this size
+MAX_BUFFER_SIZE = 16 * 1024 * 1024  # Buffered bytes are sent as a part once they reach this size
+
+# Manifests are built from a copy in /tmp, larger documents are not chunked
+DELTA_MAX_CHUNKING_BYTES = int(os.getenv('DELTA_MAX_CHUNKING_BYTES', str(1024 ** 3)))
+
+# Errors of a read or write conditional on the base ETag, once the document has changed
+CONFLICT_CODES = ('PreconditionFailed', '412', 'ConditionalRequestConflict')
+
+
+class DeltaConflict(Exception):
+    """The document changed since the client read its manifest, or cannot take delta updates."""
+
+
+def stored_codec(head):
+    """Return the compression codec of a stored object, from its head_object response."""
+    return head.get('Metadata', {}).get('content-codec', CODEC_NONE)
+
+
+def document_size(head):
+    """Return the size of a stored document before compression."""
+    return int(head.get('Metadata', {}).get('original-size', head['ContentLength']))
+
+
+def written_version(base_head, response, metadata, stored_size):
+    """
+    Describe the version a write created, as head_object would, from the write's own response.
+
+    A second HEAD could describe a version written by someone else in the meantime.
+    """
+    version = {'ETag': response['ETag'], 'ContentLength': stored_size, 'Metadata': metadata,
+               'ContentType': base_head.get('ContentType', 'application/octet-stream')}
+    if response.get('ChecksumSHA256'):
+        version['ChecksumSHA256'] = response['ChecksumSHA256']
+    return version
+
+
+def load_chunk_manifest(s3, bucket, user_id, document_name, head, logger):
+    """
+    Return the chunk manifest of a document's current version, building it if needed.
+
+    The manifest is stored next to the document's previews and records the ETag it
+    describes. A missing or stale manifest is rebuilt by chunking the stored object from a
+    temporary file, which reads the document once per version written by something other
+    than a delta update. The chunks of a compressed document are those of its decompressed
+    bytes, the same bytes the client chunks.
+
+    Raises:
+        DeltaConflict: The document is stored encrypted, so its chunks cannot be reused, or
+            has no manifest and is too large to chunk.
+    """
+    if is_encrypted(head.get('Metadata')):
+        raise DeltaConflict('Delta updates need a document stored without encryption')
+
+    manifest_key = derived_key(user_id, document_name, CHUNK_MANIFEST_ARTIFACT)
+    try:
+        manifest = json.loads(s3.get_object(Bucket=bucket, Key=manifest_key)['Body'].read())
+        if manifest.get('etag') == head['ETag'] and manifest.get('chunker') == CHUNKER:
+            return manifest
+        logger.info(f"Chunk manifest of {document_name} is stale, rebuilding it")
+    except ClientError as e:
+        if e.response['Error']['Code'] not in ('NoSuchKey', '404'):
+            raise
+
+    size = document_size(head)
+    if size > DELTA_MAX_CHUNKING_BYTES:
+        raise DeltaConflict(f"Documents over {DELTA_MAX_CHUNKING_BYTES} bytes need a full upload first")
+
+    with tempfile.TemporaryFile() as local_copy:
+        size = download_document(s3, bucket, document_key(user_id, document_name), head, local_copy)
+        if size:
+            with mmap.mmap(local_copy.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                chunks = build_chunk_list(mapped)
+        else:
+            chunks = []
+
+    manifest = {'etag': head['ETag'], 'size': size, 'chunker': CHUNKER, 'chunks': chunks}
+    save_chunk_manifest(s3, bucket, user_id, document_name, manifest)
+    logger.info(f"Built chunk manifest of {document_name} with {len(chunks)} chunks")
+    return manifest
+
+
+def download_document(s3, bucket, key, head, target):
+    """
+    Write the decompressed bytes of the version of an object described by head to a file.
+
+    Returns:
+        int: The number of bytes written.
+    """
+    response = s3.get_object(Bucket=bucket, Key=key, IfMatch=head['ETag'])
+    written = 0
+    for chunk in iter_decompressed(response['Body'].iter_chunks(STREAM_CHUNK_SIZE), stored_codec(head)):
+        target.write(chunk)
+        written += len(chunk)
+    target.flush()
+    return written
+
+
+def save_chunk_manifest(s3, bucket, user_id, document_name, manifest):
+    """Store a document's chunk manifest."""
+    s3.put_object(Bucket=bucket, Key=derived_key(user_id, document_name, CHUNK_MANIFEST_ARTIFACT),
+                  Body=json.dumps(manifest, separators=(',', ':')).encode('utf-8'),
+                  ContentType='application/json')
+
+
+def plan_segments(manifest, chunks):
+    """
+    Resolve the chunk list of a new version against the base manifest.
+
+    Args:
+        manifest (dict): The base version's chunk manifest.
+        chunks (list): The new version's chunks, each {'sha256'} for a chunk of the base
+            version or {'data'} (base64 decoded to bytes by the caller) for new content.
+
+    Returns:
+        tuple: (segments, chunk list of the new version). Segments are ('copy', offset,
+        length) ranges of the base object, with adjacent ranges merged, and ('data', bytes).
+
+    Raises:
+        ValueError: A chunk references a hash the base version does not have.
+    """
+    base_ranges, offset = {}, 0
+    for length, digest in manifest['chunks']:
+        base_ranges.setdefault(digest, (offset, length))
+        offset += length
+
+    segments, new_chunks = [], []
+    for chunk in chunks:
+        if 'data' in chunk:
+            data = chunk['data']
+            new_chunks.append([len(data), hashlib.sha256(data).hexdigest()])
+            if segments and segments[-1][0] == 'data':
+                segments[-1] = ('data', segments[-1][1] + data)
+            else:
+                segments.append(('data', data))
+            continue
+
+        if chunk.get('sha256') not in base_ranges:
+            raise ValueError(f"Unknown chunk {chunk.get('sha256')}")
+        start, length = base_ranges[chunk['sha256']]
+        new_chunks.append([length, chunk['sha256']])
+        if segments and segments[-1][0] == 'copy' and segments[-1][1] + segments[-1][2] == start:
+            segments[-1] = ('copy', segments[-1][1], segments[-1][2] + length)
+        else:
+            segments.append(('copy', start, length))
+    return segments, new_chunks
+
+
+def assemble_document(s3, bucket, key, base_head, segments, max_workers, logger):
+    """
+    Write a new version of an object from ranges of its current version and new bytes.
+
+    Unchanged ranges of at least 5 MB become UploadPartCopy parts, copied by S3 in parallel.
+    Parts must be 5 MB or more, so new bytes and short ranges around them are sent as a
+    regular part, topped up to 5 MB with a ranged GET of the following range. The Lambda
+    therefore handles the new bytes plus at most about 5 MB per changed region, however
+    large the document is. Every read and copy is conditional on the base ETag, and so is
+    completing the upload, so a version written in the meantime is never replaced.
+
+    Returns:
+        tuple: The head_object fields of the version written, and counts of 'copied_bytes'
+        and 'sent_bytes' (bytes the Lambda read or received).
+
+    Raises:
+        DeltaConflict: The document changed since base_head was read.
+    """
+    size = sum(segment[2] if segment[0] == 'copy' else len(segment[1]) for segment in segments)
+    metadata = {**base_head.get('Metadata', {}), 'content-codec': CODEC_NONE, 'original-size': str(size)}
+    upload_id = s3.create_multipart_upload(
+        Bucket=bucket, Key=key, ContentType=base_head.get('ContentType', 'application/octet-stream'),
+        Metadata=metadata, ChecksumAlgorithm='SHA256'
+    )['UploadId']
+    copy_source = {'Bucket': bucket, 'Key': key}
+    stats = {'copied_bytes': 0, 'sent_bytes': 0}
+    parts, copies, buffer = [], [], bytearray()
+
+    def read_range(start, length):
+        response = s3.get_object(Bucket=bucket, Key=key, Range=f'bytes={start}-{start + length - 1}',
+                                 IfMatch=base_head['ETag'])
+        return response['Body'].read()
+
+    def upload_buffer():
+        number = len(parts) + len(copies) + 1
+        response = s3.upload_part(Bucket=bucket, Key=key, UploadId=upload_id, PartNumber=number,
+                                  Body=bytes(buffer), ChecksumAlgorithm='SHA256')
+        parts.append({'PartNumber': number, 'ETag': response['ETag'], 'ChecksumSHA256': response.get('ChecksumSHA256')})
+        stats['sent_bytes'] += len(buffer)
+        buffer.clear()
+
+    def copy_range(number, start, length):
+        result = s3.upload_part_copy(
+            Bucket=bucket, Key=key, UploadId=upload_id, PartNumber=number, CopySource=copy_source,
+            CopySourceRange=f'bytes={start}-{start + length - 1}', CopySourceIfMatch=base_head['ETag']
+        )['CopyPartResult']
+        part = {'PartNumber': number, 'ETag': result['ETag']}
+        if result.get('ChecksumSHA256'):
+            part['ChecksumSHA256'] = result['ChecksumSHA256']
+        return part
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for segment in segments:
+                if segment[0] == 'data':
+                    buffer += segment[1]
+                    if len(buffer) >= MAX_BUFFER_SIZE:
+                        upload_buffer()
+                    continue
+
+                _, start, length = segment
+                if buffer and len(buffer) < MIN_PART_SIZE:
+                    # Top the buffered bytes up to a valid part from the start of this range
+                    take = min(MIN_PART_SIZE - len(buffer), length)
+                    buffer += read_range(start, take)
+                    start, length = start + take, length - take
+                if length >= MIN_PART_SIZE:
+                    if buffer:
+                        upload_buffer()
+                    # Split evenly, so no copied part falls below the 5 MB minimum
+                    count = max(1, length // COPY_PART_SIZE)
+                    for index in range(count):
+                        part_start = start + length * index // count
+                        part_end = start + length * (index + 1) // count
+                        number = len(parts) + len(copies) + 1
+                        copies.append(executor.submit(copy_range, number, part_start, part_end - part_start))
+                    stats['copied_bytes'] += length
+                elif length:
+                    buffer += read_range(start, length)
+                    if len(buffer) >= MAX_BUFFER_SIZE:
+                        upload_buffer()
+
+            if buffer or not (parts or copies):
+                upload_buffer()
+            parts.extend(future.result() for future in copies)
+
+        response = s3.complete_multipart_upload(
+            Bucket=bucket, Key=key, UploadId=upload_id, IfMatch=base_head['ETag'],
+            MultipartUpload={'Parts': sorted(parts, key=lambda part: part['PartNumber'])}
+        )
+    except ClientError as e:
+        s3.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+        if e.response['Error']['Code'] in CONFLICT_CODES:
+            raise DeltaConflict('The document changed while the update was assembled') from None
+        raise
+    except Exception:
+        s3.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+        raise
+
+    logger.info(f"Assembled {key}: {stats['copied_bytes']} bytes copied in S3, "
+                f"{stats['sent_bytes']} bytes sent in {len(parts) - len(copies)} parts")
+    return written_version(base_head, response, metadata, size), stats
+
+
+def rewrite_compressed_document(s3, bucket, key, base_head, segments, logger):
+    """
+    Write a new version of a compressed object from ranges of its current version and new bytes.
+
+    Ranges of compressed bytes cannot be copied inside S3, so the current version is
+    decompressed to a temporary file, and the new version is compressed from it and the new
+    bytes with the same codec and put in one request. The client still sends only the
+    changed chunks, and the document stays compressed. Segments are as for assemble_document,
+    and the put is conditional on the base ETag too.
+
+    Returns:
+        tuple: The head_object fields of the version written, and counts of 'copied_bytes'
+        (none, nothing is copied in S3) and 'sent_bytes' (the size of the object put).
+
+    Raises:
+        DeltaConflict: The document changed since base_head was read.
+    """
+    codec = stored_codec(base_head)
+    compressor = stream_compressor(codec)
+    size = 0
+    with tempfile.TemporaryFile() as base, tempfile.TemporaryFile() as new_version:
+        try:
+            download_document(s3, bucket, key, base_head, base)
+        except ClientError as e:
+            if e.response['Error']['Code'] in CONFLICT_CODES:
+                raise DeltaConflict('The document changed while the update was assembled') from None
+            raise
+
+        for segment in segments:
+            if segment[0] == 'data':
+                new_version.write(compressor.compress(segment[1]))
+                size += len(segment[1])
+                continue
+
+            _, start, length = segment
+            base.seek(start)
+            while length:
+                data = base.read(min(length, STREAM_CHUNK_SIZE))
+                if not data:
+                    raise ValueError(f"Chunk range ends past the {key} version it was built from")
+                new_version.write(compressor.compress(data))
+                size += len(data)
+                length -= len(data)
+        new_version.write(compressor.flush())
+
+        stored_size = new_version.tell()
+        new_version.seek(0)
+        metadata = {**base_head.get('Metadata', {}), 'content-codec': codec, 'original-size': str(size)}
+        try:
+            response = s3.put_object(
+                Bucket=bucket, Key=key, Body=new_version, IfMatch=base_head['ETag'],
+                ContentType=base_head.get('ContentType', 'application/octet-stream'),
+                Metadata=metadata, ChecksumAlgorithm='SHA256'
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] in CONFLICT_CODES:
+                raise DeltaConflict('The document changed while the update was assembled') from None
+            raise
+
+    logger.info(f"Rewrote {key} with {codec}: {size} bytes stored in {stored_size}")
+    return written_version(base_head, response, metadata, stored_size), {'copied_bytes': 0, 'sent_bytes': stored_size}
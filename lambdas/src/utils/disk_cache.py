@@ -0,0 +1,90 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+
+
+class DiskCache:
+    """
+    A size-bounded LRU cache of S3 objects on local disk, keyed by object key and ETag.
+
+    The index lives in memory, so it only knows files written by this container; the
+    directory is cleared when the cache is created. Files are written to a temporary name
+    and renamed into place, so a reader never sees a partial entry.
+    """
+
+    def __init__(self, directory, max_bytes, max_entry_bytes=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes or max_bytes
+        self.total_bytes = 0
+        self._entries = OrderedDict()   # key -> {'etag', 'path', 'size', 'attributes'}, least recently used first
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory, exist_ok=True)
+
+    def get(self, key):
+        """Return the entry for a key, marking it most recently used, or None."""
+        entry = self._entries.get(key)
+        if entry:
+            self._entries.move_to_end(key)
+        return entry
+
+    def iter_chunks(self, entry, chunk_size=1024 * 1024):
+        """Yield the cached bytes of an entry, a chunk at a time."""
+        with open(entry['path'], 'rb') as cached_file:
+            yield from iter(lambda: cached_file.read(chunk_size), b'')
+
+    def fits(self, size):
+        """Check whether an object of this size may be cached."""
+        return size is not None and size <= self.max_entry_bytes
+
+    def put(self, key, etag, chunks, attributes=None):
+        """
+        Stream an object's chunks into the cache, replacing any older version of the key.
+
+        Args:
+            key (str): The S3 object key.
+            etag (str): The object's ETag, used to revalidate the entry later.
+            chunks (iterable): The object body as byte chunks.
+            attributes (dict): Response attributes to return on a hit, such as the content type.
+
+        Returns:
+            dict: The new entry.
+        """
+        name = hashlib.sha256(f'{key}\0{etag}'.encode('utf-8')).hexdigest()
+        path = os.path.join(self.directory, name)
+        size = 0
+        descriptor, temporary_path = tempfile.mkstemp(dir=self.directory, prefix='.partial-')
+        try:
+            with os.fdopen(descriptor, 'wb') as temporary_file:
+                for chunk in chunks:
+                    temporary_file.write(chunk)
+                    size += len(chunk)
+            # Drop the old version first, it may share the path when the ETag is unchanged
+            self.discard(key)
+            os.replace(temporary_path, path)
+        except BaseException:
+            os.unlink(temporary_path)
+            raise
+
+        entry = {'etag': etag, 'path': path, 'size': size, 'attributes': attributes or {}}
+        self._entries[key] = entry
+        self.total_bytes += size
+        self._evict()
+        return entry
+
+    def discard(self, key):
+        """Remove a key from the cache, if present."""
+        entry = self._entries.pop(key, None)
+        if entry:
+            self.total_bytes -= entry['size']
+            try:
+                os.remove(entry['path'])
+            except OSError:
+                pass
+
+    def _evict(self):
+        """Drop least recently used entries until the cache is within its byte budget."""
+        while self.total_bytes > self.max_bytes and self._entries:
+            self.discard(next(iter(self._entries)))
@@ -0,0 +1,286 @@
+import io
+import os
+import struct
+import time
+from botocore.exceptions import ClientError
+from memory_cache import MemoryCache
+
+try:
+    from cryptography.exceptions import InvalidTag
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+except ImportError:  # Envelope encryption is unavailable when cryptography is not packaged
+    AESGCM = None
+
+# Encryption schemes as recorded in S3 object metadata
+ENCRYPTION_NONE = 'none'
+ENCRYPTION_ENVELOPE = 'aes-256-gcm-stream'
+
+# S3 user metadata of an encrypted object: the scheme, the KMS-wrapped data key, and the
+# nonce prefix and plaintext segment size the object was encrypted with
+ENCRYPTION_METADATA = 'content-encryption'
+WRAPPED_KEY_METADATA = 'encryption-wrapped-key'
+NONCE_PREFIX_METADATA = 'encryption-nonce-prefix'
+SEGMENT_SIZE_METADATA = 'encryption-segment-size'
+
+# Objects are encrypted a segment at a time, each segment with its own nonce and tag, so
+# neither side ever holds more than a segment beyond what it streams. A nonce is the
+# object's random prefix, the segment number and a flag set on the last segment only,
+# which makes reordered, dropped or truncated segments fail authentication.
+SEGMENT_SIZE = 64 * 1024
+TAG_SIZE = 16
+NONCE_PREFIX_SIZE = 7
+MAX_SEGMENTS = 2 ** 32
+
+# A data key encrypts objects until it reaches one of these limits, then KMS generates a new one
+DATA_KEY_MAX_AGE_SECONDS = float(os.getenv('DATA_KEY_MAX_AGE_SECONDS', '300'))
+DATA_KEY_MAX_BYTES = int(os.getenv('DATA_KEY_MAX_BYTES', str(1024 ** 3)))
+DATA_KEY_MAX_MESSAGES = int(os.getenv('DATA_KEY_MAX_MESSAGES', '10000'))
+
+# Decrypted data keys kept for reads, each for DATA_KEY_MAX_AGE_SECONDS
+DATA_KEY_CACHE_ENTRIES = int(os.getenv('DATA_KEY_CACHE_ENTRIES', '1000'))
+
+
+class DecryptionError(Exception):
+    """An encrypted object failed authentication, or its encryption metadata is incomplete."""
+
+
+def resolve_encryption(setting):
+    """
+    Map the DOCUMENT_ENCRYPTION setting to a scheme.
+
+    'envelope' needs the cryptography package; unlike compression it never falls back, a
+    deployment that asks for encryption must not store plaintext.
+
+    Raises:
+        ValueError: Envelope encryption was asked for but cryptography is not packaged.
+    """
+    if (setting or '').lower() != 'envelope':
+        return ENCRYPTION_NONE
+    if not AESGCM:
+        raise ValueError("DOCUMENT_ENCRYPTION=envelope needs the cryptography package")
+    return ENCRYPTION_ENVELOPE
+
+
+def is_encrypted(metadata):
+    """Check an object's S3 user metadata for envelope encryption."""
+    return (metadata or {}).get(ENCRYPTION_METADATA, ENCRYPTION_NONE) != ENCRYPTION_NONE
+
+
+class DataKeyCache:
+    """
+    KMS data keys, reused within limits so most writes and reads make no KMS call.
+
+    Writes share one data key until it is max_age_seconds old or has encrypted max_bytes or
+    max_messages objects, then ask KMS for a new one. Reads unwrap a data key once and keep
+    it for max_age_seconds. Plaintext keys only live in the container's memory; every
+    object carries its data key wrapped by the KMS key.
+    """
+
+    def __init__(self, kms, key_id, encryption_context, max_age_seconds=DATA_KEY_MAX_AGE_SECONDS,
+                 max_bytes=DATA_KEY_MAX_BYTES, max_messages=DATA_KEY_MAX_MESSAGES,
+                 max_entries=DATA_KEY_CACHE_ENTRIES):
+        self.kms = kms
+        self.key_id = key_id
+        self.encryption_context = encryption_context
+        self.max_age_seconds = max_age_seconds
+        self.max_bytes = max_bytes
+        self.max_messages = max_messages
+        self.kms_calls = 0
+        self._current = None    # The data key writes use, with its creation time and usage
+        self._unwrapped = MemoryCache(max_entries, max_entries * 32, max_age_seconds)
+
+    def encryption_key(self, size):
+        """
+        Return the (plaintext, wrapped) data key to encrypt an object of size bytes with.
+
+        The object is counted against the key's limits; a key that would exceed them is
+        replaced, unless it has not been used yet.
+        """
+        current = self._current
+        if (not current or time.monotonic() - current['created_at'] >= self.max_age_seconds
+                or current['messages'] >= self.max_messages
+                or (current['messages'] and current['bytes'] + size > self.max_bytes)):
+            response = self.kms.generate_data_key(KeyId=self.key_id, KeySpec='AES_256',
+                                                  EncryptionContext=self.encryption_context)
+            self.kms_calls += 1
+            current = self._current = {'plaintext': response['Plaintext'], 'wrapped': response['CiphertextBlob'],
+                                       'created_at': time.monotonic(), 'bytes': 0, 'messages': 0}
+            self._unwrapped.put(current['wrapped'], current['plaintext'], len(current['plaintext']))
+
+        current['messages'] += 1
+        current['bytes'] += size
+        return current['plaintext'], current['wrapped']
+
+    def decryption_key(self, wrapped):
+        """Return the plaintext of a wrapped data key, asking KMS only on a cache miss."""
+        plaintext = self._unwrapped.get(wrapped)
+        if plaintext is None:
+            params = {'CiphertextBlob': wrapped, 'EncryptionContext': self.encryption_context}
+            if self.key_id:
+                params['KeyId'] = self.key_id
+            plaintext = self.kms.decrypt(**params)['Plaintext']
+            self.kms_calls += 1
+            self._unwrapped.put(wrapped, plaintext, len(plaintext))
+        return plaintext
+
+
+def document_data_keys(kms, bucket, key_id=None):
+    """
+    Return the data key cache for the documents of a bucket.
+
+    Every handler reading or writing the bucket's documents uses the same encryption
+    context, the bucket name. Object keys are left out of it, so copies and renames, which
+    copy the object and its metadata inside S3, stay readable.
+    """
+    return DataKeyCache(kms, key_id, {'bucket': bucket})
+
+
+def segment_nonce(prefix, number, last):
+    """Return the nonce of a segment: the object's prefix, the segment number and the last-segment flag."""
+    if number >= MAX_SEGMENTS:
+        raise ValueError("Object has too many segments to encrypt")
+    return prefix + struct.pack('>IB', number, 1 if last else 0)
+
+
+def iter_encrypted(chunks, key, nonce_prefix, segment_size=SEGMENT_SIZE):
+    """
+    Encrypt an iterable of byte chunks lazily, yielding one ciphertext segment at a time.
+
+    A segment is only sealed once the next byte has arrived, as the last one is flagged;
+    an empty input still yields a last, empty segment carrying its tag. At most one
+    segment of plaintext is buffered, however large the chunks are.
+    """
+    cipher = AESGCM(key)
+    buffer = bytearray()
+    number = 0
+    for chunk in chunks:
+        view = memoryview(chunk)
+        while view:
+            if len(buffer) == segment_size:
+                yield cipher.encrypt(segment_nonce(nonce_prefix, number, False), bytes(buffer), None)
+                buffer.clear()
+                number += 1
+            taken = segment_size - len(buffer)
+            buffer += view[:taken]
+            view = view[taken:]
+    yield cipher.encrypt(segment_nonce(nonce_prefix, number, True), bytes(buffer), None)
+
+
+def encrypt_document(data, data_keys):
+    """
+    Encrypt a document held in memory under a cached data key.
+
+    Segments are written to one buffer as they are sealed, rather than collected and
+    joined, so the ciphertext is held once beside the document.
+
+    Returns:
+        tuple: The ciphertext, and the S3 user metadata to store it with.
+    """
+    key, wrapped = data_keys.encryption_key(len(data))
+    nonce_prefix = os.urandom(NONCE_PREFIX_SIZE)
+    ciphertext = io.BytesIO()
+    for segment in iter_encrypted([data], key, nonce_prefix):
+        ciphertext.write(segment)
+    return ciphertext.getvalue(), {
+        ENCRYPTION_METADATA: ENCRYPTION_ENVELOPE,
+        WRAPPED_KEY_METADATA: encode_metadata_bytes(wrapped),
+        NONCE_PREFIX_METADATA: encode_metadata_bytes(nonce_prefix),
+        SEGMENT_SIZE_METADATA: str(SEGMENT_SIZE)
+    }
+
+
+def iter_decrypted(chunks, metadata, data_keys):
+    """
+    Decrypt an iterable of byte chunks lazily, yielding plaintext a segment at a time.
+
+    Objects stored without encryption pass through unchanged, like iter_decompressed does
+    for uncompressed ones, so readers chain the two: decrypt, then decompress. At most one
+    sealed segment is buffered, however large the chunks are.
+
+    Raises:
+        DecryptionError: A segment failed authentication or the object was truncated.
+    """
+    if not is_encrypted(metadata):
+        yield from chunks
+        return
+
+    try:
+        if metadata[ENCRYPTION_METADATA] != ENCRYPTION_ENVELOPE:
+            raise DecryptionError(f"Unknown encryption scheme {metadata[ENCRYPTION_METADATA]}")
+        wrapped = decode_metadata_bytes(metadata[WRAPPED_KEY_METADATA])
+        nonce_prefix = decode_metadata_bytes(metadata[NONCE_PREFIX_METADATA])
+        sealed_size = int(metadata[SEGMENT_SIZE_METADATA]) + TAG_SIZE
+    except (KeyError, ValueError) as e:
+        raise DecryptionError(f"Incomplete encryption metadata: {str(e)}") from None
+
+    cipher = AESGCM(data_keys.decryption_key(wrapped))
+    buffer = bytearray()
+    number = 0
+
+    def open_segment(segment, last):
+        try:
+            return cipher.decrypt(segment_nonce(nonce_prefix, number, last), bytes(segment), None)
+        except InvalidTag:
+            raise DecryptionError(f"Segment {number} failed authentication") from None
+
+    for chunk in chunks:
+        view = memoryview(chunk)
+        while view:
+            # The last segment is only known at the end, so a full one is held back until more arrives
+            if len(buffer) == sealed_size:
+                yield open_segment(buffer, False)
+                buffer.clear()
+                number += 1
+            taken = sealed_size - len(buffer)
+            buffer += view[:taken]
+            view = view[taken:]
+    plaintext = open_segment(buffer, True)
+    if plaintext:
+        yield plaintext
+
+
+def encode_metadata_bytes(value):
+    """Encode bytes for S3 user metadata, which only carries ASCII text."""
+    return value.hex()
+
+
+def decode_metadata_bytes(value):
+    """Decode bytes written by encode_metadata_bytes."""
+    return bytes.fromhex(value)
+
+
+class LocalKms:
+    """
+    Stands in for the KMS client in scripts and tests, with no AWS account.
+
+    Implements the generate_data_key and decrypt calls DataKeyCache makes, with the same
+    parameters and response fields. Data keys are wrapped with AES-GCM under a key that
+    only this instance holds, bound to their encryption context as KMS binds them, and a
+    wrapped key that does not authenticate raises InvalidCiphertextException.
+    """
+
+    def __init__(self, key_id='local'):
+        self.key_id = key_id
+        self.calls = {'GenerateDataKey': 0, 'Decrypt': 0}
+        self._cipher = AESGCM(AESGCM.generate_key(bit_length=256))
+
+    def generate_data_key(self, KeyId, KeySpec='AES_256', EncryptionContext=None):
+        self.calls['GenerateDataKey'] += 1
+        plaintext = os.urandom(32)
+        nonce = os.urandom(12)
+        wrapped = nonce + self._cipher.encrypt(nonce, plaintext, self._context_bytes(EncryptionContext))
+        return {'KeyId': KeyId, 'Plaintext': plaintext, 'CiphertextBlob': wrapped}
+
+    def decrypt(self, CiphertextBlob, EncryptionContext=None, KeyId=None):
+        self.calls['Decrypt'] += 1
+        try:
+            plaintext = self._cipher.decrypt(CiphertextBlob[:12], CiphertextBlob[12:],
+                                             self._context_bytes(EncryptionContext))
+        except (InvalidTag, ValueError):
+            raise ClientError({'Error': {'Code': 'InvalidCiphertextException', 'Message': 'Invalid ciphertext'}},
+                              'Decrypt') from None
+        return {'KeyId': KeyId or self.key_id, 'Plaintext': plaintext}
+
+    @staticmethod
+    def _context_bytes(encryption_context):
+        return repr(sorted((encryption_context or {}).items())).encode('utf-8')
@@ -0,0 +1,215 @@
+import hashlib
+import json
+import os
+import time
+import uuid
+from botocore.exceptions import ClientError
+
+# Records of requests sent with an Idempotency-Key, keyed by user_id and "<operation>#<key>".
+# Without the table the header is ignored and every request does its work.
+IDEMPOTENCY_TABLE_NAME = os.getenv('IDEMPOTENCY_TABLE_NAME')
+
+# How long a completed response is replayed to retries, after which DynamoDB TTL removes it
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv('IDEMPOTENCY_TTL_SECONDS', str(24 * 3600)))
+
+IDEMPOTENCY_KEY_HEADER = 'idempotency-key'
+MAX_KEY_LENGTH = 255
+MAX_STORED_BODY_BYTES = 300 * 1024      # Leaves room under DynamoDB's 400 KB item limit
+DEFAULT_LEASE_SECONDS = 60              # Used when the handler has no context to read its deadline from
+
+STATUS_IN_PROGRESS = 'in_progress'
+STATUS_COMPLETED = 'completed'
+
+# Attributes of an idempotency record:
+#   user_id, idempotency_key  key attributes, the key being "<operation>#<client key>"
+#   status                    in_progress while the first request runs, then completed
+#   fingerprint               SHA-256 of the request body, a reused key must send the same body
+#   claim_token               identifies the invocation holding the record while in progress
+#   lease_expires_at          epoch seconds after which an in-progress record may be taken over
+#   response_status, response_headers, response_body
+#                             the stored response, replayed once completed
+#   expires_at                epoch seconds, DynamoDB TTL attribute
+
+
+def get_idempotency_key(event):
+    """Return the request's Idempotency-Key header, whatever its case, or None."""
+    for name, value in (event.get('headers') or {}).items():
+        if name.lower() == IDEMPOTENCY_KEY_HEADER:
+            return value.strip() or None
+    return None
+
+
+def request_fingerprint(event):
+    """Hash the request body, so a key reused for a different request is detected."""
+    body = event.get('body') or ''
+    return hashlib.sha256(body.encode('utf-8') if isinstance(body, str) else body).hexdigest()
+
+
+def run_idempotent(dynamodb_client, event, context, user_id, operation, process, cors_headers, logger):
+    """
+    Run a request's work at most once per Idempotency-Key, replaying its response to retries.
+
+    The first request claims the key with a conditional put of an in-progress record, runs
+    process and stores its response. A retry of a completed request gets the stored response
+    back without any work; one arriving while the first still runs gets a 409 to retry later.
+    The claim is a lease that ends with the invocation's deadline, so a request that timed
+    out or crashed can be retried. Failed requests (4xx and 5xx) release the key, since they
+    did no work that needs protecting and the client may fix and resend them.
+
+    Args:
+        dynamodb_client: A boto3 DynamoDB client.
+        event (dict): The API Gateway event, read for the header and the body.
+        context: The Lambda context, whose remaining time bounds the lease.
+        user_id (str): The authenticated user, keys are scoped per user.
+        operation (str): The operation name, keys are scoped per operation.
+        process (callable): Does the work and returns the Lambda proxy response.
+        cors_headers (dict): Headers for responses generated here.
+        logger (logging.Logger): Logger.
+
+    Returns:
+        dict: The Lambda proxy response.
+    """
+    key = get_idempotency_key(event)
+    if not key or not IDEMPOTENCY_TABLE_NAME:
+        return process()
+    if len(key) > MAX_KEY_LENGTH:
+        return generate_response(400, f'Idempotency-Key must be at most {MAX_KEY_LENGTH} characters', cors_headers)
+
+    record_key = {'user_id': {'S': user_id}, 'idempotency_key': {'S': f'{operation}#{key}'}}
+    fingerprint = request_fingerprint(event)
+    lease_seconds = (context.get_remaining_time_in_millis() // 1000 + 1) if context else DEFAULT_LEASE_SECONDS
+    claim_token = uuid.uuid4().hex
+
+    existing = claim_key(dynamodb_client, record_key, fingerprint, claim_token, lease_seconds)
+    if existing is not None:
+        return replay_response(existing, fingerprint, key, cors_headers, logger)
+
+    try:
+        response = process()
+    except Exception:
+        release_key(dynamodb_client, record_key, claim_token, logger)
+        raise
+
+    if 200 <= response.get('statusCode', 500) < 300:
+        save_response(dynamodb_client, record_key, claim_token, response, cors_headers, logger)
+    else:
+        release_key(dynamodb_client, record_key, claim_token, logger)
+    return response
+
+
+def claim_key(dynamodb_client, record_key, fingerprint, claim_token, lease_seconds):
+    """
+    Claim a key with a conditional put of an in-progress record.
+
+    The put succeeds if there is no record, the record is past its TTL but not yet removed,
+    or an in-progress record's lease has run out.
+
+    Returns:
+        dict: None when claimed, otherwise the existing record.
+    """
+    now = int(time.time())
+    try:
+        dynamodb_client.put_item(
+            TableName=IDEMPOTENCY_TABLE_NAME,
+            Item={
+                **record_key,
+                'status': {'S': STATUS_IN_PROGRESS},
+                'fingerprint': {'S': fingerprint},
+                'claim_token': {'S': claim_token},
+                'lease_expires_at': {'N': str(now + lease_seconds)},
+                'expires_at': {'N': str(now + IDEMPOTENCY_TTL_SECONDS)}
+            },
+            ConditionExpression=('attribute_not_exists(user_id) OR expires_at < :now '
+                                 'OR (#status = :in_progress AND lease_expires_at < :now)'),
+            ExpressionAttributeNames={'#status': 'status'},
+            ExpressionAttributeValues={':now': {'N': str(now)}, ':in_progress': {'S': STATUS_IN_PROGRESS}},
+            ReturnValuesOnConditionCheckFailure='ALL_OLD'
+        )
+        return None
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        existing = e.response.get('Item')
+    if existing is None:
+        existing = dynamodb_client.get_item(TableName=IDEMPOTENCY_TABLE_NAME, Key=record_key,
+                                            ConsistentRead=True).get('Item')
+    # Removed between the put and the read, treat it as still held rather than racing again
+    return existing or {'status': {'S': STATUS_IN_PROGRESS}, 'fingerprint': {'S': fingerprint}}
+
+
+def replay_response(record, fingerprint, key, cors_headers, logger):
+    """Answer a repeated key from its record: the stored response, or a conflict."""
+    if record['fingerprint']['S'] != fingerprint:
+        logger.warning(f"Idempotency-Key {key} reused with a different request")
+        return generate_response(422, 'Idempotency-Key was already used for a different request', cors_headers)
+
+    if record['status']['S'] != STATUS_COMPLETED:
+        logger.info(f"Request with Idempotency-Key {key} is still in progress")
+        return generate_response(409, 'A request with this Idempotency-Key is in progress, retry later',
+                                 {**cors_headers, 'Retry-After': '1'})
+
+    logger.info(f"Replaying the stored response for Idempotency-Key {key}")
+    response = {
+        'statusCode': int(record['response_status']['N']),
+        'headers': {**cors_headers, **json.loads(record['response_headers']['S']), 'Idempotent-Replayed': 'true'},
+        'body': record['response_body']['S']
+    }
+    if record.get('response_base64', {}).get('BOOL'):
+        response['isBase64Encoded'] = True
+    return response
+
+
+def save_response(dynamodb_client, record_key, claim_token, response, cors_headers, logger):
+    """Store a successful response on the claimed record, marking it completed."""
+    body = response.get('body') or ''
+    if len(body) > MAX_STORED_BODY_BYTES:
+        logger.warning(f"Response of {len(body)} bytes is too large to store, releasing the Idempotency-Key")
+        release_key(dynamodb_client, record_key, claim_token, logger)
+        return
+
+    headers = {name: value for name, value in (response.get('headers') or {}).items() if name not in cors_headers}
+    try:
+        dynamodb_client.update_item(
+            TableName=IDEMPOTENCY_TABLE_NAME,
+            Key=record_key,
+            UpdateExpression=('SET #status = :completed, response_status = :response_status, '
+                              'response_headers = :response_headers, response_body = :response_body, '
+                              'response_base64 = :response_base64, expires_at = :expires_at '
+                              'REMOVE claim_token, lease_expires_at'),
+            ConditionExpression='claim_token = :claim_token',
+            ExpressionAttributeNames={'#status': 'status'},
+            ExpressionAttributeValues={
+                ':completed': {'S': STATUS_COMPLETED},
+                ':response_status': {'N': str(response['statusCode'])},
+                ':response_headers': {'S': json.dumps(headers)},
+                ':response_body': {'S': body},
+                ':response_base64': {'BOOL': bool(response.get('isBase64Encoded'))},
+                ':expires_at': {'N': str(int(time.time()) + IDEMPOTENCY_TTL_SECONDS)},
+                ':claim_token': {'S': claim_token}
+            }
+        )
+    except ClientError as e:
+        # The lease ran out and another invocation took the key over, its response will be stored
+        logger.warning(f"Failed to store the idempotent response: {e.response['Error']['Message']}")
+
+
+def release_key(dynamodb_client, record_key, claim_token, logger):
+    """Delete a claimed record, so a retry with the same key does the work again."""
+    try:
+        dynamodb_client.delete_item(
+            TableName=IDEMPOTENCY_TABLE_NAME,
+            Key=record_key,
+            ConditionExpression='claim_token = :claim_token',
+            ExpressionAttributeValues={':claim_token': {'S': claim_token}}
+        )
+    except ClientError as e:
+        logger.warning(f"Failed to release the Idempotency-Key: {e.response['Error']['Message']}")
+
+
+def generate_response(status_code, message, cors_headers):
+    """Generate an HTTP response with CORS headers."""
+    return {
+        'statusCode': status_code,
+        'headers': cors_headers,
+        'body': json.dumps(message)
+    }
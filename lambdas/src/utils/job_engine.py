@@ -0,0 +1,370 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timezone
+from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger()
+
+STATUS_PENDING = 'pending'
+STATUS_RUNNING = 'running'
+STATUS_COMPLETED = 'completed'
+STATUS_FAILED = 'failed'
+
+# Items handed to a job type per batch; progress is checkpointed after every batch
+JOB_BATCH_SIZE = int(os.getenv('JOB_BATCH_SIZE', '25'))
+
+# Runs of a job that may end without a checkpoint (crash, timeout) before it is failed
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '5'))
+
+# Time kept back from the worker's deadline to checkpoint and requeue the rest of a job
+JOB_DEADLINE_RESERVE_SECONDS = float(os.getenv('JOB_DEADLINE_RESERVE_SECONDS', '30'))
+
+JOB_RECORD_TTL_SECONDS = 7 * 24 * 3600
+MAX_RECORDED_FAILURES = 50              # Failed items kept on the record, the rest are only counted
+
+# Attributes of a job record in the jobs table, beside the export records of export_assets:
+#   user_id, job_id           key attributes
+#   job_type, params          what to run, as submitted
+#   status                    pending, running, completed or failed
+#   processed, failed, total  items done, items that failed, and items overall when known up front
+#   cursor                    where the next batch starts, set by the job type at each checkpoint
+#   failures                  the first MAX_RECORDED_FAILURES failed items, {item, error}
+#   attempts                  runs since the last checkpoint, reset as the job progresses
+#   lease_token, lease_expires_at
+#                             the run holding the job, and the epoch second its hold ends
+#   last_error                the error the last failed run raised
+#   error                     why a failed job failed
+#   created_at, updated_at, completed_at
+#   expires_at                epoch seconds, DynamoDB TTL attribute
+
+
+class SqsJobQueue:
+    """Job queue on SQS, consumed by the worker Lambda through its event source mapping."""
+
+    def __init__(self, sqs_client, queue_url):
+        self.sqs_client = sqs_client
+        self.queue_url = queue_url
+
+    def send(self, message):
+        self.sqs_client.send_message(QueueUrl=self.queue_url, MessageBody=json.dumps(message))
+
+
+class InMemoryJobQueue:
+    """
+    In-process stand-in for SqsJobQueue, to run the engine without AWS.
+
+    Messages are handed out as the records of an SQS event, so a worker can be driven
+    directly: queue.drain(lambda event: engine.handle_records(event['Records'], context)).
+    Records reported in batchItemFailures are redelivered, up to max_receive_count times,
+    then moved to dead_letters as SQS would move them to a dead-letter queue. The default
+    leaves the engine one more run than JOB_MAX_ATTEMPTS, to fail the job itself first.
+    """
+
+    def __init__(self, max_receive_count=JOB_MAX_ATTEMPTS + 1):
+        self.max_receive_count = max_receive_count
+        self.messages = deque()
+        self.dead_letters = []
+        self._lock = threading.Lock()
+
+    def send(self, message):
+        with self._lock:
+            self.messages.append({'messageId': uuid.uuid4().hex, 'body': json.dumps(message), 'receive_count': 0})
+
+    def receive(self, max_messages=10):
+        """Take up to max_messages messages off the queue, as SQS event records."""
+        with self._lock:
+            taken = [self.messages.popleft() for _ in range(min(max_messages, len(self.messages)))]
+        for message in taken:
+            message['receive_count'] += 1
+        return [{'messageId': message['messageId'], 'body': message['body'],
+                 'attributes': {'ApproximateReceiveCount': str(message['receive_count'])}, '_message': message}
+                for message in taken]
+
+    def drain(self, consumer, max_messages=10):
+        """
+        Deliver messages to consumer until the queue is empty, including those it sends itself.
+
+        Returns:
+            int: The number of deliveries made.
+        """
+        deliveries = 0
+        while True:
+            records = self.receive(max_messages)
+            if not records:
+                return deliveries
+            deliveries += len(records)
+            response = consumer({'Records': records}) or {}
+            failed = {failure['itemIdentifier'] for failure in response.get('batchItemFailures', [])}
+            for record in records:
+                if record['messageId'] not in failed:
+                    continue
+                message = record['_message']
+                with self._lock:
+                    if message['receive_count'] >= self.max_receive_count:
+                        self.dead_letters.append(message)
+                    else:
+                        self.messages.append(message)
+
+
+class JobEngine:
+    """
+    Runs bulk operations as jobs, in batches with a checkpoint after each.
+
+    submit writes the job record and sends its key to the queue. The worker passes the
+    queue's records to handle_records, which runs each job until it completes or the
+    invocation is close to its deadline; then the job is checkpointed and its key sent
+    again, so a job of any size continues over as many invocations as it needs.
+
+    A run holds its job through a lease, taken with a conditional update, so duplicate
+    deliveries do not run a job twice. A run that crashes or times out leaves its last
+    checkpoint behind; SQS redelivers the message and the next run resumes from there,
+    repeating at most one batch, so job types must process items idempotently.
+
+    Job types are objects with:
+        name                              the job_type clients submit
+        validate(params)                  the checked params, raising ValueError if invalid
+        total(params)                     the item count, or None if unknown until the job ends
+        next_batch(job, cursor, limit)    (items, next_cursor), next_cursor None after the last
+        process(job, items)               [{'item', 'error'}] for the items that failed
+    Cursors are stored on the job record, so must be values DynamoDB can hold.
+    """
+
+    def __init__(self, jobs_table, queue, job_types, batch_size=JOB_BATCH_SIZE,
+                 reserve_seconds=JOB_DEADLINE_RESERVE_SECONDS):
+        self.jobs_table = jobs_table
+        self.queue = queue
+        self.job_types = {job_type.name: job_type for job_type in job_types}
+        self.batch_size = batch_size
+        self.reserve_seconds = reserve_seconds
+
+    def submit(self, user_id, job_type, params):
+        """
+        Validate and record a job, then queue it.
+
+        Raises:
+            ValueError: The job type is unknown or its params are invalid.
+
+        Returns:
+            dict: The job record.
+        """
+        if job_type not in self.job_types:
+            raise ValueError(f"Unknown job type '{job_type}', expected one of: {', '.join(sorted(self.job_types))}")
+        params = self.job_types[job_type].validate(params or {})
+
+        now = utc_now()
+        job = {
+            'user_id': user_id,
+            'job_id': uuid.uuid4().hex,
+            'job_type': job_type,
+            'params': params,
+            'status': STATUS_PENDING,
+            'processed': 0,
+            'failed': 0,
+            'failures': [],
+            'attempts': 0,
+            'created_at': now,
+            'updated_at': now,
+            'expires_at': int(time.time()) + JOB_RECORD_TTL_SECONDS
+        }
+        total = self.job_types[job_type].total(params)
+        if total is not None:
+            job['total'] = total
+        self.jobs_table.put_item(Item=job)
+
+        try:
+            self.queue.send({'user_id': user_id, 'job_id': job['job_id']})
+        except Exception:
+            self.finish(job, STATUS_FAILED, error='Failed to queue the job')
+            raise
+        logger.info(f"Submitted {job_type} job {job['job_id']}")
+        return job
+
+    def get(self, user_id, job_id):
+        """Return a job record, or None. Export records, which run elsewhere, are left out."""
+        job = self.jobs_table.get_item(Key={'user_id': user_id, 'job_id': job_id}, ConsistentRead=True).get('Item')
+        return job if job and job.get('job_type') in self.job_types else None
+
+    def handle_records(self, records, context):
+        """
+        Run the jobs of a batch of SQS records.
+
+        Returns:
+            dict: The partial batch response, listing the records to redeliver.
+        """
+        failures = []
+        for record in records:
+            try:
+                key = json.loads(record['body'])
+                self.run(key['user_id'], key['job_id'], context)
+            except Exception as e:
+                logger.error(f"Job message {record['messageId']} failed, it will be redelivered: {str(e)}")
+                failures.append({'itemIdentifier': record['messageId']})
+        return {'batchItemFailures': failures}
+
+    def run(self, user_id, job_id, context):
+        """
+        Run a job from its last checkpoint until it completes or the deadline nears.
+
+        Returns:
+            str: The job's status afterwards, or 'skipped' if another run holds it or it is over.
+        """
+        deadline = time.monotonic() + context.get_remaining_time_in_millis() / 1000 - self.reserve_seconds
+        job = self.claim(user_id, job_id, context)
+        if job is None:
+            return 'skipped'
+        if int(job['attempts']) > JOB_MAX_ATTEMPTS:
+            logger.error(f"Job {job_id} made no progress in {JOB_MAX_ATTEMPTS} runs, failing it")
+            error = f"Job stopped after {JOB_MAX_ATTEMPTS} runs without progress: {job.get('last_error', 'timed out')}"
+            return self.finish(job, STATUS_FAILED, error=error)
+
+        job_type = self.job_types[job['job_type']]
+        try:
+            while True:
+                items, next_cursor = job_type.next_batch(job, job.get('cursor'), self.batch_size)
+                failures = job_type.process(job, items) if items else []
+                job = self.checkpoint(job, len(items), failures, next_cursor)
+                if next_cursor is None:
+                    logger.info(f"Job {job_id} completed: {job['processed']} items, {job['failed']} failed")
+                    return self.finish(job, STATUS_COMPLETED)
+                if time.monotonic() >= deadline:
+                    break
+        except Exception as e:
+            self.release(job, error=str(e))
+            raise
+
+        # Out of time: hand the rest to a fresh invocation rather than risk the timeout
+        self.release(job)
+        self.queue.send({'user_id': user_id, 'job_id': job_id})
+        logger.info(f"Job {job_id} checkpointed at {job['processed']} items and requeued")
+        return STATUS_RUNNING
+
+    def claim(self, user_id, job_id, context):
+        """
+        Take a job's lease until the invocation's deadline, counting the attempt.
+
+        Returns:
+            dict: The job record, or None if it is over or another run holds it.
+        """
+        now = int(time.time())
+        try:
+            return self.jobs_table.update_item(
+                Key={'user_id': user_id, 'job_id': job_id},
+                UpdateExpression=('SET #status = :running, lease_token = :token, lease_expires_at = :lease, '
+                                  'attempts = attempts + :one, updated_at = :now'),
+                ConditionExpression=(Attr('status').eq(STATUS_PENDING)
+                                     | (Attr('status').eq(STATUS_RUNNING) & Attr('lease_expires_at').lt(now))),
+                ExpressionAttributeNames={'#status': 'status'},
+                ExpressionAttributeValues={
+                    ':running': STATUS_RUNNING,
+                    ':token': uuid.uuid4().hex,
+                    ':lease': now + context.get_remaining_time_in_millis() // 1000 + 1,
+                    ':one': 1,
+                    ':now': utc_now()
+                },
+                ReturnValues='ALL_NEW'
+            )['Attributes']
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                logger.warning(f"Job {job_id} is over or held by another run, skipping")
+                return None
+            raise
+
+    def checkpoint(self, job, count, failures, cursor):
+        """
+        Record a processed batch and where the next one starts, while the lease is held.
+
+        Raises:
+            ClientError: ConditionalCheckFailedException if the lease was lost to another run.
+
+        Returns:
+            dict: The updated job record.
+        """
+        recorded = (job.get('failures', []) + failures)[:MAX_RECORDED_FAILURES]
+        attributes = {
+            'processed': job['processed'] + count - len(failures),
+            'failed': job['failed'] + len(failures),
+            'failures': recorded,
+            'attempts': 0,
+            'updated_at': utc_now()
+        }
+        names = {f'#{name}': name for name in attributes}
+        values = {f':{name}': value for name, value in attributes.items()}
+        update = 'SET ' + ', '.join(f'#{name} = :{name}' for name in attributes)
+        if cursor is None:
+            update += ' REMOVE #cursor'
+        else:
+            update += ', #cursor = :cursor'
+            values[':cursor'] = cursor
+        self.jobs_table.update_item(
+            Key={'user_id': job['user_id'], 'job_id': job['job_id']},
+            UpdateExpression=update,
+            ConditionExpression=Attr('lease_token').eq(job['lease_token']),
+            ExpressionAttributeNames={**names, '#cursor': 'cursor'},
+            ExpressionAttributeValues=values
+        )
+        job = {**job, **attributes, 'cursor': cursor}
+        return job if cursor is not None else {name: value for name, value in job.items() if name != 'cursor'}
+
+    def release(self, job, error=None):
+        """End a run's lease early, so the job's next message can claim it at once."""
+        values = {':zero': 0}
+        update = 'SET lease_expires_at = :zero'
+        if error:
+            update += ', last_error = :error'
+            values[':error'] = error
+        try:
+            self.jobs_table.update_item(
+                Key={'user_id': job['user_id'], 'job_id': job['job_id']},
+                UpdateExpression=update,
+                ConditionExpression=Attr('lease_token').eq(job['lease_token']),
+                ExpressionAttributeValues=values
+            )
+        except ClientError as e:
+            logger.warning(f"Failed to release job {job['job_id']}: {e.response['Error']['Message']}")
+
+    def finish(self, job, status, error=None):
+        """Record a job's final status and drop its lease."""
+        attributes = {'status': status, 'updated_at': utc_now(), 'completed_at': utc_now()}
+        if error:
+            attributes['error'] = error
+        self.jobs_table.update_item(
+            Key={'user_id': job['user_id'], 'job_id': job['job_id']},
+            UpdateExpression=('SET ' + ', '.join(f'#{name} = :{name}' for name in attributes)
+                              + ' REMOVE lease_token, lease_expires_at'),
+            ExpressionAttributeNames={f'#{name}': name for name in attributes},
+            ExpressionAttributeValues={f':{name}': value for name, value in attributes.items()}
+        )
+        return status
+
+
+def job_summary(job):
+    """Return the client view of a job and its progress."""
+    summary = {
+        'jobId': job['job_id'],
+        'jobType': job['job_type'],
+        'status': job['status'],
+        'processed': job['processed'],
+        'failed': job['failed'],
+        'createdAt': job['created_at'],
+        'updatedAt': job['updated_at']
+    }
+    if job.get('total') is not None:
+        summary['total'] = job['total']
+    if job.get('failures'):
+        summary['failures'] = job['failures']
+    if job.get('completed_at'):
+        summary['completedAt'] = job['completed_at']
+    if job.get('error'):
+        summary['error'] = job['error']
+    return summary
+
+
+def utc_now():
+    """Return the current time as an ISO 8601 UTC timestamp."""
+    return datetime.now(timezone.utc).isoformat()
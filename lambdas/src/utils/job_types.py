@@ -0,0 +1,196 @@
+import datetime
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+from metadata_utils import write_batches
+from storage_utils import derived_key, document_key, THUMBNAIL_ARTIFACT, EXCERPT_ARTIFACT, CHUNK_MANIFEST_ARTIFACT
+
+# Bulk operations run by the job engine (job_engine.JobEngine). The submit endpoint only
+# validates, through the classes; the worker runs instances bound to its clients.
+
+MAX_DOCUMENT_NAMES = 1000               # document_names are kept on the job record
+
+
+class DeleteDocumentsJob:
+    """Delete the documents under a prefix or of a list of names, with their derived artifacts."""
+
+    name = 'delete_documents'
+
+    def __init__(self, s3_client, dynamodb_resource, bucket_name, table_name):
+        self.s3_client = s3_client
+        self.dynamodb_resource = dynamodb_resource
+        self.bucket_name = bucket_name
+        self.table_name = table_name
+        self.table = dynamodb_resource.Table(table_name)
+
+    @staticmethod
+    def validate(params):
+        """Check for either 'prefix' or 'document_names', as export_assets takes them."""
+        prefix = params.get('prefix')
+        document_names = params.get('document_names')
+        if (prefix is None) == (document_names is None):
+            raise ValueError("Provide either 'prefix' or 'document_names'")
+
+        if document_names is not None:
+            if not isinstance(document_names, list) or not all(isinstance(name, str) and name
+                                                                for name in document_names):
+                raise ValueError("'document_names' must be a list of document names")
+            document_names = list(dict.fromkeys(document_names))
+            if not document_names or len(document_names) > MAX_DOCUMENT_NAMES:
+                raise ValueError(f"'document_names' must hold 1 to {MAX_DOCUMENT_NAMES} names")
+            return {'document_names': document_names}
+
+        # An empty prefix would select every document, too easily sent by mistake
+        if not isinstance(prefix, str) or not prefix:
+            raise ValueError("'prefix' must be a non-empty string")
+        return {'prefix': prefix}
+
+    @staticmethod
+    def total(params):
+        return len(params['document_names']) if 'document_names' in params else None
+
+    def next_batch(self, job, cursor, limit):
+        """Take the next names from the list, or query the next page of names under the prefix."""
+        params = job['params']
+        if 'document_names' in params:
+            start = int(cursor or 0)
+            names = params['document_names'][start:start + limit]
+            return names, (start + limit if start + limit < len(params['document_names']) else None)
+
+        query = {
+            'KeyConditionExpression': (Key('user_id').eq(job['user_id'])
+                                       & Key('document_name').begins_with(params['prefix'])),
+            'ProjectionExpression': 'document_name',
+            'Limit': limit
+        }
+        if cursor:
+            query['ExclusiveStartKey'] = cursor
+        response = self.table.query(**query)
+        return [item['document_name'] for item in response['Items']], response.get('LastEvaluatedKey')
+
+    def process(self, job, names):
+        """
+        Delete each document's object and artifacts in one request, then the metadata items
+        of those deleted. Deleting twice is harmless, so a repeated batch is too.
+        """
+        user_id = job['user_id']
+        objects = []
+        for name in names:
+            objects.append({'Key': document_key(user_id, name)})
+            objects.extend({'Key': derived_key(user_id, name, artifact)}
+                           for artifact in (THUMBNAIL_ARTIFACT, EXCERPT_ARTIFACT, CHUNK_MANIFEST_ARTIFACT))
+        response = self.s3_client.delete_objects(Bucket=self.bucket_name, Delete={'Objects': objects, 'Quiet': True})
+
+        # Orphaned artifacts are harmless, only a document that is still stored has failed
+        failures = {}
+        for error in response.get('Errors', []):
+            parsed = parse_user_key(user_id, error['Key'])
+            if parsed in names:
+                failures[parsed] = f"{error['Code']}: {error['Message']}"
+        deleted = [name for name in names if name not in failures]
+
+        failures.update(batch_delete_items(
+            self.dynamodb_resource, self.table_name,
+            {name: {'user_id': user_id, 'document_name': name} for name in deleted}
+        ))
+        return [{'item': name, 'error': error} for name, error in failures.items()]
+
+
+class BackfillUploadDatesJob:
+    """
+    Rewrite upload_date values of the form str(datetime.now()), written before timestamps were
+    ISO 8601 with an offset, so every document is listed by the upload_date index in order.
+    """
+
+    name = 'backfill_upload_dates'
+
+    def __init__(self, dynamodb_resource, table_name):
+        self.table = dynamodb_resource.Table(table_name)
+
+    @staticmethod
+    def validate(params):
+        if params:
+            raise ValueError("backfill_upload_dates takes no parameters")
+        return {}
+
+    @staticmethod
+    def total(params):
+        return None
+
+    def next_batch(self, job, cursor, limit):
+        query = {
+            'KeyConditionExpression': Key('user_id').eq(job['user_id']),
+            'ProjectionExpression': 'document_name, upload_date',
+            'Limit': limit
+        }
+        if cursor:
+            query['ExclusiveStartKey'] = cursor
+        response = self.table.query(**query)
+        return response['Items'], response.get('LastEvaluatedKey')
+
+    def process(self, job, items):
+        """Rewrite legacy values, each conditional on the value read so a newer write is kept."""
+        failures = []
+        for item in items:
+            value = item.get('upload_date')
+            if not value or 'T' in value:
+                continue
+            try:
+                self.table.update_item(
+                    Key={'user_id': job['user_id'], 'document_name': item['document_name']},
+                    UpdateExpression='SET upload_date = :upload_date',
+                    ConditionExpression='upload_date = :legacy',
+                    ExpressionAttributeValues={':upload_date': to_iso_timestamp(value), ':legacy': value}
+                )
+            except ValueError:
+                failures.append({'item': item['document_name'], 'error': f"Unrecognised upload_date '{value}'"})
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    raise
+        return failures
+
+
+def to_iso_timestamp(value):
+    """
+    Convert a legacy upload_date to the format of metadata_utils.utc_timestamp.
+
+    Legacy values carry no offset; Lambda runs in UTC, so they are read as UTC.
+    """
+    parsed = datetime.datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return parsed.astimezone(datetime.timezone.utc).isoformat(timespec='microseconds')
+
+
+def parse_user_key(user_id, key):
+    """Return the document name of one of the user's document keys, or None for other keys."""
+    prefix = document_key(user_id, '')
+    return key[len(prefix):] if key.startswith(prefix) else None
+
+
+def batch_delete_items(dynamodb_resource, table_name, keys):
+    """
+    Delete items with BatchWriteItem, retrying unprocessed ones.
+
+    Args:
+        keys (dict): Item keys, by the name failures are reported under.
+
+    Returns:
+        dict: An error message by name, for the items still unprocessed after the retries.
+    """
+    names_by_key = {tuple(sorted(key.items())): name for name, key in keys.items()}
+    unprocessed = write_batches(dynamodb_resource, table_name,
+                                [{'DeleteRequest': {'Key': key}} for key in keys.values()])
+    return {names_by_key[tuple(sorted(request['DeleteRequest']['Key'].items()))]: 'Throttled, not deleted'
+            for request in unprocessed}
+
+
+def job_types_for(s3_client, dynamodb_resource, bucket_name, table_name):
+    """Return the runnable job types, bound to the worker's clients."""
+    return [
+        DeleteDocumentsJob(s3_client, dynamodb_resource, bucket_name, table_name),
+        BackfillUploadDatesJob(dynamodb_resource, table_name)
+    ]
+
+
+# The job types as submitted, for validation before anything runs
+JOB_TYPES = [DeleteDocumentsJob, BackfillUploadDatesJob]
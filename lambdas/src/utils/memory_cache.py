@@ -0,0 +1,46 @@
+import time
+from collections import OrderedDict
+
+
+class MemoryCache:
+    """
+    An in-container LRU cache bounded by entry count, total bytes and entry age.
+
+    Lambda keeps module state between warm invocations, so a module-level instance
+    serves repeated requests from the same container. Sizes are supplied by the caller,
+    typically the length of the value's serialized form.
+    """
+
+    def __init__(self, max_entries, max_bytes, ttl_seconds):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.total_bytes = 0
+        self._entries = OrderedDict()   # key -> (value, size, stored_at), least recently used first
+
+    def get(self, key):
+        """Return the cached value, or None if it is missing or older than the TTL."""
+        entry = self._entries.get(key)
+        if not entry:
+            return None
+        if time.monotonic() - entry[2] >= self.ttl_seconds:
+            self.discard(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, value, size):
+        """Store a value, evicting least recently used entries to stay within the bounds."""
+        self.discard(key)
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (value, size, time.monotonic())
+        self.total_bytes += size
+        while len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes:
+            self.discard(next(iter(self._entries)))
+
+    def discard(self, key):
+        """Remove a key from the cache, if present."""
+        entry = self._entries.pop(key, None)
+        if entry:
+            self.total_bytes -= entry[1]
@@ -0,0 +1,185 @@
+import datetime
+import random
+import time
+from compression_utils import CODEC_NONE
+from storage_utils import document_key
+
+# Attributes every document item carries, whichever path wrote it:
+#   user_id, document_name    key attributes
+#   storage_key               S3 key of the stored object
+#   size                      size of the document as uploaded, in bytes
+#   stored_size               size of the S3 object (differs when compressed)
+#   content_type              media type of the document
+#   content_codec             compression codec of the stored object
+#   etag                      S3 ETag of the stored object
+#   checksum_algorithm        algorithm of the checksum below (e.g. SHA256)
+#   checksum                  base64 checksum of the stored object as reported by S3
+#   upload_date               time the document was last written, ISO 8601 in UTC so it sorts
+#                             as a string (the sort key of the user_id + upload_date index)
+# and, once derive_previews has run:
+#   preview                   media_type, thumbnail_key, excerpt_key, and the etag derived from
+
+BATCH_WRITE_MAX_ITEMS = 25
+BATCH_WRITE_ATTEMPTS = 6
+BATCH_WRITE_BASE_DELAY_SECONDS = 0.05
+BATCH_GET_MAX_KEYS = 100
+
+
+class UnprocessedKeysError(Exception):
+    """Items could not be read, the table kept throttling their keys."""
+
+
+def utc_timestamp():
+    """
+    Return the current time as an ISO 8601 UTC timestamp.
+
+    Always with microseconds and the same offset, so timestamps have a fixed width and
+    compare correctly as strings.
+    """
+    return datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='microseconds')
+
+
+def build_document_item(user_id, document_name, size, content_type, etag,
+                        checksum_algorithm=None, checksum=None, content_codec=CODEC_NONE,
+                        stored_size=None, upload_date=None):
+    """
+    Build a document metadata item in DynamoDB attribute-value format.
+
+    Args:
+        user_id (str): The owner of the document.
+        document_name (str): The document name.
+        size (int): The document size in bytes, before compression.
+        content_type (str): The document content type.
+        etag (str): The S3 ETag of the stored object.
+        checksum_algorithm (str): The checksum algorithm, if a checksum is recorded.
+        checksum (str): The base64 checksum of the stored object.
+        content_codec (str): The compression codec of the stored object.
+        stored_size (int): The size of the stored object, defaults to size.
+        upload_date (str): The ISO 8601 write time, defaults to now.
+
+    Returns:
+        dict: The DynamoDB item.
+    """
+    item = {
+        'user_id': {'S': user_id},
+        'document_name': {'S': document_name},
+        'storage_key': {'S': document_key(user_id, document_name)},
+        'size': {'N': str(size)},
+        'stored_size': {'N': str(stored_size if stored_size is not None else size)},
+        'content_type': {'S': content_type},
+        'content_codec': {'S': content_codec},
+        'etag': {'S': etag.strip('"')},
+        'upload_date': {'S': upload_date or utc_timestamp()}
+    }
+    if checksum:
+        item['checksum_algorithm'] = {'S': checksum_algorithm}
+        item['checksum'] = {'S': checksum}
+    return item
+
+
+def build_document_item_from_head(user_id, document_name, head, upload_date=None):
+    """
+    Build a document metadata item from a head_object (or get_object) response.
+
+    The original size and codec come from the object metadata written at upload time.
+    """
+    metadata = head.get('Metadata', {})
+    checksum_algorithm, checksum = None, None
+    for algorithm in ('SHA256', 'CRC32C', 'SHA1', 'CRC32'):
+        if head.get(f'Checksum{algorithm}'):
+            checksum_algorithm, checksum = algorithm, head[f'Checksum{algorithm}']
+            break
+
+    return build_document_item(
+        user_id,
+        document_name,
+        size=int(metadata.get('original-size', head['ContentLength'])),
+        content_type=head.get('ContentType', 'application/octet-stream'),
+        etag=head['ETag'],
+        checksum_algorithm=checksum_algorithm,
+        checksum=checksum,
+        content_codec=metadata.get('content-codec', CODEC_NONE),
+        stored_size=head['ContentLength'],
+        upload_date=upload_date
+    )
+
+
+def save_document_item(dynamodb_client, table_name, item):
+    """
+    Write a document item, replacing the schema attributes and keeping any others.
+
+    An update rather than a put, so attributes added asynchronously (such as previews)
+    survive a re-upload.
+    """
+    key = {name: item[name] for name in ('user_id', 'document_name')}
+    attributes = {name: value for name, value in item.items() if name not in key}
+    removed = [name for name in ('checksum_algorithm', 'checksum') if name not in attributes]
+
+    update_expression = 'SET ' + ', '.join(f'#{name} = :{name}' for name in attributes)
+    if removed:
+        update_expression += ' REMOVE ' + ', '.join(f'#{name}' for name in removed)
+
+    dynamodb_client.update_item(
+        TableName=table_name,
+        Key=key,
+        UpdateExpression=update_expression,
+        ExpressionAttributeNames={f'#{name}': name for name in list(attributes) + removed},
+        ExpressionAttributeValues={f':{name}': value for name, value in attributes.items()}
+    )
+
+
+def write_batches(dynamodb, table_name, requests):
+    """
+    Write put and delete requests with BatchWriteItem, 25 at a time.
+
+    Unprocessed requests, left over when the table throttles, are retried with full-jitter
+    backoff. Works with a client or a resource, given requests in the matching format.
+
+    Returns:
+        list: The requests still unprocessed after BATCH_WRITE_ATTEMPTS attempts.
+    """
+    failed = []
+    for start in range(0, len(requests), BATCH_WRITE_MAX_ITEMS):
+        pending = requests[start:start + BATCH_WRITE_MAX_ITEMS]
+        for attempt in range(BATCH_WRITE_ATTEMPTS):
+            if attempt:
+                time.sleep(random.uniform(0, BATCH_WRITE_BASE_DELAY_SECONDS * 2 ** attempt))
+            response = dynamodb.batch_write_item(RequestItems={table_name: pending})
+            pending = response.get('UnprocessedItems', {}).get(table_name, [])
+            if not pending:
+                break
+        failed.extend(pending)
+    return failed
+
+
+def get_document_items(dynamodb, table_name, user_id, names):
+    """
+    Read the items of a user's documents with BatchGetItem, 100 keys at a time.
+
+    Unprocessed keys, left over when the table throttles, are retried with full-jitter
+    backoff as in write_batches. Takes a boto3 DynamoDB resource.
+
+    Returns:
+        list: The items, in the order of names. Names without an item are left out.
+
+    Raises:
+        UnprocessedKeysError: Keys were still unprocessed after BATCH_WRITE_ATTEMPTS attempts.
+    """
+    names = list(dict.fromkeys(names))     # A key may only appear once per request
+    items = {}
+    for start in range(0, len(names), BATCH_GET_MAX_KEYS):
+        keys = [{'user_id': user_id, 'document_name': name} for name in names[start:start + BATCH_GET_MAX_KEYS]]
+        request = {table_name: {'Keys': keys}}
+        for attempt in range(BATCH_WRITE_ATTEMPTS):
+            if attempt:
+                time.sleep(random.uniform(0, BATCH_WRITE_BASE_DELAY_SECONDS * 2 ** attempt))
+            response = dynamodb.batch_get_item(RequestItems=request)
+            for item in response['Responses'].get(table_name, []):
+                items[item['document_name']] = item
+            request = response.get('UnprocessedKeys')
+            if not request:
+                break
+        if request:
+            raise UnprocessedKeysError(f"{len(request[table_name]['Keys'])} keys of {table_name} still unprocessed "
+                                       f"after {BATCH_WRITE_ATTEMPTS} attempts")
+    return [items[name] for name in names if name in items]
@@ -0,0 +1,36 @@
+import os
+import json
+import time
+
+# CloudWatch namespace for all platform metrics
+METRICS_NAMESPACE = os.getenv('METRICS_NAMESPACE', 'DigitalAssetPlatform')
+
+
+def emit_metrics(metrics, dimensions=None, units=None):
+    """
+    Emit metrics in CloudWatch Embedded Metric Format.
+
+    The record is printed to stdout, where CloudWatch Logs extracts the metrics
+    asynchronously, so no PutMetricData call sits on the request path.
+
+    Args:
+        metrics (dict): Metric names mapped to their values.
+        dimensions (dict): Optional dimension names mapped to their values.
+        units (dict): Optional metric names mapped to CloudWatch units, defaults to Count.
+    """
+    dimensions = dimensions or {}
+    units = units or {}
+    record = {
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': METRICS_NAMESPACE,
+                'Dimensions': [list(dimensions)],
+                'Metrics': [{'Name': name, 'Unit': units.get(name, 'Count')} for name in metrics]
+            }]
+        },
+        **dimensions,
+        **metrics
+    }
+    # Printed rather than logged, the log formatter's prefix would break EMF parsing
+    print(json.dumps(record), flush=True)
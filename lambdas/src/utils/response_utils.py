@@ -0,0 +1,94 @@
+import os
+import gzip
+import base64
+from decimal import Decimal
+from compression_utils import CODEC_GZIP, accepts_encoding
+
+# Bodies below this size fit in a packet or two, so gzip only costs CPU
+RESPONSE_GZIP_MIN_BYTES = int(os.getenv('RESPONSE_GZIP_MIN_BYTES', '1400'))
+
+# Tuned with scripts/benchmark_response_gzip.py on a 5000-document listing: levels 4-8 tie
+# for the best net saving at 2 Mbit/s, levels 1-3 win at 20 Mbit/s, where 4 is ~15 ms behind
+# and 6 ~35 ms. Level 4 stays closest to the best on both links.
+RESPONSE_GZIP_LEVEL = int(os.getenv('RESPONSE_GZIP_LEVEL', '4'))
+
+
+def json_default(value):
+    """json.dumps default for the Decimal values the DynamoDB resource API returns for numbers."""
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def etag_matches(event, etag):
+    """
+    Check the request's If-None-Match header against an ETag.
+
+    Comparison is weak, as RFC 9110 requires for If-None-Match, so W/ prefixes are ignored.
+    """
+    headers = event.get('headers') or {}
+    if_none_match = headers.get('if-none-match') or headers.get('If-None-Match')
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+
+    opaque = etag[2:] if etag.startswith('W/') else etag
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if (candidate[2:] if candidate.startswith('W/') else candidate) == opaque:
+            return True
+    return False
+
+
+def not_modified_response(etag, cors_headers, extra_headers=None):
+    """Return a body-less 304 response carrying the current ETag."""
+    return {
+        'statusCode': 304,
+        'headers': {**cors_headers, 'ETag': etag, **(extra_headers or {})},
+        'body': ''
+    }
+
+
+def compress_response(event, response, logger=None):
+    """
+    Gzip an API Gateway proxy response when the body is large enough and the client accepts gzip.
+
+    Responses that are already base64 encoded or carry a Content-Encoding are passed through.
+
+    Args:
+        event (dict): The Lambda event object containing request headers.
+        response (dict): The proxy response returned by the handler.
+        logger (logging.Logger): Optional logger instance.
+
+    Returns:
+        dict: The response, gzip compressed where worthwhile.
+    """
+    body = response.get('body')
+    headers = response.get('headers') or {}
+
+    if not isinstance(body, str) or response.get('isBase64Encoded') or 'Content-Encoding' in headers:
+        return response
+
+    raw_body = body.encode('utf-8')
+    if len(raw_body) < RESPONSE_GZIP_MIN_BYTES or not accepts_encoding(event, CODEC_GZIP):
+        return response
+
+    compressed = gzip.compress(raw_body, compresslevel=RESPONSE_GZIP_LEVEL, mtime=0)
+    if len(compressed) >= len(raw_body):
+        return response
+
+    if logger:
+        logger.info(f"Gzip compressed response body from {len(raw_body)} to {len(compressed)} bytes")
+
+    return {
+        **response,
+        'headers': {
+            **headers,
+            'Content-Type': headers.get('Content-Type', 'application/json'),
+            'Content-Encoding': CODEC_GZIP,
+            'Vary': 'Accept-Encoding'
+        },
+        'body': base64.b64encode(compressed).decode('utf-8'),
+        'isBase64Encoded': True
+    }
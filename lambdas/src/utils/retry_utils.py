@@ -0,0 +1,232 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+from botocore.config import Config
+from botocore.exceptions import ClientError, ConnectionError as BotocoreConnectionError, HTTPClientError
+
+logger = logging.getLogger()
+
+THROTTLING = 'throttling'
+TRANSIENT = 'transient'
+
+# Error codes by class; anything else (AccessDenied, NoSuchKey, failed conditions) is final
+THROTTLING_ERROR_CODES = {
+    'SlowDown', 'ProvisionedThroughputExceededException', 'TooManyRequestsException', 'ThrottlingException',
+    'Throttling', 'ThrottledException', 'RequestLimitExceeded', 'RequestThrottled', 'RequestThrottledException'
+}
+TRANSIENT_ERROR_CODES = {
+    'InternalError', 'InternalServerError', 'InternalFailure', 'ServiceUnavailable', 'ServiceUnavailableException',
+    'RequestTimeout', 'RequestTimeoutException', 'PriorRequestNotComplete'
+}
+TRANSIENT_STATUS_CODES = {500, 502, 503, 504}
+
+# Retries allowed per error class within one call. Throttling gets more, since it clears as
+# callers spread out; a dependency failing with server errors rarely recovers within a request.
+RETRY_BUDGETS = {
+    THROTTLING: int(os.getenv('RETRY_THROTTLING_ATTEMPTS', '5')),
+    TRANSIENT: int(os.getenv('RETRY_TRANSIENT_ATTEMPTS', '2'))
+}
+RETRY_BASE_DELAY_SECONDS = float(os.getenv('RETRY_BASE_DELAY_SECONDS', '0.05'))
+RETRY_MAX_DELAY_SECONDS = float(os.getenv('RETRY_MAX_DELAY_SECONDS', '2'))
+
+# Time kept back from the invocation's deadline to build and return the response
+RETRY_DEADLINE_RESERVE_SECONDS = float(os.getenv('RETRY_DEADLINE_RESERVE_SECONDS', '1'))
+
+# Calls failing in a row, after their retries, before a dependency's circuit opens
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', '5'))
+CIRCUIT_RESET_SECONDS = float(os.getenv('CIRCUIT_RESET_SECONDS', '10'))
+
+# Clients given to RetryPolicy.install make a single attempt per retry botocore would make itself,
+# so retries are not multiplied and all of them respect the invocation's deadline
+RETRY_CLIENT_CONFIG = Config(retries={'total_max_attempts': 1, 'mode': 'standard'})
+
+
+class CircuitOpenError(Exception):
+    """A dependency's circuit is open, the call was not made."""
+
+    def __init__(self, dependency, retry_after):
+        super().__init__(f"{dependency} is unavailable, failing fast for {retry_after:.0f}s")
+        self.dependency = dependency
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Per-container circuit breaker of one dependency.
+
+    While closed, calls go through and calls that fail with throttling or server errors
+    after their retries are counted. Once failure_threshold calls in a row have failed the
+    circuit opens, and calls fail at once with CircuitOpenError for reset_seconds. Then a
+    single trial call goes through: if it succeeds the circuit closes, if not it opens again.
+    """
+
+    def __init__(self, name, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_seconds=CIRCUIT_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.trial_started_at = None
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Let a call through, or raise CircuitOpenError while the circuit is open."""
+        with self._lock:
+            if self.opened_at is None:
+                return
+            now = time.monotonic()
+            waited = now - self.opened_at
+            # A trial whose outcome was never recorded counts as over after reset_seconds
+            trial_running = self.trial_started_at is not None and now - self.trial_started_at < self.reset_seconds
+            if waited < self.reset_seconds or trial_running:
+                raise CircuitOpenError(self.name, max(1.0, self.reset_seconds - waited))
+            self.trial_started_at = now
+
+    def record_success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                logger.info(f"Circuit of {self.name} closed")
+            self.failures = 0
+            self.opened_at = None
+            self.trial_started_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.trial_started_at is not None or (self.opened_at is None
+                                                     and self.failures >= self.failure_threshold):
+                logger.warning(f"Circuit of {self.name} opened after {self.failures} failed calls")
+                self.opened_at = time.monotonic()
+                self.trial_started_at = None
+
+
+_circuit_breakers = {}
+_circuit_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(name):
+    """Return the container's circuit breaker of a dependency, shared by all its clients."""
+    with _circuit_breakers_lock:
+        if name not in _circuit_breakers:
+            _circuit_breakers[name] = CircuitBreaker(name)
+        return _circuit_breakers[name]
+
+
+def classify_attempt(response=None, caught_exception=None):
+    """Return the error class of one attempt: THROTTLING, TRANSIENT, or None if it is final."""
+    if caught_exception is not None:
+        return TRANSIENT if isinstance(caught_exception, (BotocoreConnectionError, HTTPClientError)) else None
+    if response is None:
+        return None
+    parsed = response[1] or {}
+    code = parsed.get('Error', {}).get('Code')
+    if code in THROTTLING_ERROR_CODES:
+        return THROTTLING
+    status = parsed.get('ResponseMetadata', {}).get('HTTPStatusCode') or getattr(response[0], 'status_code', 200)
+    if code in TRANSIENT_ERROR_CODES or status in TRANSIENT_STATUS_CODES:
+        return TRANSIENT
+    return None
+
+
+class RetryPolicy:
+    """
+    Retries of AWS calls with per-error-class budgets and full-jitter backoff, bounded by
+    the invocation's remaining time, in front of a circuit breaker per dependency.
+
+    The policy hooks into botocore's own retry events, so every call made through an
+    installed client is covered without wrapping call sites. Each retry sleeps a random
+    time between zero and base_delay * 2**retries, capped at max_delay, so callers
+    throttled together do not retry together. A retry that would end past the deadline is
+    not made, and the error is returned while there is still time to answer.
+
+    Lambda runs one invocation at a time per container, so the deadline is kept on the
+    policy; call start_invocation at the top of every invocation.
+    """
+
+    def __init__(self, budgets=None, base_delay=RETRY_BASE_DELAY_SECONDS, max_delay=RETRY_MAX_DELAY_SECONDS,
+                 reserve_seconds=RETRY_DEADLINE_RESERVE_SECONDS):
+        self.budgets = budgets or RETRY_BUDGETS
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.reserve_seconds = reserve_seconds
+        self.deadline = None
+
+    def start_invocation(self, context):
+        """Bound this invocation's retries by the time the Lambda context has left."""
+        remaining = context.get_remaining_time_in_millis() / 1000 if context else None
+        self.deadline = time.monotonic() + remaining - self.reserve_seconds if remaining else None
+
+    def install(self, *clients):
+        """
+        Register the policy on boto3 clients (or resources) created with RETRY_CLIENT_CONFIG.
+
+        Returns:
+            list: The clients, for chaining at module level.
+        """
+        for client in clients:
+            client = getattr(getattr(client, 'meta', None), 'client', client)    # Accept boto3 resources
+            breaker = get_circuit_breaker(client.meta.service_model.service_name)
+            client.meta.events.register('before-call', lambda breaker=breaker, **kwargs: breaker.before_call())
+            client.meta.events.register(
+                'needs-retry', lambda breaker=breaker, **kwargs: self.needs_retry(breaker, **kwargs)
+            )
+        return list(clients)
+
+    def delay(self, retries):
+        """Return the full-jitter sleep before retry number retries (0 based)."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** retries)))
+
+    def needs_retry(self, breaker, response=None, caught_exception=None, request_dict=None, operation=None, **kwargs):
+        """
+        Decide after each attempt whether to retry, as botocore's needs-retry handler.
+
+        Returns:
+            float: Seconds to sleep before the retry, or None to return the outcome.
+        """
+        error_class = classify_attempt(response, caught_exception)
+        if error_class is None:
+            breaker.record_success()    # Answered, even if with an error of the caller's making
+            return None
+
+        retries = request_dict['context'].setdefault('retries_by_class', {}) if request_dict else {}
+        used = retries.get(error_class, 0)
+        delay = self.delay(sum(retries.values()))
+        name = getattr(operation, 'name', 'call')
+        if used >= self.budgets.get(error_class, 0):
+            logger.warning(f"{breaker.name} {name} failed with {error_class} errors after {used} retries")
+        elif self.deadline is not None and time.monotonic() + delay > self.deadline:
+            logger.warning(f"{breaker.name} {name} failed with {error_class} errors, no time left to retry")
+        else:
+            retries[error_class] = used + 1
+            logger.info(f"{breaker.name} {name} {error_class} error, retry {used + 1} in {delay * 1000:.0f} ms")
+            return delay
+
+        breaker.record_failure()
+        return None
+
+
+def is_unavailable(error):
+    """Check for an error meaning a dependency is overloaded or down, rather than a failed request."""
+    if isinstance(error, CircuitOpenError):
+        return True
+    if isinstance(error, ClientError):
+        return classify_attempt((None, error.response)) is not None
+    return isinstance(error, (BotocoreConnectionError, HTTPClientError))
+
+
+def unavailable_response(error, cors_headers):
+    """
+    Return a 503 asking the client to come back later.
+
+    Retry-After is the time until the circuit closes, or a second for throttling, so
+    clients back off rather than add to the load.
+    """
+    retry_after = error.retry_after if isinstance(error, CircuitOpenError) else 1
+    return {
+        'statusCode': 503,
+        'headers': {**cors_headers, 'Retry-After': str(int(round(retry_after)))},
+        'body': json.dumps('Service temporarily unavailable, retry later')
+    }
@@ -0,0 +1,79 @@
+from urllib.parse import unquote_plus
+
+# Prefixes in the assets bucket that hold platform-generated objects rather than user documents
+DERIVED_PREFIX = 'derived/'
+INDEX_PREFIX = 'index/'
+EXPORT_PREFIX = 'exports/'
+STAGING_PREFIX = 'staging/'
+RESERVED_PREFIXES = (DERIVED_PREFIX, INDEX_PREFIX, EXPORT_PREFIX, STAGING_PREFIX)
+
+# Derived artifact names under derived/{user_id}/{document_name}/
+THUMBNAIL_ARTIFACT = 'thumbnail.jpg'
+EXCERPT_ARTIFACT = 'excerpt.txt'
+CHUNK_MANIFEST_ARTIFACT = 'chunks.json'   # Content-defined chunks, for delta updates
+
+
+def document_key(user_id, document_name):
+    """Return the S3 key a user's document is stored under."""
+    return f'{user_id}/{document_name}'
+
+
+def derived_key(user_id, document_name, artifact):
+    """Return the S3 key of an artifact derived from a user's document."""
+    return f'{DERIVED_PREFIX}{user_id}/{document_name}/{artifact}'
+
+
+def staging_key(user_id, token):
+    """Return the S3 key an object is staged under before it replaces one of a user's documents."""
+    return f'{STAGING_PREFIX}{user_id}/{token}'
+
+
+def name_index_key(user_id):
+    """Return the S3 key of a user's document name trigram index."""
+    return f'{INDEX_PREFIX}{user_id}/names.trg'
+
+
+def content_segment_prefix(user_id):
+    """Return the S3 prefix holding a user's full-text index segments."""
+    return f'{INDEX_PREFIX}{user_id}/content/'
+
+
+def content_segment_key(user_id, sequence, level=0):
+    """
+    Return the S3 key of a full-text index segment.
+
+    Sequence numbers are zero padded so keys sort oldest first; a merged segment takes the
+    newest sequence number of its inputs and a higher level.
+    """
+    return f'{content_segment_prefix(user_id)}{int(sequence):040d}-{level:02d}.seg'
+
+
+def export_key(user_id, export_id):
+    """Return the S3 key of a zip archive built by an export."""
+    return f'{EXPORT_PREFIX}{user_id}/{export_id}.zip'
+
+
+def parse_content_segment_key(key):
+    """Return the (sequence, level) of a segment key."""
+    sequence, level = key.rsplit('/', 1)[-1][:-len('.seg')].split('-')
+    return int(sequence), int(level)
+
+
+def parse_document_key(key):
+    """
+    Split a document key into its user ID and document name.
+
+    Args:
+        key (str): The S3 object key, URL-encoded as in S3 event notifications or plain.
+
+    Returns:
+        tuple: (user_id, document_name), or None for keys that are not user documents.
+    """
+    key = unquote_plus(key)
+    if key.startswith(RESERVED_PREFIXES) or '/' not in key:
+        return None
+
+    user_id, document_name = key.split('/', 1)
+    if not user_id or not document_name:
+        return None
+    return user_id, document_name
@@ -0,0 +1,196 @@
+import heapq
+from collections import defaultdict
+
+# Serialized layout (all integers are LEB128 varints):
+#   magic | name count | (length, utf-8 name)* | trigram count | (length, utf-8 trigram, length, postings)*
+# Names are sorted and identified by position. Each posting list holds the ascending
+# IDs of the names containing the trigram, delta encoded, so most entries take one byte.
+MAGIC = b'TRG1'
+
+
+def encode_varint(value, out):
+    """Append an unsigned integer to a bytearray as a LEB128 varint."""
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def decode_varint(buffer, offset):
+    """Read a LEB128 varint from the buffer, returning the value and the next offset."""
+    value, shift = 0, 0
+    while True:
+        byte = buffer[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def name_trigrams(name):
+    """Return the set of lowercase trigrams in a name."""
+    lowered = name.lower()
+    return {lowered[i:i + 3] for i in range(len(lowered) - 2)}
+
+
+def encode_postings(ids):
+    """Delta encode an ascending list of IDs."""
+    out, previous = bytearray(), 0
+    for name_id in ids:
+        encode_varint(name_id - previous, out)
+        previous = name_id
+    return bytes(out)
+
+
+def decode_postings(data):
+    """Decode a delta encoded posting list into ascending IDs."""
+    ids, offset, current = [], 0, 0
+    while offset < len(data):
+        delta, offset = decode_varint(data, offset)
+        current += delta
+        ids.append(current)
+    return ids
+
+
+class TrigramIndex:
+    """
+    A compact substring index over one user's document names.
+
+    Posting lists stay encoded in memory and are only decoded for the trigrams of a
+    query, so loading and caching a 100k-name index is cheap.
+    """
+
+    def __init__(self, names, postings):
+        self.names = names          # Sorted document names, position is the name ID
+        self.postings = postings    # Trigram -> encoded posting list
+
+    @classmethod
+    def build(cls, names):
+        """Build an index from an iterable of document names."""
+        names = sorted(set(names))
+        lists = defaultdict(list)
+        for name_id, name in enumerate(names):
+            for trigram in name_trigrams(name):
+                lists[trigram].append(name_id)
+        return cls(names, {trigram: encode_postings(ids) for trigram, ids in lists.items()})
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Load an index from its serialized form."""
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError("Not a trigram index")
+
+        buffer = memoryview(data)
+        offset = len(MAGIC)
+        count, offset = decode_varint(buffer, offset)
+        names = []
+        for _ in range(count):
+            length, offset = decode_varint(buffer, offset)
+            names.append(bytes(buffer[offset:offset + length]).decode('utf-8'))
+            offset += length
+
+        count, offset = decode_varint(buffer, offset)
+        postings = {}
+        for _ in range(count):
+            length, offset = decode_varint(buffer, offset)
+            trigram = bytes(buffer[offset:offset + length]).decode('utf-8')
+            offset += length
+            length, offset = decode_varint(buffer, offset)
+            postings[trigram] = bytes(buffer[offset:offset + length])
+            offset += length
+        return cls(names, postings)
+
+    def to_bytes(self):
+        """Serialize the index."""
+        out = bytearray(MAGIC)
+        encode_varint(len(self.names), out)
+        for name in self.names:
+            encoded = name.encode('utf-8')
+            encode_varint(len(encoded), out)
+            out += encoded
+
+        encode_varint(len(self.postings), out)
+        for trigram in sorted(self.postings):
+            encoded = trigram.encode('utf-8')
+            encode_varint(len(encoded), out)
+            out += encoded
+            encode_varint(len(self.postings[trigram]), out)
+            out += self.postings[trigram]
+        return bytes(out)
+
+    def with_changes(self, added=(), removed=()):
+        """
+        Return a new index with names added and removed, a name in both being removed.
+
+        Only the trigrams of the changed names are computed. Every posting list is remapped
+        to the new name IDs, which shift as names are inserted into and dropped from the
+        sorted list, and the IDs of the added names are merged in.
+        """
+        removed = set(removed)
+        current = set(self.names)
+        inserted = {name for name in added if name not in removed and name not in current}
+        dropped = removed & current
+        if not inserted and not dropped:
+            return self
+
+        names = sorted((current - dropped) | inserted)
+        new_ids = {name: name_id for name_id, name in enumerate(names) if name in inserted}
+
+        # Old name ID -> new name ID, None for dropped names
+        remap, new_id = [], 0
+        for name in self.names:
+            if name in dropped:
+                remap.append(None)
+                continue
+            while names[new_id] != name:
+                new_id += 1
+            remap.append(new_id)
+            new_id += 1
+
+        additions = defaultdict(list)
+        for name in sorted(inserted):
+            for trigram in name_trigrams(name):
+                additions[trigram].append(new_ids[name])
+
+        postings = {}
+        for trigram, encoded in self.postings.items():
+            ids = [remap[name_id] for name_id in decode_postings(encoded) if remap[name_id] is not None]
+            if trigram in additions:
+                ids = list(heapq.merge(ids, additions.pop(trigram)))
+            if ids:
+                postings[trigram] = encode_postings(ids)
+        for trigram, ids in additions.items():
+            postings[trigram] = encode_postings(ids)
+        return TrigramIndex(names, postings)
+
+    def search(self, query, limit=50):
+        """
+        Return up to limit names containing the query, case-insensitively, in name order.
+
+        Queries of three or more characters intersect the posting lists of their trigrams,
+        starting from the shortest; shorter queries fall back to a scan of the names.
+        """
+        needle = query.lower()
+        if len(needle) < 3:
+            candidates = range(len(self.names))
+        else:
+            encoded = [self.postings.get(trigram) for trigram in name_trigrams(needle)]
+            if not all(encoded):
+                return []
+            encoded.sort(key=len)
+            candidates = decode_postings(encoded[0])
+            for other in encoded[1:]:
+                if not candidates:
+                    return []
+                other_ids = set(decode_postings(other))
+                candidates = [name_id for name_id in candidates if name_id in other_ids]
+
+        # Trigram matches can be false positives (e.g. 'abcd' vs 'abc...bcd'), so verify each
+        results = []
+        for name_id in candidates:
+            if needle in self.names[name_id].lower():
+                results.append(self.names[name_id])
+                if len(results) >= limit:
+                    break
+        return results
@@ -0,0 +1,203 @@
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import boto3
+import botocore.session
+from botocore.credentials import CredentialProvider, CredentialResolver, Credentials
+from auth_utils import prime_jwks_client
+
+try:
+    from snapshot_restore_py import register_after_restore, register_before_snapshot
+except ImportError:
+    register_after_restore = register_before_snapshot = None
+
+logger = logging.getLogger()
+
+# The platform's bucket and table, whose endpoints most handlers talk to
+DIGITAL_ASSETS_BUCKET_NAME = os.getenv('DIGITAL_ASSETS_BUCKET_NAME')
+DYNAMODB_TABLE_NAME = os.getenv('DYNAMODB_TABLE_NAME')
+
+
+def is_warmup_event(event):
+    """Check for the scheduled warm-up event, {"warmup": true}, sent by the EventBridge rules."""
+    return isinstance(event, dict) and event.get('warmup') is True
+
+
+def open_connection(client, user_pool_id=None):
+    """
+    Send a cheap request through a client, so its pool holds an open TLS connection.
+
+    S3 requests go to the bucket's virtual-hosted endpoint, so the HEAD targets the
+    platform's bucket. Errors are ignored: a denied request has still opened the connection.
+    """
+    client = getattr(getattr(client, 'meta', None), 'client', client)    # Accept boto3 resources
+    service = client.meta.service_model.service_name
+    try:
+        if service == 's3':
+            if DIGITAL_ASSETS_BUCKET_NAME:
+                client.head_bucket(Bucket=DIGITAL_ASSETS_BUCKET_NAME)
+            else:
+                client.list_buckets()
+        elif service == 'dynamodb':
+            if DYNAMODB_TABLE_NAME:
+                client.describe_table(TableName=DYNAMODB_TABLE_NAME)
+            else:
+                client.describe_limits()
+        elif service == 'cognito-idp':
+            if user_pool_id:
+                client.describe_user_pool(UserPoolId=user_pool_id)
+            else:
+                client.list_user_pools(MaxResults=1)
+        elif service == 'lambda':
+            client.get_account_settings()
+        elif service == 'kms':
+            client.list_aliases(Limit=1)
+        else:
+            return None
+    except Exception as e:
+        logger.debug(f"Priming request to {service} failed: {str(e)}")
+    return service
+
+
+def prime(clients, region=None, user_pool_id=None, refresh=False):
+    """
+    Prime a container's caches: pooled connections, JWKS keys and the crypto backend.
+
+    Args:
+        clients (list): The handler's boto3 clients and resources.
+        region (str): The Cognito user pool's region, for handlers that verify tokens.
+        user_pool_id (str): The Cognito user pool, for handlers that verify tokens.
+        refresh (bool): Refetch the JWKS keys even if they are cached.
+
+    Returns:
+        dict: What was primed and how long it took.
+    """
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(clients) + 1) as executor:
+        connections = [executor.submit(open_connection, client, user_pool_id) for client in clients]
+        jwks = (executor.submit(prime_jwks_client, region, user_pool_id, refresh)
+                if region and user_pool_id else None)
+        services = [future.result() for future in connections]
+        signing_keys = 0
+        if jwks:
+            try:
+                signing_keys = jwks.result()
+            except Exception as e:
+                logger.warning(f"Failed to prime the JWKS keys: {str(e)}")
+
+    return {
+        'warmup': True,
+        'connections': sorted(service for service in services if service),
+        'signing_keys': signing_keys,
+        'milliseconds': round((time.perf_counter() - started) * 1000)
+    }
+
+
+def handle_warmup(logger, clients, region=None, user_pool_id=None):
+    """Prime the container for a scheduled warm-up event and return the result, skipping the handler."""
+    result = prime(clients, region, user_pool_id)
+    logger.info(f"Warm-up primed {', '.join(result['connections']) or 'no connections'} "
+                f"and {result['signing_keys']} signing keys in {result['milliseconds']} ms")
+    return result
+
+
+class RestorableCredentials(Credentials):
+    """
+    Credentials from the default chain that can be resolved again.
+
+    Clients keep the credentials object they were created with, so clients created at
+    cold start would sign with the ones captured in a snapshot. Clients given this one
+    sign with whatever refresh() last resolved.
+    """
+    method = 'restorable'
+
+    def __init__(self, credentials):
+        self._credentials = credentials
+
+    def refresh(self):
+        """Resolve the default chain again, from a new session so no cached result is reused."""
+        credentials = botocore.session.get_session().get_credentials()
+        if credentials is not None:
+            self._credentials = credentials
+
+    def get_frozen_credentials(self):
+        return self._credentials.get_frozen_credentials()
+
+    @property
+    def access_key(self):
+        return self.get_frozen_credentials().access_key
+
+    @property
+    def secret_key(self):
+        return self.get_frozen_credentials().secret_key
+
+    @property
+    def token(self):
+        return self.get_frozen_credentials().token
+
+
+class RestorableCredentialProvider(CredentialProvider):
+    """Provide a session's clients with RestorableCredentials, shared so that one refresh covers them all."""
+    METHOD = 'restorable'
+
+    def __init__(self):
+        super().__init__()
+        self.credentials = None
+
+    def load(self):
+        if self.credentials is None:
+            credentials = botocore.session.get_session().get_credentials()
+            if credentials is None:
+                return None
+            self.credentials = RestorableCredentials(credentials)
+        return self.credentials
+
+
+credential_provider = RestorableCredentialProvider()
+
+
+def restorable_session():
+    """Return a botocore session whose clients sign with the credentials refresh_credentials() refreshes."""
+    session = botocore.session.get_session()
+    session.register_component('credential_provider', CredentialResolver([credential_provider]))
+    return session
+
+
+def refresh_credentials():
+    """Give the clients of restorable sessions the current execution-role credentials."""
+    if credential_provider.credentials is not None:
+        credential_provider.credentials.refresh()
+
+
+# On runtimes with snapshots, the clients handlers create at import come from a restorable session
+if register_after_restore:
+    boto3.setup_default_session(botocore_session=restorable_session())
+
+
+def register_snapshot_hooks(clients, region=None, user_pool_id=None):
+    """
+    Prime the container before a SnapStart snapshot, and refresh it after each restore.
+
+    Before the snapshot, connections are opened and the JWKS keys loaded, so the snapshot
+    carries imported and initialised modules. After a restore the credentials are refreshed,
+    the JWKS keys refetched and connections reopened, since the captured ones are stale.
+    The hooks are only registered on runtimes that provide them, where this module has made
+    the default boto3 session restorable, so the clients must be created after importing it.
+
+    Returns:
+        bool: Whether the hooks were registered.
+    """
+    if not register_after_restore:
+        return False
+
+    @register_before_snapshot
+    def before_snapshot():
+        prime(clients, region, user_pool_id)
+
+    @register_after_restore
+    def after_restore():
+        refresh_credentials()
+        prime(clients, region, user_pool_id, refresh=True)
+
+    return True
@@ -0,0 +1,91 @@
+import zipfile
+
+MIN_PART_SIZE = 5 * 1024 * 1024     # S3 minimum for every part but the last
+MAX_PARTS = 10000                   # S3 limit per upload
+
+
+class MultipartUploadWriter:
+    """
+    A write-only file object that streams into an S3 multipart upload.
+
+    Written bytes are buffered until a full part is available, so memory stays bounded by
+    the part size however large the object grows. The writer cannot seek, which zipfile
+    handles by writing a data descriptor after each entry instead of patching its header.
+    """
+
+    def __init__(self, s3, bucket, key, part_size, content_type='application/octet-stream'):
+        if part_size < MIN_PART_SIZE:
+            raise ValueError(f"Part size must be at least {MIN_PART_SIZE} bytes")
+        self.s3 = s3
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.bytes_written = 0
+        self.parts = []
+        self._buffer = bytearray()
+        self._upload_id = s3.create_multipart_upload(Bucket=bucket, Key=key, ContentType=content_type)['UploadId']
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._buffer += data
+        self.bytes_written += len(data)
+        while len(self._buffer) >= self.part_size:
+            self._upload_part(bytes(self._buffer[:self.part_size]))
+            del self._buffer[:self.part_size]
+        return len(data)
+
+    def flush(self):
+        # Parts other than the last must be at least 5 MB, so nothing is sent before it fills
+        pass
+
+    def complete(self):
+        """Upload the buffered tail as the last part and complete the upload."""
+        if self._buffer or not self.parts:
+            self._upload_part(bytes(self._buffer))
+            self._buffer.clear()
+        self.s3.complete_multipart_upload(
+            Bucket=self.bucket, Key=self.key, UploadId=self._upload_id,
+            MultipartUpload={'Parts': self.parts}
+        )
+
+    def abort(self):
+        """Abort the upload, releasing the parts stored so far."""
+        self._buffer.clear()
+        self.s3.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id)
+
+    def _upload_part(self, body):
+        number = len(self.parts) + 1
+        if number > MAX_PARTS:
+            raise ValueError(f"Archive exceeds {MAX_PARTS} parts of {self.part_size} bytes")
+        response = self.s3.upload_part(
+            Bucket=self.bucket, Key=self.key, UploadId=self._upload_id, PartNumber=number, Body=body
+        )
+        self.parts.append({'PartNumber': number, 'ETag': response['ETag']})
+
+
+def write_zip(writer, entries):
+    """
+    Write entries to a zip archive on a non-seekable writer, one chunk at a time.
+
+    Args:
+        writer: A file object with write() and flush(), such as MultipartUploadWriter.
+        entries (iterable): (name, size, date_time, compress, chunks) tuples. size is the
+            uncompressed size, used to switch an entry to ZIP64 when it needs it, and
+            chunks is an iterable of the entry's bytes.
+
+    Returns:
+        int: The number of entries written.
+    """
+    count = 0
+    with zipfile.ZipFile(writer, 'w', allowZip64=True) as archive:
+        for name, size, date_time, compress, chunks in entries:
+            info = zipfile.ZipInfo(name.lstrip('/'), date_time=max(date_time, (1980, 1, 1, 0, 0, 0)))
+            info.compress_type = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+            info.file_size = size
+            with archive.open(info, 'w') as entry:
+                for chunk in chunks:
+                    entry.write(chunk)
+            count += 1
+    return count
@@ -0,0 +1,112 @@
+"""
+Shared setup for the Lambda tests.
+
+Handlers import their utils from flat directories, as they do in a Lambda, so those
+directories are put on sys.path. moto stands in for AWS in-process; handlers read their
+configuration at import, so it is set here before any test imports one.
+"""
+import os
+import sys
+
+import boto3
+import pytest
+from botocore.awsrequest import AWSResponse
+from botocore.exceptions import ClientError
+from moto import mock_aws
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+ASSETS_DIR = os.path.join(SRC_DIR, 'assets')
+for directory in [os.path.join(SRC_DIR, 'utils'), ASSETS_DIR] + sorted(
+        os.path.join(ASSETS_DIR, name) for name in os.listdir(ASSETS_DIR)
+        if os.path.isdir(os.path.join(ASSETS_DIR, name)) and not name.startswith(('.', '_'))):
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
+
+REGION = 'us-east-1'
+BUCKET = 'test-assets'
+METADATA_TABLE = 'test-metadata'
+IDEMPOTENCY_TABLE = 'test-idempotency'
+JOBS_TABLE = 'test-jobs'
+COLLECTION_VERSIONS_TABLE = 'test-collection-versions'
+
+os.environ.update({
+    'AWS_ACCESS_KEY_ID': 'testing',
+    'AWS_SECRET_ACCESS_KEY': 'testing',
+    'AWS_SESSION_TOKEN': 'testing',
+    'AWS_DEFAULT_REGION': REGION,
+    'AWS_REGION': REGION,
+    'DIGITAL_ASSETS_BUCKET_NAME': BUCKET,
+    'DYNAMODB_TABLE_NAME': METADATA_TABLE,
+    'IDEMPOTENCY_TABLE_NAME': IDEMPOTENCY_TABLE,
+    'JOBS_TABLE_NAME': JOBS_TABLE,
+    'COLLECTION_VERSIONS_TABLE_NAME': COLLECTION_VERSIONS_TABLE,
+    'COGNITO_USER_POOL_ID': f'{REGION}_tests',
+})
+
+
+def fixture_path(name):
+    """Return the path of a file in tests/fixtures."""
+    return os.path.join(FIXTURES_DIR, name)
+
+
+@pytest.fixture
+def aws():
+    """Run the test against moto's in-process AWS."""
+    with mock_aws():
+        yield
+
+
+@pytest.fixture
+def s3(aws):
+    """An S3 client with the assets bucket created."""
+    client = boto3.client('s3', region_name=REGION)
+    client.create_bucket(Bucket=BUCKET)
+    evaluate_write_conditions(client)
+    return client
+
+
+def evaluate_write_conditions(client):
+    """
+    Answer If-Match and If-None-Match on CopyObject and CompleteMultipartUpload as S3 does.
+
+    moto only evaluates them on PutObject and DeleteObject. The check runs after every other
+    handler of the call, so a test can have another writer land just before the write.
+    """
+    def keep_params(params, context, **kwargs):
+        context['write_params'] = dict(params)
+
+    def check_conditions(context, **kwargs):
+        params = context['write_params']
+        try:
+            current = client.head_object(Bucket=params['Bucket'], Key=params['Key'])['ETag']
+        except ClientError:
+            current = None
+        if 'IfMatch' in params and current is None:
+            error, status = {'Code': 'NoSuchKey', 'Message': 'The specified key does not exist.'}, 404
+        elif ('IfMatch' in params and params['IfMatch'].strip('"') != current.strip('"')
+              or params.get('IfNoneMatch') == '*' and current is not None):
+            error, status = {'Code': 'PreconditionFailed', 'Message': 'At least one of the pre-conditions failed'}, 412
+        else:
+            return None
+        return AWSResponse(None, status, {}, None), {'Error': error, 'ResponseMetadata': {'HTTPStatusCode': status}}
+
+    for operation in ('CopyObject', 'CompleteMultipartUpload'):
+        client.meta.events.register(f'before-parameter-build.s3.{operation}', keep_params)
+        client.meta.events.register_last(f'before-call.s3.{operation}', check_conditions)
+
+
+@pytest.fixture
+def dynamodb(aws):
+    """A DynamoDB client with the metadata table created."""
+    client = boto3.client('dynamodb', region_name=REGION)
+    client.create_table(
+        TableName=METADATA_TABLE,
+        BillingMode='PAY_PER_REQUEST',
+        KeySchema=[{'AttributeName': 'user_id', 'KeyType': 'HASH'},
+                   {'AttributeName': 'document_name', 'KeyType': 'RANGE'}],
+        AttributeDefinitions=[{'AttributeName': 'user_id', 'AttributeType': 'S'},
+                              {'AttributeName': 'document_name', 'AttributeType': 'S'}]
+    )
+    return client
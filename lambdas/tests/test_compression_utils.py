@@ -0,0 +1,92 @@
+import gzip
+import logging
+import os
+
+import pytest
+
+import compression_utils
+from compression_utils import (CODEC_GZIP, CODEC_NONE, CODEC_ZSTD, accepts_encoding, choose_codec, compress_document,
+                               guess_content_type, is_compressible_content_type, iter_decompressed, resolve_codec,
+                               stream_compressor)
+
+logger = logging.getLogger(__name__)
+TEXT = b''.join(f'{number},north,widget,{number * 3}\n'.encode() for number in range(5000))
+
+
+def pieces(data, size):
+    return [data[start:start + size] for start in range(0, len(data), size)]
+
+
+def test_content_type_is_guessed_from_the_name_when_missing():
+    assert guess_content_type('notes.txt') == 'text/plain'
+    assert guess_content_type('notes.txt', 'application/json') == 'application/json'
+    assert guess_content_type('no-extension') == 'application/octet-stream'
+
+
+@pytest.mark.parametrize('content_type, compressible', [
+    ('text/csv', True), ('Application/JSON; charset=utf-8', True), ('application/ld+json', True),
+    ('image/svg+xml', True), ('image/png', False), ('application/zip', False), (None, False),
+])
+def test_text_like_content_types_are_compressible(content_type, compressible):
+    assert is_compressible_content_type(content_type) == compressible
+
+
+def test_codec_setting_falls_back_to_gzip_without_zstandard(monkeypatch):
+    assert [resolve_codec(setting) for setting in ('auto', 'ZSTD', 'gzip', 'off', None)] == [
+        CODEC_ZSTD, CODEC_ZSTD, CODEC_GZIP, CODEC_NONE, CODEC_NONE]
+
+    monkeypatch.setattr(compression_utils, 'zstandard', None)
+    assert resolve_codec('auto') == resolve_codec('zstd') == CODEC_GZIP
+
+
+def test_codec_is_chosen_by_type_size_and_a_sample_ratio():
+    assert choose_codec('text/csv', TEXT, 'auto', logger) == CODEC_ZSTD
+    assert choose_codec('text/csv', TEXT, 'off', logger) == CODEC_NONE
+    assert choose_codec('text/csv', TEXT[:100], 'auto', logger) == CODEC_NONE
+    assert choose_codec('image/png', TEXT, 'auto', logger) == CODEC_NONE
+    assert choose_codec('text/plain', os.urandom(100000), 'auto', logger) == CODEC_NONE
+
+
+@pytest.mark.parametrize('codec', [CODEC_GZIP, CODEC_ZSTD])
+def test_documents_decompress_lazily_from_chunks(codec):
+    compressed = compress_document(TEXT, codec)
+
+    assert len(compressed) < len(TEXT) // 3
+    assert b''.join(iter_decompressed(pieces(compressed, 1000), codec)) == TEXT
+
+
+@pytest.mark.parametrize('codec', [CODEC_GZIP, CODEC_ZSTD])
+def test_streamed_compression_writes_the_same_format(codec):
+    compressor = stream_compressor(codec)
+    compressed = b''.join(compressor.compress(piece) for piece in pieces(TEXT, 4096)) + compressor.flush()
+
+    assert b''.join(iter_decompressed([compressed], codec)) == TEXT
+
+
+def test_gzip_documents_are_deterministic_and_standard():
+    assert compress_document(TEXT, CODEC_GZIP) == compress_document(TEXT, CODEC_GZIP)
+    assert gzip.decompress(compress_document(TEXT, CODEC_GZIP)) == TEXT
+
+
+def test_uncompressed_documents_pass_through():
+    assert compress_document(b'raw', CODEC_NONE) == b'raw'
+    assert list(iter_decompressed([b'ra', b'w'], CODEC_NONE)) == [b'ra', b'w']
+    with pytest.raises(ValueError):
+        stream_compressor(CODEC_NONE)
+
+
+@pytest.mark.parametrize('header, codec, accepted', [
+    ('gzip, deflate, br', CODEC_GZIP, True),
+    ('GZIP', CODEC_GZIP, True),
+    ('gzip;q=0', CODEC_GZIP, False),
+    ('gzip; q=0.0, br', CODEC_GZIP, False),
+    ('gzip;q=0.5', CODEC_GZIP, True),
+    ('*', CODEC_ZSTD, True),
+    ('gzip, br', CODEC_ZSTD, False),
+    (None, CODEC_GZIP, False),
+    (None, CODEC_NONE, True),
+])
+def test_accept_encoding_is_honoured(header, codec, accepted):
+    event = {'headers': {'Accept-Encoding': header} if header else {}}
+
+    assert accepts_encoding(event, codec) == accepted
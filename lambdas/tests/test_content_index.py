@@ -0,0 +1,75 @@
+import pytest
+
+from content_index import ContentIndex, Segment, build_segment, merge_segments, tokenize
+
+
+def segment(documents):
+    return Segment(build_segment({name: tokenize(text) if text is not None else None
+                                  for name, text in documents.items()}))
+
+
+def test_tokens_are_lowercase_words_of_a_bounded_length():
+    assert tokenize('Quarterly REPORT: revenue, revenue! a ' + 'x' * 65) == {'quarterly', 'report', 'revenue'}
+
+
+def test_terms_are_found_by_binary_search():
+    built = segment({f'doc-{number}.txt': f'common term{number} {"even" if number % 2 == 0 else "odd"}'
+                     for number in range(50)})
+
+    assert built.postings('term7') == [built.names.index('doc-7.txt')]
+    assert len(built.postings('even')) == 25 and len(built.postings('common')) == 50
+    for missing in ('', 'aaaa', 'term', 'zzzz', 'év'):
+        assert built.postings(missing) == []
+
+
+def test_segment_is_read_from_a_memory_mapped_file(tmp_path):
+    path = tmp_path / 'segment.seg'
+    path.write_bytes(build_segment({'a.txt': {'alpha', 'beta'}, 'b.txt': None}))
+
+    mapped = Segment.open(str(path))
+    try:
+        assert mapped.names == ['a.txt', 'b.txt'] and mapped.deleted == {'b.txt'}
+        assert list(mapped.iter_terms()) == [('alpha', [0]), ('beta', [0])]
+    finally:
+        mapped.close()
+
+
+def test_other_data_is_refused():
+    with pytest.raises(ValueError):
+        Segment(b'TRG1' + bytes(40))
+
+
+def test_newer_segments_shadow_and_tombstones_hide_older_documents():
+    index = ContentIndex([
+        segment({'a.txt': 'alpha beta', 'b.txt': 'alpha', 'c.txt': 'alpha gamma'}),
+        segment({'a.txt': 'gamma', 'c.txt': None}),
+        segment({'d.txt': 'alpha beta'}),
+    ])
+
+    assert index.search(['alpha']) == ['b.txt', 'd.txt']
+    assert index.search(['alpha', 'beta']) == ['d.txt']
+    assert index.search(['gamma']) == ['a.txt']
+    assert index.search(['alpha'], limit=1) == ['b.txt']
+    assert index.search([]) == [] and index.search(['missing', 'alpha']) == []
+    assert index.live_names() == ['a.txt', 'b.txt', 'd.txt']
+
+
+def test_merged_segment_answers_as_its_inputs_did():
+    segments = [
+        segment({'a.txt': 'alpha beta', 'b.txt': 'alpha', 'c.txt': 'alpha gamma'}),
+        segment({'a.txt': 'gamma', 'c.txt': None, 'e.txt': 'beta'}),
+        segment({'b.txt': 'beta delta', 'd.txt': 'alpha beta'}),
+    ]
+    merged = Segment(merge_segments(segments))
+    index = ContentIndex([merged])
+
+    for terms in (['alpha'], ['beta'], ['gamma'], ['beta', 'delta'], ['alpha', 'beta']):
+        assert index.search(terms) == ContentIndex(segments).search(terms)
+    assert merged.deleted == {'c.txt'} and merged.postings('alpha') == [merged.names.index('d.txt')]
+
+
+def test_merged_tombstone_still_hides_an_older_segment():
+    oldest = segment({'a.txt': 'alpha', 'b.txt': 'alpha'})
+    merged = Segment(merge_segments([segment({'a.txt': None}), segment({'c.txt': 'alpha'})]))
+
+    assert ContentIndex([oldest, merged]).search(['alpha']) == ['b.txt', 'c.txt']
@@ -0,0 +1,153 @@
+import logging
+
+import pytest
+
+import copy_utils
+from conftest import BUCKET, METADATA_TABLE
+from copy_utils import CopyConflict, copy_document
+from metadata_utils import build_document_item_from_head, save_document_item
+from storage_utils import STAGING_PREFIX, document_key
+
+USER_ID = 'user-1'
+logger = logging.getLogger(__name__)
+
+
+def upload(s3, dynamodb, document_name, body, register=True):
+    """Write a document, and its item as register_metadata would."""
+    key = document_key(USER_ID, document_name)
+    s3.put_object(Bucket=BUCKET, Key=key, Body=body, ContentType='text/plain', ChecksumAlgorithm='SHA256')
+    if register:
+        register_item(s3, dynamodb, document_name)
+
+
+def register_item(s3, dynamodb, document_name):
+    head = s3.head_object(Bucket=BUCKET, Key=document_key(USER_ID, document_name), ChecksumMode='ENABLED')
+    save_document_item(dynamodb, METADATA_TABLE, build_document_item_from_head(USER_ID, document_name, head))
+
+
+def item(dynamodb, document_name):
+    return dynamodb.get_item(TableName=METADATA_TABLE, Key={
+        'user_id': {'S': USER_ID}, 'document_name': {'S': document_name}
+    }).get('Item')
+
+
+def copy(s3, dynamodb, source, destination, move=False, overwrite=False):
+    return copy_document(s3, dynamodb, BUCKET, METADATA_TABLE, USER_ID, source, destination, move, overwrite,
+                         multipart_threshold=copy_utils.COPY_OBJECT_MAX_BYTES, part_size=8 * 1024 ** 2,
+                         max_workers=2, logger=logger)
+
+
+def read(s3, document_name):
+    return s3.get_object(Bucket=BUCKET, Key=document_key(USER_ID, document_name))['Body'].read()
+
+
+def test_copy_writes_the_destination_item(s3, dynamodb):
+    upload(s3, dynamodb, 'a.txt', b'first')
+
+    written = copy(s3, dynamodb, 'a.txt', 'b.txt')
+
+    assert read(s3, 'b.txt') == b'first'
+    assert item(dynamodb, 'b.txt')['etag'] == written['etag'] and item(dynamodb, 'a.txt')
+
+
+def test_copy_already_registered_from_its_notification_succeeds(s3, dynamodb, monkeypatch):
+    upload(s3, dynamodb, 'a.txt', b'first')
+    copy_stored_object = copy_utils.copy_stored_object
+
+    def copy_then_register(*args, **kwargs):
+        parts = copy_stored_object(*args, **kwargs)
+        register_item(s3, dynamodb, 'b.txt')    # register_metadata wins the race
+        return parts
+
+    monkeypatch.setattr(copy_utils, 'copy_stored_object', copy_then_register)
+
+    written = copy(s3, dynamodb, 'a.txt', 'b.txt', move=True)
+
+    assert item(dynamodb, 'b.txt')['etag'] == written['etag'] and item(dynamodb, 'a.txt') is None
+    assert read(s3, 'b.txt') == b'first'
+
+
+def test_copy_refuses_a_destination_uploaded_meanwhile(s3, dynamodb, monkeypatch):
+    upload(s3, dynamodb, 'a.txt', b'first')
+    copy_stored_object = copy_utils.copy_stored_object
+
+    def copy_then_upload(*args, **kwargs):
+        parts = copy_stored_object(*args, **kwargs)
+        # Another upload to the destination registers before the copy's transaction
+        dynamodb.update_item(TableName=METADATA_TABLE,
+                             Key={'user_id': {'S': USER_ID}, 'document_name': {'S': 'b.txt'}},
+                             UpdateExpression='SET etag = :etag', ExpressionAttributeValues={':etag': {'S': 'other'}})
+        return parts
+
+    monkeypatch.setattr(copy_utils, 'copy_stored_object', copy_then_upload)
+
+    with pytest.raises(CopyConflict):
+        copy(s3, dynamodb, 'a.txt', 'b.txt', move=True)
+    assert item(dynamodb, 'a.txt') and item(dynamodb, 'b.txt')['etag']['S'] == 'other'
+
+
+def test_existing_destination_needs_overwrite(s3, dynamodb):
+    upload(s3, dynamodb, 'a.txt', b'first')
+    upload(s3, dynamodb, 'b.txt', b'second')
+
+    with pytest.raises(CopyConflict):
+        copy(s3, dynamodb, 'a.txt', 'b.txt')
+
+    copy(s3, dynamodb, 'a.txt', 'b.txt', overwrite=True)
+    assert read(s3, 'b.txt') == b'first'
+
+
+def test_source_changed_since_registration_is_refused(s3, dynamodb):
+    upload(s3, dynamodb, 'a.txt', b'first')
+    upload(s3, dynamodb, 'a.txt', b'changed', register=False)
+
+    with pytest.raises(CopyConflict):
+        copy(s3, dynamodb, 'a.txt', 'b.txt', move=True)
+    assert item(dynamodb, 'b.txt') is None and read(s3, 'a.txt') == b'changed'
+
+
+def staged_objects(s3):
+    return s3.list_objects_v2(Bucket=BUCKET, Prefix=STAGING_PREFIX).get('KeyCount', 0)
+
+
+def test_overwrite_replaces_the_destination_and_its_item(s3, dynamodb):
+    upload(s3, dynamodb, 'a.txt', b'first')
+    upload(s3, dynamodb, 'b.txt', b'second')
+
+    written = copy(s3, dynamodb, 'a.txt', 'b.txt', move=True, overwrite=True)
+
+    stored = s3.head_object(Bucket=BUCKET, Key=document_key(USER_ID, 'b.txt'))
+    assert read(s3, 'b.txt') == b'first' and written['etag']['S'] == stored['ETag'].strip('"')
+    assert item(dynamodb, 'b.txt') == written and item(dynamodb, 'a.txt') is None
+    assert staged_objects(s3) == 0
+
+
+def test_refused_overwrite_leaves_the_destination_untouched(s3, dynamodb):
+    upload(s3, dynamodb, 'a.txt', b'first')
+    upload(s3, dynamodb, 'b.txt', b'second')
+    destination_item = item(dynamodb, 'b.txt')
+    upload(s3, dynamodb, 'a.txt', b'changed', register=False)
+
+    with pytest.raises(CopyConflict):
+        copy(s3, dynamodb, 'a.txt', 'b.txt', move=True, overwrite=True)
+
+    assert read(s3, 'b.txt') == b'second' and item(dynamodb, 'b.txt') == destination_item
+    assert read(s3, 'a.txt') == b'changed' and staged_objects(s3) == 0
+
+
+def test_copy_does_not_replace_a_destination_created_after_the_check(s3, dynamodb, monkeypatch):
+    upload(s3, dynamodb, 'a.txt', b'first')
+    object_exists = copy_utils.object_exists
+
+    def check_then_upload(s3_client, bucket, key):
+        exists = object_exists(s3_client, bucket, key)
+        upload(s3, dynamodb, 'b.txt', b'uploaded meanwhile')
+        return exists
+
+    monkeypatch.setattr(copy_utils, 'object_exists', check_then_upload)
+
+    with pytest.raises(CopyConflict):
+        copy(s3, dynamodb, 'a.txt', 'b.txt', move=True)
+
+    assert read(s3, 'b.txt') == b'uploaded meanwhile' and read(s3, 'a.txt') == b'first'
+    assert item(dynamodb, 'a.txt')
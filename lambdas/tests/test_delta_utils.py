@@ -0,0 +1,148 @@
+import gzip
+import hashlib
+import logging
+import random
+
+import boto3
+import pytest
+
+import delta_utils
+from chunking import chunk_boundaries
+from compression_utils import CODEC_GZIP, CODEC_ZSTD, compress_document, iter_decompressed
+from conftest import BUCKET, REGION
+from encryption_utils import ENCRYPTION_ENVELOPE, ENCRYPTION_METADATA
+from storage_utils import document_key
+
+USER_ID = 'user-1'
+logger = logging.getLogger(__name__)
+
+
+def text_document(lines, seed=3):
+    words = random.Random(seed).choices(['alpha', 'beta', 'gamma', 'delta', 'epsilon'], k=lines * 8)
+    return ''.join(f"{index} {' '.join(words[index * 8:index * 8 + 8])}\n" for index in range(lines)).encode()
+
+
+def store(s3, document_name, body, metadata=None):
+    key = document_key(USER_ID, document_name)
+    s3.put_object(Bucket=BUCKET, Key=key, Body=body, ContentType='text/plain', Metadata=metadata or {})
+    return s3.head_object(Bucket=BUCKET, Key=key)
+
+
+def client_chunks(data, manifest):
+    """Chunk a new version as the client does, sending only chunks the manifest lacks."""
+    known = {digest for _, digest in manifest['chunks']}
+    chunks, start = [], 0
+    for end in chunk_boundaries(data):
+        digest = hashlib.sha256(data[start:end]).hexdigest()
+        chunks.append({'sha256': digest} if digest in known else {'data': data[start:end]})
+        start = end
+    return chunks
+
+
+def edit(data):
+    middle = len(data) // 2
+    return data[:middle] + b'an inserted line\n' + data[middle:]
+
+
+@pytest.mark.parametrize('codec', [CODEC_GZIP, CODEC_ZSTD])
+def test_compressed_document_takes_a_delta_and_stays_compressed(s3, codec):
+    original = text_document(20000)
+    head = store(s3, 'notes.txt', compress_document(original, codec),
+                 {'content-codec': codec, 'original-size': str(len(original))})
+
+    manifest = delta_utils.load_chunk_manifest(s3, BUCKET, USER_ID, 'notes.txt', head, logger)
+    assert manifest['size'] == len(original) and len(manifest['chunks']) > 4
+
+    updated = edit(original)
+    chunks = client_chunks(updated, manifest)
+    new_bytes = sum(len(chunk['data']) for chunk in chunks if 'data' in chunk)
+    assert new_bytes < len(updated) // 4
+
+    segments, _ = delta_utils.plan_segments(manifest, chunks)
+    version, stats = delta_utils.rewrite_compressed_document(s3, BUCKET, document_key(USER_ID, 'notes.txt'), head,
+                                                             segments, logger)
+
+    response = s3.get_object(Bucket=BUCKET, Key=document_key(USER_ID, 'notes.txt'))
+    assert version['ETag'] == response['ETag'] and version['ContentLength'] == response['ContentLength']
+    assert delta_utils.document_size(version) == len(updated)
+    assert response['Metadata'] == {'content-codec': codec, 'original-size': str(len(updated))}
+    assert stats == {'copied_bytes': 0, 'sent_bytes': response['ContentLength']}
+    assert response['ContentLength'] < len(updated) // 2
+    assert b''.join(iter_decompressed(response['Body'].iter_chunks(), codec)) == updated
+
+
+def test_manifest_of_a_compressed_document_matches_its_decompressed_bytes(s3):
+    original = text_document(5000)
+    compressed = store(s3, 'a.txt', gzip.compress(original), {'content-codec': CODEC_GZIP})
+    plain = store(s3, 'b.txt', original)
+
+    assert (delta_utils.load_chunk_manifest(s3, BUCKET, USER_ID, 'a.txt', compressed, logger)['chunks']
+            == delta_utils.load_chunk_manifest(s3, BUCKET, USER_ID, 'b.txt', plain, logger)['chunks'])
+
+
+def test_rewrite_refuses_a_changed_base(s3):
+    original = text_document(2000)
+    head = store(s3, 'notes.txt', gzip.compress(original), {'content-codec': CODEC_GZIP})
+    manifest = delta_utils.load_chunk_manifest(s3, BUCKET, USER_ID, 'notes.txt', head, logger)
+    segments, _ = delta_utils.plan_segments(manifest, client_chunks(edit(original), manifest))
+    store(s3, 'notes.txt', gzip.compress(original + b'changed\n'), {'content-codec': CODEC_GZIP})
+
+    with pytest.raises(delta_utils.DeltaConflict):
+        delta_utils.rewrite_compressed_document(s3, BUCKET, document_key(USER_ID, 'notes.txt'), head, segments, logger)
+
+
+def test_encrypted_document_is_refused(s3):
+    head = store(s3, 'secret.txt', b'x', {ENCRYPTION_METADATA: ENCRYPTION_ENVELOPE})
+
+    with pytest.raises(delta_utils.DeltaConflict):
+        delta_utils.load_chunk_manifest(s3, BUCKET, USER_ID, 'secret.txt', head, logger)
+
+
+def write_before(s3, operation, body):
+    """Have another writer replace notes.txt just before the client's next call of operation."""
+    other_writer = boto3.client('s3', region_name=REGION)
+
+    def replace_document(**kwargs):
+        s3.meta.events.unregister(f'before-call.s3.{operation}', replace_document)
+        other_writer.put_object(Bucket=BUCKET, Key=document_key(USER_ID, 'notes.txt'), Body=body)
+
+    s3.meta.events.register(f'before-call.s3.{operation}', replace_document)
+
+
+def planned_edit(s3, body, metadata=None):
+    head = store(s3, 'notes.txt', body, metadata)
+    original = text_document(2000)
+    manifest = delta_utils.load_chunk_manifest(s3, BUCKET, USER_ID, 'notes.txt', head, logger)
+    segments, _ = delta_utils.plan_segments(manifest, client_chunks(edit(original), manifest))
+    return head, segments
+
+
+def test_assembled_version_does_not_replace_a_write_since_the_base(s3):
+    head, segments = planned_edit(s3, text_document(2000))
+    write_before(s3, 'CompleteMultipartUpload', b'written meanwhile')
+
+    with pytest.raises(delta_utils.DeltaConflict):
+        delta_utils.assemble_document(s3, BUCKET, document_key(USER_ID, 'notes.txt'), head, segments, 2, logger)
+
+    assert s3.get_object(Bucket=BUCKET, Key=document_key(USER_ID, 'notes.txt'))['Body'].read() == b'written meanwhile'
+
+
+def test_rewritten_version_does_not_replace_a_write_since_the_base(s3):
+    head, segments = planned_edit(s3, gzip.compress(text_document(2000)), {'content-codec': CODEC_GZIP})
+    write_before(s3, 'PutObject', b'written meanwhile')
+
+    with pytest.raises(delta_utils.DeltaConflict):
+        delta_utils.rewrite_compressed_document(s3, BUCKET, document_key(USER_ID, 'notes.txt'), head, segments, logger)
+
+    assert s3.get_object(Bucket=BUCKET, Key=document_key(USER_ID, 'notes.txt'))['Body'].read() == b'written meanwhile'
+
+
+def test_assembled_version_is_described_by_the_write(s3):
+    head, segments = planned_edit(s3, text_document(2000))
+
+    version, stats = delta_utils.assemble_document(s3, BUCKET, document_key(USER_ID, 'notes.txt'), head, segments, 2,
+                                                   logger)
+
+    stored = s3.head_object(Bucket=BUCKET, Key=document_key(USER_ID, 'notes.txt'))
+    assert version['ETag'] == stored['ETag'] and version['ContentLength'] == stored['ContentLength']
+    assert stats['sent_bytes'] == stored['ContentLength'] == len(edit(text_document(2000)))
@@ -0,0 +1,136 @@
+import io
+import logging
+
+import pytest
+from PIL import Image
+
+import derive_previews as previews
+from compression_utils import CODEC_GZIP, compress_document
+from conftest import BUCKET, METADATA_TABLE, fixture_path
+from encryption_utils import LocalKms, document_data_keys, encrypt_document
+from storage_utils import derived_key, document_key
+
+USER_ID = 'user-1'
+logger = logging.getLogger(__name__)
+
+
+@pytest.fixture
+def data_keys():
+    return document_data_keys(LocalKms(), BUCKET)
+
+
+def store(s3, dynamodb, document_name, body, content_type, metadata=None):
+    """Write a document and its item, as an upload does."""
+    response = s3.put_object(Bucket=BUCKET, Key=document_key(USER_ID, document_name), Body=body,
+                             ContentType=content_type, Metadata=metadata or {})
+    dynamodb.put_item(TableName=METADATA_TABLE, Item={
+        'user_id': {'S': USER_ID}, 'document_name': {'S': document_name},
+        'etag': {'S': response['ETag'].strip('"')}
+    })
+    return response['ETag'].strip('"')
+
+
+def read_fixture(name):
+    with open(fixture_path(name), 'rb') as fixture:
+        return fixture.read()
+
+
+def derive(s3, dynamodb, document_name, data_keys):
+    return previews.derive_previews(s3, dynamodb, BUCKET, METADATA_TABLE, USER_ID, document_name, data_keys, logger)
+
+
+def recorded_preview(dynamodb, document_name):
+    item = dynamodb.get_item(TableName=METADATA_TABLE,
+                             Key={'user_id': {'S': USER_ID}, 'document_name': {'S': document_name}})['Item']
+    return {name: value['S'] for name, value in item['preview']['M'].items()}
+
+
+def read_artifact(s3, key):
+    return s3.get_object(Bucket=BUCKET, Key=key)['Body'].read()
+
+
+def test_text_document_gets_an_excerpt(s3, dynamodb, data_keys):
+    etag = store(s3, dynamodb, 'notes.txt', read_fixture('notes.txt'), 'text/plain')
+
+    preview = derive(s3, dynamodb, 'notes.txt', data_keys)
+
+    assert preview == recorded_preview(dynamodb, 'notes.txt')
+    assert preview['media_type'] == 'text/plain' and preview['etag'] == etag
+    assert preview['excerpt_key'] == derived_key(USER_ID, 'notes.txt', 'excerpt.txt')
+    assert read_artifact(s3, preview['excerpt_key']) == read_fixture('notes.txt')
+    assert 'thumbnail_key' not in preview
+
+
+def test_image_gets_a_thumbnail_sniffed_from_its_bytes(s3, dynamodb, data_keys):
+    store(s3, dynamodb, 'photo', read_fixture('photo.png'), 'application/octet-stream')
+
+    preview = derive(s3, dynamodb, 'photo', data_keys)
+
+    assert preview['media_type'] == 'image/png'
+    with Image.open(io.BytesIO(read_artifact(s3, preview['thumbnail_key']))) as thumbnail:
+        assert thumbnail.format == 'JPEG'
+        assert thumbnail.size == (256, 192)
+
+
+def test_pdf_gets_its_first_page_text(s3, dynamodb, data_keys):
+    store(s3, dynamodb, 'report.pdf', read_fixture('report.pdf'), 'application/pdf')
+
+    preview = derive(s3, dynamodb, 'report.pdf', data_keys)
+
+    assert read_artifact(s3, preview['excerpt_key']) == b'Quarterly report: revenue grew in every region.'
+
+
+def test_compressed_and_encrypted_documents_are_decoded(s3, dynamodb, data_keys):
+    text = read_fixture('notes.txt') * 50
+    body, metadata = encrypt_document(compress_document(text, CODEC_GZIP), data_keys)
+    store(s3, dynamodb, 'notes-large.txt', body, 'text/plain', {'content-codec': CODEC_GZIP, **metadata})
+
+    preview = derive(s3, dynamodb, 'notes-large.txt', data_keys)
+
+    assert read_artifact(s3, preview['excerpt_key']) == text[:previews.EXCERPT_CHARS]
+
+
+def test_source_size_limit_applies_to_the_decompressed_document(s3, dynamodb, data_keys, monkeypatch):
+    pdf = read_fixture('report.pdf')
+    body = compress_document(pdf, CODEC_GZIP)
+    store(s3, dynamodb, 'report.pdf', body, 'application/pdf',
+          {'content-codec': CODEC_GZIP, 'original-size': str(len(pdf))})
+    monkeypatch.setattr(previews, 'MAX_SOURCE_BYTES', len(body))
+
+    preview = derive(s3, dynamodb, 'report.pdf', data_keys)
+
+    assert preview['media_type'] == 'application/pdf' and 'excerpt_key' not in preview
+
+
+def test_deleted_document_is_skipped(s3, dynamodb, data_keys):
+    assert derive(s3, dynamodb, 'gone.txt', data_keys) is None
+
+
+def test_document_without_an_item_records_nothing(s3, dynamodb, data_keys):
+    s3.put_object(Bucket=BUCKET, Key=document_key(USER_ID, 'orphan.txt'), Body=b'no item', ContentType='text/plain')
+
+    assert derive(s3, dynamodb, 'orphan.txt', data_keys)['media_type'] == 'text/plain'
+    assert 'Item' not in dynamodb.get_item(TableName=METADATA_TABLE,
+                                           Key={'user_id': {'S': USER_ID}, 'document_name': {'S': 'orphan.txt'}})
+
+
+def stream_record(event_name, document_name, etag, preview_etag=None):
+    new_image = {'etag': {'S': etag}}
+    if preview_etag is not None:
+        new_image['preview'] = {'M': {'etag': {'S': preview_etag}}}
+    return {'eventName': event_name, 'dynamodb': {
+        'Keys': {'user_id': {'S': USER_ID}, 'document_name': {'S': document_name}},
+        'NewImage': new_image
+    }}
+
+
+def test_only_items_with_a_missing_or_stale_preview_are_derived():
+    records = [
+        stream_record('INSERT', 'new.txt', 'e1'),
+        stream_record('MODIFY', 'current.txt', 'e2', preview_etag='e2'),
+        stream_record('MODIFY', 'stale.txt', 'e3', preview_etag='e0'),
+        stream_record('MODIFY', 'new.txt', 'e1'),
+        {'eventName': 'REMOVE', 'dynamodb': {'Keys': {'user_id': {'S': USER_ID}, 'document_name': {'S': 'x'}}}},
+    ]
+
+    assert previews.collect_documents_needing_previews(records) == [(USER_ID, 'new.txt'), (USER_ID, 'stale.txt')]
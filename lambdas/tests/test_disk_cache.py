@@ -0,0 +1,82 @@
+import os
+
+import pytest
+
+from disk_cache import DiskCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return DiskCache(str(tmp_path / 'cache'), max_bytes=100, max_entry_bytes=60)
+
+
+def cached_files(cache):
+    return sorted(os.listdir(cache.directory))
+
+
+def read(cache, key):
+    return b''.join(cache.iter_chunks(cache.get(key), chunk_size=7))
+
+
+def test_entry_is_streamed_in_and_read_back_in_chunks(cache):
+    entry = cache.put('user/a.txt', '"e1"', [b'hello ', b'world'], {'content_type': 'text/plain'})
+
+    assert entry['size'] == 11 and cache.total_bytes == 11
+    assert cache.get('user/a.txt') == entry and entry['attributes'] == {'content_type': 'text/plain'}
+    assert list(cache.iter_chunks(entry, chunk_size=4)) == [b'hell', b'o wo', b'rld']
+    assert cache.get('user/missing.txt') is None
+
+
+def test_least_recently_used_entries_are_evicted_past_the_byte_budget(cache):
+    for name in ('a', 'b', 'c'):
+        cache.put(name, 'e', [name.encode() * 30])
+    cache.get('a')                                  # a is now the most recently used
+
+    cache.put('d', 'e', [b'd' * 30])
+
+    assert cache.get('b') is None and cache.total_bytes == 90
+    assert read(cache, 'a') == b'a' * 30 and read(cache, 'd') == b'd' * 30
+    assert len(cached_files(cache)) == 3
+
+
+def test_new_version_replaces_the_old_one(cache):
+    cache.put('a', 'e1', [b'first'])
+    cache.put('a', 'e2', [b'second version'])
+    cache.put('a', 'e2', [b'same etag'])            # Rewritten in place under the same file name
+
+    assert cache.get('a')['etag'] == 'e2' and read(cache, 'a') == b'same etag'
+    assert cache.total_bytes == 9 and len(cached_files(cache)) == 1
+
+
+def test_failed_put_leaves_no_partial_file_and_keeps_the_old_entry(cache):
+    cache.put('a', 'e1', [b'first'])
+
+    def failing_download():
+        yield b'partial'
+        raise ConnectionError('connection reset')
+
+    with pytest.raises(ConnectionError):
+        cache.put('a', 'e2', failing_download())
+
+    assert read(cache, 'a') == b'first' and cache.total_bytes == 5
+    assert not [name for name in cached_files(cache) if name.startswith('.partial-')]
+
+
+def test_discard_removes_the_file(cache):
+    cache.put('a', 'e1', [b'first'])
+    cache.discard('a')
+    cache.discard('a')
+
+    assert cache.get('a') is None and cache.total_bytes == 0 and cached_files(cache) == []
+
+
+def test_only_objects_of_a_known_size_within_the_entry_limit_fit(cache):
+    assert cache.fits(60) and not cache.fits(61) and not cache.fits(None)
+
+
+def test_files_of_an_earlier_container_are_cleared(tmp_path):
+    directory = tmp_path / 'cache'
+    directory.mkdir()
+    (directory / 'stale').write_bytes(b'unknown to the index')
+
+    assert cached_files(DiskCache(str(directory), max_bytes=100)) == []
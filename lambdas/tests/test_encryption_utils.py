@@ -0,0 +1,106 @@
+import os
+
+import pytest
+from botocore.exceptions import ClientError
+
+from conftest import BUCKET
+from encryption_utils import (SEGMENT_SIZE, TAG_SIZE, DecryptionError, LocalKms, document_data_keys,
+                              encrypt_document, iter_decrypted, iter_encrypted)
+
+SEALED_SIZE = SEGMENT_SIZE + TAG_SIZE
+
+
+@pytest.fixture
+def kms():
+    return LocalKms()
+
+
+def pieces(data, size):
+    """Split data into chunks of size bytes, as a streamed S3 body arrives."""
+    return [data[start:start + size] for start in range(0, len(data), size)] or [b'']
+
+
+def decrypt(ciphertext, metadata, data_keys, chunk_size=1024 * 1024):
+    return b''.join(iter_decrypted(pieces(ciphertext, chunk_size), metadata, data_keys))
+
+
+@pytest.mark.parametrize('size', [0, 1, SEGMENT_SIZE - 1, SEGMENT_SIZE, SEGMENT_SIZE + 1, 5 * SEGMENT_SIZE + 17])
+@pytest.mark.parametrize('chunk_size', [1000, SEALED_SIZE, 1024 * 1024])
+def test_round_trip(kms, size, chunk_size):
+    document = os.urandom(size)
+    ciphertext, metadata = encrypt_document(document, document_data_keys(kms, BUCKET))
+
+    # A reader elsewhere has its own cache, and unwraps the data key through KMS
+    assert decrypt(ciphertext, metadata, document_data_keys(kms, BUCKET), chunk_size) == document
+    assert len(ciphertext) == size + max(1, -(-size // SEGMENT_SIZE)) * TAG_SIZE
+
+
+def test_streamed_encryption_matches_whatever_the_chunking(kms):
+    document = os.urandom(3 * SEGMENT_SIZE + 5)
+    key, nonce_prefix = os.urandom(32), os.urandom(7)
+
+    whole = b''.join(iter_encrypted([document], key, nonce_prefix))
+
+    assert b''.join(iter_encrypted(pieces(document, 4099), key, nonce_prefix)) == whole
+    assert b''.join(iter_encrypted(pieces(document, SEGMENT_SIZE), key, nonce_prefix)) == whole
+
+
+def test_data_keys_are_reused(kms):
+    writer, reader = document_data_keys(kms, BUCKET), document_data_keys(kms, BUCKET)
+
+    encrypted = [encrypt_document(os.urandom(100), writer) for _ in range(5)]
+    for ciphertext, metadata in encrypted:
+        decrypt(ciphertext, metadata, reader)
+
+    assert kms.calls == {'GenerateDataKey': 1, 'Decrypt': 1}
+
+
+def encrypted_segments(kms, segments=3):
+    document = os.urandom(segments * SEGMENT_SIZE - 10)
+    data_keys = document_data_keys(kms, BUCKET)
+    ciphertext, metadata = encrypt_document(document, data_keys)
+    return bytearray(ciphertext), metadata, data_keys
+
+
+def test_tampered_segment_fails_authentication(kms):
+    ciphertext, metadata, data_keys = encrypted_segments(kms)
+    ciphertext[SEALED_SIZE + 100] ^= 1
+
+    chunks = iter_decrypted(pieces(bytes(ciphertext), 1000), metadata, data_keys)
+    assert len(next(chunks)) == SEGMENT_SIZE        # Segments before the tampered one are served
+    with pytest.raises(DecryptionError, match='Segment 1'):
+        next(chunks)
+
+
+def test_truncated_object_fails_authentication(kms):
+    ciphertext, metadata, data_keys = encrypted_segments(kms)
+
+    with pytest.raises(DecryptionError):
+        decrypt(bytes(ciphertext[:2 * SEALED_SIZE]), metadata, data_keys)
+
+
+def test_reordered_segments_fail_authentication(kms):
+    ciphertext, metadata, data_keys = encrypted_segments(kms)
+    swapped = ciphertext[SEALED_SIZE:2 * SEALED_SIZE] + ciphertext[:SEALED_SIZE] + ciphertext[2 * SEALED_SIZE:]
+
+    with pytest.raises(DecryptionError, match='Segment 0'):
+        decrypt(bytes(swapped), metadata, data_keys)
+
+
+def test_data_key_is_bound_to_the_bucket(kms):
+    ciphertext, metadata = encrypt_document(b'secret', document_data_keys(kms, BUCKET))
+
+    with pytest.raises(ClientError, match='InvalidCiphertextException'):
+        decrypt(ciphertext, metadata, document_data_keys(kms, 'another-bucket'))
+
+
+def test_incomplete_metadata_is_refused(kms):
+    ciphertext, metadata = encrypt_document(b'secret', document_data_keys(kms, BUCKET))
+    del metadata['encryption-nonce-prefix']
+
+    with pytest.raises(DecryptionError, match='Incomplete'):
+        decrypt(ciphertext, metadata, document_data_keys(kms, BUCKET))
+
+
+def test_unencrypted_objects_pass_through(kms):
+    assert decrypt(b'plain', {}, document_data_keys(kms, BUCKET)) == b'plain'
@@ -0,0 +1,178 @@
+import json
+import logging
+import time
+
+import boto3
+import pytest
+
+import idempotency_utils as idempotency
+from conftest import IDEMPOTENCY_TABLE, REGION
+
+USER_ID = 'user-1'
+CORS_HEADERS = {'Access-Control-Allow-Origin': '*'}
+logger = logging.getLogger(__name__)
+
+
+class Context:
+    def __init__(self, remaining_ms=30000):
+        self.remaining_ms = remaining_ms
+
+    def get_remaining_time_in_millis(self):
+        return self.remaining_ms
+
+
+class Handler:
+    """Counts the requests that did their work, answering with the response given."""
+
+    def __init__(self, status=200):
+        self.status = status
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return {'statusCode': self.status, 'headers': {**CORS_HEADERS, 'X-Call': str(self.calls)},
+                'body': json.dumps({'call': self.calls})}
+
+
+@pytest.fixture
+def dynamodb(aws):
+    client = boto3.client('dynamodb', region_name=REGION)
+    client.create_table(
+        TableName=IDEMPOTENCY_TABLE,
+        BillingMode='PAY_PER_REQUEST',
+        KeySchema=[{'AttributeName': 'user_id', 'KeyType': 'HASH'},
+                   {'AttributeName': 'idempotency_key', 'KeyType': 'RANGE'}],
+        AttributeDefinitions=[{'AttributeName': 'user_id', 'AttributeType': 'S'},
+                              {'AttributeName': 'idempotency_key', 'AttributeType': 'S'}]
+    )
+    return client
+
+
+def request(body, key='key-1'):
+    headers = {'Idempotency-Key': key} if key else {}
+    return {'headers': headers, 'body': json.dumps(body)}
+
+
+def run(dynamodb, event, process, context=None):
+    return idempotency.run_idempotent(dynamodb, event, context or Context(), USER_ID, 'upload_asset', process,
+                                      CORS_HEADERS, logger)
+
+
+def stored_record(dynamodb, key='key-1'):
+    return dynamodb.get_item(TableName=IDEMPOTENCY_TABLE, Key={
+        'user_id': {'S': USER_ID}, 'idempotency_key': {'S': f'upload_asset#{key}'}
+    }, ConsistentRead=True).get('Item')
+
+
+def test_retry_replays_the_stored_response(dynamodb):
+    handler = Handler()
+
+    first = run(dynamodb, request({'name': 'a'}), handler)
+    retry = run(dynamodb, request({'name': 'a'}), handler)
+
+    assert handler.calls == 1
+    assert stored_record(dynamodb)['status']['S'] == idempotency.STATUS_COMPLETED
+    assert 'claim_token' not in stored_record(dynamodb)
+    assert retry['statusCode'] == first['statusCode'] and retry['body'] == first['body']
+    assert retry['headers'] == {**first['headers'], 'Idempotent-Replayed': 'true'}
+
+
+def test_key_reused_for_a_different_request_is_refused(dynamodb):
+    handler = Handler()
+    run(dynamodb, request({'name': 'a'}), handler)
+
+    response = run(dynamodb, request({'name': 'b'}), handler)
+
+    assert response['statusCode'] == 422 and handler.calls == 1
+
+
+def test_retry_while_the_first_request_runs_gets_a_conflict(dynamodb):
+    handler = Handler()
+    responses = []
+
+    def first():
+        responses.append(run(dynamodb, request({'name': 'a'}), handler))
+        return handler()
+
+    run(dynamodb, request({'name': 'a'}), first)
+
+    assert responses[0]['statusCode'] == 409 and responses[0]['headers']['Retry-After'] == '1'
+    assert handler.calls == 1
+
+
+def test_expired_lease_is_taken_over(dynamodb):
+    now = int(time.time())
+    event = request({'name': 'a'})
+    dynamodb.put_item(TableName=IDEMPOTENCY_TABLE, Item={
+        'user_id': {'S': USER_ID}, 'idempotency_key': {'S': 'upload_asset#key-1'},
+        'status': {'S': idempotency.STATUS_IN_PROGRESS},
+        'fingerprint': {'S': idempotency.request_fingerprint(event)},
+        'claim_token': {'S': 'crashed-invocation'},
+        'lease_expires_at': {'N': str(now - 1)},
+        'expires_at': {'N': str(now + 3600)}
+    })
+    handler = Handler()
+
+    response = run(dynamodb, event, handler)
+
+    assert response['statusCode'] == 200 and handler.calls == 1
+    assert stored_record(dynamodb)['status']['S'] == idempotency.STATUS_COMPLETED
+
+
+def test_lease_in_force_is_not_taken_over(dynamodb):
+    handler = Handler()
+    event = request({'name': 'a'})
+    assert idempotency.claim_key(dynamodb, {'user_id': {'S': USER_ID}, 'idempotency_key': {'S': 'upload_asset#key-1'}},
+                                 idempotency.request_fingerprint(event), 'running-invocation', 60) is None
+
+    assert run(dynamodb, event, handler)['statusCode'] == 409 and handler.calls == 0
+
+
+def test_invocation_that_lost_its_lease_does_not_store_its_response(dynamodb):
+    record_key = {'user_id': {'S': USER_ID}, 'idempotency_key': {'S': 'upload_asset#key-1'}}
+    idempotency.claim_key(dynamodb, record_key, 'fingerprint', 'new-owner', 60)
+
+    idempotency.save_response(dynamodb, record_key, 'old-owner', Handler()(), CORS_HEADERS, logger)
+    idempotency.release_key(dynamodb, record_key, 'old-owner', logger)
+
+    record = stored_record(dynamodb)
+    assert record['status']['S'] == idempotency.STATUS_IN_PROGRESS and record['claim_token']['S'] == 'new-owner'
+
+
+@pytest.mark.parametrize('status', [400, 500])
+def test_failed_request_releases_the_key(dynamodb, status):
+    handler = Handler(status)
+
+    run(dynamodb, request({'name': 'a'}), handler)
+    run(dynamodb, request({'name': 'a'}), handler)
+
+    assert handler.calls == 2 and stored_record(dynamodb) is None
+
+
+def test_exception_releases_the_key(dynamodb):
+    def crash():
+        raise RuntimeError('boom')
+
+    with pytest.raises(RuntimeError):
+        run(dynamodb, request({'name': 'a'}), crash)
+
+    assert stored_record(dynamodb) is None
+
+
+def test_requests_without_a_key_always_run(dynamodb):
+    handler = Handler()
+
+    run(dynamodb, request({'name': 'a'}, key=None), handler)
+    run(dynamodb, request({'name': 'a'}, key=None), handler)
+
+    assert handler.calls == 2
+
+
+def test_keys_are_scoped_per_user(dynamodb):
+    handler = Handler()
+    event = request({'name': 'a'})
+
+    run(dynamodb, event, handler)
+    idempotency.run_idempotent(dynamodb, event, Context(), 'user-2', 'upload_asset', handler, CORS_HEADERS, logger)
+
+    assert handler.calls == 2
@@ -0,0 +1,167 @@
+import boto3
+import pytest
+
+import job_engine
+from conftest import JOBS_TABLE, REGION
+from job_engine import InMemoryJobQueue, JobEngine, job_summary
+
+USER_ID = 'user-1'
+
+
+class Context:
+    def __init__(self, remaining_ms=60000):
+        self.remaining_ms = remaining_ms
+
+    def get_remaining_time_in_millis(self):
+        return self.remaining_ms
+
+
+class NumbersJob:
+    """Processes the numbers 0 to count - 1, failing those listed and recording every run."""
+
+    name = 'numbers'
+
+    def __init__(self, failing=(), crash_at=None, crashes=1):
+        self.failing = set(failing)
+        self.crash_at = crash_at
+        self.crashes = crashes
+        self.processed = []
+
+    @staticmethod
+    def validate(params):
+        if not isinstance(params.get('count'), int):
+            raise ValueError("'count' must be an integer")
+        return params
+
+    @staticmethod
+    def total(params):
+        return params['count']
+
+    def next_batch(self, job, cursor, limit):
+        start = int(cursor or 0)
+        end = min(start + limit, int(job['params']['count']))
+        return list(range(start, end)), (end if end < job['params']['count'] else None)
+
+    def process(self, job, items):
+        if self.crash_at in items and self.crashes:
+            self.crashes -= 1
+            raise RuntimeError(f'crashed at {self.crash_at}')
+        self.processed.extend(items)
+        return [{'item': str(item), 'error': 'odd one out'} for item in items if item in self.failing]
+
+
+@pytest.fixture
+def jobs_table(aws):
+    dynamodb = boto3.resource('dynamodb', region_name=REGION)
+    return dynamodb.create_table(
+        TableName=JOBS_TABLE,
+        BillingMode='PAY_PER_REQUEST',
+        KeySchema=[{'AttributeName': 'user_id', 'KeyType': 'HASH'},
+                   {'AttributeName': 'job_id', 'KeyType': 'RANGE'}],
+        AttributeDefinitions=[{'AttributeName': 'user_id', 'AttributeType': 'S'},
+                              {'AttributeName': 'job_id', 'AttributeType': 'S'}]
+    )
+
+
+def engine_for(jobs_table, job_type, reserve_seconds=0):
+    queue = InMemoryJobQueue()
+    return JobEngine(jobs_table, queue, [job_type], batch_size=10, reserve_seconds=reserve_seconds), queue
+
+
+def drain(engine, queue, context=None):
+    return queue.drain(lambda event: engine.handle_records(event['Records'], context or Context()))
+
+
+def test_job_runs_to_completion_in_one_invocation(jobs_table):
+    job_type = NumbersJob()
+    engine, queue = engine_for(jobs_table, job_type)
+    job = engine.submit(USER_ID, 'numbers', {'count': 35})
+
+    assert drain(engine, queue) == 1
+
+    stored = engine.get(USER_ID, job['job_id'])
+    assert stored['status'] == job_engine.STATUS_COMPLETED
+    assert (stored['processed'], stored['failed'], stored['total']) == (35, 0, 35)
+    assert 'cursor' not in stored and 'lease_token' not in stored
+    assert job_type.processed == list(range(35))
+
+
+def test_job_out_of_time_is_checkpointed_and_resumed(jobs_table):
+    job_type = NumbersJob()
+    # Reserving all of the remaining time leaves each invocation one batch
+    engine, queue = engine_for(jobs_table, job_type, reserve_seconds=60)
+    job = engine.submit(USER_ID, 'numbers', {'count': 35})
+
+    assert engine.run(USER_ID, job['job_id'], Context()) == job_engine.STATUS_RUNNING
+    stored = engine.get(USER_ID, job['job_id'])
+    assert (stored['processed'], stored['cursor'], stored['lease_expires_at']) == (10, 10, 0)
+    assert len(queue.messages) == 2     # The submitted message and the requeued one
+
+    drain(engine, queue)
+
+    stored = engine.get(USER_ID, job['job_id'])
+    assert stored['status'] == job_engine.STATUS_COMPLETED and stored['processed'] == 35
+    assert job_type.processed == list(range(35))
+    assert not queue.dead_letters
+
+
+def test_crashed_run_resumes_from_its_last_checkpoint(jobs_table):
+    job_type = NumbersJob(crash_at=25)
+    engine, queue = engine_for(jobs_table, job_type)
+    job = engine.submit(USER_ID, 'numbers', {'count': 35})
+
+    assert drain(engine, queue) == 2    # Redelivered once after the crash
+
+    stored = engine.get(USER_ID, job['job_id'])
+    assert stored['status'] == job_engine.STATUS_COMPLETED and stored['processed'] == 35
+    assert stored['last_error'] == 'crashed at 25' and stored['attempts'] == 0
+    # Batches checkpointed before the crash are not run again
+    assert job_type.processed == list(range(35))
+
+
+def test_failed_items_are_counted_and_reported(jobs_table):
+    failing = range(0, 200, 2)
+    engine, queue = engine_for(jobs_table, NumbersJob(failing=failing))
+    job = engine.submit(USER_ID, 'numbers', {'count': 200})
+
+    drain(engine, queue)
+
+    summary = job_summary(engine.get(USER_ID, job['job_id']))
+    assert summary['status'] == job_engine.STATUS_COMPLETED
+    assert (summary['processed'], summary['failed'], summary['total']) == (100, 100, 200)
+    assert len(summary['failures']) == job_engine.MAX_RECORDED_FAILURES
+    assert summary['failures'][0] == {'item': '0', 'error': 'odd one out'}
+
+
+def test_job_without_progress_is_failed_before_the_dead_letter_queue(jobs_table):
+    engine, queue = engine_for(jobs_table, NumbersJob(crash_at=0, crashes=100))
+    job = engine.submit(USER_ID, 'numbers', {'count': 5})
+
+    assert drain(engine, queue) == job_engine.JOB_MAX_ATTEMPTS + 1
+
+    summary = job_summary(engine.get(USER_ID, job['job_id']))
+    assert summary['status'] == job_engine.STATUS_FAILED
+    assert summary['error'].endswith('crashed at 0') and summary['processed'] == 0
+    assert not queue.dead_letters
+
+
+def test_duplicate_delivery_skips_a_held_job(jobs_table):
+    engine, queue = engine_for(jobs_table, NumbersJob())
+    job = engine.submit(USER_ID, 'numbers', {'count': 5})
+    claimed = engine.claim(USER_ID, job['job_id'], Context())
+
+    assert engine.run(USER_ID, job['job_id'], Context()) == 'skipped'
+
+    engine.release(claimed)
+    assert engine.run(USER_ID, job['job_id'], Context()) == job_engine.STATUS_COMPLETED
+    assert engine.run(USER_ID, job['job_id'], Context()) == 'skipped'
+
+
+def test_submit_validates_params(jobs_table):
+    engine, queue = engine_for(jobs_table, NumbersJob())
+
+    with pytest.raises(ValueError):
+        engine.submit(USER_ID, 'numbers', {'count': 'many'})
+    with pytest.raises(ValueError):
+        engine.submit(USER_ID, 'unknown', {})
+    assert not queue.messages
@@ -0,0 +1,62 @@
+import pytest
+
+import memory_cache
+from memory_cache import MemoryCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(memory_cache.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = MemoryCache(max_entries=10, max_bytes=100, ttl_seconds=30)
+    cache.put('a', {'items': []}, 10)
+
+    clock[0] += 29.9
+    assert cache.get('a') == {'items': []}
+    clock[0] += 0.1
+    assert cache.get('a') is None and cache.total_bytes == 0
+
+
+def test_least_recently_used_entries_are_evicted_past_the_entry_count(clock):
+    cache = MemoryCache(max_entries=2, max_bytes=100, ttl_seconds=30)
+    cache.put('a', 'A', 1)
+    cache.put('b', 'B', 1)
+    cache.get('a')
+
+    cache.put('c', 'C', 1)
+
+    assert cache.get('b') is None and cache.get('a') == 'A' and cache.get('c') == 'C'
+
+
+def test_least_recently_used_entries_are_evicted_past_the_byte_budget(clock):
+    cache = MemoryCache(max_entries=10, max_bytes=100, ttl_seconds=30)
+    cache.put('a', 'A', 40)
+    cache.put('b', 'B', 40)
+
+    cache.put('c', 'C', 40)
+
+    assert cache.get('a') is None and cache.total_bytes == 80
+
+
+def test_oversized_value_is_not_stored_and_drops_the_old_one(clock):
+    cache = MemoryCache(max_entries=10, max_bytes=100, ttl_seconds=30)
+    cache.put('a', 'small', 10)
+    cache.put('b', 'B', 10)
+
+    cache.put('a', 'huge', 101)
+
+    assert cache.get('a') is None and cache.get('b') == 'B' and cache.total_bytes == 10
+
+
+def test_replacing_a_value_restarts_its_ttl_and_counts_its_new_size(clock):
+    cache = MemoryCache(max_entries=10, max_bytes=100, ttl_seconds=30)
+    cache.put('a', 'old', 10)
+    clock[0] += 20
+    cache.put('a', 'new', 25)
+    clock[0] += 20
+
+    assert cache.get('a') == 'new' and cache.total_bytes == 25
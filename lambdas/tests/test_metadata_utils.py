@@ -0,0 +1,60 @@
+import boto3
+import pytest
+
+import metadata_utils
+from conftest import METADATA_TABLE, REGION
+from metadata_utils import BATCH_WRITE_ATTEMPTS, UnprocessedKeysError, get_document_items
+
+USER_ID = 'user-1'
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(metadata_utils.time, 'sleep', lambda seconds: None)
+
+
+class ThrottledResource:
+    """A DynamoDB resource that leaves the keys of a request unprocessed a number of times."""
+
+    def __init__(self, throttles, items):
+        self.throttles = throttles
+        self.items = items
+        self.requests = 0
+
+    def batch_get_item(self, RequestItems):
+        self.requests += 1
+        if self.throttles:
+            self.throttles -= 1
+            return {'Responses': {}, 'UnprocessedKeys': RequestItems}
+        (table_name, request), = RequestItems.items()
+        names = {key['document_name'] for key in request['Keys']}
+        return {'Responses': {table_name: [item for item in self.items if item['document_name'] in names]}}
+
+
+def test_items_come_back_in_the_order_of_the_names(dynamodb):
+    table = boto3.resource('dynamodb', region_name=REGION).Table(METADATA_TABLE)
+    names = [f'doc-{index:03d}.txt' for index in range(250)]
+    with table.batch_writer() as batch:
+        for name in names[::2]:
+            batch.put_item(Item={'user_id': USER_ID, 'document_name': name})
+    requested = names[::-1] + names[:3]
+
+    items = get_document_items(boto3.resource('dynamodb', region_name=REGION), METADATA_TABLE, USER_ID, requested)
+
+    assert [item['document_name'] for item in items] == names[-2::-2]
+
+
+def test_unprocessed_keys_are_retried():
+    items = [{'user_id': USER_ID, 'document_name': 'a.txt'}]
+    resource = ThrottledResource(2, items)
+
+    assert get_document_items(resource, METADATA_TABLE, USER_ID, ['a.txt', 'b.txt']) == items
+    assert resource.requests == 3
+
+
+def test_keys_still_unprocessed_after_the_last_attempt_raise():
+    resource = ThrottledResource(BATCH_WRITE_ATTEMPTS, [])
+
+    with pytest.raises(UnprocessedKeysError):
+        get_document_items(resource, METADATA_TABLE, USER_ID, ['a.txt'])
+    assert resource.requests == BATCH_WRITE_ATTEMPTS
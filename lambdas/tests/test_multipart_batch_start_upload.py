@@ -0,0 +1,123 @@
+import json
+import logging
+from urllib.parse import parse_qs, urlparse
+
+import boto3
+import pytest
+from botocore.exceptions import ClientError
+
+import multipart_batch_start_upload as batch_start
+from conftest import BUCKET, IDEMPOTENCY_TABLE, REGION
+from storage_utils import document_key
+
+USER_ID = 'user-1'
+PART_SIZE = batch_start.MIN_PART_SIZE
+logger = logging.getLogger(__name__)
+
+
+class Context:
+    def get_remaining_time_in_millis(self):
+        return 30000
+
+
+@pytest.fixture(autouse=True)
+def handler_clients(s3, monkeypatch):
+    """Point the handler at moto, signed in as USER_ID."""
+    dynamodb = boto3.client('dynamodb', region_name=REGION)
+    dynamodb.create_table(
+        TableName=IDEMPOTENCY_TABLE,
+        BillingMode='PAY_PER_REQUEST',
+        KeySchema=[{'AttributeName': 'user_id', 'KeyType': 'HASH'},
+                   {'AttributeName': 'idempotency_key', 'KeyType': 'RANGE'}],
+        AttributeDefinitions=[{'AttributeName': 'user_id', 'AttributeType': 'S'},
+                              {'AttributeName': 'idempotency_key', 'AttributeType': 'S'}]
+    )
+    monkeypatch.setattr(batch_start, 's3_client', s3)
+    monkeypatch.setattr(batch_start, 'dynamodb_client', dynamodb)
+    monkeypatch.setattr(batch_start, 'extract_and_verify_token',
+                        lambda event, region, pool_id: {'statusCode': 200, 'body': {'user_id': USER_ID}})
+
+
+def a_file(filename, size, **overrides):
+    parts = max(1, -(-size // PART_SIZE))
+    return {'filename': filename, 'size': size, 'checksums': [f'checksum-{number}' for number in range(parts)],
+            **overrides}
+
+
+def start(body, idempotency_key=None):
+    headers = {'Idempotency-Key': idempotency_key} if idempotency_key else {}
+    response = batch_start.handle_post_request({'headers': headers, 'body': json.dumps(body)}, Context(), logger, {})
+    return response['statusCode'], json.loads(response['body'])
+
+
+def open_uploads(s3):
+    return s3.list_multipart_uploads(Bucket=BUCKET).get('Uploads', [])
+
+
+def test_small_files_get_a_put_and_large_ones_a_multipart_upload(s3):
+    status, body = start({'partSize': PART_SIZE, 'files': [
+        a_file('folder/notes.txt', 10), a_file('folder/empty.bin', 0), a_file('folder/video.mp4', 2 * PART_SIZE + 1)
+    ]})
+
+    assert status == 200 and body['failed'] == [] and body['checksumHeader'] == 'x-amz-checksum-sha256'
+    uploads = {upload['filename']: upload for upload in body['uploads']}
+    assert uploads['folder/notes.txt']['contentType'] == 'text/plain'
+    put_url = urlparse(uploads['folder/notes.txt']['url'])
+    assert put_url.path.endswith(document_key(USER_ID, 'folder/notes.txt')) and 'uploadId' not in put_url.query
+    assert 'url' in uploads['folder/empty.bin']
+
+    video = uploads['folder/video.mp4']
+    assert len(video['partUrls']) == 3
+    assert [parse_qs(urlparse(url).query)['partNumber'] for url in video['partUrls']] == [['1'], ['2'], ['3']]
+    assert [upload['UploadId'] for upload in open_uploads(s3)] == [video['uploadId']]
+
+
+def test_files_that_cannot_be_started_are_reported_and_the_rest_started(s3, monkeypatch):
+    create_multipart_upload = s3.create_multipart_upload
+
+    def refuse_one(**kwargs):
+        if kwargs['Key'].endswith('locked.bin'):
+            raise ClientError({'Error': {'Code': 'AccessDenied', 'Message': 'Access Denied'}}, 'CreateMultipartUpload')
+        return create_multipart_upload(**kwargs)
+
+    monkeypatch.setattr(s3, 'create_multipart_upload', refuse_one)
+
+    status, body = start({'partSize': PART_SIZE, 'files': [
+        a_file('a.bin', PART_SIZE + 1), a_file('locked.bin', PART_SIZE + 1), a_file('b.txt', 5)
+    ]})
+
+    assert status == 200
+    assert body['failed'] == [{'filename': 'locked.bin', 'error': 'Access Denied'}]
+    assert sorted(upload['filename'] for upload in body['uploads']) == ['a.bin', 'b.txt']
+    assert len(open_uploads(s3)) == 1
+
+
+@pytest.mark.parametrize('body, problem', [
+    ([], 'the body must be an object'),
+    ({'partSize': PART_SIZE, 'files': [a_file('a', 1)], 'checksumAlgorithm': 'md5'}, 'checksumAlgorithm'),
+    ({'partSize': PART_SIZE - 1, 'files': [a_file('a', 1)]}, "'partSize'"),
+    ({'partSize': PART_SIZE, 'files': []}, "'files' must be a non-empty list"),
+    ({'partSize': PART_SIZE, 'files': [a_file('a', 1), a_file('a', 2)]}, 'a is listed twice'),
+    ({'partSize': PART_SIZE, 'files': [{'size': 1, 'checksums': ['c']}]}, "'filename'"),
+    ({'partSize': PART_SIZE, 'files': [a_file('a', -1)]}, "'size' must be a byte count"),
+    ({'partSize': PART_SIZE, 'files': [a_file('a', PART_SIZE + 1, checksums=['c'])]}, 'one base64 checksum per part'),
+    ({'partSize': PART_SIZE, 'files': [a_file('a', PART_SIZE * 10001)]}, 'more than 10000 parts'),
+    ({'partSize': PART_SIZE, 'files': [a_file(f'f{number}', 1) for number in range(501)]}, 'at most 500 files'),
+    ({'partSize': PART_SIZE, 'files': [a_file(f'f{number}', PART_SIZE * 500) for number in range(5)]},
+     'at most 2000'),
+])
+def test_invalid_batches_are_refused_before_anything_starts(s3, body, problem):
+    status, message = start(body)
+
+    assert status == 400 and problem in message
+    assert open_uploads(s3) == []
+
+
+def test_retried_batch_starts_its_uploads_once(s3):
+    body = {'partSize': PART_SIZE, 'checksumAlgorithm': 'crc32c', 'files': [a_file('video.mp4', PART_SIZE + 1)]}
+
+    first = start(body, idempotency_key='folder-1')
+    retried = start(body, idempotency_key='folder-1')
+
+    assert first == retried and first[1]['checksumAlgorithm'] == 'CRC32C'
+    assert len(open_uploads(s3)) == 1
@@ -0,0 +1,73 @@
+import logging
+
+import boto3
+import pytest
+
+import process_metadata_stream as stream
+from conftest import BUCKET, REGION
+from storage_utils import name_index_key
+from trigram_index import TrigramIndex
+
+USER_ID = 'user-1'
+logger = logging.getLogger(__name__)
+
+
+@pytest.fixture(autouse=True)
+def s3_client(s3, monkeypatch):
+    monkeypatch.setattr(stream, 's3_client', s3)
+    return s3
+
+
+def indexed_names(s3):
+    return TrigramIndex.from_bytes(s3.get_object(Bucket=BUCKET, Key=name_index_key(USER_ID))['Body'].read()).names
+
+
+def update_before_next_put(s3, added):
+    """Have an overlapping batch update the index just before the client's next put."""
+    other_client = boto3.client('s3', region_name=REGION)
+
+    def update_index(**kwargs):
+        s3.meta.events.unregister('before-call.s3.PutObject', update_index)
+        response = other_client.get_object(Bucket=BUCKET, Key=name_index_key(USER_ID))
+        index = TrigramIndex.from_bytes(response['Body'].read()).with_changes(added)
+        other_client.put_object(Bucket=BUCKET, Key=name_index_key(USER_ID), Body=index.to_bytes())
+
+    s3.meta.events.register('before-call.s3.PutObject', update_index)
+
+
+def test_concurrent_update_is_not_lost(s3):
+    stream.update_name_index(USER_ID, {'a.txt'}, set(), logger)
+    update_before_next_put(s3, {'b.txt'})
+
+    stream.update_name_index(USER_ID, {'c.txt'}, {'a.txt'}, logger)
+
+    assert indexed_names(s3) == ['b.txt', 'c.txt']
+
+
+def test_index_created_concurrently_is_not_replaced(s3):
+    other_client = boto3.client('s3', region_name=REGION)
+
+    def create_index(**kwargs):
+        s3.meta.events.unregister('before-call.s3.PutObject', create_index)
+        other_client.put_object(Bucket=BUCKET, Key=name_index_key(USER_ID),
+                                Body=TrigramIndex.build(['b.txt']).to_bytes())
+
+    s3.meta.events.register('before-call.s3.PutObject', create_index)
+
+    stream.update_name_index(USER_ID, {'a.txt'}, set(), logger)
+
+    assert indexed_names(s3) == ['a.txt', 'b.txt']
+
+
+def test_changes_are_folded_per_user_later_records_winning():
+    def record(event_name, user_id, document_name):
+        return {'eventName': event_name,
+                'dynamodb': {'Keys': {'user_id': {'S': user_id}, 'document_name': {'S': document_name}}}}
+
+    changes = stream.collect_name_changes([
+        record('INSERT', USER_ID, 'a.txt'), record('REMOVE', USER_ID, 'a.txt'),
+        record('REMOVE', USER_ID, 'b.txt'), record('INSERT', USER_ID, 'b.txt'),
+        record('MODIFY', 'user-2', 'c.txt'),
+    ])
+
+    assert dict(changes) == {USER_ID: ({'b.txt'}, {'a.txt'}), 'user-2': (set(), set())}
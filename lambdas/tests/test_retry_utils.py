@@ -0,0 +1,215 @@
+import json
+
+import boto3
+import pytest
+from botocore.awsrequest import AWSResponse
+from botocore.exceptions import ClientError
+
+import retry_utils
+from conftest import REGION
+from retry_utils import (RETRY_CLIENT_CONFIG, THROTTLING, TRANSIENT, CircuitBreaker, CircuitOpenError, RetryPolicy,
+                         is_unavailable, unavailable_response)
+
+THROTTLED = (400, {'__type': 'com.amazonaws.dynamodb.v20120810#ProvisionedThroughputExceededException',
+                   'message': 'Rate exceeded'})
+SERVER_ERROR = (500, {'__type': 'com.amazonaws.dynamodb.v20120810#InternalServerError', 'message': 'Internal error'})
+CONDITION_FAILED = (400, {'__type': 'com.amazonaws.dynamodb.v20120810#ConditionalCheckFailedException',
+                          'message': 'The conditional request failed'})
+OK = (200, {})
+
+
+class Clock:
+    """A monotonic clock the test moves by hand."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+class Body:
+    def __init__(self, data):
+        self.data = data
+
+    def stream(self, **kwargs):
+        yield self.data
+
+
+class FakeEndpoint:
+    """Answer a client's requests with scripted DynamoDB responses, before they are sent."""
+
+    def __init__(self, client, responses):
+        self.responses = list(responses)
+        self.requests = 0
+        client.meta.events.register('before-send', self.send)
+
+    def send(self, request, **kwargs):
+        self.requests += 1
+        status, body = self.responses.pop(0)
+        return AWSResponse(request.url, status, {'Content-Type': 'application/x-amz-json-1.0'},
+                           Body(json.dumps(body).encode()))
+
+
+class Context:
+    def __init__(self, remaining_seconds):
+        self.remaining_seconds = remaining_seconds
+
+    def get_remaining_time_in_millis(self):
+        return self.remaining_seconds * 1000
+
+
+@pytest.fixture(autouse=True)
+def breakers(monkeypatch):
+    """Give each test its own circuit breakers, they are otherwise shared by the container."""
+    monkeypatch.setattr(retry_utils, '_circuit_breakers', {})
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(retry_utils.time, 'monotonic', clock.monotonic)
+    return clock
+
+
+def policy(budgets=None):
+    return RetryPolicy(budgets=budgets or {THROTTLING: 3, TRANSIENT: 1}, base_delay=0.001, max_delay=0.001)
+
+
+def client_with(retry_policy, responses):
+    client = boto3.client('dynamodb', region_name=REGION, config=RETRY_CLIENT_CONFIG)
+    retry_policy.install(client)
+    return client, FakeEndpoint(client, responses)
+
+
+def get_item(client):
+    return client.get_item(TableName='items', Key={'id': {'S': '1'}})
+
+
+def test_throttled_call_is_retried_until_it_succeeds():
+    client, endpoint = client_with(policy(), [THROTTLED, THROTTLED, OK])
+
+    get_item(client)
+
+    assert endpoint.requests == 3
+    assert retry_utils.get_circuit_breaker('dynamodb').failures == 0
+
+
+def test_retries_stop_when_the_class_budget_is_spent():
+    client, endpoint = client_with(policy(), [THROTTLED] * 10)
+
+    with pytest.raises(ClientError, match='ProvisionedThroughputExceededException'):
+        get_item(client)
+
+    assert endpoint.requests == 4       # The first attempt and three retries
+    assert retry_utils.get_circuit_breaker('dynamodb').failures == 1
+
+
+def test_each_error_class_has_its_own_budget():
+    client, endpoint = client_with(policy(), [SERVER_ERROR, THROTTLED, THROTTLED, OK])
+    get_item(client)
+    assert endpoint.requests == 4
+
+    client, endpoint = client_with(policy(), [SERVER_ERROR, SERVER_ERROR, OK])
+    with pytest.raises(ClientError, match='InternalServerError'):
+        get_item(client)
+    assert endpoint.requests == 2
+
+
+def test_final_errors_are_not_retried_and_count_as_answers():
+    breaker = retry_utils.get_circuit_breaker('dynamodb')
+    breaker.failures = 2
+    client, endpoint = client_with(policy(), [CONDITION_FAILED])
+
+    with pytest.raises(ClientError, match='ConditionalCheckFailedException'):
+        get_item(client)
+
+    assert endpoint.requests == 1 and breaker.failures == 0
+
+
+def test_deadline_cuts_retries_short(monkeypatch):
+    retry_policy = RetryPolicy(budgets={THROTTLING: 5}, reserve_seconds=1)
+    monkeypatch.setattr(retry_policy, 'delay', lambda retries: 0.2)
+    client, endpoint = client_with(retry_policy, [THROTTLED] * 6)
+
+    retry_policy.start_invocation(Context(remaining_seconds=1.1))    # 0.1 s to spare, less than a retry's delay
+    with pytest.raises(ClientError):
+        get_item(client)
+    assert endpoint.requests == 1
+
+    endpoint.responses[:] = [THROTTLED, OK]
+    retry_policy.start_invocation(Context(remaining_seconds=30))
+    monkeypatch.setattr(retry_policy, 'delay', lambda retries: 0.001)
+    get_item(client)
+    assert endpoint.requests == 3
+
+
+def test_backoff_is_full_jitter_capped_at_max_delay(monkeypatch):
+    retry_policy = RetryPolicy(base_delay=0.1, max_delay=1)
+    monkeypatch.setattr(retry_utils.random, 'uniform', lambda low, high: (low, high))
+
+    assert [retry_policy.delay(retries) for retries in range(5)] == [(0, 0.1), (0, 0.2), (0, 0.4), (0, 0.8), (0, 1)]
+
+
+def test_circuit_opens_half_opens_and_closes(clock):
+    breaker = CircuitBreaker('s3', failure_threshold=2, reset_seconds=10)
+
+    breaker.record_failure()
+    breaker.before_call()                       # One failure leaves it closed
+    breaker.record_failure()
+    with pytest.raises(CircuitOpenError) as opened:
+        breaker.before_call()
+    assert opened.value.retry_after == 10
+
+    clock.now += 10
+    breaker.before_call()                       # Half open: a single trial goes through
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()                   # and no other call while it runs
+    breaker.record_failure()                    # The trial failed, so it opens again
+    clock.now += 5
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    clock.now += 5
+    breaker.before_call()
+    breaker.record_success()                    # The trial succeeded, so it closes
+    breaker.before_call()
+    breaker.before_call()
+    assert breaker.failures == 0 and breaker.opened_at is None
+
+
+def test_trial_without_an_outcome_lapses_after_the_reset_time(clock):
+    breaker = CircuitBreaker('s3', failure_threshold=1, reset_seconds=10)
+    breaker.record_failure()
+    clock.now += 10
+    breaker.before_call()                       # A trial whose outcome is never recorded
+
+    clock.now += 10
+    breaker.before_call()
+
+
+def test_open_circuit_fails_calls_without_sending_them(clock):
+    client, endpoint = client_with(policy({THROTTLING: 0}), [THROTTLED] * 2)
+    breaker = retry_utils.get_circuit_breaker('dynamodb')
+    breaker.failure_threshold = 2
+
+    for _ in range(2):
+        with pytest.raises(ClientError):
+            get_item(client)
+    with pytest.raises(CircuitOpenError):
+        get_item(client)
+    assert endpoint.requests == 2
+
+    clock.now += breaker.reset_seconds
+    endpoint.responses[:] = [OK]
+    get_item(client)
+    assert endpoint.requests == 3 and breaker.opened_at is None
+
+
+def test_unavailable_errors_get_a_503_with_retry_after():
+    throttled = ClientError({'Error': {'Code': 'SlowDown'}, 'ResponseMetadata': {'HTTPStatusCode': 503}}, 'PutObject')
+    denied = ClientError({'Error': {'Code': 'AccessDenied'}, 'ResponseMetadata': {'HTTPStatusCode': 403}}, 'PutObject')
+
+    assert is_unavailable(throttled) and is_unavailable(CircuitOpenError('s3', 7)) and not is_unavailable(denied)
+    assert unavailable_response(CircuitOpenError('s3', 7), {})['headers']['Retry-After'] == '7'
+    assert unavailable_response(throttled, {'Access-Control-Allow-Origin': '*'})['statusCode'] == 503
@@ -0,0 +1,31 @@
+import json
+import logging
+
+import pytest
+
+import search_content
+
+USER_ID = 'user-1'
+logger = logging.getLogger(__name__)
+
+
+@pytest.fixture(autouse=True)
+def signed_in(monkeypatch):
+    monkeypatch.setattr(search_content, 'extract_and_verify_token',
+                        lambda event, region, pool_id: {'statusCode': 200, 'body': {'user_id': USER_ID}})
+
+
+def search(body):
+    return search_content.handle_post_request({'body': json.dumps(body)}, logger, {})
+
+
+@pytest.mark.parametrize('limit', [0, -1, search_content.MAX_LIMIT + 1])
+def test_limit_out_of_range_is_refused(limit):
+    response = search({'query': 'report', 'limit': limit})
+
+    assert response['statusCode'] == 400
+    assert json.loads(response['body']) == f'limit must be between 1 and {search_content.MAX_LIMIT}'
+
+
+def test_limit_that_is_not_a_number_is_refused():
+    assert search({'query': 'report', 'limit': 'many'})['statusCode'] == 400
@@ -0,0 +1,90 @@
+import random
+
+import pytest
+
+from trigram_index import TrigramIndex, decode_postings, decode_varint, encode_postings, encode_varint
+
+
+def random_names(rng, count):
+    words = ['report', 'invoice', 'photo', 'notes', 'draft', 'final', 'scan', 'Q3']
+    return {f"{rng.choice(words)}-{rng.randrange(1000)}.{rng.choice(['pdf', 'txt', 'png'])}" for _ in range(count)}
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_changes_give_the_index_a_rebuild_would(seed):
+    rng = random.Random(seed)
+    names = random_names(rng, 300)
+    added = random_names(rng, 40) | set(rng.sample(sorted(names), 5))
+    removed = set(rng.sample(sorted(names), 30)) | set(rng.sample(sorted(added), 3)) | {'never-indexed.txt'}
+
+    changed = TrigramIndex.build(names).with_changes(added, removed)
+
+    rebuilt = TrigramIndex.build((names | added) - removed)
+    assert changed.names == rebuilt.names and changed.postings == rebuilt.postings
+
+
+def test_unchanged_index_is_returned_as_is():
+    index = TrigramIndex.build(['a.txt', 'b.txt'])
+
+    assert index.with_changes(['a.txt'], ['missing.txt']) is index
+
+
+def test_changed_index_finds_added_names_and_drops_removed_ones():
+    index = TrigramIndex.build(['report-1.pdf', 'report-2.pdf']).with_changes(['annual REPORT.txt'], ['report-1.pdf'])
+
+    assert index.search('report') == ['annual REPORT.txt', 'report-2.pdf']
+
+
+@pytest.mark.parametrize('value', [0, 1, 127, 128, 300, 16383, 16384, 2 ** 35 + 7])
+def test_varints_round_trip(value):
+    out = bytearray(b'x')
+    encode_varint(value, out)
+
+    assert decode_varint(out, 1) == (value, len(out))
+    assert len(out) - 1 == max(1, -(-value.bit_length() // 7))
+
+
+def test_posting_lists_are_delta_encoded():
+    ids = [3, 4, 5, 200, 201, 100000]
+
+    encoded = encode_postings(ids)
+
+    assert decode_postings(encoded) == ids
+    assert len(encoded) == 1 + 1 + 1 + 2 + 1 + 3      # Small gaps take one byte each
+    assert decode_postings(b'') == []
+
+
+def test_index_round_trips_through_bytes():
+    index = TrigramIndex.build(['résumé.pdf', 'notes.txt', 'Notes backup.txt', 'ab'])
+
+    loaded = TrigramIndex.from_bytes(index.to_bytes())
+
+    assert loaded.names == index.names and loaded.postings == index.postings
+    assert loaded.search('SUM') == ['résumé.pdf']
+
+
+def test_other_data_is_refused():
+    with pytest.raises(ValueError):
+        TrigramIndex.from_bytes(b'CIX1\x00')
+
+
+def test_search_is_case_insensitive_in_name_order_up_to_the_limit():
+    index = TrigramIndex.build([f'Report {number:02d}.pdf' for number in range(10)] + ['summary.txt'])
+
+    assert index.search('report', limit=3) == ['Report 00.pdf', 'Report 01.pdf', 'Report 02.pdf']
+    assert index.search('REPORT 09') == ['Report 09.pdf']
+    assert index.search('missing') == []
+
+
+def test_trigram_false_positives_are_dropped():
+    # 'abcd' shares every trigram with 'abc-bcd', but is not a substring of it
+    index = TrigramIndex.build(['abc-bcd', 'xabcdx'])
+
+    assert index.search('abcd') == ['xabcdx']
+
+
+def test_short_queries_scan_the_names():
+    index = TrigramIndex.build(['a.md', 'b.md', 'notes.txt'])
+
+    assert index.search('.m') == ['a.md', 'b.md']
+    assert index.search('') == ['a.md', 'b.md', 'notes.txt']
@@ -0,0 +1,77 @@
+import base64
+import hashlib
+import json
+import logging
+
+import pytest
+
+import view_asset
+from compression_utils import CODEC_GZIP, compress_document
+from conftest import BUCKET
+from disk_cache import DiskCache
+from encryption_utils import SEGMENT_SIZE, LocalKms, document_data_keys, encrypt_document
+from storage_utils import document_key
+
+USER_ID = 'user-1'
+DOCUMENT = '\n'.join(hashlib.sha256(str(number).encode()).hexdigest() for number in range(5000)).encode()
+logger = logging.getLogger(__name__)
+
+
+@pytest.fixture
+def stored(s3, tmp_path, monkeypatch):
+    """An encrypted, gzip compressed document several segments long, with view_asset reading it."""
+    kms = LocalKms()
+    body, metadata = encrypt_document(compress_document(DOCUMENT, CODEC_GZIP), document_data_keys(kms, BUCKET))
+    assert len(body) > 2 * SEGMENT_SIZE
+    s3.put_object(Bucket=BUCKET, Key=document_key(USER_ID, 'notes.txt'), Body=body, ContentType='text/plain',
+                  Metadata={'content-codec': CODEC_GZIP, **metadata})
+
+    monkeypatch.setattr(view_asset, 's3_client', s3)
+    monkeypatch.setattr(view_asset, 'data_keys', document_data_keys(kms, BUCKET))
+    monkeypatch.setattr(view_asset, 'document_cache', DiskCache(str(tmp_path / 'cache'), 64 * 1024 * 1024))
+    monkeypatch.setattr(view_asset, 'decode_jwt_token', lambda token, logger: {'sub': USER_ID})
+    monkeypatch.setattr(view_asset, 'record_cache_result', lambda hit: None)
+    return body
+
+
+def view(response_format, accept_encoding=None):
+    headers = {'authorization': 'Bearer token'}
+    if accept_encoding:
+        headers['accept-encoding'] = accept_encoding
+    event = {'headers': headers, 'queryStringParameters': {'documentName': 'notes.txt', 'format': response_format}}
+    return view_asset.handle_post_request(event, logger, {})
+
+
+def test_document_is_decrypted_and_decompressed_from_s3_and_the_cache(stored):
+    for _ in range(2):      # A miss that fills the cache, then a hit
+        response = view('json')
+        assert response['statusCode'] == 200
+        assert json.loads(response['body']) == DOCUMENT.decode()
+
+    response = view('raw')
+    assert base64.b64decode(response['body']) == DOCUMENT
+    assert 'Content-Encoding' not in response['headers']
+
+
+def test_encoded_document_is_decrypted_but_not_decompressed(stored):
+    response = view('raw', accept_encoding='gzip, br')
+
+    assert response['headers']['Content-Encoding'] == CODEC_GZIP
+    assert base64.b64decode(response['body']) == compress_document(DOCUMENT, CODEC_GZIP)
+
+
+def test_document_too_large_to_cache_is_streamed_from_s3(stored, monkeypatch):
+    monkeypatch.setattr(view_asset, 'document_cache', DiskCache(view_asset.document_cache.directory, SEGMENT_SIZE))
+
+    assert json.loads(view('json')['body']) == DOCUMENT.decode()
+    assert view_asset.document_cache.total_bytes == 0
+
+
+def test_tampered_document_is_not_served(stored, s3):
+    tampered = bytearray(stored)
+    tampered[SEGMENT_SIZE + 100] ^= 1
+    s3.put_object(Bucket=BUCKET, Key=document_key(USER_ID, 'notes.txt'), Body=bytes(tampered),
+                  ContentType='text/plain', Metadata=s3.head_object(
+                      Bucket=BUCKET, Key=document_key(USER_ID, 'notes.txt'))['Metadata'])
+
+    assert view('json')['statusCode'] == 500
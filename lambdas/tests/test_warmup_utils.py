@@ -0,0 +1,54 @@
+import boto3
+import pytest
+from botocore.awsrequest import AWSResponse
+
+import warmup_utils
+from conftest import REGION
+from warmup_utils import RestorableCredentialProvider, refresh_credentials, restorable_session
+
+
+@pytest.fixture(autouse=True)
+def credential_provider(monkeypatch):
+    provider = RestorableCredentialProvider()
+    monkeypatch.setattr(warmup_utils, 'credential_provider', provider)
+    return provider
+
+
+class Body:
+    def stream(self, **kwargs):
+        yield b'{}'
+
+
+def signing_keys(client):
+    """Send requests nowhere, recording the access key each one was signed with."""
+    keys = []
+
+    def send(request, **kwargs):
+        keys.append(request.headers['Authorization'].decode().split('Credential=')[1].split('/')[0])
+        return AWSResponse(request.url, 200, {}, Body())
+
+    client.meta.events.register('before-send.sqs', send)
+    return keys
+
+
+def test_clients_sign_with_the_refreshed_credentials(monkeypatch):
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'before-snapshot')
+    client = boto3.Session(botocore_session=restorable_session()).client('sqs', region_name=REGION)
+    other = boto3.Session(botocore_session=restorable_session()).client('sqs', region_name=REGION)
+    keys, other_keys = signing_keys(client), signing_keys(other)
+    client.list_queues()
+
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'after-restore')
+    client.list_queues()
+    refresh_credentials()
+    client.list_queues()
+    other.list_queues()
+
+    assert keys == ['before-snapshot', 'before-snapshot', 'after-restore']
+    assert other_keys == ['after-restore']
+
+
+def test_refresh_before_any_client_is_a_no_op(credential_provider):
+    refresh_credentials()
+
+    assert credential_provider.credentials is None
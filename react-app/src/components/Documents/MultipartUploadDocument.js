@@ -9,9 +9,16 @@ import {
   generatePresignedUrls,
   uploadPart,
   completeMultipartUpload,
+  abortMultipartUpload,
   resetUploadProgress,
 } from '../../store/slices/documentSlice';
 
+// Base64 SHA-256 of a file slice, as S3 expects in x-amz-checksum-sha256
+const sha256Base64 = async (blob) => {
+  const digest = await crypto.subtle.digest('SHA-256', await blob.arrayBuffer());
+  return btoa(String.fromCharCode(...new Uint8Array(digest)));
+};
+
 const MultipartUploadDocument = () => {
   const [file, setFile] = useState(null);
   const [errorMessage, setErrorMessage] = useState('');
@@ -43,11 +50,12 @@ const MultipartUploadDocument = () => {
     }
     dispatch(resetUploadProgress());
 
+    let uploadId = null;
     try {
       console.log('Starting multipart upload process for file:', file.name);
 
       // Step 1: Initiate Upload
-      const uploadId = await dispatch(
+      uploadId = await dispatch(
         initiateMultipartUpload(file.name)
       ).unwrap();
 
@@ -55,11 +63,18 @@ const MultipartUploadDocument = () => {
       const partSize = 5 * 1024 * 1024; // 5MB
       const totalParts = Math.ceil(file.size / partSize);
 
+      // Checksum every part up front, the presigned URLs are signed over them
+      const checksums = [];
+      for (let i = 0; i < file.size; i += partSize) {
+        checksums.push(await sha256Base64(file.slice(i, i + partSize)));
+      }
+
       const partUrls = await dispatch(
         generatePresignedUrls({
           uploadId,
           filename: file.name,
           parts: totalParts,
+          checksums,
         })
       ).unwrap();
 
@@ -80,6 +95,7 @@ const MultipartUploadDocument = () => {
             partData: part,
             partNumber,
             totalParts,
+            checksum: checksums[partNumber - 1],
           })
         ).unwrap();
 
@@ -101,6 +117,10 @@ const MultipartUploadDocument = () => {
       navigate('/dashboard');
     } catch (err) {
       console.error('Multipart upload failed:', err);
+      // Release the parts already uploaded instead of leaving them for the sweeper
+      if (uploadId) {
+        dispatch(abortMultipartUpload({ uploadId, filename: file.name }));
+      }
       setErrorMessage(err || 'An error occurred during upload.');
     }
   };
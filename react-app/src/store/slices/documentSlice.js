@@ -15,7 +15,7 @@ export const initiateMultipartUpload = createAsyncThunk(
 
       const response = await axios.post(
         url,
-        { filename },
+        { filename, checksumAlgorithm: 'SHA256' },
         {
           headers: {
             'Content-Type': 'application/json',
@@ -38,14 +38,15 @@ export const initiateMultipartUpload = createAsyncThunk(
 // Generate Presigned URLs
 export const generatePresignedUrls = createAsyncThunk(
   'documents/generatePresignedUrls',
-  async ({ uploadId, filename, parts }, { rejectWithValue }) => {
+  async ({ uploadId, filename, parts, checksums }, { rejectWithValue }) => {
     try {
       const token = localStorage.getItem('IdToken');
       const url = `${process.env.REACT_APP_API_BASE_URL}/multipart_generate_presigned_urls`;
 
+      // Each part URL is signed over the part's SHA-256 checksum
       const response = await axios.post(
         url,
-        { uploadId, filename, parts },
+        { uploadId, filename, parts, checksumAlgorithm: 'SHA256', checksums },
         {
           headers: {
             Authorization: `Bearer ${token}`,
@@ -68,13 +69,14 @@ export const generatePresignedUrls = createAsyncThunk(
 
 export const uploadPart = createAsyncThunk(
   'documents/uploadPart',
-  async ({ partUrl, partData, partNumber, totalParts }, thunkAPI) => {
+  async ({ partUrl, partData, partNumber, totalParts, checksum }, thunkAPI) => {
     const { dispatch, rejectWithValue } = thunkAPI;
     console.log(`Uploading part ${partNumber}/${totalParts} to URL:`, partUrl);
     try {
       const response = await axios.put(partUrl, partData, {
         headers: {
           'Content-Type': 'application/octet-stream',
+          'x-amz-checksum-sha256': checksum,
         },
         onUploadProgress: (progressEvent) => {
           const partProgress = Math.round(
@@ -94,7 +96,7 @@ export const uploadPart = createAsyncThunk(
       }
       console.log(`Upload complete for part ${partNumber}, ETag: ${etag}`);
 
-      return { PartNumber: partNumber, ETag: etag };
+      return { PartNumber: partNumber, ETag: etag, ChecksumSHA256: checksum };
     } catch (error) {
       const errorMessage =
         error.response?.data?.message || error.message || `Failed to upload part ${partNumber}.`;
@@ -168,13 +170,42 @@ export const completeMultipartUpload = createAsyncThunk(
   }
 );
 
+// Abort Multipart Upload (client-side cancel or failure cleanup)
+export const abortMultipartUpload = createAsyncThunk(
+  'documents/abortMultipartUpload',
+  async ({ uploadId, filename }, { rejectWithValue }) => {
+    try {
+      const token = localStorage.getItem('IdToken');
+      const url = `${process.env.REACT_APP_API_BASE_URL}/multipart_abort_upload`;
+
+      await axios.post(
+        url,
+        { uploadId, filename },
+        {
+          headers: {
+            Authorization: `Bearer ${token}`,
+            'Content-Type': 'application/json',
+          },
+        }
+      );
+
+      return uploadId;
+    } catch (error) {
+      return rejectWithValue(
+        error.response?.data?.message || 'Failed to abort upload.'
+      );
+    }
+  }
+);
+
 // Existing Thunks for Other Operations
 
 export const fetchDocuments = createAsyncThunk(
   'documents/fetchDocuments',
-  async (_, { rejectWithValue }) => {
+  async (_, { getState, rejectWithValue }) => {
     try {
       const token = localStorage.getItem('IdToken');
+      const { itemsEtag } = getState().documents;
 
       const response = await axios.post(
         `${process.env.REACT_APP_API_BASE_URL}/list_assets`,
@@ -183,11 +214,17 @@ export const fetchDocuments = createAsyncThunk(
           headers: {
             'Content-Type': 'application/json',
             Authorization: `Bearer ${token}`,
+            // The server answers 304 with no body while the collection is unchanged
+            ...(itemsEtag && { 'If-None-Match': itemsEtag }),
           },
+          validateStatus: (status) => (status >= 200 && status < 300) || status === 304,
         }
       );
 
-      return response.data;
+      if (response.status === 304) {
+        return { notModified: true };
+      }
+      return { items: response.data, etag: response.headers.etag || null };
     } catch (error) {
       return rejectWithValue(
         error.response?.data || 'Failed to fetch documents'
@@ -305,6 +342,7 @@ export const documentSlice = createSlice({
   name: 'documents',
   initialState: {
     items: [],
+    itemsEtag: null, // ETag of the last full listing, for conditional refreshes
     loading: false,
     error: null,
     viewUrl: null,
@@ -379,7 +417,10 @@ export const documentSlice = createSlice({
       })
       .addCase(fetchDocuments.fulfilled, (state, action) => {
         state.loading = false;
-        state.items = action.payload;
+        if (!action.payload.notModified) {
+          state.items = action.payload.items;
+          state.itemsEtag = action.payload.etag;
+        }
       })
       .addCase(fetchDocuments.rejected, (state, action) => {
         state.loading = false;
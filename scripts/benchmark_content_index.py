@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Benchmark the full-text content index on a synthetic corpus, without AWS.
+
+Documents are drawn from a Zipf-like vocabulary and indexed in batches, one segment per
+batch as the indexing Lambda writes them, with a share of the batches overwriting or
+deleting earlier documents. The script times segment building, memory-mapping the
+segments, queries against the unmerged stack, the merge, and queries against the merged
+segment.
+
+Usage:
+    python3 benchmark_content_index.py --documents 20000 --segments 40 --queries 500
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambdas', 'src', 'utils'))
+
+from content_index import ContentIndex, Segment, build_segment, merge_segments  # noqa: E402
+
+
+def build_vocabulary(size, rng):
+    """Return a list of distinct pseudo-words."""
+    letters = 'etaoinshrdlcumwfgypbvkjxqz'
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choices(letters, k=rng.randint(3, 10))))
+    return sorted(words)
+
+
+def build_batches(documents, segments, words_per_document, vocabulary, rng):
+    """Yield per-segment document batches of name -> tokens, with overwrites and deletes."""
+    cumulative, total = [], 0.0
+    for rank in range(len(vocabulary)):
+        total += 1 / (rank + 1)
+        cumulative.append(total)
+    per_segment = max(1, documents // segments)
+    created = []
+    for _ in range(segments):
+        batch = {}
+        for _ in range(per_segment):
+            roll = rng.random()
+            if created and roll < 0.05:
+                batch[rng.choice(created)] = None
+                continue
+            name = rng.choice(created) if created and roll < 0.15 else f'document-{len(created)}.txt'
+            if name not in created:
+                created.append(name)
+            batch[name] = set(rng.choices(vocabulary, cum_weights=cumulative, k=words_per_document))
+        yield batch
+
+
+def time_queries(index, queries):
+    """Return the mean query time in milliseconds and the total number of hits."""
+    hits = 0
+    started = time.perf_counter()
+    for terms in queries:
+        hits += len(index.search(terms, limit=100))
+    return (time.perf_counter() - started) * 1000 / len(queries), hits
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--documents', type=int, default=20000, help='Document writes in the corpus')
+    parser.add_argument('--segments', type=int, default=40, help='Segments the writes are split into')
+    parser.add_argument('--words', type=int, default=300, help='Words drawn per document')
+    parser.add_argument('--vocabulary', type=int, default=50000, help='Distinct words in the corpus')
+    parser.add_argument('--queries', type=int, default=500, help='Queries per measurement')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    vocabulary = build_vocabulary(args.vocabulary, rng)
+    queries = [rng.sample(vocabulary[:5000], rng.randint(1, 3)) for _ in range(args.queries)]
+
+    batches = list(build_batches(args.documents, args.segments, args.words, vocabulary, rng))
+
+    with tempfile.TemporaryDirectory() as directory:
+        started = time.perf_counter()
+        paths, total_bytes = [], 0
+        for number, batch in enumerate(batches):
+            data = build_segment(batch)
+            path = os.path.join(directory, f'{number:040d}-00.seg')
+            with open(path, 'wb') as segment_file:
+                segment_file.write(data)
+            paths.append(path)
+            total_bytes += len(data)
+        build_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        index = ContentIndex([Segment.open(path) for path in paths])
+        open_ms = (time.perf_counter() - started) * 1000
+        stacked_ms, stacked_hits = time_queries(index, queries)
+
+        started = time.perf_counter()
+        merged = merge_segments(index.segments)
+        merge_seconds = time.perf_counter() - started
+        index.close()
+
+        merged_path = os.path.join(directory, 'merged.seg')
+        with open(merged_path, 'wb') as segment_file:
+            segment_file.write(merged)
+        merged_index = ContentIndex([Segment.open(merged_path)])
+        merged_ms, merged_hits = time_queries(merged_index, queries)
+        live = len(merged_index.live_names())
+        merged_index.close()
+
+    print(f"Corpus: {args.documents} writes in {args.segments} segments, {live} live documents")
+    print(f"{'step':<28}{'result':>24}")
+    print(f"{'build segments':<28}{build_seconds:>22.2f} s")
+    print(f"{'segment bytes':<28}{total_bytes:>24,}")
+    print(f"{'mmap + open segments':<28}{open_ms:>21.1f} ms")
+    print(f"{'query, unmerged':<28}{stacked_ms:>21.3f} ms")
+    print(f"{'merge':<28}{merge_seconds:>22.2f} s")
+    print(f"{'merged bytes':<28}{len(merged):>24,}")
+    print(f"{'query, merged':<28}{merged_ms:>21.3f} ms")
+    if stacked_hits != merged_hits:
+        print(f"Mismatch: {stacked_hits} hits before the merge, {merged_hits} after")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Benchmark gzip levels for list_assets/view_asset response bodies.
+
+For each level the script measures the compression time of a synthetic listing and
+compares it with the transfer time saved on a slow link. The recommended level is the
+one with the largest net saving, which is what RESPONSE_GZIP_LEVEL should be set to.
+
+Usage:
+    python3 benchmark_response_gzip.py --documents 5000 --bandwidth-mbps 2 --cpu-scale 8
+"""
+import argparse
+import datetime
+import gzip
+import json
+import random
+import string
+import time
+
+
+def build_listing(documents, seed=42):
+    """Build a list_assets style JSON body with the given number of documents."""
+    rng = random.Random(seed)
+    extensions = ['pdf', 'txt', 'csv', 'json', 'docx', 'xml', 'png']
+    start = datetime.datetime(2024, 1, 1)
+    items = []
+    for index in range(documents):
+        stem = ''.join(rng.choices(string.ascii_lowercase + '-_', k=rng.randint(6, 24)))
+        items.append({
+            'user_id': '5f1c2d3e-aaaa-bbbb-cccc-0123456789ab',
+            'document_name': f'{stem}-{index}.{rng.choice(extensions)}',
+            'upload_date': str(start + datetime.timedelta(seconds=rng.randint(0, 3e7))),
+            'content_type': 'application/octet-stream',
+            'content_codec': rng.choice(['identity', 'gzip', 'zstd']),
+        })
+    return json.dumps(items).encode('utf-8')
+
+
+def time_compression(body, level, rounds):
+    """Return the best-of-N compression time in seconds and the compressed size."""
+    best = float('inf')
+    compressed = b''
+    for _ in range(rounds):
+        started = time.perf_counter()
+        compressed = gzip.compress(body, compresslevel=level, mtime=0)
+        best = min(best, time.perf_counter() - started)
+    return best, len(compressed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--documents', type=int, default=5000, help='Documents in the synthetic listing')
+    parser.add_argument('--bandwidth-mbps', type=float, default=2.0, help='Client link speed in Mbit/s')
+    parser.add_argument('--cpu-scale', type=float, default=8.0,
+                        help='Slowdown of the Lambda CPU relative to this machine (128 MB is roughly 8x)')
+    parser.add_argument('--rounds', type=int, default=5, help='Timing rounds per level')
+    args = parser.parse_args()
+
+    body = build_listing(args.documents)
+    bytes_per_second = args.bandwidth_mbps * 1e6 / 8
+    print(f"Body: {len(body)} bytes, link: {args.bandwidth_mbps} Mbit/s, cpu scale: {args.cpu_scale}x")
+    print(f"{'level':>5} {'size':>10} {'ratio':>7} {'cpu ms':>8} {'saved ms':>9} {'net ms':>8}")
+
+    best_level, best_net = None, float('-inf')
+    for level in range(1, 10):
+        seconds, size = time_compression(body, level, args.rounds)
+        cpu_ms = seconds * args.cpu_scale * 1000
+        saved_ms = (len(body) - size) / bytes_per_second * 1000
+        net_ms = saved_ms - cpu_ms
+        print(f"{level:>5} {size:>10} {size / len(body):>7.3f} {cpu_ms:>8.1f} {saved_ms:>9.1f} {net_ms:>8.1f}")
+        if net_ms > best_net:
+            best_level, best_net = level, net_ms
+
+    print(f"Recommended RESPONSE_GZIP_LEVEL={best_level} (net saving {best_net:.1f} ms)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Copy the items of a metadata table saved before its range key was renamed into the
+table Terraform recreated with the document_name range key.
+
+Changing a DynamoDB table's key replaces the table, so its items have to be carried over
+from a copy taken before `terraform apply`:
+
+    aws dynamodb create-backup --table-name TABLE --backup-name TABLE-before-document-name
+    aws dynamodb restore-table-from-backup --target-table-name TABLE-migration --backup-arn ARN
+    terraform apply
+    python3 migrate_metadata_table.py --source TABLE-migration --target TABLE
+
+Items keyed by digital_asset_name get it renamed to document_name; an item carrying
+both keeps its document_name. Everything else, including upload_date, is copied as it
+is. The script only writes to the target, so it can be run again after a failure; drop
+the migration table once the counts match.
+
+Usage:
+    python3 migrate_metadata_table.py --source TABLE-migration --target TABLE [--dry-run]
+"""
+import argparse
+import sys
+
+import boto3
+
+LEGACY_RANGE_KEY = 'digital_asset_name'
+RANGE_KEY = 'document_name'
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--source', required=True, help='Table restored from the backup taken before the apply')
+    parser.add_argument('--target', required=True, help='The metadata table with the document_name range key')
+    parser.add_argument('--region', help='AWS region, defaults to the configured one')
+    parser.add_argument('--dry-run', action='store_true', help='Only count the items that would be copied')
+    return parser.parse_args()
+
+
+def migrate_item(item):
+    """Return the item keyed by document_name, or None if it has neither range key."""
+    item = dict(item)
+    legacy_name = item.pop(LEGACY_RANGE_KEY, None)
+    if RANGE_KEY not in item:
+        if legacy_name is None:
+            return None
+        item[RANGE_KEY] = legacy_name
+    return item
+
+
+def main():
+    args = parse_args()
+    dynamodb = boto3.resource('dynamodb', region_name=args.region)
+    source, target = dynamodb.Table(args.source), dynamodb.Table(args.target)
+
+    copied = skipped = 0
+    scan_params = {}
+    with target.batch_writer() as batch:    # Batches of 25, resending unprocessed items
+        while True:
+            page = source.scan(**scan_params)
+            for item in page['Items']:
+                migrated = migrate_item(item)
+                if migrated is None:
+                    skipped += 1
+                    continue
+                if not args.dry_run:
+                    batch.put_item(Item=migrated)
+                copied += 1
+            if 'LastEvaluatedKey' not in page:
+                break
+            scan_params['ExclusiveStartKey'] = page['LastEvaluatedKey']
+
+    print(f"{'Would copy' if args.dry_run else 'Copied'} {copied} items from {args.source} to {args.target}, "
+          f"skipped {skipped} without a range key")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())